@@ -14,6 +14,10 @@ class GuiImportError(ImportError):
     pass
 
 
+# note: the startup tracer must be started before anything else is imported
+from . import startup_trace
+startup_trace.start_from_env()
+
 from .version import ELECTRUM_VERSION
 from .util import format_satoshis
 from .wallet import Wallet
@@ -27,7 +27,7 @@ import dataclasses
 import threading
 import itertools
 from collections import defaultdict
-from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List
+from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List, Iterable
 
 from .crypto import sha256
 from . import bitcoin, util
@@ -37,6 +37,7 @@ from .transaction import Transaction, TxOutput, TxInput, PartialTxInput, TxOutpo
 from .synchronizer import Synchronizer
 from .verifier import SPV
 from .blockchain import hash_header, Blockchain
+from .bloom_filter import BloomFilter
 from .i18n import _
 from .logging import Logger
 from .util import EventListener, event_listener
@@ -55,6 +56,9 @@ TX_HEIGHT_UNCONFIRMED = 0
 TX_TIMESTAMP_INF = 999_999_999_999
 TX_HEIGHT_INF = 10 ** 9
 
+# a tx is deeply mined once it has more confirmations than this
+TX_DEEPLY_MINED_CONF = 20  # FIXME unify with lnutil.REDEEM_AFTER_DOUBLE_SPENT_DELAY ?
+
 
 from enum import IntEnum, auto
 
@@ -102,6 +106,9 @@ class AddressSynchronizer(Logger, EventListener):
 
         self._get_balance_cache = {}
         self._get_utxos_cache = {}
+        # scriptpubkeys of the addresses that were in db.history, built on first use (see is_maybe_mine_script).
+        # Access with self.lock.
+        self._scripts_filter = None  # type: Optional[BloomFilter]
 
         self.load_and_cleanup()
 
@@ -133,6 +140,42 @@ class AddressSynchronizer(Logger, EventListener):
         if not address: return False
         return self.db.is_addr_in_history(address)
 
+    def _get_scripts_filter(self) -> BloomFilter:
+        if self._scripts_filter is None:
+            addresses = self.db.get_history()
+            self._scripts_filter = BloomFilter(capacity=max(1000, 2 * len(addresses)))
+            self._add_to_scripts_filter(addresses)
+        return self._scripts_filter
+
+    def _add_to_scripts_filter(self, addresses: Iterable[str]) -> None:
+        for address in addresses:
+            # note: the checksum of our addresses was verified when they were added.
+            # a bogus script for an invalid one does no harm
+            if script := bitcoin.address_to_script_unchecked(address):
+                self._scripts_filter.add(script)
+
+    @with_lock
+    def is_maybe_mine_script(self, scriptpubkey: Optional[bytes]) -> bool:
+        """Returns False if scriptpubkey is not the script of an address in our set.
+        If it returns True, it probably is: is_mine tells for sure.
+
+        This is much faster than deriving the address of the script, and is used
+        to skip the outputs of a tx that are not ours. The filter is never pruned,
+        it has the scripts of all the addresses that were in our set since we were
+        created, so this also holds for wallet.is_mine.
+        """
+        if not scriptpubkey:
+            return False
+        return scriptpubkey in self._get_scripts_filter()
+
+    def get_txout_address(self, txo: TxOutput, *, prefilter: bool = False) -> Optional[str]:
+        """If prefilter is True, returns None if the address is not ours,
+        without deriving it (see is_maybe_mine_script).
+        """
+        if prefilter and not self.is_maybe_mine_script(txo.scriptpubkey):
+            return None
+        return txo.address
+
     def get_addresses(self):
         return sorted(self.db.get_history())
 
@@ -157,7 +200,8 @@ class AddressSynchronizer(Logger, EventListener):
         return len(self._history_local.get(addr, ()))
 
     @with_lock
-    def get_txin_address(self, txin: TxInput) -> Optional[str]:
+    def get_txin_address(self, txin: TxInput, *, prefilter: bool = False) -> Optional[str]:
+        """If prefilter is True, None might also be returned if the address is not ours."""
         if txin.address:
             return txin.address
         prevout_hash = txin.prevout.txid.hex()
@@ -168,7 +212,7 @@ class AddressSynchronizer(Logger, EventListener):
                 return addr
         tx = self.db.get_transaction(prevout_hash)
         if tx:
-            return tx.outputs()[prevout_n].address
+            return self.get_txout_address(tx.outputs()[prevout_n], prefilter=prefilter)
         return None
 
     @with_lock
@@ -231,12 +275,24 @@ class AddressSynchronizer(Logger, EventListener):
                 self.network = None
 
     def add_address(self, address: str) -> None:
-        if address not in self.db.history:
-            self.db.history[address] = []
-        if self.synchronizer:
-            self.synchronizer.add(address)
+        self.add_addresses([address])
+
+    def add_addresses(self, addresses: Sequence[str]) -> None:
+        with self.lock:
+            if self._scripts_filter is not None:
+                self._add_to_scripts_filter(addresses)
+        for address in addresses:
+            if address not in self.db.history:
+                self.db.history[address] = []
+            if self.synchronizer:
+                self.synchronizer.add(address)
         self.up_to_date_changed()
 
+    def remove_addresses(self, addresses: Iterable[str]) -> None:
+        """Stops syncing addresses. Their history is removed by the caller."""
+        if self.synchronizer:
+            self.synchronizer.remove(addresses)
+
     @with_lock
     def get_conflicting_transactions(self, tx: Transaction, *, include_self: bool = False) -> Set[str]:
         """Returns a set of transaction hashes from the wallet history that are
@@ -305,8 +361,8 @@ class AddressSynchronizer(Logger, EventListener):
                 # note that during sync, if the transactions are not properly sorted,
                 # it could happen that we think tx is unrelated but actually one of the inputs is is_mine.
                 # this is the main motivation for allow_unrelated
-                is_mine = any([self.is_mine(self.get_txin_address(txin)) for txin in tx.inputs()])
-                is_for_me = any([self.is_mine(txo.address) for txo in tx.outputs()])
+                is_mine = any([self.is_mine(self.get_txin_address(txin, prefilter=True)) for txin in tx.inputs()])
+                is_for_me = any([self.is_mine(self.get_txout_address(txo, prefilter=True)) for txo in tx.outputs()])
                 if not is_mine and not is_for_me:
                     raise UnrelatedTransactionException()
             # Find all conflicting transactions.
@@ -336,7 +392,7 @@ class AddressSynchronizer(Logger, EventListener):
             # add inputs
             def add_value_from_prev_output():
                 # note: this takes linear time in num is_mine outputs of prev_tx
-                addr = self.get_txin_address(txi)
+                addr = self.get_txin_address(txi, prefilter=True)
                 if addr and self.is_mine(addr):
                     outputs = self.db.get_txo_addr(prevout_hash, addr)
                     try:
@@ -360,7 +416,7 @@ class AddressSynchronizer(Logger, EventListener):
                 ser = tx_hash + ':%d'%n
                 scripthash = bitcoin.script_to_scripthash(txo.scriptpubkey)
                 self.db.add_prevout_by_scripthash(scripthash, prevout=TxOutpoint.from_str(ser), value=v)
-                addr = txo.address
+                addr = self.get_txout_address(txo, prefilter=True)
                 if addr and self.is_mine(addr):
                     self.db.add_txo_addr(tx_hash, addr, n, v, is_coinbase)
                     self.invalidate_cache()
@@ -510,6 +566,7 @@ class AddressSynchronizer(Logger, EventListener):
 
     @with_lock
     def clear_history(self):
+        self._get_scripts_filter()  # keep the scripts of the addresses we had
         self.db.clear_history()
         self._history_local.clear()
         self.invalidate_cache()
@@ -1069,7 +1126,7 @@ class AddressSynchronizer(Logger, EventListener):
             return TxMinedDepth.FREE
         tx_mined_depth = self.get_tx_height(txid)
         height, conf = tx_mined_depth.height(), tx_mined_depth.conf
-        if conf > 20:  # FIXME unify with lnutil.REDEEM_AFTER_DOUBLE_SPENT_DELAY ?
+        if conf > TX_DEEPLY_MINED_CONF:
             return TxMinedDepth.DEEP
         elif conf > 0:
             return TxMinedDepth.SHALLOW
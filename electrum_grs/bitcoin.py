@@ -455,6 +455,35 @@ def address_to_script(addr: str, *, net=None) -> bytes:
     return script
 
 
+def address_to_script_unchecked(addr: str, *, net=None) -> Optional[bytes]:
+    """Same as address_to_script for a valid address, but the checksum is not
+    verified, which is most of the work. Meant for addresses that were checked
+    before, e.g. those of a wallet. For an invalid address, might return None
+    or a script that has nothing to do with it.
+    """
+    if net is None: net = constants.net
+    if addr.lower().startswith(net.SEGWIT_HRP + '1'):
+        encoding, hrp, data = segwit_addr.bech32_decode(addr, with_checksum=False)
+        if hrp != net.SEGWIT_HRP or not data or len(data) < 7 or data[0] > 16:
+            return None
+        witprog = segwit_addr.convertbits(data[1:-6], 5, 8, False)
+        if not witprog:
+            return None
+        return construct_script([data[0], bytes(witprog)])
+    try:
+        _bytes = base_decode(addr, base=58)
+    except (BaseDecodeError, ValueError):
+        return None
+    if _bytes is None or len(_bytes) != 25:
+        return None
+    addrtype, hash_160_ = _bytes[0], _bytes[1:21]
+    if addrtype == net.ADDRTYPE_P2PKH:
+        return pubkeyhash_to_p2pkh_script(hash_160_)
+    elif addrtype == net.ADDRTYPE_P2SH:
+        return construct_script([opcodes.OP_HASH160, hash_160_, opcodes.OP_EQUAL])
+    return None
+
+
 def neuter_bitcoin_address(addr: str) -> str:
     """Truncate a groestlcoin address, for display in errors that might get sent to the crash reporter,
     to reduce harm to the user's privacy.
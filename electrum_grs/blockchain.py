@@ -20,6 +20,7 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import json
 import os
 import threading
 import time
@@ -104,6 +105,176 @@ blockchains = {}  # type: Dict[str, Blockchain]
 blockchains_lock = threading.RLock()  # lock order: take this last; so after Blockchain.lock
 
 
+class SyncJournal(Logger):
+    """Journal of the header sync, stored next to the headers files.
+
+    For each headers file (by path relative to the headers dir), records:
+    - 'forkpoint': the height of the first header of the file,
+    - 'verified': the height and hash of the last header known to be connected and fsynced,
+    - 'pending': the ranges of heights [start, end] that are being written.
+
+    Single headers are appended without fsync, while chunks and swaps with the parent chain
+    rewrite parts of the files. After a crash, replay() undoes the pending writes, checks that
+    the files still have the verified headers, and checks that the headers after them connect,
+    so that the chains are consistent before syncing with servers again.
+    """
+
+    def __init__(self, headers_dir: str):
+        Logger.__init__(self)
+        self.headers_dir = headers_dir
+        self.path = os.path.join(headers_dir, 'sync_journal.json')
+        self.lock = threading.RLock()
+        self._entries = {}  # type: Dict[str, dict]
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"cannot read sync journal, ignoring it: {e!r}")
+
+    def _save(self) -> None:
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def _key(self, chain: 'Blockchain') -> str:
+        return os.path.relpath(chain.path(), self.headers_dir)
+
+    def _get_entry(self, chain: 'Blockchain') -> dict:
+        key = self._key(chain)
+        entry = self._entries.get(key)
+        if entry is None or entry['forkpoint'] != chain.forkpoint:
+            entry = self._entries[key] = {
+                'forkpoint': chain.forkpoint,
+                'verified': [chain.forkpoint - 1, chain.get_hash(chain.forkpoint - 1)],
+                'pending': [],
+            }
+        return entry
+
+    def begin_write(self, chain: 'Blockchain', start: int, end: int) -> None:
+        with self.lock:
+            self._get_entry(chain)['pending'].append([start, end])
+            self._save()
+
+    def end_write(self, chain: 'Blockchain', start: int, end: int) -> None:
+        """To be called once the headers in [start, end] are written and fsynced."""
+        with self.lock:
+            entry = self._get_entry(chain)
+            if [start, end] in entry['pending']:
+                entry['pending'].remove([start, end])
+            self._set_verified(chain, entry)
+            self._save()
+
+    def add_chain(self, chain: 'Blockchain') -> None:
+        with self.lock:
+            self._get_entry(chain)
+            self._save()
+
+    def set_verified(self, chain: 'Blockchain') -> None:
+        """To be called once the headers file of chain is fsynced."""
+        with self.lock:
+            self._set_verified(chain, self._get_entry(chain))
+            self._save()
+
+    def _set_verified(self, chain: 'Blockchain', entry: dict) -> None:
+        height = chain.height()
+        if entry['pending']:
+            # headers in or after an interrupted write cannot be trusted
+            height = min(height, min(start for start, end in entry['pending']) - 1)
+        height = max(height, chain.forkpoint - 1)
+        try:
+            entry['verified'] = [height, chain.get_hash(height)]
+        except MissingHeader:
+            pass  # within the checkpoint region
+
+    def forget(self, path: str) -> None:
+        with self.lock:
+            if self._entries.pop(os.path.relpath(path, self.headers_dir), None) is not None:
+                self._save()
+
+    def replay(self, chain: 'Blockchain') -> bool:
+        """Reconciles the headers file of chain with the journal.
+        Returns False if the file does not have the headers the journal says it has.
+        """
+        with self.lock, chain.lock:
+            key = self._key(chain)
+            entry = self._entries.get(key)
+            if entry is None or entry['forkpoint'] != chain.forkpoint:
+                return True
+            max_cp = constants.net.max_checkpoint()
+            for start, end in entry['pending']:
+                self.logger.info(f"{key}: write of headers [{start}, {end}] was interrupted")
+                start = max(start, chain.forkpoint)
+                if start > chain.height():
+                    continue
+                if start <= max_cp:
+                    # checkpoint region: headers are requested again when needed
+                    end = min(end, max_cp, chain.height())
+                    chain.write(bytes(HEADER_SIZE * (end - start + 1)), (start - chain.forkpoint) * HEADER_SIZE, truncate=False)
+                else:
+                    chain.write(b'', (start - chain.forkpoint) * HEADER_SIZE)
+            entry['pending'] = []
+            height, header_hash = entry['verified']
+            height = max(min(height, chain.height()), max_cp)
+            if height == entry['verified'][0] and not chain.check_hash(height, header_hash):
+                self.logger.info(f"{key}: header at verified height {height} does not match the journal")
+                self._entries.pop(key)
+                self._save()
+                return False
+            num_headers = self._count_headers_that_connect(chain, height)
+            if height + num_headers < chain.height():
+                self.logger.info(f"{key}: truncating to height {height + num_headers}, after a crash")
+                chain.write(b'', (height + num_headers + 1 - chain.forkpoint) * HEADER_SIZE)
+            self._set_verified(chain, entry)
+            self._save()
+            return True
+
+    def _count_headers_that_connect(self, chain: 'Blockchain', height: int) -> int:
+        """Returns the number of headers after height that connect to it."""
+        if height >= chain.height():
+            return 0
+        try:
+            prev_hash = chain.get_hash(height)
+        except MissingHeader:
+            return 0
+        with open(chain.path(), 'rb') as f:
+            f.seek((height + 1 - chain.forkpoint) * HEADER_SIZE)
+            data = f.read()
+        num_headers = 0
+        for raw_header in util.chunks(data, size=HEADER_SIZE):
+            if len(raw_header) < HEADER_SIZE:
+                break
+            header = deserialize_header(raw_header, height + 1 + num_headers)
+            if header['prev_block_hash'] != prev_hash:
+                break
+            prev_hash = hash_raw_header(raw_header)
+            num_headers += 1
+        return num_headers
+
+    def prune(self) -> None:
+        """Forgets the files that do not exist anymore."""
+        with self.lock:
+            for key in list(self._entries):
+                if not os.path.exists(os.path.join(self.headers_dir, key)):
+                    self._entries.pop(key)
+            self._save()
+
+
+# key: headers dir
+_sync_journals = {}  # type: Dict[str, SyncJournal]
+
+
+def get_sync_journal(config: 'SimpleConfig') -> SyncJournal:
+    headers_dir = util.get_headers_dir(config)
+    with blockchains_lock:
+        if headers_dir not in _sync_journals:
+            _sync_journals[headers_dir] = SyncJournal(headers_dir)
+        return _sync_journals[headers_dir]
+
+
 def read_blockchains(config: 'SimpleConfig'):
     best_chain = Blockchain(config=config,
                             forkpoint=0,
@@ -111,6 +282,11 @@ def read_blockchains(config: 'SimpleConfig'):
                             forkpoint_hash=constants.net.GENESIS,
                             prev_hash=None)
     blockchains[constants.net.GENESIS] = best_chain
+    journal = get_sync_journal(config)
+    if not journal.replay(best_chain):
+        _logger.info("[blockchain] deleting best chain. inconsistent with sync journal.")
+        os.unlink(best_chain.path())
+        best_chain.update_size()
     # consistency checks
     if best_chain.height() > constants.net.max_checkpoint():
         header_after_cp = best_chain.read_header(constants.net.max_checkpoint()+1)
@@ -150,6 +326,9 @@ def read_blockchains(config: 'SimpleConfig'):
                        parent=parent,
                        forkpoint_hash=first_hash,
                        prev_hash=prev_hash)
+        if not journal.replay(b):
+            delete_chain(filename, "inconsistent with sync journal")
+            return
         # consistency checks
         h = b.read_header(b.forkpoint)
         if first_hash != hash_header(h):
@@ -164,6 +343,7 @@ def read_blockchains(config: 'SimpleConfig'):
 
     for filename in l:
         instantiate_chain(filename)
+    journal.prune()
 
 
 def get_best_chain() -> 'Blockchain':
@@ -284,6 +464,7 @@ class Blockchain(Logger):
                           prev_hash=parent.get_hash(forkpoint-1))
         self.assert_headers_file_available(parent.path())
         open(self.path(), 'w+').close()
+        get_sync_journal(self.config).add_chain(self)
         self.save_header(header)
         # put into global dict. note that in some cases
         # save_header might have already put it there but that's OK
@@ -376,7 +557,12 @@ class Blockchain(Logger):
             chunk = chunk[-delta_bytes:]
             delta_bytes = 0
         truncate = not chunk_within_checkpoint_region
+        start = self.forkpoint + delta_bytes // HEADER_SIZE
+        end = start + len(chunk) // HEADER_SIZE - 1
+        journal = get_sync_journal(self.config)
+        journal.begin_write(self, start, end)
         self.write(chunk, delta_bytes, truncate)
+        journal.end_write(self, start, end)
         self.swap_with_parent()
 
     def swap_with_parent(self) -> None:
@@ -424,6 +610,10 @@ class Blockchain(Logger):
         with open(parent.path(), 'rb') as f:
             f.seek((forkpoint - parent.forkpoint)*HEADER_SIZE)
             parent_data = f.read(parent_branch_size*HEADER_SIZE)
+        # if we crash while swapping, the branches of both files are discarded on startup
+        journal = get_sync_journal(self.config)
+        journal.begin_write(self, forkpoint, forkpoint + parent_branch_size - 1)
+        journal.begin_write(parent, forkpoint, self.height())
         self.write(parent_data, 0)
         parent.write(my_data, (forkpoint - parent.forkpoint)*HEADER_SIZE)
         # swap parameters
@@ -435,6 +625,9 @@ class Blockchain(Logger):
         os.replace(child_old_name, parent.path())
         self.update_size()
         parent.update_size()
+        journal.forget(child_old_name)
+        journal.end_write(self, forkpoint, forkpoint + len(my_data) // HEADER_SIZE - 1)
+        journal.set_verified(parent)
         # update pointers
         blockchains.pop(child_old_id, None)
         blockchains.pop(parent_old_id, None)
@@ -476,7 +669,11 @@ class Blockchain(Logger):
         assert delta == self.size(), (delta, self.size())
         assert len(data) == HEADER_SIZE
         # note: we don't fsync, to improve perf. losing headers at end of file is ok.
-        self.write(data, delta*HEADER_SIZE, fsync=False)
+        #       (except at the end of a chunk, so that the sync journal can move forward)
+        end_of_chunk = (header.get('block_height') + 1) % CHUNK_SIZE == 0
+        self.write(data, delta*HEADER_SIZE, fsync=end_of_chunk)
+        if end_of_chunk:
+            get_sync_journal(self.config).set_verified(self)
         self.swap_with_parent()
 
     @with_lock
@@ -0,0 +1,108 @@
+"""Bloom filter: a compact set of byte strings that can have false positives.
+
+`item in bloom` is False if the item was never added, and True if it was
+added, or, with probability about `error_rate`, if it was not. Items cannot
+be removed.
+
+The filter grows as items are added: when the current slice of bits holds
+`capacity` items, a new slice twice as large is added, with half the error
+rate. The error rates of the slices add up to at most `error_rate`, whatever
+the number of items (see "Scalable Bloom Filters", Almeida et al., 2007).
+
+The address synchronizer uses it to skip, without deriving their address,
+the outputs of a tx that are not ours (see AddressSynchronizer.is_maybe_mine_script).
+"""
+
+import hashlib
+import math
+from typing import List, Iterable
+
+
+class _BloomSlice:
+
+    __slots__ = ('capacity', 'num_bits', 'num_hashes', 'bits', 'count')
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _indexes(self, h1: int, h2: int) -> Iterable[int]:
+        # double hashing, see Kirsch and Mitzenmacher, "Less Hashing, Same Performance"
+        m = self.num_bits
+        return ((h1 + i * h2) % m for i in range(self.num_hashes))
+
+    def add(self, h1: int, h2: int) -> None:
+        bits = self.bits
+        for i in self._indexes(h1, h2):
+            bits[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+    def __contains__(self, h) -> bool:
+        bits = self.bits
+        return all(bits[i >> 3] & (1 << (i & 7)) for i in self._indexes(*h))
+
+
+class BloomFilter:
+
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, capacity: int = 1000, error_rate: float = 0.001):
+        assert capacity > 0, capacity
+        assert 0 < error_rate < 1, error_rate
+        self.initial_capacity = capacity
+        self.initial_error_rate = error_rate
+        self._slices = []  # type: List[_BloomSlice]
+        self._add_slice()
+
+    def _add_slice(self) -> None:
+        n = len(self._slices)
+        self._slices.append(_BloomSlice(
+            capacity=self.initial_capacity * self.GROWTH ** n,
+            error_rate=self.initial_error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** n))
+
+    @staticmethod
+    def _hash(item: bytes):
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        # h2 is odd, so that the indexes of an item are all different if num_bits is a power of 2
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def add(self, item: bytes) -> None:
+        h = self._hash(item)
+        if any(h in s for s in self._slices):
+            return
+        current = self._slices[-1]
+        if current.count >= current.capacity:
+            self._add_slice()
+            current = self._slices[-1]
+        current.add(*h)
+
+    def update(self, items: Iterable[bytes]) -> None:
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: bytes) -> bool:
+        h = self._hash(item)
+        return any(h in s for s in self._slices)
+
+    def __len__(self) -> int:
+        """Number of items added (approximately: an item is not counted if it was a false positive)."""
+        return sum(s.count for s in self._slices)
+
+    def clear(self) -> None:
+        self._slices = []
+        self._add_slice()
+
+    @property
+    def error_rate(self) -> float:
+        """Expected false positive rate, given the number of items."""
+        return 1 - math.prod(
+            1 - (1 - math.exp(-s.num_hashes * s.count / s.num_bits)) ** s.num_hashes
+            for s in self._slices)
+
+    @property
+    def size_in_bytes(self) -> int:
+        return sum(len(s.bits) for s in self._slices)
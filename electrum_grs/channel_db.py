@@ -23,6 +23,7 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import bisect
 import ipaddress
 import time
 import random
@@ -40,7 +41,7 @@ from aiorpcx import NetAddress
 from electrum_ecc import ECPubkey
 
 from .sql_db import SqlDB, sql
-from . import constants, util
+from . import constants, util, startup_trace
 from .util import profiler, get_headers_dir, is_ip_address, json_normalize, UserFacingException, is_private_netaddress
 from .lntransport import LNPeerAddr
 from .lnutil import (ShortChannelID, validate_features, IncompatibleOrInsaneFeatures, LnFeatureContexts,
@@ -373,6 +374,42 @@ PRIMARY KEY(node_id)
 )"""
 
 
+class SortedIndex:
+    """Sorted list of keys, for range queries.
+    Insertion and removal are a bisection and a memmove, so the index can be
+    kept current on every gossip message. Not thread-safe.
+    """
+
+    def __init__(self, keys=()):
+        self._keys = sorted(set(keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key) -> None:
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            self._keys.insert(i, key)
+
+    def discard(self, key) -> None:
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def range(self, lower, upper) -> list:
+        """Keys k with lower <= k < upper, sorted."""
+        start = bisect.bisect_left(self._keys, lower)
+        end = bisect.bisect_left(self._keys, upper, lo=start)
+        return self._keys[start:end]
+
+
+def scid_lower_bound(block_height: int) -> bytes:
+    """Compares below or equal to the short channel ids at block_height, and above those of lower blocks."""
+    if block_height >= 1 << 24:
+        return b'\xff' * 9
+    return max(block_height, 0).to_bytes(3, 'big')
+
+
 class ChannelDB(SqlDB):
 
     NUM_MAX_RECENT_PEERS = 20
@@ -404,6 +441,10 @@ class ChannelDB(SqlDB):
         self._chans_with_0_policies = set()  # type: Set[ShortChannelID]
         self._chans_with_1_policies = set()  # type: Set[ShortChannelID]
         self._chans_with_2_policies = set()  # type: Set[ShortChannelID]
+        # indexes for gossip queries from peers, see get_channels_in_range and get_gossip_in_timespan
+        self._scid_index = SortedIndex()  # of ShortChannelID
+        self._policy_ts_index = SortedIndex()  # of (timestamp, scid, node_id)
+        self._node_ts_index = SortedIndex()  # of (timestamp, node_id)
 
         self.forwarding_lock = threading.RLock()
         self.fwd_channels = []  # type: List[GossipForwardingMessage]
@@ -503,6 +544,7 @@ class ChannelDB(SqlDB):
         channel_info = channel_info._replace(capacity_sat=capacity_sat)
         with self.lock:
             self._channels[channel_info.short_channel_id] = channel_info
+            self._scid_index.add(channel_info.short_channel_id)
             self._channels_for_node[channel_info.node1_id].add(channel_info.short_channel_id)
             self._channels_for_node[channel_info.node2_id].add(channel_info.short_channel_id)
         self._update_num_policies_for_chan(channel_info.short_channel_id)
@@ -573,6 +615,9 @@ class ChannelDB(SqlDB):
         policy = Policy.from_msg(payload)
         with self.lock:
             self._policies[key] = policy
+            if old_policy:
+                self._policy_ts_index.discard((old_policy.timestamp, short_channel_id, start_node))
+            self._policy_ts_index.add((policy.timestamp, short_channel_id, start_node))
         self._update_num_policies_for_chan(short_channel_id)
         if 'raw' in payload:
             self._db_save_policy(policy.key, payload['raw'])
@@ -713,6 +758,9 @@ class ChannelDB(SqlDB):
             # save
             with self.lock:
                 self._nodes[node_id] = node_info
+                if node:
+                    self._node_ts_index.discard((node.timestamp, node_id))
+                self._node_ts_index.add((node_info.timestamp, node_id))
             if 'raw' in msg_payload:
                 self._db_save_node_info(node_id, msg_payload['raw'])
             with self.lock:
@@ -739,7 +787,8 @@ class ChannelDB(SqlDB):
             for key in old_policies:
                 node_id, scid = key
                 with self.lock:
-                    self._policies.pop(key)
+                    policy = self._policies.pop(key)
+                    self._policy_ts_index.discard((policy.timestamp, scid, node_id))
                 self._db_delete_policy(*key)
                 self._update_num_policies_for_chan(scid)
             self.update_counts()
@@ -801,6 +850,7 @@ class ChannelDB(SqlDB):
         # FIXME what about rm-ing policies?
         with self.lock:
             channel_info = self._channels.pop(short_channel_id, None)
+            self._scid_index.discard(short_channel_id)
             if channel_info:
                 self._channels_for_node[channel_info.node1_id].remove(channel_info.short_channel_id)
                 self._channels_for_node[channel_info.node2_id].remove(channel_info.short_channel_id)
@@ -827,6 +877,7 @@ class ChannelDB(SqlDB):
 
     @sql
     @profiler
+    @startup_trace.span('channel_db.load_data')
     @handle_abort
     def load_data(self):
         if self.data_loaded.is_set():
@@ -884,6 +935,12 @@ class ChannelDB(SqlDB):
             except FailedToParseMsg:
                 continue
             self._policies[(p.start_node, p.short_channel_id)] = p
+        with self.lock:
+            self._scid_index = SortedIndex(self._channels.keys())
+            self._policy_ts_index = SortedIndex(
+                (p.timestamp, scid, node_id) for (node_id, scid), p in self._policies.items())
+            self._node_ts_index = SortedIndex(
+                (node_info.timestamp, node_id) for node_id, node_info in self._nodes.items())
         for channel_info in self._channels.values():
             self._channels_for_node[channel_info.node1_id].add(channel_info.short_channel_id)
             self._channels_for_node[channel_info.node2_id].add(channel_info.short_channel_id)
@@ -1051,21 +1108,17 @@ class ChannelDB(SqlDB):
         -> List[GossipForwardingMessage]:
         """Set the timestamps of the passed channel announcements from the corresponding policies"""
         timestamped_chan_anns: List[GossipForwardingMessage] = []
-        with self.lock:
-            policies = self._policies.copy()
-            channels = self._channels.copy()
-
         for chan_ann in channel_anns:
             if chan_ann.timestamp is not None:
                 timestamped_chan_anns.append(chan_ann)
                 continue
 
             scid = chan_ann.scid
-            if (channel_info := channels.get(scid)) is None:
-                continue
-
-            policy1 = policies.get((channel_info.node1_id, scid))
-            policy2 = policies.get((channel_info.node2_id, scid))
+            with self.lock:
+                if (channel_info := self._channels.get(scid)) is None:
+                    continue
+                policy1 = self._policies.get((channel_info.node1_id, scid))
+                policy2 = self._policies.get((channel_info.node2_id, scid))
             potential_timestamps = []
             for policy in [policy1, policy2]:
                 if policy is not None:
@@ -1091,30 +1144,39 @@ class ChannelDB(SqlDB):
         -> List[GossipForwardingMessage]:
         """Return a list of gossip messages matching the requested timespan."""
         forwarding_gossip = []
+        lower = (timespan.first_timestamp,)
+        upper = (timespan.first_timestamp + timespan.timestamp_range,)
         with self.lock:
-            chans = self._channels.copy()
-            policies = self._policies.copy()
-            nodes = self._nodes.copy()
-
-        for short_id, chan in chans.items():
-            # fetching the timestamp from the channel update (according to BOLT-07)
-            chan_up_n1 = policies.get((chan.node1_id, short_id))
-            chan_up_n2 = policies.get((chan.node2_id, short_id))
+            # only look at the policies and nodes in the timespan
+            policies_for_chan = defaultdict(list)  # type: Dict[ShortChannelID, List[Policy]]
+            for timestamp, short_id, node_id in self._policy_ts_index.range(lower, upper):
+                if policy := self._policies.get((node_id, short_id)):
+                    policies_for_chan[short_id].append(policy)
+            chans = {short_id: self._channels.get(short_id) for short_id in policies_for_chan}
+            nodes = [self._nodes.get(node_id) for timestamp, node_id in self._node_ts_index.range(lower, upper)]
+
+        for short_id, policies in policies_for_chan.items():
+            chan = chans[short_id]
+            if chan is None or chan.raw is None:
+                continue
             updates = []
-            for policy in [chan_up_n1, chan_up_n2]:
-                if policy and policy.raw and timespan.in_range(policy.timestamp):
+            for policy in sorted(policies, key=lambda p: p.start_node != chan.node1_id):
+                if policy.start_node not in (chan.node1_id, chan.node2_id):
+                    continue
+                # fetching the timestamp from the channel update (according to BOLT-07)
+                if policy.raw and timespan.in_range(policy.timestamp):
                     if policy.message_flags & 0b10 == 0:  # check that its not "dont_forward"
                         updates.append(GossipForwardingMessage(
                             msg=policy.raw,
                             timestamp=policy.timestamp))
-            if not updates or chan.raw is None:
+            if not updates:
                 continue
             chan_ann_ts = min(update.timestamp for update in updates)
             channel_announcement = GossipForwardingMessage(msg=chan.raw, timestamp=chan_ann_ts)
             forwarding_gossip.extend([channel_announcement] + updates)
 
-        for node_ann in nodes.values():
-            if timespan.in_range(node_ann.timestamp) and node_ann.raw:
+        for node_ann in nodes:
+            if node_ann and timespan.in_range(node_ann.timestamp) and node_ann.raw:
                 forwarding_gossip.append(GossipForwardingMessage(
                     msg=node_ann.raw,
                     timestamp=node_ann.timestamp))
@@ -1122,13 +1184,9 @@ class ChannelDB(SqlDB):
 
     def get_channels_in_range(self, first_blocknum: int, number_of_blocks: int) -> List[ShortChannelID]:
         with self.lock:
-            channels = self._channels.copy()
-        scids: List[ShortChannelID] = []
-        for scid in channels:
-            if first_blocknum <= scid.block_height < first_blocknum + number_of_blocks:
-                scids.append(scid)
-        scids.sort()
-        return scids
+            return self._scid_index.range(
+                scid_lower_bound(first_blocknum),
+                scid_lower_bound(first_blocknum + number_of_blocks))
 
     def get_gossip_for_scid_request(self, scid: ShortChannelID) -> List[bytes]:
         requested_gossip = []
@@ -24,7 +24,7 @@
 # SOFTWARE.
 from collections import defaultdict
 from math import floor, log10
-from typing import NamedTuple, List, Callable, Sequence, Dict, Tuple, Mapping, Type, TYPE_CHECKING
+from typing import NamedTuple, List, Callable, Sequence, Dict, Tuple, Mapping, Type, Optional, TYPE_CHECKING
 from decimal import Decimal
 
 from .bitcoin import sha256, COIN, is_address
@@ -90,6 +90,18 @@ class ScoredCandidate(NamedTuple):
     buckets: List[Bucket]
 
 
+class SpendTarget(NamedTuple):
+    """What make_tx is trying to fund, for choosers that search over
+    bucket values directly instead of only via sufficient_funds."""
+    input_value: int              # value of the fixed inputs, in satoshis
+    spent_amount: int             # value of the fixed outputs, in satoshis
+    base_weight: int              # weight of the tx with fixed inputs/outputs and no change
+    has_fixed_inputs: bool
+    change_weight: int            # weight of a single change output
+    dust_threshold: int
+    fee_estimator_w: Callable[[int], int]
+
+
 def strip_unneeded(bkts: List[Bucket], sufficient_funds: Callable) -> List[Bucket]:
     '''Remove buckets that are unnecessary in achieving the spend amount'''
     if sufficient_funds([], bucket_value_sum=0):
@@ -330,6 +342,17 @@ class CoinChooserBase(Logger):
         def fee_estimator_w(weight):
             return fee_estimator_vb(Transaction.virtual_size_from_weight(weight))
 
+        change_weight = 4 * Transaction.estimated_output_size_for_address(change_addrs[0]) if change_addrs else 4 * 31  # p2wpkh
+        self.target = SpendTarget(
+            input_value=input_value,
+            spent_amount=spent_amount,
+            base_weight=base_weight,
+            has_fixed_inputs=bool(inputs),
+            change_weight=change_weight,
+            dust_threshold=dust_threshold,
+            fee_estimator_w=fee_estimator_w,
+        )
+
         def sufficient_funds(buckets: List[Bucket], *, bucket_value_sum: int) -> bool:
             '''Given a list of buckets, return True if it has enough
             value to pay for the transaction'''
@@ -523,8 +546,258 @@ class CoinChooserPrivacy(CoinChooserRandom):
         return penalty
 
 
+class CoinChooserBranchAndBound(CoinChooserPrivacy):
+    """Tries to find a set of buckets that pays for the outputs without
+    needing a change output, using a depth-first branch-and-bound search over
+    effective values (as in Bitcoin Core's SelectCoinsBnB).
+    If no such set exists, falls back to a knapsack heuristic that aims for
+    a reasonably sized change output.
+    Coins are bucketed per address, as in CoinChooserPrivacy, and confirmed
+    coins are preferred over unconfirmed ones.
+    Unlike CoinChooserRandom, only a single candidate is built into a tx,
+    and the search itself runs in O(1) per step.
+    """
+
+    BNB_MAX_TRIES = 100_000
+    KNAPSACK_MAX_STEPS = 1_000_000  # iterations * num_buckets
+    KNAPSACK_MIN_CHANGE = COIN // 1000
+
+    def choose_buckets(self, buckets, sufficient_funds, penalty_func):
+        conf_buckets = [bkt for bkt in buckets if bkt.min_height > 0]
+        unconf_buckets = [bkt for bkt in buckets if bkt.min_height == 0]
+        other_buckets = [bkt for bkt in buckets if bkt.min_height < 0]
+
+        already_selected = []  # type: List[Bucket]
+        for bkts_choose_from in [conf_buckets, unconf_buckets, other_buckets]:
+            selected = self._select_buckets(bkts_choose_from, forced=already_selected)
+            if selected is not None:
+                break
+            already_selected += bkts_choose_from
+        else:
+            raise NotEnoughFunds()
+        selected = already_selected + selected
+        winner = penalty_func(selected)
+        num_change = sum(1 for o in winner.tx.outputs() if o.is_change)
+        self.logger.info(f"Total number of buckets: {len(buckets)}. "
+                         f"Selected {len(selected)}, with {num_change} change outputs")
+        return winner
+
+    def _select_buckets(self, buckets: List[Bucket], *, forced: List[Bucket]) -> Optional[List[Bucket]]:
+        """Returns the buckets to add on top of `forced`, or None if
+        even all of `buckets` would not be enough.
+        """
+        acc = _WeightAccumulator(self.target, forced)
+        if not acc.is_sufficient(buckets):
+            return None
+        if acc.is_sufficient([]):
+            return []
+        selection = self._branch_and_bound(buckets, acc)
+        if selection is not None:
+            self.logger.info(f"branch and bound found changeless selection of {len(selection)} buckets")
+            return selection
+        return self._knapsack(buckets, acc)
+
+    def _ev_target(self, buckets: Sequence[Bucket], acc: '_WeightAccumulator') -> int:
+        """Sum of effective values the selected buckets need to reach."""
+        target = self.target
+        overhead = 2 if any(bkt.witness for bkt in buckets) or acc.num_witness > 0 else 0
+        fee = target.fee_estimator_w(acc.weight + overhead)
+        return target.spent_amount + fee - acc.value
+
+    def _branch_and_bound(self, buckets: List[Bucket], acc: '_WeightAccumulator') -> Optional[List[Bucket]]:
+        target = self.target
+        pool = sorted(buckets, key=lambda bkt: bkt.effective_value, reverse=True)
+        evs = [bkt.effective_value for bkt in pool]
+        ev_target = self._ev_target(pool, acc)
+        change_fee = target.fee_estimator_w(target.change_weight)
+        # any excess below this is dropped into the fee by _change_outputs
+        max_excess = change_fee + target.dust_threshold - 1
+
+        curr_selection = []  # type: List[int]  # indices into pool
+        curr_ev = 0
+        curr_available = sum(evs)
+        best_selection = None  # type: Optional[List[int]]
+        best_excess = None  # type: Optional[int]
+        index = 0
+        for _ in range(self.BNB_MAX_TRIES):
+            backtrack = False
+            if curr_ev + curr_available < ev_target or curr_ev > ev_target + max_excess:
+                backtrack = True
+            elif curr_ev >= ev_target:
+                # candidate found; check it against the exact weight and fee
+                excess = acc.excess_without_change()
+                if (excess is not None
+                        and excess + target.fee_estimator_w(acc.weight_total()) - target.fee_estimator_w(acc.weight_total() + target.change_weight) < target.dust_threshold
+                        and (best_excess is None or excess < best_excess)):
+                    best_selection = curr_selection[:]
+                    best_excess = excess
+                    if excess == 0:
+                        break
+                backtrack = True
+            if backtrack:
+                if not curr_selection:
+                    break  # exhausted the search space
+                # add the omitted buckets back before trying the omission branch of the last included one
+                index -= 1
+                while index > curr_selection[-1]:
+                    curr_available += evs[index]
+                    index -= 1
+                curr_selection.pop()
+                curr_ev -= evs[index]
+                acc.remove(pool[index])
+            else:
+                curr_available -= evs[index]
+                # skip the inclusion branch if the previous bucket had the same value and was excluded
+                if (not curr_selection
+                        or curr_selection[-1] == index - 1
+                        or evs[index] != evs[index - 1]):
+                    curr_selection.append(index)
+                    curr_ev += evs[index]
+                    acc.add(pool[index])
+            index += 1
+        # reset the accumulator for the caller
+        for i in curr_selection:
+            acc.remove(pool[i])
+        if best_selection is None:
+            return None
+        return [pool[i] for i in best_selection]
+
+    def _knapsack(self, buckets: List[Bucket], acc: '_WeightAccumulator') -> List[Bucket]:
+        """Stochastic approximation of the subset sum closest to the target
+        plus a change output (as in Bitcoin Core's KnapsackSolver).
+        """
+        target = self.target
+        ev_target = self._ev_target(buckets, acc)
+        ev_target += target.fee_estimator_w(target.change_weight) + max(target.dust_threshold, self.KNAPSACK_MIN_CHANGE)
+        lowest_larger = None  # type: Optional[Bucket]
+        applicable = []  # type: List[Bucket]
+        for bkt in buckets:
+            if bkt.effective_value == ev_target:
+                return self._fill_up(buckets, [bkt], acc)
+            elif bkt.effective_value < ev_target:
+                applicable.append(bkt)
+            elif lowest_larger is None or bkt.effective_value < lowest_larger.effective_value:
+                lowest_larger = bkt
+        applicable_sum = sum(bkt.effective_value for bkt in applicable)
+        if applicable_sum == ev_target:
+            return self._fill_up(buckets, applicable, acc)
+        if applicable_sum < ev_target:
+            return self._fill_up(buckets, [lowest_larger] if lowest_larger else [], acc)
+
+        applicable.sort(key=lambda bkt: bkt.effective_value, reverse=True)
+        evs = [bkt.effective_value for bkt in applicable]
+        n = len(evs)
+        best = [True] * n
+        best_sum = applicable_sum
+        iterations = max(10, min(1000, self.KNAPSACK_MAX_STEPS // n))
+        for _ in range(iterations):
+            if best_sum == ev_target:
+                break
+            included = [False] * n
+            total = 0
+            reached_target = False
+            rand = self.p.get_bytes((n + 7) // 8)
+            for pass_ in range(2):
+                if reached_target:
+                    break
+                for i in range(n):
+                    if pass_ == 0:
+                        take = (rand[i >> 3] >> (i & 7)) & 1
+                    else:
+                        take = not included[i]
+                    if take:
+                        total += evs[i]
+                        included[i] = True
+                        if total >= ev_target:
+                            reached_target = True
+                            if total < best_sum:
+                                best_sum = total
+                                best = included[:]
+                            total -= evs[i]
+                            included[i] = False
+        if lowest_larger is not None and lowest_larger.effective_value <= best_sum:
+            selection = [lowest_larger]
+        else:
+            selection = [bkt for bkt, inc in zip(applicable, best) if inc]
+        return self._fill_up(buckets, selection, acc)
+
+    def _fill_up(self, buckets: List[Bucket], selection: List[Bucket], acc: '_WeightAccumulator') -> List[Bucket]:
+        """Adds the largest remaining buckets to selection until it is
+        sufficient. Only needed if fee rounding made the estimates slightly off.
+        """
+        selection = list(selection)
+        if acc.is_sufficient(selection):
+            return selection
+        selected_ids = set(map(id, selection))
+        for bkt in sorted(buckets, key=lambda b: b.effective_value, reverse=True):
+            if id(bkt) in selected_ids:
+                continue
+            selection.append(bkt)
+            if acc.is_sufficient(selection):
+                return selection
+        raise NotEnoughFunds()
+
+
+class _WeightAccumulator:
+    """Keeps track of the value and weight of a changing set of buckets
+    in O(1) per update, mirroring CoinChooserBase._get_tx_weight.
+    """
+
+    def __init__(self, target: SpendTarget, forced: Sequence[Bucket]):
+        self.target = target
+        self.value = target.input_value
+        self.weight = target.base_weight
+        self.num_witness = 0
+        self.num_legacy_coins = 0
+        self.num_buckets = 0
+        for bkt in forced:
+            self.add(bkt)
+
+    def add(self, bkt: Bucket) -> None:
+        self.value += bkt.value
+        self.weight += bkt.weight
+        self.num_buckets += 1
+        if bkt.witness:
+            self.num_witness += 1
+        else:
+            self.num_legacy_coins += len(bkt.coins)
+
+    def remove(self, bkt: Bucket) -> None:
+        self.value -= bkt.value
+        self.weight -= bkt.weight
+        self.num_buckets -= 1
+        if bkt.witness:
+            self.num_witness -= 1
+        else:
+            self.num_legacy_coins -= len(bkt.coins)
+
+    def weight_total(self) -> int:
+        if self.num_witness > 0:
+            return self.weight + 2 + self.num_legacy_coins
+        return self.weight
+
+    def excess_without_change(self) -> Optional[int]:
+        """Value left for the fee beyond what the estimator asks for,
+        or None if the current set is not sufficient.
+        """
+        if self.num_buckets == 0 and not self.target.has_fixed_inputs:
+            return None
+        excess = self.value - self.target.spent_amount - self.target.fee_estimator_w(self.weight_total())
+        return excess if excess >= 0 else None
+
+    def is_sufficient(self, extra: Sequence[Bucket]) -> bool:
+        for bkt in extra:
+            self.add(bkt)
+        try:
+            return self.excess_without_change() is not None
+        finally:
+            for bkt in extra:
+                self.remove(bkt)
+
+
 COIN_CHOOSERS = {
     'Privacy': CoinChooserPrivacy,
+    'BranchAndBound': CoinChooserBranchAndBound,
 }  # type: Mapping[str, Type[CoinChooserBase]]
 
 
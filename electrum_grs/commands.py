@@ -33,22 +33,19 @@ import binascii
 import base64
 import asyncio
 import inspect
+import itertools
 from asyncio import CancelledError
 from collections import defaultdict
 from functools import wraps
 from decimal import Decimal, InvalidOperation
-from typing import Optional, TYPE_CHECKING, Dict, List, Any, Union
+from typing import Optional, TYPE_CHECKING, Dict, List, Any, Union, Sequence, Callable, Tuple, Iterable
 import os
 import re
 
 import electrum_ecc as ecc
 
 from . import util
-from .lnmsg import OnionWireSerializer
-from .lnworker import LN_P2P_NETWORK_TIMEOUT
 from .logging import Logger
-from .onion_message import create_blinded_path, send_onion_message_to
-from .submarine_swaps import NostrTransport
 from .util import (
     bfh, json_decode, json_normalize, is_hash256_str, is_hex_str, to_bytes, parse_max_spend, to_decimal,
     UserFacingException, InvalidPassword
@@ -71,11 +68,12 @@ from .wallet import (
 from .address_synchronizer import TX_HEIGHT_LOCAL
 from .mnemonic import Mnemonic
 from .lnutil import (channel_id_from_funding_tx, LnFeatures, SENT, RECEIVED, MIN_FINAL_CLTV_DELTA_ACCEPTED,
-                     PaymentFeeBudget, NBLOCK_CLTV_DELTA_TOO_FAR_INTO_FUTURE)
+                     PaymentFeeBudget, NBLOCK_CLTV_DELTA_TOO_FAR_INTO_FUTURE, LN_P2P_NETWORK_TIMEOUT)
 from .plugin import run_hook, DeviceMgr, Plugins
 from .version import ELECTRUM_VERSION
 from .simple_config import SimpleConfig
 from .fee_policy import FeePolicy, FEE_ETA_TARGETS, FEERATE_DEFAULT_RELAY
+from .cost_basis import COST_BASIS_METHODS
 from . import GuiImportError
 from . import crypto
 from . import constants
@@ -113,6 +111,41 @@ def format_satoshis(x: Union[float, int, Decimal, None]) -> Optional[str]:
     return util.format_satoshis_plain(x, is_max_allowed=False)
 
 
+def paginate(items: Iterable, *, key: Callable[[Any], str], limit: Optional[int], cursor: Optional[str]) -> Tuple[list, Optional[str]]:
+    """Returns a page of at most `limit` items, starting after the item
+    designated by `cursor`, and the cursor for the next page (None if there is none).
+    A cursor is the position and key of the last returned item. The key
+    makes it robust to items being inserted or removed between calls.
+    Items are iterated until the page is full, so they can be a generator.
+    """
+    if limit is not None and limit < 1:
+        raise UserFacingException('limit must be positive')
+    start = 0
+    it = iter(items)
+    if cursor:
+        pos, _, last_key = cursor.partition(':')
+        try:
+            pos = int(pos)
+        except ValueError:
+            raise UserFacingException(f'invalid cursor: {cursor!r}') from None
+        if isinstance(items, Sequence) and 0 <= pos < len(items) and key(items[pos]) == last_key:
+            start = pos + 1
+            it = (items[i] for i in range(start, len(items)))
+        else:
+            for i, item in enumerate(it):
+                if key(item) == last_key:
+                    start = i + 1
+                    break
+            else:
+                raise UserFacingException(f'invalid cursor: {cursor!r}')
+    page = list(itertools.islice(it, limit))
+    next_cursor = None
+    sentinel = object()
+    if limit is not None and page and next(it, sentinel) is not sentinel:
+        next_cursor = f'{start + len(page) - 1}:{key(page[-1])}'
+    return page, next_cursor
+
+
 class Command:
     def __init__(self, func, name, s):
         self.name = name
@@ -415,6 +448,9 @@ class Commands(Logger):
         else:
             cv = self.config.cv.from_key(key)
             cv.set(value)
+        if self.daemon and key == SimpleConfig.FX_USE_EXCHANGE_RATE.key() and value:
+            # the daemon creates its fx thread on first use
+            self.daemon.fx.trigger_update()
 
     @command('')
     async def setconfig(self, key, value):
@@ -470,15 +506,22 @@ class Commands(Logger):
         return s
 
     @command('n')
-    async def getaddresshistory(self, address):
+    async def getaddresshistory(self, address, limit=None, cursor=None):
         """
         Return the transaction history of any address. Note: This is a
         walletless server query, results are not checked by SPV.
+        If limit or cursor is given, returns a page of results and the cursor of the next page.
 
         arg:str:address:Groestlcoin address
+        arg:int:limit:Maximum number of items to return
+        arg:str:cursor:Cursor returned by a previous call, to get the next page
         """
         sh = bitcoin.address_to_scripthash(address)
-        return await self.network.get_history_for_scripthash(sh)
+        hist = await self.network.get_history_for_scripthash(sh)
+        if limit is None and cursor is None:
+            return hist
+        items, next_cursor = paginate(hist, key=lambda x: x['tx_hash'], limit=limit, cursor=cursor)
+        return {'items': items, 'next_cursor': next_cursor}
 
     @command('wp')
     async def unlock(self, wallet: Abstract_Wallet = None, password=None):
@@ -486,15 +529,26 @@ class Commands(Logger):
         wallet.unlock(password)
 
     @command('w')
-    async def listunspent(self, wallet: Abstract_Wallet = None):
+    async def listunspent(self, limit=None, cursor=None, wallet: Abstract_Wallet = None):
         """List unspent outputs. Returns the list of unspent transaction
-        outputs in your wallet."""
+        outputs in your wallet.
+        If limit or cursor is given, returns a page of results and the cursor of the next page.
+
+        arg:int:limit:Maximum number of items to return
+        arg:str:cursor:Cursor returned by a previous call, to get the next page
+        """
+        utxos = wallet.get_utxos()
+        paginated = limit is not None or cursor is not None
+        if paginated:
+            utxos, next_cursor = paginate(utxos, key=lambda x: x.prevout.to_str(), limit=limit, cursor=cursor)
         coins = []
-        for txin in wallet.get_utxos():
+        for txin in utxos:
             d = txin.to_json()
             v = d.pop("value_sats")
             d["value"] = format_satoshis(v)
             coins.append(d)
+        if paginated:
+            return {'items': coins, 'next_cursor': next_cursor}
         return coins
 
     @command('n')
@@ -1033,17 +1087,20 @@ class Commands(Logger):
         return kwargs
 
     @command('w')
-    async def onchain_capital_gains(self, year=None, wallet: Abstract_Wallet = None):
+    async def onchain_capital_gains(self, year=None, method=None, wallet: Abstract_Wallet = None):
         """
-        Capital gains, using utxo pricing.
+        Capital gains of on-chain transactions.
         This cannot be used with lightning.
 
         arg:int:year:Show cap gains for a given year
+        arg:str:method:Cost basis method: utxo, average, fifo or lifo. Defaults to the config setting
         """
+        if method is not None and method not in COST_BASIS_METHODS:
+            raise UserFacingException(f"unknown cost basis method {method!r}. Choose from {', '.join(COST_BASIS_METHODS)}")
         kwargs = self.get_year_timestamps(year)
         from .exchange_rate import FxThread
         fx = self.daemon.fx if self.daemon else FxThread(config=self.config)
-        return json_normalize(wallet.get_onchain_capital_gains(fx, **kwargs))
+        return json_normalize(wallet.get_onchain_capital_gains(fx, method=method, **kwargs))
 
     @command('wp')
     async def bumpfee(self, tx, new_fee_rate, from_coins=None, decrease_payment=False, password=None, unsigned=False, wallet: Abstract_Wallet = None):
@@ -1085,16 +1142,19 @@ class Commands(Logger):
     @command('w')
     async def onchain_history(
         self, show_fiat=False, year=None, show_addresses=False,
-        from_height=None, to_height=None,
+        from_height=None, to_height=None, limit=None, cursor=None,
         wallet: Abstract_Wallet = None,
     ):
         """Wallet onchain history. Returns the transaction history of your wallet.
+        If limit or cursor is given, returns a page of results and the cursor of the next page.
 
         arg:bool:show_addresses:Show input and output addresses
         arg:bool:show_fiat:Show fiat value of transactions
         arg:int:year:Show history for a given year
         arg:int:from_height:Only show transactions that confirmed after(inclusive) given block height
         arg:int:to_height:Only show transactions that confirmed before(exclusive) given block height
+        arg:int:limit:Maximum number of items to return
+        arg:str:cursor:Cursor returned by a previous call, to get the next page
         """
         # trigger lnwatcher callbacks for their side effects: setting labels and accounting_addresses
         if not self.network and wallet.lnworker:
@@ -1103,11 +1163,20 @@ class Commands(Logger):
         kwargs = self.get_year_timestamps(year)
         kwargs['from_height'] = from_height
         kwargs['to_height'] = to_height
-        onchain_history = wallet.get_onchain_history(**kwargs)
-        out = [x.to_dict() for x in onchain_history.values()]
+        # note: the balance of an item, and its cost basis, depend on all the history before it,
+        # so the history of the whole wallet is built, and only the per-item work (to_dict,
+        # addresses, fiat values) is paged. The cost basis engine is updated incrementally,
+        # so that getting the next pages does not compute it again.
+        onchain_history = wallet.get_onchain_history(**kwargs).values()
+        paginated = limit is not None or cursor is not None
+        if paginated:
+            onchain_history, next_cursor = paginate(onchain_history, key=lambda x: x.txid, limit=limit, cursor=cursor)
+        out = [x.to_dict() for x in onchain_history]
         if show_fiat:
             from .exchange_rate import FxThread
             fx = self.daemon.fx if self.daemon else FxThread(config=self.config)
+            cost_basis = wallet.get_cost_basis(fx)
+            price_func = wallet.get_batched_price_func(fx, [item['timestamp'] for item in out])
         else:
             fx = None
         for item in out:
@@ -1117,15 +1186,39 @@ class Commands(Logger):
                 item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value_sat': x.value},
                                            tx.outputs()))
             if fx:
-                fiat_fields = wallet.get_tx_item_fiat(tx_hash=item['txid'], amount_sat=item['amount_sat'], fx=fx, tx_fee=item['fee_sat'])
+                fiat_fields = wallet.get_tx_item_fiat(
+                    tx_hash=item['txid'], amount_sat=item['amount_sat'], fx=fx, tx_fee=item['fee_sat'],
+                    cost_basis=cost_basis.get(item['txid']), price_func=price_func)
                 item.update(fiat_fields)
+        if paginated:
+            return json_normalize({'items': out, 'next_cursor': next_cursor})
         return json_normalize(out)
 
     @command('wl')
-    async def lightning_history(self, wallet: Abstract_Wallet = None):
-        """ lightning history. """
-        lightning_history = wallet.lnworker.get_lightning_history() if wallet.lnworker else {}
-        sorted_hist= sorted(lightning_history.values(), key=lambda x: x.timestamp)
+    async def lightning_history(
+        self, year=None, from_timestamp=None, to_timestamp=None, limit=None, cursor=None,
+        wallet: Abstract_Wallet = None,
+    ):
+        """ lightning history.
+        If limit or cursor is given, returns a page of results and the cursor of the next page.
+
+        arg:int:year:Show history for a given year
+        arg:int:from_timestamp:Only show items after(inclusive) given timestamp
+        arg:int:to_timestamp:Only show items before(exclusive) given timestamp
+        arg:int:limit:Maximum number of items to return
+        arg:str:cursor:Cursor returned by a previous call, to get the next page
+        """
+        kwargs = self.get_year_timestamps(year)
+        if from_timestamp is not None:
+            kwargs['from_timestamp'] = from_timestamp
+        if to_timestamp is not None:
+            kwargs['to_timestamp'] = to_timestamp
+        lightning_history = wallet.lnworker.get_lightning_history(**kwargs) if wallet.lnworker else {}
+        sorted_hist = sorted(lightning_history.values(), key=lambda x: (x.timestamp, x.payment_hash or x.group_id))
+        if limit is not None or cursor is not None:
+            key = lambda x: x.payment_hash or x.group_id
+            sorted_hist, next_cursor = paginate(sorted_hist, key=key, limit=limit, cursor=cursor)
+            return json_normalize({'items': [x.to_dict() for x in sorted_hist], 'next_cursor': next_cursor})
         return json_normalize([x.to_dict() for x in sorted_hist])
 
     @command('w')
@@ -1278,15 +1371,17 @@ class Commands(Logger):
             raise UserFacingException("Request not found")
         return wallet.export_invoice(r)
 
-    def _filter_invoices(self, _list, wallet, pending, expired, paid):
+    def _get_status_filter(self, pending, expired, paid) -> Optional[int]:
         if pending:
-            f = PR_UNPAID
+            return PR_UNPAID
         elif expired:
-            f = PR_EXPIRED
+            return PR_EXPIRED
         elif paid:
-            f = PR_PAID
-        else:
-            f = None
+            return PR_PAID
+        return None
+
+    def _filter_invoices(self, _list, wallet, pending, expired, paid):
+        f = self._get_status_filter(pending, expired, paid)
         if f is not None:
             _list = [x for x in _list if f == wallet.get_invoice_status(x)]
         return _list
@@ -1299,8 +1394,7 @@ class Commands(Logger):
         arg:bool:pending:Show only pending requests
         arg:bool:expired:Show only expired requests
         """
-        l = wallet.get_sorted_requests()
-        l = self._filter_invoices(l, wallet, pending, expired, paid)
+        l = wallet.get_sorted_requests(status=self._get_status_filter(pending, expired, paid))
         return [wallet.export_request(x) for x in l]
 
     @command('w')
@@ -1841,13 +1935,19 @@ class Commands(Logger):
         return wallet.lnworker.node_keypair.pubkey.hex() + (('@' + listen_addr) if listen_addr else '')
 
     @command('wl')
-    async def list_channels(self, public: bool = False, private: bool = False, active: bool = False, open: bool = False, wallet: Abstract_Wallet = None):
-        """Return the list of channels in the wallet
+    async def list_channels(
+        self, public: bool = False, private: bool = False, active: bool = False, open: bool = False,
+        limit=None, cursor=None, wallet: Abstract_Wallet = None,
+    ):
+        """Return the list of channels in the wallet.
+        If limit or cursor is given, returns a page of results and the cursor of the next page.
 
         arg:bool:public:list only public channels
         arg:bool:private:list only private channels
         arg:bool:open:list only open channels
         arg:bool:active:list only active channels
+        arg:int:limit:Maximum number of items to return
+        arg:str:cursor:Cursor returned by a previous call, to get the next page
         """
         from .lnutil import LOCAL, REMOTE, format_short_channel_id
         if public and private:
@@ -1863,7 +1963,11 @@ class Commands(Logger):
                 return False
             return True
 
-        return [
+        channels = (chan for chan in wallet.lnworker.channels.values() if _filter(chan))
+        paginated = limit is not None or cursor is not None
+        if paginated:
+            channels, next_cursor = paginate(channels, key=lambda x: x.funding_outpoint.to_str(), limit=limit, cursor=cursor)
+        out = [
             {
                 'short_channel_id': format_short_channel_id(chan.short_channel_id) if chan.short_channel_id else None,
                 'channel_id': chan.channel_id.hex(),
@@ -1880,23 +1984,38 @@ class Commands(Logger):
                 'remote_reserve': chan.config[LOCAL].reserve_sat,
                 'local_unsettled_sent': chan.balance_tied_up_in_htlcs_by_direction(LOCAL, direction=SENT) // 1000,
                 'remote_unsettled_sent': chan.balance_tied_up_in_htlcs_by_direction(REMOTE, direction=SENT) // 1000,
-            } for chan in wallet.lnworker.channels.values() if _filter(chan)
+            } for chan in channels
         ]
+        if paginated:
+            return {'items': out, 'next_cursor': next_cursor}
+        return out
 
     @command('wl')
-    async def list_channel_backups(self, wallet: Abstract_Wallet = None):
-        """Return the list of channel backups in the wallet"""
+    async def list_channel_backups(self, limit=None, cursor=None, wallet: Abstract_Wallet = None):
+        """Return the list of channel backups in the wallet.
+        If limit or cursor is given, returns a page of results and the cursor of the next page.
+
+        arg:int:limit:Maximum number of items to return
+        arg:str:cursor:Cursor returned by a previous call, to get the next page
+        """
         # FIXME: we need to be online to display capacity of backups
         from .lnutil import LOCAL, REMOTE, format_short_channel_id
-        return [
+        channels = wallet.lnworker.channel_backups.values()
+        paginated = limit is not None or cursor is not None
+        if paginated:
+            channels, next_cursor = paginate(channels, key=lambda x: x.funding_outpoint.to_str(), limit=limit, cursor=cursor)
+        out = [
             {
                 'short_channel_id': format_short_channel_id(chan.short_channel_id) if chan.short_channel_id else None,
                 'channel_id': chan.channel_id.hex(),
                 'channel_point': chan.funding_outpoint.to_str(),
                 'closing_txid': chan.get_closing_height()[0] if chan.get_closing_height() else None,
                 'state': chan.get_state().name,
-            } for chan in wallet.lnworker.channel_backups.values()
+            } for chan in channels
         ]
+        if paginated:
+            return {'items': out, 'next_cursor': next_cursor}
+        return out
 
     @command('wnl')
     async def enable_htlc_settle(self, b: bool, wallet: Abstract_Wallet = None):
@@ -2102,6 +2221,7 @@ class Commands(Logger):
 
         arg:int:query_time:Optional timeout how long the relays should be queried for provider announcements. Default: 15 sec
         """
+        from .submarine_swaps import NostrTransport
         sm = wallet.lnworker.swap_manager
         async with sm.create_transport() as transport:
             assert isinstance(transport, NostrTransport)
@@ -2270,6 +2390,7 @@ class Commands(Logger):
             'message': {'text': message.encode('utf-8')}
         }
 
+        from .onion_message import send_onion_message_to
         try:
             send_onion_message_to(wallet.lnworker, node_id_or_blinded_path, destination_payload)
             return {'success': True}
@@ -2290,6 +2411,8 @@ class Commands(Logger):
         arg:int:dummy_hops:Number of dummy hops to add
         """
         # TODO: allow introduction_point to not be a direct peer and construct a route
+        from .lnmsg import OnionWireSerializer
+        from .onion_message import create_blinded_path
         assert wallet
         assert node_id
 
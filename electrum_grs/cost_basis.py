@@ -0,0 +1,265 @@
+"""Cost basis of the coins in a wallet, for capital gains.
+
+Methods:
+ - 'utxo': a coin is acquired at the price of the tx that created it. Coins
+   created by a tx that spends our own coins inherit the average acquisition
+   price of its inputs. This is what Abstract_Wallet.average_price computes.
+   It needs the inputs of each tx, so it is on-chain only.
+ - 'average': all holdings form a single pool, and coins leaving the wallet
+   are charged the average acquisition price of the pool.
+ - 'fifo', 'lifo': each acquisition is a lot; coins leaving the wallet
+   consume the oldest (fifo) or the newest (lifo) lots first.
+
+The pooled methods only look at how the wallet balance changes, so the
+history can include lightning payments.
+
+The history is processed in a single pass. The engine keeps checkpoints of
+its state, so that when the history changes (new txs, a tx getting mined),
+only the events after the first change are processed again.
+"""
+
+import time
+from decimal import Decimal
+from typing import NamedTuple, Optional, Sequence, Tuple, List, Dict, Callable, Union, Any
+
+from .bitcoin import COIN
+
+
+COST_BASIS_METHODS = ('utxo', 'average', 'fifo', 'lifo')
+
+_NAN = Decimal('NaN')
+
+
+class CostBasisEvent(NamedTuple):
+    key: str  # txid, or lightning payment hash/group key
+    timestamp: Optional[int]  # None if unconfirmed
+    amount_sat: Union[int, Decimal]  # change of the wallet balance, msat precision for lightning
+    fiat_value: Optional[Decimal] = None  # set by the user
+    inputs: Tuple[Tuple[str, int], ...] = ()  # (prev_txid, value) of our inputs. 'utxo' method only
+
+
+class CostBasisResult(NamedTuple):
+    fiat_value: Decimal
+    acquisition_price: Optional[Decimal]  # for coins leaving the wallet
+    capital_gain: Optional[Decimal]
+    holding_sat: Union[int, Decimal, None]  # after the event. None for the 'utxo' method
+    holding_cost: Optional[Decimal]  # acquisition price of holding_sat
+
+
+def _is_nan(x: Optional[Decimal]) -> bool:
+    return x is not None and x.is_nan()
+
+
+class CostBasisEngine:
+
+    CHECKPOINT_INTERVAL = 1000
+
+    def __init__(
+            self,
+            method: str,
+            price_func: Callable[[float], Decimal],
+            rates_func: Callable[[Sequence[int]], List[Decimal]] = None,  # price_func, for many timestamps at once
+    ):
+        if method not in COST_BASIS_METHODS:
+            raise ValueError(f'unknown cost basis method: {method!r}')
+        self.method = method
+        self.price_func = price_func
+        self.rates_func = rates_func
+        self._events = []  # type: List[CostBasisEvent]
+        self._results = []  # type: List[CostBasisResult]
+        self._events_by_key = {}  # type: Dict[str, CostBasisEvent]
+        self._unit_costs = {}  # type: Dict[str, Decimal]  # txid -> fiat price of one coin created by txid
+        self._prices = {}  # type: Dict[Optional[int], Decimal]  # timestamp -> rate, for one update
+        self._first_nan = None  # type: Optional[int]  # index of the first result without a rate
+        self._reset_state()
+        self._checkpoints = [(0, self._snapshot())]  # type: List[Tuple[int, Any]]
+
+    def _reset_state(self):
+        self._holding_sat = 0
+        self._holding_cost = Decimal(0)
+        self._lots = []  # type: List[Tuple[Union[int, Decimal], Decimal]]  # (amount_sat, cost) not yet consumed (lifo)
+        self._head = 0  # fifo: first lot that is not fully consumed
+        self._used = 0  # fifo: amount consumed from the lot at _head
+
+    def _snapshot(self):
+        # fifo lots are only ever appended, lifo lots are popped from the end
+        lots = list(self._lots) if self.method == 'lifo' else len(self._lots)
+        return self._holding_sat, self._holding_cost, lots, self._head, self._used
+
+    def _restore(self, state):
+        self._holding_sat, self._holding_cost, lots, self._head, self._used = state
+        if self.method == 'lifo':
+            self._lots = list(lots)
+        else:
+            del self._lots[lots:]
+
+    def update(self, events: Sequence[CostBasisEvent]) -> List[CostBasisResult]:
+        """Returns the result of each event.
+        Events are processed from the first one that differs from the previous call.
+        """
+        self._prices = {}
+        self._events_by_key = {event.key: event for event in events}
+        start = 0
+        for old, new in zip(self._events, events):
+            if old != new:
+                break
+            start += 1
+        # retry events that had no exchange rate, if there is one now
+        if self._first_nan is not None and self._first_nan < start:
+            if not self._price(self._events[self._first_nan].timestamp).is_nan():
+                start = self._first_nan
+        if start < len(self._events):
+            while self._checkpoints[-1][0] > start:
+                self._checkpoints.pop()
+            start, state = self._checkpoints[-1]
+            self._restore(state)
+            for event in self._events[start:]:
+                self._unit_costs.pop(event.key, None)
+            del self._results[start:]
+            if self._first_nan is not None and self._first_nan >= start:
+                self._first_nan = None
+        self._events = list(events)
+        self._prefetch_prices(events[start:])
+        for i in range(start, len(events)):
+            result = self._process(events[i])
+            self._results.append(result)
+            if self._first_nan is None and (_is_nan(result.fiat_value) or _is_nan(result.acquisition_price)):
+                self._first_nan = i
+            if (i + 1) % self.CHECKPOINT_INTERVAL == 0:
+                self._checkpoints.append((i + 1, self._snapshot()))
+        return list(self._results)
+
+    def _prefetch_prices(self, events: Sequence[CostBasisEvent]) -> None:
+        if self.rates_func is None:
+            return
+        timestamps = list({event.timestamp for event in events
+                           if event.timestamp and event.fiat_value is None and event.timestamp not in self._prices})
+        if timestamps:
+            self._prices.update(zip(timestamps, self.rates_func(timestamps)))
+
+    def _price(self, timestamp: Optional[int]) -> Decimal:
+        price = self._prices.get(timestamp)
+        if price is None:
+            price = self._prices[timestamp] = self.price_func(timestamp if timestamp else time.time())
+        return price
+
+    def _process(self, event: CostBasisEvent) -> CostBasisResult:
+        amount = event.amount_sat
+        fiat_value = event.fiat_value
+        if fiat_value is None:
+            fiat_value = amount / Decimal(COIN) * self._price(event.timestamp)
+        acquisition_price = None
+        if self.method == 'utxo':
+            if amount < 0:
+                acquisition_price = - amount / Decimal(COIN) * self.unit_cost(event.key)
+        elif amount > 0:
+            self._acquire(amount, fiat_value)
+        elif amount < 0:
+            acquisition_price = self._dispose(-amount)
+        capital_gain = - fiat_value - acquisition_price if acquisition_price is not None else None
+        if self.method == 'utxo':
+            return CostBasisResult(fiat_value, acquisition_price, capital_gain, None, None)
+        return CostBasisResult(fiat_value, acquisition_price, capital_gain, self._holding_sat, self._holding_cost)
+
+    def _acquire(self, amount, cost: Decimal) -> None:
+        self._holding_sat += amount
+        self._holding_cost += cost
+        if self.method in ('fifo', 'lifo'):
+            self._lots.append((amount, cost))
+
+    def _dispose(self, amount) -> Decimal:
+        """Removes amount from the holdings, and returns its acquisition price.
+        Coins beyond the holdings (e.g. history not known) have no acquisition price.
+        """
+        amount = min(amount, self._holding_sat)
+        if amount <= 0:
+            return Decimal(0)
+        if self.method == 'average':
+            cost = self._holding_cost * amount / self._holding_sat
+        else:
+            cost = self._consume_lots(amount)
+        self._holding_sat -= amount
+        self._holding_cost -= cost
+        return cost
+
+    def _consume_lots(self, amount) -> Decimal:
+        lots = self._lots
+        cost = Decimal(0)
+        while amount > 0:
+            if self.method == 'fifo':
+                if self._head >= len(lots):
+                    break
+                lot_amount, lot_cost = lots[self._head]
+                available = lot_amount - self._used
+                taken = min(available, amount)
+                cost += lot_cost * taken / lot_amount
+                if taken < available:
+                    self._used += taken
+                else:
+                    self._used = 0
+                    self._head += 1
+            else:
+                # a lot acquired after a partial disposal goes on top of the
+                # partially consumed one, so lifo lots keep their own remainder
+                if not lots:
+                    break
+                lot_amount, lot_cost = lots[-1]
+                taken = min(lot_amount, amount)
+                taken_cost = lot_cost * taken / lot_amount
+                cost += taken_cost
+                if taken < lot_amount:
+                    lots[-1] = (lot_amount - taken, lot_cost - taken_cost)
+                else:
+                    lots.pop()
+            amount -= taken
+        return cost
+
+    def _has_inputs(self, txid: str) -> bool:
+        event = self._events_by_key.get(txid)
+        return event is not None and bool(event.inputs)
+
+    def unit_cost(self, txid: str) -> Decimal:
+        """Average acquisition price of the inputs of txid, per coin ('utxo' method)."""
+        unit_costs = self._unit_costs
+        if txid in unit_costs:
+            return unit_costs[txid]
+        if not self._has_inputs(txid):
+            return _NAN
+        # iterative, so that long chains of self-spends do not hit the recursion limit
+        stack = [txid]
+        while stack:
+            key = stack[-1]
+            if key in unit_costs:
+                stack.pop()
+                continue
+            inputs = self._events_by_key[key].inputs
+            missing = [prev for prev, v in inputs if prev not in unit_costs and self._has_inputs(prev)]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            unit_costs[key] = self._unit_cost_from_inputs(inputs)
+        return unit_costs[txid]
+
+    def _unit_cost_from_inputs(self, inputs: Sequence[Tuple[str, int]]) -> Decimal:
+        """Needs the unit cost of the inputs created by our own txs."""
+        input_value = 0
+        total_price = 0
+        for prev, v in inputs:
+            input_value += v
+            total_price += self.coin_cost(prev, v)
+        return total_price / (input_value / Decimal(COIN))
+
+    def coin_cost(self, txid: str, value: Optional[int]) -> Decimal:
+        """Acquisition price of a coin of the given value created by txid ('utxo' method)."""
+        if value is None:
+            return _NAN
+        unit_cost = self._unit_costs.get(txid)
+        if unit_cost is not None:
+            return unit_cost * value / Decimal(COIN)
+        event = self._events_by_key.get(txid)
+        if event is not None and event.inputs:
+            return self.unit_cost(txid) * value / Decimal(COIN)
+        if event is not None and event.fiat_value is not None:
+            return event.fiat_value
+        return self._price(event.timestamp if event else None) * value / Decimal(COIN)
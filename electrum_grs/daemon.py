@@ -41,6 +41,8 @@ from aiohttp import web, client_exceptions
 from aiorpcx import ignore_after
 
 from . import util
+from . import metrics
+from . import startup_trace
 from .network import Network
 from .util import (
     json_decode, to_bytes, to_string, profiler, standardize_path, constant_time_compare, InvalidPassword,
@@ -216,6 +218,8 @@ class AuthenticatedServer(Logger):
         self.auth_lock = asyncio.Lock()
         self._methods = {}  # type: Dict[str, Callable]
 
+    STREAM_CHUNK_SIZE = 64 * 1024
+
     def register_method(self, name: str, f):
         assert name not in self._methods, f"name collision for {name}"
         self._methods[name] = f
@@ -234,30 +238,75 @@ class AuthenticatedServer(Logger):
         username, _, password = credentials.partition(':')
         if not (constant_time_compare(username, self.rpc_user)
                 and constant_time_compare(password, self.rpc_password)):
-            await asyncio.sleep(0.050)
+            # only failed attempts are serialized, to slow down brute-forcing
+            async with self.auth_lock:
+                await asyncio.sleep(0.050)
             raise AuthenticationCredentialsInvalid('Invalid Credentials')
 
+    async def handle_metrics(self, request):
+        """Serves the metrics registry in the Prometheus text format."""
+        try:
+            await self.authenticate(request.headers)
+        except AuthenticationInvalidOrMissing:
+            return web.Response(headers={"WWW-Authenticate": "Basic realm=Electrum-GRS"},
+                                text='Unauthorized', status=401)
+        except AuthenticationCredentialsInvalid:
+            return web.Response(text='Forbidden', status=403)
+        return web.Response(text=metrics.REGISTRY.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Prometheus-Format-Version': '0.0.4'})
+
     async def handle(self, request):
-        async with self.auth_lock:
-            try:
-                await self.authenticate(request.headers)
-            except AuthenticationInvalidOrMissing:
-                return web.Response(headers={"WWW-Authenticate": "Basic realm=Electrum-GRS"},
-                                    text='Unauthorized', status=401)
-            except AuthenticationCredentialsInvalid:
-                return web.Response(text='Forbidden', status=403)
         try:
-            request = await request.text()
-            request = json.loads(request)
-            method = request['method']
-            _id = request['id']
-            params = request.get('params', [])  # type: Union[Sequence, Mapping]
-            if method not in self._methods:
-                raise Exception(f"attempting to use unregistered method: {method}")
-            f = self._methods[method]
+            await self.authenticate(request.headers)
+        except AuthenticationInvalidOrMissing:
+            return web.Response(headers={"WWW-Authenticate": "Basic realm=Electrum-GRS"},
+                                text='Unauthorized', status=401)
+        except AuthenticationCredentialsInvalid:
+            return web.Response(text='Forbidden', status=403)
+        try:
+            body = json.loads(await request.text())
+            if isinstance(body, list):
+                if not body:
+                    raise Exception("empty batch")
+            else:
+                # a single request is parsed upfront, to keep responding with
+                # a 500 to invalid ones
+                self._parse_request(body)
         except Exception as e:
             self.logger.exception("invalid request")
             return web.Response(text='Invalid Request', status=500)
+        stream = 'application/x-ndjson' in request.headers.get('Accept', '')
+        if isinstance(body, list):
+            # JSON-RPC 2.0 batch. the requests are run concurrently
+            if stream:
+                return await self._stream_responses(request, [self._handle_request(r) for r in body])
+            responses = await asyncio.gather(*[self._handle_request(r) for r in body])
+            return web.json_response(list(responses))
+        if stream:
+            return await self._stream_responses(request, [self._handle_request(body)])
+        return web.json_response(await self._handle_request(body))
+
+    def _parse_request(self, request) -> Tuple[Callable, Union[Sequence, Mapping], str]:
+        method = request['method']
+        _id = request['id']
+        params = request.get('params', [])  # type: Union[Sequence, Mapping]
+        if method not in self._methods:
+            raise Exception(f"attempting to use unregistered method: {method}")
+        return self._methods[method], params, _id
+
+    async def _handle_request(self, request) -> dict:
+        try:
+            f, params, _id = self._parse_request(request)
+        except Exception as e:
+            self.logger.info(f"invalid request in batch: {e!r}")
+            return {
+                'id': request.get('id') if isinstance(request, dict) else None,
+                'jsonrpc': '2.0',
+                'error': {
+                    'code': JsonRPCError.Codes.INVALID_REQUEST,
+                    'message': 'Invalid Request',
+                },
+            }
         response = {
             'id': _id,
             'jsonrpc': '2.0',
@@ -282,7 +331,43 @@ class AuthenticatedServer(Logger):
                     "traceback": "".join(traceback.format_exception(e)),
                 },
             }
-        return web.json_response(response)
+        return response
+
+    @staticmethod
+    def _iter_encode_response(response: dict):
+        """Encodes a JSON-RPC response in pieces. If the result is a list, its
+        items are encoded one at a time, so that large results are never held
+        in memory as a single string.
+        """
+        result = response.get('result')
+        if not isinstance(result, list):
+            yield json.dumps(response)
+            return
+        head = dict(response)
+        del head['result']
+        yield json.dumps(head)[:-1] + (', "result": [' if head else '"result": [')
+        for i, item in enumerate(result):
+            yield (', ' if i else '') + json.dumps(item)
+        yield ']}'
+
+    async def _stream_responses(self, request, coros) -> web.StreamResponse:
+        """Writes one JSON-RPC response per line (NDJSON), in the order they complete."""
+        resp = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await resp.prepare(request)
+        for fut in asyncio.as_completed(coros):
+            response = await fut
+            buf = []
+            buf_len = 0
+            for chunk in self._iter_encode_response(response):
+                buf.append(chunk)
+                buf_len += len(chunk)
+                if buf_len >= self.STREAM_CHUNK_SIZE:
+                    await resp.write(''.join(buf).encode('utf8'))
+                    buf, buf_len = [], 0
+            buf.append('\n')
+            await resp.write(''.join(buf).encode('utf8'))
+        await resp.write_eof()
+        return resp
 
 
 class CommandsServer(AuthenticatedServer):
@@ -312,6 +397,7 @@ class CommandsServer(AuthenticatedServer):
             for cmdname in known_commands:
                 self.register_method(cmdname, getattr(self.cmd_runner, cmdname))
             self.register_method('run_cmdline', self.run_cmdline)
+            self.app.router.add_get("/metrics", self.handle_metrics)
 
     def _socket_config_str(self) -> str:
         if self.socktype == 'unix':
@@ -352,6 +438,8 @@ class CommandsServer(AuthenticatedServer):
         self.logger.info(
             f"now running and listening. socktype={self.socktype}, addr={addr}. "
             f"only_minimal_jsonrpc={self._only_minimal_jsonrpc}")
+        startup_trace.mark('jsonrpc_ready')
+        startup_trace.write_report()
 
     async def ping(self):
         return True
@@ -422,8 +510,11 @@ class Daemon(Logger):
         self._plugins = None  # type: Optional[Plugins]
         self.asyncio_loop = util.get_asyncio_loop()
         if not self.config.NETWORK_OFFLINE:
-            self.network = Network(config, daemon=self)
-        self.fx = FxThread(config=config)
+            with startup_trace.span('network'):
+                self.network = Network(config, daemon=self)
+        self._fx = None  # type: Optional[FxThread]  # created on first use
+        self._fx_lock = threading.Lock()
+        self._fx_created = asyncio.Event()
         # wallet_key -> wallet
         self._wallets = {}  # type: Dict[str, Abstract_Wallet]
         self._wallet_lock = threading.RLock()
@@ -435,13 +526,29 @@ class Daemon(Logger):
         self.taskgroup = OldTaskGroup()
         asyncio.run_coroutine_threadsafe(self._run(), self.asyncio_loop)
         if start_network and self.network:
-            self.start_network()
+            with startup_trace.span('network.start'):
+                self.start_network()
         # Setup commands server
         self.commands_server = None
         if listen_jsonrpc:
             self.commands_server = CommandsServer(self, fd, only_minimal_jsonrpc=only_minimal_jsonrpc)
             asyncio.run_coroutine_threadsafe(self.taskgroup.spawn(self.commands_server.run()), self.asyncio_loop)
 
+    @property
+    def fx(self) -> FxThread:
+        with self._fx_lock:
+            if self._fx is None:
+                with startup_trace.span('fx'):
+                    self._fx = FxThread(config=self.config)
+                self.asyncio_loop.call_soon_threadsafe(self._fx_created.set)
+            return self._fx
+
+    async def _run_fx(self):
+        # the fx thread is created when first used (see setconfig for exchange rates getting enabled)
+        if not self.config.FX_USE_EXCHANGE_RATE:
+            await self._fx_created.wait()
+        await self.fx.run()
+
     @log_exceptions
     async def _run(self):
         self.logger.info("starting taskgroup.")
@@ -461,10 +568,8 @@ class Daemon(Logger):
         self.logger.info(f"starting network.")
         assert not self.config.NETWORK_OFFLINE
         assert self.network
-        self.network.start(jobs=[self.fx.run])
-        # prepare lightning functionality, also load channel db early
-        if self.config.LIGHTNING_USE_GOSSIP:
-            self.network.start_gossip()
+        self.network.start(jobs=[self._run_fx])
+        # note: the channel db is loaded when a wallet with lightning is added, see add_wallet
 
     @staticmethod
     def _wallet_key_from_path(path) -> str:
@@ -518,8 +623,9 @@ class Daemon(Logger):
             if self.config.get('wallet_path') is None:
                 self.config.CURRENT_WALLET = path
             return wallet
-        wallet = self._load_wallet(
-            path, password, upgrade=upgrade, config=self.config, force_check_password=force_check_password)
+        with startup_trace.span('wallet'):
+            wallet = self._load_wallet(
+                path, password, upgrade=upgrade, config=self.config, force_check_password=force_check_password)
         if self.network:
             wallet.start_network(self.network)
         elif wallet.lnworker:
@@ -565,6 +671,9 @@ class Daemon(Logger):
         path = wallet.storage.get_path()
         wallet_key = self._wallet_key_from_path(path)
         self._wallets[wallet_key] = wallet
+        if wallet.lnworker and wallet.network:
+            # prepare lightning functionality, also load channel db
+            wallet.network.start_gossip()
         run_hook('daemon_wallet_loaded', self, wallet)
 
     def get_wallet(self, path: str) -> Optional[Abstract_Wallet]:
@@ -623,7 +732,8 @@ class Daemon(Logger):
             self.logger.warning("Ignoring parameter 'wallet_path' for daemon. "
                                 "Use the load_wallet command instead.")
         # init plugins
-        self._plugins = Plugins(self.config, 'cmdline')
+        with startup_trace.span('plugins'):
+            self._plugins = Plugins(self.config, 'cmdline')
         # block until we are stopping
         try:
             self._stopping_soon_or_errored.wait()
@@ -664,6 +774,8 @@ class Daemon(Logger):
             if self.listen_jsonrpc:
                 self.logger.info("removing lockfile")
                 remove_lockfile(get_lockfile(self.config))
+            # again, with the subsystems that were initialized on first use
+            startup_trace.write_report()
             self.logger.info("stopped")
             self._stopped_event.set()
 
@@ -197,6 +197,7 @@ class PubkeyProvider(object):
             self.extkey = BIP32Node.from_xkey(pubkey, allow_custom_headers=False)
         if deriv_path and self.extkey is None:
             raise ValueError("deriv_path suffix present for simple pubkey")
+        self._pubkey_bytes = None  # type: Optional[bytes]  # cached, if not ranged
 
     @classmethod
     def parse(cls, s: str) -> 'PubkeyProvider':
@@ -240,6 +241,13 @@ class PubkeyProvider(object):
         if self.is_range() and pos is None:
             raise ValueError("pos must be set for ranged descriptor")
         # note: if not ranged, we ignore pos.
+        if self.is_range():
+            return self._get_pubkey_bytes(pos=pos)
+        if self._pubkey_bytes is None:
+            self._pubkey_bytes = self._get_pubkey_bytes(pos=None)
+        return self._pubkey_bytes
+
+    def _get_pubkey_bytes(self, *, pos: Optional[int] = None) -> bytes:
         if self.extkey is not None:
             compressed = True  # bip32 implies compressed pubkeys
             if self.deriv_path is None:
@@ -328,6 +336,7 @@ class Descriptor(object):
         self.pubkeys = pubkeys
         self.subdescriptors = subdescriptors
         self.name = name
+        self._expanded = None  # type: Optional[ExpandedScripts]  # cached, if not ranged
 
     def to_string_no_checksum(self) -> str:
         """
@@ -352,7 +361,18 @@ class Descriptor(object):
     def expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
         """
         Returns the scripts for a descriptor at the given `pos` for ranged descriptors.
+
+        For descriptors that are not ranged, the result is cached, as it is needed
+        several times for each txin (see PartialTxInput.script_descriptor) and
+        deriving child pubkeys from xpubs is slow. The result must not be modified.
         """
+        if self.is_range():
+            return self._expand(pos=pos)
+        if self._expanded is None:
+            self._expanded = self._expand(pos=None)
+        return self._expanded
+
+    def _expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
         raise NotImplementedError("The Descriptor base class does not implement this method")
 
     def _satisfy_inner(
@@ -473,7 +493,7 @@ class PKDescriptor(Descriptor):
         """
         super().__init__([pubkey], [], "pk")
 
-    def expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
+    def _expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
         pubkey = self.pubkeys[0].get_pubkey_bytes(pos=pos)
         script = construct_script([pubkey, opcodes.OP_CHECKSIG])
         return ExpandedScripts(output_script=script)
@@ -514,7 +534,7 @@ class PKHDescriptor(Descriptor):
         """
         super().__init__([pubkey], [], "pkh")
 
-    def expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
+    def _expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
         pubkey = self.pubkeys[0].get_pubkey_bytes(pos=pos)
         pkh = hash_160(pubkey)
         script = bitcoin.pubkeyhash_to_p2pkh_script(pkh)
@@ -556,7 +576,7 @@ class WPKHDescriptor(Descriptor):
         """
         super().__init__([pubkey], [], "wpkh")
 
-    def expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
+    def _expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
         pkh = hash_160(self.pubkeys[0].get_pubkey_bytes(pos=pos))
         output_script = construct_script([0, pkh])
         scriptcode = bitcoin.pubkeyhash_to_p2pkh_script(pkh)
@@ -624,7 +644,7 @@ class MultisigDescriptor(Descriptor):
     def to_string_no_checksum(self) -> str:
         return "{}({},{})".format(self.name, self.thresh, ",".join([p.to_string() for p in self.pubkeys]))
 
-    def expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
+    def _expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
         der_pks = [p.get_pubkey_bytes(pos=pos) for p in self.pubkeys]
         if self.is_sorted:
             der_pks.sort()
@@ -676,7 +696,7 @@ class SHDescriptor(Descriptor):
         """
         super().__init__([], [subdescriptor], "sh")
 
-    def expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
+    def _expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
         assert len(self.subdescriptors) == 1
         sub_scripts = self.subdescriptors[0].expand(pos=pos)
         redeem_script = sub_scripts.output_script
@@ -723,7 +743,7 @@ class WSHDescriptor(Descriptor):
         """
         super().__init__([], [subdescriptor], "wsh")
 
-    def expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
+    def _expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
         assert len(self.subdescriptors) == 1
         sub_scripts = self.subdescriptors[0].expand(pos=pos)
         witness_script = sub_scripts.output_script
@@ -802,7 +822,7 @@ class TRDescriptor(Descriptor):
         return True
 
     # TODO add more test vectors from BIP-0386
-    def expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
+    def _expand(self, *, pos: Optional[int] = None) -> "ExpandedScripts":
         internal_pubkey = self.pubkeys[0].get_pubkey_bytes(pos=pos)
         script_tree = None
         if self.desc_tree:
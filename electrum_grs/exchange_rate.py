@@ -8,12 +8,13 @@ import time
 import csv
 import decimal
 from decimal import Decimal
-from typing import Sequence, Optional, Mapping, Dict, Union, Tuple
+from typing import Sequence, Optional, Mapping, Dict, Union, Tuple, List
 
 from aiorpcx.curio import timeout_after, ignore_after
 import aiohttp
 
 from . import util
+from . import fx_history
 from .bitcoin import COIN
 from .i18n import _
 from .util import (
@@ -24,6 +25,7 @@ from .util import NetworkRetryManager
 from .network import Network
 from .simple_config import SimpleConfig
 from .logging import Logger
+from .fx_history import HistoricalRates
 
 
 # See https://en.wikipedia.org/wiki/ISO_4217
@@ -46,7 +48,7 @@ class ExchangeBase(Logger):
 
     def __init__(self, on_quotes, on_history):
         Logger.__init__(self)
-        self._history = {}  # type: Dict[str, Dict[str, str | float]]
+        self._history = {}  # type: Dict[str, HistoricalRates]
         self._quotes = {}  # type: Dict[str, Optional[Decimal]]
         self._quotes_timestamp = 0  # type: Union[int, float]
         self.on_quotes = on_quotes
@@ -98,53 +100,14 @@ class ExchangeBase(Logger):
             self._quotes_timestamp = time.time()
             self.on_quotes(received_new_data=True)
 
-    @staticmethod
-    def _read_historical_rates_from_file(
-        *, exchange_name: str, ccy: str, cache_dir: str,
-    ) -> Tuple[Optional[Dict[str, str]], Optional[float]]:
-        filename = os.path.join(cache_dir, f"{exchange_name}_{ccy}")
-        if not os.path.exists(filename):
-            return None, None
-        timestamp = os.stat(filename).st_mtime
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                h = json.loads(f.read())
-        except Exception:
-            return None, None
-        if not h:  # e.g. empty dict
-            return None, None
-        # cast rates to str
-        h = {date_str: str(rate) for (date_str, rate) in h.items()}
-        return h, timestamp
-
-    def read_historical_rates(self, ccy: str, cache_dir: str) -> Optional[dict]:
-        h, timestamp = self._read_historical_rates_from_file(
-            exchange_name=self.name(),
-            ccy=ccy,
-            cache_dir=cache_dir,
-        )
+    def read_historical_rates(self, ccy: str, cache_dir: str) -> Optional[HistoricalRates]:
+        h = fx_history.read_historical_rates(cache_dir, self.name(), ccy)
         if not h:
             return None
-        assert timestamp is not None
-        h['timestamp'] = timestamp
         self._history[ccy] = h
         self.on_history()
         return h
 
-    @staticmethod
-    def _write_historical_rates_to_file(
-        *, exchange_name: str, ccy: str, cache_dir: str, history: Dict[str, str],
-    ) -> None:
-        # sanity check types of history dict
-        assert 'timestamp' not in history
-        for key, rate in history.items():
-            assert isinstance(key, str), f"{exchange_name=}. {ccy=}. {key=!r}. {rate=!r}"
-            assert isinstance(rate, str), f"{exchange_name=}. {ccy=}. {key=!r}. {rate=!r}"
-        # write to file
-        filename = os.path.join(cache_dir, f"{exchange_name}_{ccy}")
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(json.dumps(history, sort_keys=True))
-
     @log_exceptions
     async def get_historical_rates_safe(self, ccy: str, cache_dir: str) -> None:
         try:
@@ -157,19 +120,17 @@ class ExchangeBase(Logger):
         except Exception as e:
             self.logger.exception(f"failed fx history: {repr(e)}")
             return
-        # cast rates to str
-        h_new = {date_str: str(rate) for (date_str, rate) in h_new.items()}  # type: Dict[str, str]
+        h_new = HistoricalRates.from_dict(h_new, timestamp=time.time())
         # merge old history and new history. resolve duplicate dates using new data.
-        h_old, _timestamp = self._read_historical_rates_from_file(
-            exchange_name=self.name(), ccy=ccy, cache_dir=cache_dir,
-        )
-        h_old = h_old or {}
-        h = {**h_old, **h_new}
-        # write merged data to disk cache
-        self._write_historical_rates_to_file(
-            exchange_name=self.name(), ccy=ccy, cache_dir=cache_dir, history=h,
-        )
-        h['timestamp'] = time.time()  # note: this is the only item in h that has a float value
+        h_old = self._history.get(ccy) or fx_history.read_historical_rates(cache_dir, self.name(), ccy)
+        h, first_change = h_old.merge(h_new) if h_old else (h_new, 0)
+        # write merged data to disk cache. usually only the last few days change
+        filename = fx_history.rates_filename(cache_dir, self.name(), ccy)
+        if first_change is not None:
+            h.write(filename, start=first_change)
+        elif os.path.exists(filename):
+            os.utime(filename)  # the file's mtime tells when the rates were fetched
+        h.timestamp = h_new.timestamp
         self._history[ccy] = h
         self.on_history()
 
@@ -179,20 +140,31 @@ class ExchangeBase(Logger):
         h = self._history.get(ccy)
         if h is None:
             h = self.read_historical_rates(ccy, cache_dir)
-        if h is None or h['timestamp'] < time.time() - 24*3600:
+        if h is None or h.timestamp < time.time() - 24*3600:
             util.get_asyncio_loop().create_task(self.get_historical_rates_safe(ccy, cache_dir))
 
     def history_ccys(self) -> Sequence[str]:
         return []
 
     def historical_rate(self, ccy: str, d_t: datetime) -> Decimal:
-        date_str = d_t.strftime('%Y-%m-%d')
-        rate = self._history.get(ccy, {}).get(date_str) or 'NaN'
-        try:
-            return Decimal(rate)
-        except Exception:  # guard against garbage coming from exchange
-            #self.logger.debug(f"found corrupted historical_rate: {rate=!r}. for {ccy=} at {date_str}")
+        h = self._history.get(ccy)
+        if h is None:
+            return Decimal('NaN')
+        return h.rate_for_day(fx_history.datetime_to_day(d_t))
+
+    def historical_rate_for_day(self, ccy: str, day: int) -> Decimal:
+        """day is the number of days since the epoch, see fx_history.timestamp_to_day"""
+        h = self._history.get(ccy)
+        if h is None:
             return Decimal('NaN')
+        return h.rate_for_day(day)
+
+    def historical_rates_for_days(self, ccy: str, days: Sequence[Optional[int]]) -> List[Decimal]:
+        """Same as historical_rate_for_day, for many days at once."""
+        h = self._history.get(ccy)
+        if h is None:
+            return [Decimal('NaN')] * len(days)
+        return h.rates_for_days(days)
 
     async def request_history(self, ccy: str) -> Dict[str, Union[str, float]]:
         raise NotImplementedError()  # implemented by subclasses
@@ -552,9 +524,32 @@ class FxThread(ThreadJob, EventListener, NetworkRetryManager[str]):
         return self.fiat_value(satoshis, self.history_rate(d_t))
 
     def timestamp_rate(self, timestamp: Optional[int]) -> Decimal:
-        from .util import timestamp_to_datetime
-        date = timestamp_to_datetime(timestamp)
-        return self.history_rate(date)
+        if timestamp is None:
+            return Decimal('NaN')
+        day = fx_history.timestamp_to_day(timestamp, util.DEFAULT_TIMEZONE)
+        rate = self.exchange.historical_rate_for_day(self.ccy, day)
+        if rate.is_nan():
+            rate = self._recent_spot_rate(day)
+        return rate
+
+    def rates_for_timestamps(self, timestamps: Sequence[Optional[int]]) -> List[Decimal]:
+        """Same as timestamp_rate, for many timestamps at once."""
+        days = fx_history.timestamps_to_days(timestamps, util.DEFAULT_TIMEZONE)
+        rates = self.exchange.historical_rates_for_days(self.ccy, days)
+        for i, rate in enumerate(rates):
+            if rate.is_nan() and days[i] is not None:
+                rates[i] = self._recent_spot_rate(days[i])
+        return rates
+
+    def _recent_spot_rate(self, day: int) -> Decimal:
+        # Frequently there is no rate for today, until tomorrow :)
+        # Use spot quotes in that case, see history_rate
+        today = fx_history.timestamp_to_day(time.time(), util.DEFAULT_TIMEZONE)
+        if today - day > 2:
+            return Decimal('NaN')
+        rate = self.exchange.get_cached_spot_quote(self.ccy)
+        self.history_used_spot = True
+        return Decimal(rate if rate is not None else 'NaN')
 
 
 assert globals().get(SimpleConfig.FX_EXCHANGE.get_default_value()), f"default exchange {SimpleConfig.FX_EXCHANGE.get_default_value()} does not exist"
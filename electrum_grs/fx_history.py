@@ -0,0 +1,270 @@
+"""Historical exchange rates, indexed by day.
+
+Exchanges give us one rate per day, as a dict of 'YYYY-MM-DD' -> rate.
+We store the rates of a currency as an array of int64, one per day,
+starting at first_day (days since the epoch, in the timezone of the dates).
+A lookup is an index into that array.
+
+A rate is stored as a decimal float: the high 56 bits are the coefficient
+and the low 8 bits the exponent, biased by 128. A rate that does not fit
+is rounded to 16 significant digits. 0 means there is no rate for that day.
+
+The cache file has a 16 byte header (magic, version, first_day), followed
+by the array, little-endian. It is read with a single read, and when newer
+rates come in, only the days from the first change onwards are written.
+Older versions of Electrum kept the rates in a JSON file; such files are
+converted the first time they are read.
+"""
+
+import array
+import decimal
+import json
+import os
+import struct
+import sys
+import time
+from datetime import date, datetime, timezone, tzinfo
+from decimal import Decimal
+from typing import Dict, Optional, Sequence, List, Tuple, Union
+
+from .logging import get_logger
+
+
+_logger = get_logger(__name__)
+
+MAGIC = b'EFXR'
+VERSION = 1
+HEADER = struct.Struct('<4sB3xq')  # magic, version, first_day
+assert HEADER.size == 16
+
+NO_RATE = 0
+EXPONENT_BIAS = 128
+MAX_COEFFICIENT = 2 ** 55
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+_NAN = Decimal('NaN')
+_ROUNDING_CONTEXT = decimal.Context(prec=16)
+
+
+def encode_rate(rate: Union[str, float, Decimal]) -> int:
+    try:
+        rate = Decimal(str(rate))
+    except decimal.InvalidOperation:  # garbage coming from exchange
+        return NO_RATE
+    if not rate.is_finite():
+        return NO_RATE
+    sign, digits, exponent = rate.as_tuple()
+    coefficient = int(''.join(map(str, digits)))
+    if coefficient >= MAX_COEFFICIENT:
+        sign, digits, exponent = _ROUNDING_CONTEXT.plus(rate).as_tuple()
+        coefficient = int(''.join(map(str, digits)))
+    if not -EXPONENT_BIAS <= exponent < EXPONENT_BIAS:
+        return NO_RATE
+    return ((-coefficient if sign else coefficient) << 8) | (exponent + EXPONENT_BIAS)
+
+
+def decode_rate(value: int) -> Decimal:
+    if value == NO_RATE:
+        return _NAN
+    return Decimal(value >> 8).scaleb((value & 0xff) - EXPONENT_BIAS)
+
+
+def date_to_day(date_str: str) -> int:
+    return date.fromisoformat(date_str).toordinal() - EPOCH_ORDINAL
+
+
+def datetime_to_day(d_t: datetime) -> int:
+    return d_t.toordinal() - EPOCH_ORDINAL
+
+
+_local_offsets = {}  # type: Dict[int, int]  # quarter of an hour -> utc offset
+_local_offsets_tzname = None
+
+
+def _local_utc_offset(timestamp: Union[int, float]) -> int:
+    """UTC offset of the local timezone at timestamp, including daylight saving time.
+    Offsets only change at timezone transitions, which happen at a multiple of 15 minutes.
+    """
+    global _local_offsets_tzname
+    if _local_offsets_tzname != time.tzname:  # time.tzset was called
+        _local_offsets.clear()
+        _local_offsets_tzname = time.tzname
+    quarter = int(timestamp // 900)
+    offset = _local_offsets.get(quarter)
+    if offset is None:
+        if len(_local_offsets) > 100_000:
+            _local_offsets.clear()
+        offset = _local_offsets[quarter] = time.localtime(quarter * 900).tm_gmtoff
+    return offset
+
+
+def timestamp_to_day(timestamp: Union[int, float], tz: Optional[tzinfo]) -> int:
+    """Day of timestamp, in tz (None means the local timezone), like timestamp_to_datetime."""
+    if tz is None:
+        return int((timestamp + _local_utc_offset(timestamp)) // 86400)
+    if isinstance(tz, timezone):
+        return int((timestamp + tz.utcoffset(None).total_seconds()) // 86400)
+    return datetime_to_day(datetime.fromtimestamp(timestamp, tz=tz))
+
+
+def timestamps_to_days(
+        timestamps: Sequence[Union[int, float, None]],
+        tz: Optional[tzinfo],
+) -> List[Optional[int]]:
+    if isinstance(tz, timezone):
+        offset = int(tz.utcoffset(None).total_seconds())
+        return [int((ts + offset) // 86400) if ts is not None else None for ts in timestamps]
+    return [timestamp_to_day(ts, tz) if ts is not None else None for ts in timestamps]
+
+
+class HistoricalRates:
+
+    def __init__(self, first_day: int = 0, values: Sequence[int] = (), *, timestamp: float = 0):
+        self.first_day = first_day
+        self.values = array.array('q', values)
+        self.timestamp = timestamp  # when the rates were fetched
+        self._decoded = {}  # type: Dict[int, Decimal]
+
+    @classmethod
+    def from_dict(cls, history: Dict[str, Union[str, float]], *, timestamp: float = 0) -> 'HistoricalRates':
+        """history is a dict of 'YYYY-MM-DD' -> rate, as returned by ExchangeBase.request_history"""
+        rates = {}
+        for date_str, rate in history.items():
+            try:
+                day = date_to_day(date_str)
+            except (TypeError, ValueError):
+                continue
+            rates[day] = encode_rate(rate)
+        if not rates:
+            return cls(timestamp=timestamp)
+        first_day = min(rates)
+        values = [NO_RATE] * (max(rates) - first_day + 1)
+        for day, value in rates.items():
+            values[day - first_day] = value
+        return cls(first_day, values, timestamp=timestamp)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __bool__(self):
+        return any(self.values)
+
+    def rate_for_day(self, day: Optional[int]) -> Decimal:
+        if day is None:
+            return _NAN
+        i = day - self.first_day
+        rate = self._decoded.get(i)
+        if rate is None:
+            if not 0 <= i < len(self.values):
+                return _NAN
+            rate = self._decoded[i] = decode_rate(self.values[i])
+        return rate
+
+    def rates_for_days(self, days: Sequence[Optional[int]]) -> List[Decimal]:
+        return [self.rate_for_day(day) for day in days]
+
+    def merge(self, other: 'HistoricalRates') -> Tuple['HistoricalRates', Optional[int]]:
+        """Returns the merged rates, and the index of the first value that changed.
+        Days without rate in other keep the rate of self.
+        """
+        if not self.values:
+            return other, 0
+        if not other.values:
+            return self, None
+        first_day = min(self.first_day, other.first_day)
+        last_day = max(self.first_day + len(self.values), other.first_day + len(other.values))
+        values = array.array('q', [NO_RATE]) * (last_day - first_day)
+        start = self.first_day - first_day
+        values[start:start + len(self.values)] = self.values
+        first_change = None
+        offset = other.first_day - first_day
+        for i, value in enumerate(other.values, start=offset):
+            if value != NO_RATE and values[i] != value:
+                values[i] = value
+                if first_change is None:
+                    first_change = i
+        if first_day != self.first_day:
+            first_change = 0
+        elif first_change is None and len(values) != len(self.values):
+            first_change = len(self.values)
+        return HistoricalRates(first_day, values, timestamp=other.timestamp), first_change
+
+    @classmethod
+    def read(cls, filename: str) -> Optional['HistoricalRates']:
+        try:
+            with open(filename, 'rb') as f:
+                header = f.read(HEADER.size)
+                data = f.read()
+            timestamp = os.stat(filename).st_mtime
+        except OSError:
+            return None
+        if len(header) != HEADER.size:
+            return None
+        magic, version, first_day = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            return None
+        values = array.array('q')
+        # ignore a partially written value at the end
+        values.frombytes(data[:len(data) - len(data) % values.itemsize])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return cls(first_day, values, timestamp=timestamp)
+
+    def write(self, filename: str, *, start: int = 0) -> None:
+        """Writes the values from index start onwards. Writes the whole file if start is 0."""
+        values = self.values
+        if sys.byteorder == 'big':
+            values = array.array('q', values)
+            values.byteswap()
+        if start == 0 or not os.path.exists(filename):
+            tmp = filename + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, self.first_day))
+                values.tofile(f)
+            os.replace(tmp, filename)
+            return
+        with open(filename, 'r+b') as f:
+            f.seek(HEADER.size + start * values.itemsize)
+            f.write(values[start:].tobytes())
+            f.truncate()
+
+
+def rates_filename(cache_dir: str, exchange_name: str, ccy: str) -> str:
+    return os.path.join(cache_dir, f"{exchange_name}_{ccy}.rates")
+
+
+def read_historical_rates(cache_dir: str, exchange_name: str, ccy: str) -> Optional[HistoricalRates]:
+    filename = rates_filename(cache_dir, exchange_name, ccy)
+    rates = HistoricalRates.read(filename)
+    if rates is None:
+        rates = _migrate_json_rates(cache_dir, exchange_name, ccy)
+    return rates if rates else None
+
+
+def _migrate_json_rates(cache_dir: str, exchange_name: str, ccy: str) -> Optional[HistoricalRates]:
+    json_filename = os.path.join(cache_dir, f"{exchange_name}_{ccy}")
+    try:
+        with open(json_filename, 'r', encoding='utf-8') as f:
+            history = json.loads(f.read())
+        timestamp = os.stat(json_filename).st_mtime
+    except Exception:
+        return None
+    if not isinstance(history, dict) or not history:
+        return None
+    rates = HistoricalRates.from_dict(history, timestamp=timestamp)
+    if not rates:
+        return None
+    filename = rates_filename(cache_dir, exchange_name, ccy)
+    try:
+        rates.write(filename)
+        # keep the age of the data, so that it gets refreshed when due
+        os.utime(filename, (timestamp, timestamp))
+    except OSError as e:
+        _logger.info(f"failed to convert fx history cache {json_filename}: {e!r}")
+    else:
+        _logger.info(f"converted fx history cache {json_filename}")
+    return rates
+
+
+def write_historical_rates(cache_dir: str, exchange_name: str, ccy: str, rates: HistoricalRates, *, start: int = 0):
+    rates.write(rates_filename(cache_dir, exchange_name, ccy), start=start)
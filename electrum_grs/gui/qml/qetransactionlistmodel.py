@@ -5,6 +5,7 @@ from PyQt6.QtCore import pyqtProperty, pyqtSignal, pyqtSlot
 from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex
 
 from electrum_grs.logging import get_logger
+from electrum_grs.lrucache import LRUCache
 from electrum_grs.util import Satoshis, TxMinedInfo
 from electrum_grs.address_synchronizer import TX_HEIGHT_FUTURE, TX_HEIGHT_LOCAL
 
@@ -27,6 +28,11 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
     _ROLE_MAP  = dict(zip(_ROLE_KEYS, [bytearray(x.encode()) for x in _ROLE_NAMES]))
     _ROLE_RMAP = dict(zip(_ROLE_NAMES, _ROLE_KEYS))
 
+    # rows are handed to the view in pages, as it scrolls (see fetchMore)
+    PAGE_SIZE = 100
+    # number of rows kept converted by tx_to_model
+    CACHE_SIZE = 1000
+
     requestRefresh = pyqtSignal()
 
     def __init__(self, wallet: 'Abstract_Wallet', parent=None, *, onchain_domain=None, include_lightning=True):
@@ -35,7 +41,10 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
         self.onchain_domain = onchain_domain
         self.include_lightning = include_lightning
 
-        self.tx_history = []
+        self.tx_history = []  # tx_items as returned by the wallet, newest first
+        self._key_to_row = {}  # type: Dict[str, int]
+        self._num_fetched = 0  # rows exposed to the view
+        self._model_items = LRUCache(maxsize=self.CACHE_SIZE)  # type: LRUCache[int, Dict[str, Any]]  # row->model item
 
         self.register_callbacks()
         self.destroyed.connect(lambda: self.on_destroy())
@@ -58,29 +67,21 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
         if adb != self.wallet.adb:
             return
         self._logger.debug(f'adb_set_future_tx event for txid {txid}')
-        for i, item in enumerate(self.tx_history):
-            if 'txid' in item and item['txid'] == txid:
-                self._update_future_txitem(i)
-                return
+        row = self._key_to_row.get(txid)
+        if row is not None:
+            self._update_future_txitem(row)
 
     @qt_event_listener
     def on_event_fee_histogram(self, histogram):
         self._logger.debug(f'fee histogram updated')
-        for i, tx_item in enumerate(self.tx_history):
+        # rows that have not been converted yet will get their status when they are
+        for row in list(self._model_items):
+            tx_item = self.tx_history[row]
             if 'height' not in tx_item:  # filter to on-chain
                 continue
             if tx_item['confirmations'] > 0:  # filter out already mined
                 continue
-            txid = tx_item['txid']
-            tx = self.wallet.db.get_transaction(txid)
-            if not tx:
-                continue
-            txinfo = self.wallet.get_tx_info(tx)
-            status, status_str = self.wallet.get_tx_status(txid, txinfo.tx_mined_status)
-            tx_item['date'] = status_str
-            index = self.index(i, 0)
-            roles = [self._ROLE_RMAP['date']]
-            self.dataChanged.emit(index, index, roles)
+            self._invalidate_row(row, ['date'])
 
     @qt_event_listener
     def on_event_labels_received(self, wallet, labels):
@@ -88,9 +89,20 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
             self.initModel(True)  # TODO: be less dramatic
 
     def rowCount(self, index):
-        return len(self.tx_history)
+        return self._num_fetched
+
+    def canFetchMore(self, parent):
+        return self._num_fetched < len(self.tx_history)
 
-    # also expose rowCount as a property
+    def fetchMore(self, parent):
+        num_rows = min(self.PAGE_SIZE, len(self.tx_history) - self._num_fetched)
+        if num_rows <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._num_fetched, self._num_fetched + num_rows - 1)
+        self._num_fetched += num_rows
+        self.endInsertRows()
+
+    # number of transactions, including the ones not fetched yet
     countChanged = pyqtSignal()
     @pyqtProperty(int, notify=countChanged)
     def count(self):
@@ -100,7 +112,7 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
         return self._ROLE_MAP
 
     def data(self, index, role):
-        tx = self.tx_history[index.row()]
+        tx = self._get_model_item(index.row())
         role_index = role - Qt.ItemDataRole.UserRole
 
         try:
@@ -122,13 +134,34 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
     def clear(self):
         self.beginResetModel()
         self.tx_history = []
+        self._key_to_row = {}
+        self._num_fetched = 0
+        self._model_items.clear()
         self.endResetModel()
 
+    @staticmethod
+    def get_key(tx_item) -> str:
+        return tx_item.get('txid') or tx_item['payment_hash'] or tx_item['group_id']  # fixme: this is fragile
+
+    def _get_model_item(self, row: int) -> Dict[str, Any]:
+        item = self._model_items.get(row)
+        if item is None:
+            item = self._model_items[row] = self.tx_to_model(self.tx_history[row])
+        return item
+
+    def _invalidate_row(self, row: int, roles) -> None:
+        """To be called after changing self.tx_history[row]."""
+        self._model_items.pop(row, None)
+        if row < self._num_fetched:
+            index = self.index(row, 0)
+            self.dataChanged.emit(index, index, [self._ROLE_RMAP[x] for x in roles])
+
     def tx_to_model(self, tx_item):
+        """Returns the model item for tx_item. tx_item is not modified."""
         #self._logger.debug(str(tx_item))
-        item = tx_item
+        item = dict(tx_item)
 
-        item['key'] = item.get('txid') or item['payment_hash'] or item['group_id'] # fixme: this is fragile
+        item['key'] = self.get_key(item)
 
         if 'lightning' not in item:
             item['lightning'] = False
@@ -216,14 +249,17 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
             onchain_domain=self.onchain_domain,
             include_lightning=self.include_lightning,
         )
-        txs = []
-        for key, tx in history.items():
-            txs.append(self.tx_to_model(tx))
+        txs = list(history.values())
+        txs.reverse()
 
         self.clear()
-        self.beginInsertRows(QModelIndex(), 0, len(txs) - 1)
+        # tx_items are converted lazily, when the view asks for them
+        num_rows = min(self.PAGE_SIZE, len(txs))
+        self.beginInsertRows(QModelIndex(), 0, num_rows - 1)
         self.tx_history = txs
-        self.tx_history.reverse()
+        # if keys are not unique, the first row wins
+        self._key_to_row = {self.get_key(tx_item): row for row, tx_item in reversed(list(enumerate(txs)))}
+        self._num_fetched = num_rows
         self.endInsertRows()
 
         self.countChanged.emit()
@@ -231,17 +267,14 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
         self._dirty = False
 
     def on_tx_verified(self, txid: str, info: TxMinedInfo):
-        for i, tx in enumerate(self.tx_history):
-            if 'txid' in tx and tx['txid'] == txid:
-                tx['height'] = info.height()
-                tx['confirmations'] = info.conf
-                tx['timestamp'] = info.timestamp
-                tx['section'] = self.get_section_by_timestamp(info.timestamp)
-                tx['date'] = self.format_date_by_section(tx['section'], datetime.fromtimestamp(info.timestamp))
-                index = self.index(i, 0)
-                roles = [self._ROLE_RMAP[x] for x in ['section', 'height', 'confirmations', 'timestamp', 'date']]
-                self.dataChanged.emit(index, index, roles)
-                return
+        row = self._key_to_row.get(txid)
+        if row is None or self.tx_history[row].get('txid') != txid:
+            return
+        tx_item = self.tx_history[row]
+        tx_item['height'] = info.height()
+        tx_item['confirmations'] = info.conf
+        tx_item['timestamp'] = info.timestamp
+        self._invalidate_row(row, ['section', 'height', 'confirmations', 'timestamp', 'date'])
 
     def _update_future_txitem(self, tx_item_idx: int):
         tx_item = self.tx_history[tx_item_idx]
@@ -252,23 +285,19 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
         tx = self.wallet.db.get_transaction(txid)
         if tx is None:
             return
-        txinfo = self.wallet.get_tx_info(tx)
-        status, status_str = self.wallet.get_tx_status(txid, txinfo.tx_mined_status)
-        tx_item['date'] = status_str
+        # the status shown in 'date' is derived from these by tx_to_model
         # note: if the height changes, that might affect the history order, but we won't re-sort now.
-        tx_item['height'] = self.wallet.adb.get_tx_height(txid).height()
-        index = self.index(tx_item_idx, 0)
-        roles = [self._ROLE_RMAP[x] for x in ['height', 'date']]
-        self.dataChanged.emit(index, index, roles)
+        tx_mined_info = self.wallet.adb.get_tx_height(txid)
+        tx_item['height'] = tx_mined_info.height()
+        tx_item['wanted_height'] = tx_mined_info.wanted_height
+        self._invalidate_row(tx_item_idx, ['height', 'date'])
 
     @pyqtSlot(str, str)
     def updateTxLabel(self, key, label):
-        for i, tx in enumerate(self.tx_history):
-            if tx['key'] == key:
-                tx['label'] = label
-                index = self.index(i, 0)
-                self.dataChanged.emit(index, index, [self._ROLE_RMAP['label']])
-                return
+        row = self._key_to_row.get(key)
+        if row is not None:
+            self.tx_history[row]['label'] = label
+            self._invalidate_row(row, ['label'])
 
     @pyqtSlot(int)
     def updateBlockchainHeight(self, height):
@@ -277,8 +306,10 @@ class QETransactionListModel(QAbstractListModel, QtEventListener):
             if 'height' in tx_item:
                 if tx_item['height'] > 0:
                     tx_item['confirmations'] = height - tx_item['height'] + 1
-                    index = self.index(i, 0)
-                    roles = [self._ROLE_RMAP['confirmations']]
-                    self.dataChanged.emit(index, index, roles)
                 elif tx_item['height'] in (TX_HEIGHT_FUTURE, TX_HEIGHT_LOCAL):
                     self._update_future_txitem(i)
+        # a single signal for all fetched rows, rather than one per row
+        self._model_items.clear()
+        if self._num_fetched > 0:
+            self.dataChanged.emit(
+                self.index(0, 0), self.index(self._num_fetched - 1, 0), [self._ROLE_RMAP['confirmations']])
@@ -43,7 +43,7 @@ from electrum_grs.address_synchronizer import TX_HEIGHT_LOCAL
 from electrum_grs.i18n import _
 from electrum_grs.util import (block_explorer_URL, profiler, TxMinedInfo,
                            OrderedDictWithIndex, timestamp_to_datetime,
-                           Satoshis, format_time)
+                           Satoshis, format_time, keyed_diff)
 from electrum_grs.logging import get_logger, Logger
 from electrum_grs.simple_config import SimpleConfig
 
@@ -93,6 +93,27 @@ class HistorySortModel(QSortFilterProxyModel):
 def get_item_key(tx_item):
     return tx_item.get('txid') or tx_item['payment_hash']
 
+
+# keys of tx_items that are not shown as such, see tx_item_changed
+_TX_ITEM_IGNORED_KEYS = frozenset(['balance', 'confirmations'])
+
+
+def tx_item_changed(old, new) -> bool:
+    """Whether a row needs to be redrawn when its tx_item is replaced.
+    The number of confirmations only matters up to 6, see Abstract_Wallet.get_tx_status.
+    """
+    if min(old.get('confirmations') or 0, 6) != min(new.get('confirmations') or 0, 6):
+        return True
+    # compare everything else in a single dict comparison
+    new = dict(new)
+    for k in _TX_ITEM_IGNORED_KEYS:
+        if k in old:
+            new[k] = old[k]
+        else:
+            new.pop(k, None)
+    return new != old
+
+
 def flatten_sort_key(v):
     if v is None or isinstance(v, Decimal) and v.is_nan():
         return -float("inf")
@@ -106,7 +127,20 @@ class HistoryNode(CustomNode):
 
     def __init__(self, model: 'CustomModel', tx_item):
         super().__init__(model, tx_item)
-
+        self._set_sort_keys(tx_item)
+
+    def set_data(self, tx_item, *, update_sort_keys: bool = True):
+        """Replaces the tx_item of an existing node, keeping its balance.
+        The sort keys can be kept if tx_item_changed() returned False.
+        """
+        balance = self.sort_keys[HistoryColumns.BALANCE]
+        tx_item['balance'] = self._data['balance'] if 'balance' in self._data else Satoshis(balance)
+        self._data = tx_item
+        if update_sort_keys:
+            self._set_sort_keys(tx_item)
+            self.sort_keys[HistoryColumns.BALANCE] = balance
+
+    def _set_sort_keys(self, tx_item):
         if tx_item is None:
             tx_item = {}
         is_lightning = tx_item.get('lightning', False)
@@ -240,6 +274,9 @@ class HistoryNode(CustomNode):
 
 class HistoryModel(CustomModel, Logger):
 
+    # above this many inserted/removed rows, refresh() resets the model instead of applying a diff
+    MAX_DIFF_ROWS = 1000
+
     def __init__(self, window: 'ElectrumWindow'):
         CustomModel.__init__(self, window, len(HistoryColumns))
         Logger.__init__(self)
@@ -302,57 +339,154 @@ class HistoryModel(CustomModel, Logger):
             onchain_domain=self.get_domain(),
             include_lightning=self.should_include_lightning_payments(),
         )
+        ops = keyed_diff(list(self.transactions.keys()), list(transactions.keys()))
+        num_rows_diff = sum(count for op, pos, count in ops)
+        if not self.transactions or num_rows_diff > min(self.MAX_DIFF_ROWS, len(transactions) // 2):
+            self._reset(transactions)
+            if selected_row:
+                self.view.selectionModel().select(
+                    self.createIndex(selected_row, 0),
+                    QItemSelectionModel.SelectionFlag.Rows | QItemSelectionModel.SelectionFlag.SelectCurrent)
+        else:
+            self._apply_diff(transactions, ops)
+        self.view.filter()
+        # update time filter
+        if not self.view.years and self.transactions:
+            start_date = date.today()
+            end_date = date.today()
+            if len(self.transactions) > 0:
+                start_date = self.transactions.value_from_pos(0).get('date') or start_date
+                end_date = self.transactions.value_from_pos(len(self.transactions) - 1).get('date') or end_date
+            self.view.years = [str(i) for i in range(start_date.year, end_date.year + 1)]
+            self.view.period_combo.insertItems(1, self.view.years)
+        # update counter
+        num_tx = len(self.transactions)
+        if self.view:
+            self.view.num_tx_label.setText(_("{} transactions").format(num_tx))
+
+    def _update_tx_status(self, txid: str, tx_item):
+        if not tx_item.get('lightning', False):
+            tx_mined_info = self._tx_mined_info_from_tx_item(tx_item)
+            self.tx_status_cache[txid] = self.window.wallet.get_tx_status(txid, tx_mined_info)
+
+    def _create_node(self, tx_item) -> HistoryNode:
+        node = HistoryNode(self, tx_item)
+        for child_item in tx_item.get('children', []):
+            node.addChild(HistoryNode(self, child_item))
+        return node
+
+    def _renumber_rows(self, start: int):
+        children = self._root._children
+        for row in range(start, len(children)):
+            children[row]._row = row
+
+    def _update_balances(self, start: int):
+        children = self._root._children
+        balance = children[start - 1].sort_keys[HistoryColumns.BALANCE] if start > 0 else 0
+        for node in children[start:]:
+            balance += node._data['value'].value
+            node.set_balance(balance)
+
+    def _reset(self, transactions: OrderedDictWithIndex):
+        """Rebuilds all rows."""
         old_length = self._root.childCount()
         if old_length != 0:
             self.beginRemoveRows(QModelIndex(), 0, old_length)
             self.transactions.clear()
             self._root = HistoryNode(self, None)
             self.endRemoveRows()
-        parents = {}
         for tx_item in transactions.values():
-            node = HistoryNode(self, tx_item)
-            self._root.addChild(node)
-            for child_item in tx_item.get('children', []):
-                child_node = HistoryNode(self, child_item)
-                # add child to parent
-                node.addChild(child_node)
-
+            self._root.addChild(self._create_node(tx_item))
         # compute balance once all children have been added
-        balance = 0
-        for node in self._root._children:
-            balance += node._data['value'].value
-            node.set_balance(balance)
-
+        self._update_balances(0)
         # update tx_status_cache  (before endInsertRows() triggers get_data_for_role() calls)
         self.tx_status_cache.clear()
         for txid, tx_item in transactions.items():
-            if not tx_item.get('lightning', False):
-                tx_mined_info = self._tx_mined_info_from_tx_item(tx_item)
-                self.tx_status_cache[txid] = self.window.wallet.get_tx_status(txid, tx_mined_info)
-
+            self._update_tx_status(txid, tx_item)
         new_length = self._root.childCount()
         self.beginInsertRows(QModelIndex(), 0, new_length-1)
         self.transactions = transactions
         self.endInsertRows()
 
-        if selected_row:
-            self.view.selectionModel().select(
-                self.createIndex(selected_row, 0),
-                QItemSelectionModel.SelectionFlag.Rows | QItemSelectionModel.SelectionFlag.SelectCurrent)
-        self.view.filter()
-        # update time filter
-        if not self.view.years and self.transactions:
-            start_date = date.today()
-            end_date = date.today()
-            if len(self.transactions) > 0:
-                start_date = self.transactions.value_from_pos(0).get('date') or start_date
-                end_date = self.transactions.value_from_pos(len(self.transactions) - 1).get('date') or end_date
-            self.view.years = [str(i) for i in range(start_date.year, end_date.year + 1)]
-            self.view.period_combo.insertItems(1, self.view.years)
-        # update counter
-        num_tx = len(self.transactions)
-        if self.view:
-            self.view.num_tx_label.setText(_("{} transactions").format(num_tx))
+    def _apply_diff(self, transactions: OrderedDictWithIndex, ops):
+        """Updates rows in place, given the result of keyed_diff between
+        the keys of self.transactions and those of transactions.
+        """
+        children = self._root._children
+        first_dirty_row = len(transactions)
+        # inserted and removed rows
+        for op, pos, count in ops:
+            first_dirty_row = min(first_dirty_row, pos)
+            if op == 'remove':
+                self.beginRemoveRows(QModelIndex(), pos, pos + count - 1)
+                del children[pos:pos + count]
+                self._renumber_rows(pos)
+                self.endRemoveRows()
+            else:
+                new_keys = [transactions.key_from_pos(row) for row in range(pos, pos + count)]
+                new_items = [transactions[key] for key in new_keys]
+                for key, tx_item in zip(new_keys, new_items):
+                    self._update_tx_status(key, tx_item)
+                self.beginInsertRows(QModelIndex(), pos, pos + count - 1)
+                nodes = [self._create_node(tx_item) for tx_item in new_items]
+                for node in nodes:
+                    node._parent = self._root
+                children[pos:pos] = nodes
+                self._renumber_rows(pos)
+                self.endInsertRows()
+        assert len(children) == len(transactions)
+        # rows whose tx_item changed
+        changed_rows = []
+        for row, (node, (key, tx_item)) in enumerate(zip(children, transactions.items())):
+            old_item = node._data
+            if old_item is tx_item:
+                continue  # just inserted
+            changed = tx_item_changed(old_item, tx_item)
+            if changed and (old_item.get('children') or tx_item.get('children')):
+                self._replace_children(row, node, tx_item)
+            else:
+                node.set_data(tx_item, update_sort_keys=changed)
+            if changed:
+                changed_rows.append(row)
+                if old_item['value'] != tx_item['value']:
+                    first_dirty_row = min(first_dirty_row, row)
+                self._update_tx_status(key, tx_item)
+            elif not tx_item.get('lightning', False) and not tx_item.get('confirmations'):
+                # the status of unconfirmed txs depends on the mempool
+                self._update_tx_status(key, tx_item)
+        if any(op == 'remove' for op, pos, count in ops):
+            self.tx_status_cache = {k: v for k, v in self.tx_status_cache.items() if k in transactions}
+        self.transactions = transactions
+        # balances
+        if first_dirty_row < len(children):
+            self._update_balances(first_dirty_row)
+            self.dataChanged.emit(
+                self.createIndex(first_dirty_row, HistoryColumns.BALANCE),
+                self.createIndex(len(children) - 1, HistoryColumns.BALANCE))
+        # coalesce changed rows into ranges
+        last_col = len(HistoryColumns) - 1
+        start = prev = None
+        for row in changed_rows + [None]:
+            if start is not None and (row is None or row != prev + 1):
+                self.dataChanged.emit(self.createIndex(start, 0), self.createIndex(prev, last_col))
+                start = None
+            if start is None:
+                start = row
+            prev = row
+
+    def _replace_children(self, row: int, node: HistoryNode, tx_item):
+        parent_index = self.createIndex(row, 0, node)
+        if node._children:
+            self.beginRemoveRows(parent_index, 0, len(node._children) - 1)
+            node._children = []
+            self.endRemoveRows()
+        node.set_data(tx_item)
+        child_items = tx_item.get('children', [])
+        if child_items:
+            self.beginInsertRows(parent_index, 0, len(child_items) - 1)
+            for child_item in child_items:
+                node.addChild(HistoryNode(self, child_item))
+            self.endInsertRows()
 
     def set_visibility_of_columns(self):
         def set_visible(col: int, b: bool):
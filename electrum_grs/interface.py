@@ -55,6 +55,7 @@ from . import util
 from . import x509
 from . import pem
 from . import version
+from . import metrics
 from . import blockchain
 from .blockchain import Blockchain, HEADER_SIZE, CHUNK_SIZE
 from . import bitcoin
@@ -82,6 +83,12 @@ assert PREFERRED_NETWORK_PROTOCOL in KNOWN_ELEC_PROTOCOL_TRANSPORTS
 MAX_NUM_HEADERS_PER_REQUEST = 2016
 assert MAX_NUM_HEADERS_PER_REQUEST >= CHUNK_SIZE
 
+# When looking for a forkpoint, this many heights are requested concurrently:
+# - backward search: the next steps, when they are not in the headers cache,
+# - binary search: heights splitting the interval in NUM_FORK_PROBES+1 parts,
+#   when the interval is too large for a single headers request.
+NUM_FORK_PROBES = 8
+
 
 class NetworkTimeout:
     # seconds
@@ -151,6 +158,12 @@ def protocol_tuple(s: Any) -> tuple[int, ...]:
         return (0, )
 
 
+REQUEST_LATENCY = metrics.histogram(
+    'electrum_interface_request_seconds', 'Latency of requests sent to servers', ['method'])
+REQUEST_ERRORS = metrics.counter(
+    'electrum_interface_request_errors_total', 'Failed requests sent to servers', ['method', 'reason'])
+
+
 class ChainResolutionMode(enum.Enum):
     CATCHUP = enum.auto()
     BACKWARD = enum.auto()
@@ -197,6 +210,8 @@ class NotificationSession(RPCSession):
         # aiorpcx. the timeout arg here in most cases should not be set
         msg_id = next(self._msg_counter)
         self.maybe_log(f"<-- {args} {kwargs} (id: {msg_id})")
+        method = str(args[0]) if args else ''
+        t0 = time.monotonic()
         try:
             # note: RPCSession.send_request raises TaskTimeout in case of a timeout.
             # TaskTimeout is a subclass of CancelledError, which is *suppressed* in TaskGroups
@@ -205,15 +220,23 @@ class NotificationSession(RPCSession):
                 timeout)
         except (TaskTimeout, asyncio.TimeoutError) as e:
             self.maybe_log(f"--> request timed out: {args} (id: {msg_id})")
+            REQUEST_ERRORS.labels(method=method, reason='timeout').inc()
+            self.interface.network.server_scores.record_error(self.interface.server)
             raise RequestTimedOut(f'request timed out: {args} (id: {msg_id})') from e
         except CodeMessageError as e:
             self.maybe_log(f"--> {repr(e)} (id: {msg_id})")
+            REQUEST_ERRORS.labels(method=method, reason='server_error').inc()
+            # the server did answer
+            self.interface.network.server_scores.record_response(self.interface.server, time.monotonic() - t0)
             raise
         except BaseException as e:  # cancellations, etc. are useful for debugging
             self.maybe_log(f"--> {repr(e)} (id: {msg_id})")
             raise
         else:
             self.maybe_log(f"--> {response} (id: {msg_id})")
+            elapsed = time.monotonic() - t0
+            REQUEST_LATENCY.labels(method=method).observe(elapsed)
+            self.interface.network.server_scores.record_response(self.interface.server, elapsed)
             return response
 
     def set_default_timeout(self, timeout):
@@ -551,6 +574,28 @@ def _get_cert_path_for_host(*, config: 'SimpleConfig', host: str) -> str:
     return os.path.join(config.path, 'certs', filename)
 
 
+# loading the CA bundle takes tens of milliseconds, so SSL contexts are shared between connections
+_ssl_context_cache = LRUCache(maxsize=100)  # type: LRUCache[Tuple[str, int, int], ssl.SSLContext]
+
+
+def _get_ssl_context_for_cafile(cafile: str, *, pinned: bool = False) -> ssl.SSLContext:
+    """pinned: cafile is a self-signed server certificate
+    The cache key includes the file's mtime and size, so that a re-pinned cert is picked up.
+    """
+    st = os.stat(cafile)
+    key = (cafile, st.st_mtime_ns, st.st_size)
+    sslc = _ssl_context_cache.get(key)
+    if sslc is None:
+        sslc = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH, cafile=cafile)
+        if pinned:
+            # note: Flag "ssl.VERIFY_X509_STRICT" is enabled by default in python 3.13+ (disabled in older versions).
+            #       We explicitly disable it as it breaks lots of servers.
+            sslc.verify_flags &= ~ssl.VERIFY_X509_STRICT
+            sslc.check_hostname = False
+        _ssl_context_cache[key] = sslc
+    return sslc
+
+
 class Interface(Logger):
 
     def __init__(self, *, network: 'Network', server: ServerAddr):
@@ -685,7 +730,7 @@ class Interface(Logger):
             return None
 
         # see if we already have cert for this server; or get it for the first time
-        ca_sslc = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH, cafile=ca_path)
+        ca_sslc = _get_ssl_context_for_cafile(ca_path)
         if not self._is_saved_ssl_cert_available():
             try:
                 await self._try_saving_ssl_cert_for_first_time(ca_sslc)
@@ -698,11 +743,7 @@ class Interface(Logger):
             sslc = ca_sslc
         else:
             # pinned self-signed cert
-            sslc = ssl.create_default_context(purpose=ssl.Purpose.SERVER_AUTH, cafile=self.cert_path)
-            # note: Flag "ssl.VERIFY_X509_STRICT" is enabled by default in python 3.13+ (disabled in older versions).
-            #       We explicitly disable it as it breaks lots of servers.
-            sslc.verify_flags &= ~ssl.VERIFY_X509_STRICT
-            sslc.check_hostname = False
+            sslc = _get_ssl_context_for_cafile(self.cert_path, pinned=True)
         return sslc
 
     def handle_disconnect(func):
@@ -836,6 +877,14 @@ class Interface(Logger):
             header_height = from_height + idx
             self._headers_cache[header_height] = raw_header
 
+    async def _prefetch_block_headers(self, heights: Sequence[int], *, mode: ChainResolutionMode) -> None:
+        """Populate header cache for the given block heights, requesting them concurrently."""
+        heights = [height for height in heights if height not in self._headers_cache]
+        async with OldTaskGroup() as group:
+            tasks = [(height, await group.spawn(self.get_block_header(height, mode=mode))) for height in heights]
+        for height, task in tasks:
+            self._headers_cache[height] = blockchain.serialize_header(task.result())
+
     async def get_block_header(self, height: int, *, mode: ChainResolutionMode) -> dict:
         if not is_non_negative_integer(height):
             raise Exception(f"{repr(height)} is not a block height")
@@ -1021,10 +1070,7 @@ class Interface(Logger):
 
             try:
                 async with self.taskgroup as group:
-                    await group.spawn(self.ping)
-                    await group.spawn(self.request_fee_estimates)
-                    await group.spawn(self.run_fetch_blocks)
-                    await group.spawn(self.monitor_connection)
+                    await self._spawn_session_tasks(group)
             except aiorpcx.jsonrpc.RPCError as e:
                 if e.code in (
                     JSONRPC.EXCESSIVE_RESOURCE_USAGE,
@@ -1038,6 +1084,12 @@ class Interface(Logger):
             finally:
                 self.got_disconnected.set()  # set this ASAP, ideally before any awaits
 
+    async def _spawn_session_tasks(self, group: OldTaskGroup) -> None:
+        await group.spawn(self.ping)
+        await group.spawn(self.request_fee_estimates)
+        await group.spawn(self.run_fetch_blocks)
+        await group.spawn(self.monitor_connection)
+
     async def monitor_connection(self):
         while True:
             await asyncio.sleep(1)
@@ -1116,6 +1168,7 @@ class Interface(Logger):
                 util.trigger_callback('blockchain_updated')
                 self._blockchain_updated.set()
                 self._blockchain_updated.clear()
+            self.network.record_header_lags()
             util.trigger_callback('network_updated')
             await self.network.switch_unwanted_fork_interface()
             await self.network.switch_lagging_interface()
@@ -1222,11 +1275,17 @@ class Interface(Logger):
         good = height
         while True:
             assert 0 <= good < bad, (good, bad)
+            if bad - good + 1 > MAX_NUM_HEADERS_PER_REQUEST:
+                # interval is large: request several heights concurrently, to save round-trips
+                good, bad, bad_header, chain = await self._search_headers_kary_step(good, bad, bad_header)
+                if good + 1 == bad:
+                    break
+                continue
             height = (good + bad) // 2
             self.logger.info(f"binary step. good {good}, bad {bad}, height {height}")
-            if bad - good + 1 <= MAX_NUM_HEADERS_PER_REQUEST:  # if interval is small, trade some bandwidth for lower latency
-                await self._maybe_warm_headers_cache(
-                    from_height=good, to_height=bad, mode=ChainResolutionMode.BINARY)
+            # interval is small: trade some bandwidth for lower latency
+            await self._maybe_warm_headers_cache(
+                from_height=good, to_height=bad, mode=ChainResolutionMode.BINARY)
             header = await self.get_block_header(height, mode=ChainResolutionMode.BINARY)
             chain = blockchain.check_header(header)
             if chain:
@@ -1245,6 +1304,33 @@ class Interface(Logger):
         self.logger.info(f"binary search exited. good {good}, bad {bad}. {chain=}")
         return good, bad, bad_header
 
+    async def _search_headers_kary_step(
+        self,
+        good: int,
+        bad: int,
+        bad_header: dict,
+    ) -> Tuple[int, int, dict, Optional[Blockchain]]:
+        """Narrows down the interval [good, bad] by requesting NUM_FORK_PROBES heights in it concurrently.
+        Returns the new good and bad heights, the header at bad, and the chain of the header at good
+        (or None if good did not change).
+        """
+        step = (bad - good) / (NUM_FORK_PROBES + 1)
+        heights = sorted(set(good + round(step * i) for i in range(1, NUM_FORK_PROBES + 1)) - {good, bad})
+        self.logger.info(f"k-ary step. good {good}, bad {bad}, heights {heights}")
+        await self._prefetch_block_headers(heights, mode=ChainResolutionMode.BINARY)
+        chain = None
+        for height in heights:
+            header = await self.get_block_header(height, mode=ChainResolutionMode.BINARY)
+            header_chain = blockchain.check_header(header)
+            if not header_chain:
+                bad = height
+                bad_header = header
+                break
+            chain = header_chain
+            self.blockchain = chain
+            good = height
+        return good, bad, bad_header, chain
+
     async def _resolve_potential_chain_fork_given_forkpoint(
         self,
         good: int,
@@ -1303,8 +1389,23 @@ class Interface(Logger):
         await self._maybe_warm_headers_cache(
             from_height=max(0, height-10), to_height=height, mode=ChainResolutionMode.BACKWARD)
 
+        def next_heights(height: int, delta: int) -> Sequence[int]:
+            heights = []
+            while len(heights) < NUM_FORK_PROBES:
+                heights.append(max(height, constants.net.max_checkpoint()))
+                if height <= constants.net.max_checkpoint():
+                    break
+                height -= delta
+                delta *= 2
+            return heights
+
         delta = 2
-        while await iterate():
+        while True:
+            if height not in self._headers_cache:
+                # each step would be a round-trip: request the next steps concurrently
+                await self._prefetch_block_headers(next_heights(height, delta), mode=ChainResolutionMode.BACKWARD)
+            if not await iterate():
+                break
             bad, bad_header = height, header
             height -= delta
             delta *= 2
@@ -1621,6 +1722,40 @@ class Interface(Logger):
         return res
 
 
+class RequestOnlyInterface(Interface):
+    """A connection used to send a few requests to a server we are not
+    otherwise connected to, see Network.send_multiple_requests.
+    It does not follow the chain (no header subscription, no fee estimates),
+    so it is ready as soon as the handshake is done. It closes itself after
+    IDLE_TIMEOUT, and is not reused after MAX_LIFETIME.
+    """
+
+    IDLE_TIMEOUT = 60
+    MAX_LIFETIME = 600
+
+    def __init__(self, *, network: 'Network', server: ServerAddr):
+        self.created_at = self.last_used = time.monotonic()
+        Interface.__init__(self, network=network, server=server)
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def is_expired(self) -> bool:
+        return time.monotonic() - self.created_at > self.MAX_LIFETIME
+
+    async def _spawn_session_tasks(self, group: OldTaskGroup) -> None:
+        if self.ready.cancelled():
+            raise GracefulDisconnect('conn establishment was too slow; *ready* future was cancelled')
+        self.ready.set_result(1)
+        await group.spawn(self.monitor_connection)
+        await group.spawn(self._close_when_idle)
+
+    async def _close_when_idle(self):
+        while (idle := time.monotonic() - self.last_used) < self.IDLE_TIMEOUT:
+            await asyncio.sleep(self.IDLE_TIMEOUT - idle)
+        raise GracefulDisconnect('idle', log_level=logging.DEBUG)
+
+
 def _assert_header_does_not_check_against_any_chain(header: dict) -> None:
     chain_bad = blockchain.check_header(header)
     if chain_bad:
@@ -31,6 +31,7 @@ import jsonpatch
 import jsonpointer
 
 from . import util
+from . import metrics
 from .util import WalletFileException, profiler, sticky_property
 from .logging import Logger
 from .stored_dict import StoredDict, _FLEX_KEY, registered_names, registered_keys, _convert_dict_key, _convert_dict_value
@@ -83,6 +84,8 @@ def locked(func):
     return wrapper
 
 
+WRITE_LATENCY = metrics.histogram(
+    'electrum_jsondb_write_seconds', 'Duration of JsonDB writes to storage', ['kind'])
 
 
 class JsonDB(Logger):
@@ -285,8 +288,9 @@ class JsonDB(Logger):
             self.logger.info('no pending changes')
             return
         self.logger.info(f'appending {len(self.pending_changes)} pending changes')
-        s = ''.join([',\n' + x for x in self.pending_changes])
-        self.storage.append(s)
+        with WRITE_LATENCY.labels(kind='append').time():
+            s = ''.join([',\n' + x for x in self.pending_changes])
+            self.storage.append(s)
         self.pending_changes = []
 
     @locked
@@ -296,7 +300,8 @@ class JsonDB(Logger):
             raise Exception('daemon thread cannot write db')
         if not self.modified():
             return
-        json_str = self.dump(human_readable=not self.storage.is_encrypted())
-        self.storage.write(json_str)
+        with WRITE_LATENCY.labels(kind='full').time():
+            json_str = self.dump(human_readable=not self.storage.is_encrypted())
+            self.storage.write(json_str)
         self.pending_changes = []
         self.set_modified(False)
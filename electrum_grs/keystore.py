@@ -32,7 +32,7 @@ from abc import ABC, abstractmethod
 import electrum_ecc as ecc
 from electrum_ecc import string_to_number
 
-from . import bitcoin, constants, bip32
+from . import bitcoin, constants, bip32, metrics
 from .bitcoin import deserialize_privkey, serialize_privkey, BaseDecodeError
 from .transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxInput
 from .bip32 import (convert_bip32_strpath_to_intpath, BIP32_PRIME,
@@ -58,6 +58,12 @@ if TYPE_CHECKING:
     from .plugin import Device
 
 
+PUBKEY_CACHE_LOOKUPS = metrics.counter(
+    'electrum_keystore_pubkey_cache_lookups_total', 'Lookups in the keystore pubkey cache', ['result'])
+_PUBKEY_CACHE_HITS = PUBKEY_CACHE_LOOKUPS.labels(result='hit')
+_PUBKEY_CACHE_MISSES = PUBKEY_CACHE_LOOKUPS.labels(result='miss')
+
+
 class CannotDerivePubkey(Exception): pass
 class ScriptTypeNotSupported(Exception): pass
 
@@ -453,7 +459,10 @@ class MasterPublicKeyMixin(ABC):
     def derive_pubkey(self, for_change: int, n: int) -> bytes:
         key = (for_change, n)
         if key not in self._pubkey_cache:
+            _PUBKEY_CACHE_MISSES.inc()
             self._pubkey_cache[key] = self._derive_pubkey(*key)
+        else:
+            _PUBKEY_CACHE_HITS.inc()
         return self._pubkey_cache[key]
 
     @abstractmethod
@@ -57,6 +57,7 @@ from .lnsweep import sweep_their_htlctx_justice, sweep_our_htlctx, SweepInfo, Ma
 from .lnsweep import sweep_their_ctx_to_remote_backup
 from .lnhtlc import HTLCManager
 from .lnmsg import encode_msg, decode_msg
+from .lrucache import LRUCache
 from .address_synchronizer import TX_HEIGHT_LOCAL, TX_HEIGHT_UNCONFIRMED
 from .lnutil import CHANNEL_OPENING_TIMEOUT_BLOCKS, CHANNEL_OPENING_TIMEOUT_SEC
 from .lnutil import ChannelBackupStorage, ImportedChannelBackupStorage, OnchainChannelBackupStorage
@@ -814,6 +815,9 @@ class Channel(AbstractChannel):
         self.sent_channel_ready = False # no need to persist this, because channel_ready is re-sent in channel_reestablish
         self.sent_announcement_signatures = False
         self.htlc_settle_time = {}
+        # per-commitment secrets and points that can no longer change: all of ours, and the revoked ones of the remote
+        self._secret_and_point_cache = LRUCache(maxsize=100)  # type: LRUCache[Tuple[HTLCOwner, int], Tuple[bytes, bytes]]
+        self._secret_and_point_cache_lock = threading.Lock()
 
     def get_local_scid_alias(self, *, create_new_if_needed: bool = False) -> Optional[bytes]:
         """Get scid_alias to be used for *outgoing* HTLCs.
@@ -1275,7 +1279,8 @@ class Channel(AbstractChannel):
 
         their_remote_htlc_privkey_number = derive_privkey(
             int.from_bytes(self.config[LOCAL].htlc_basepoint.privkey, 'big'),
-            self.config[REMOTE].next_per_commitment_point)
+            self.config[REMOTE].next_per_commitment_point,
+            basepoint=self.config[LOCAL].htlc_basepoint.pubkey)
         their_remote_htlc_privkey = their_remote_htlc_privkey_number.to_bytes(32, 'big')
 
         htlcsigs = []
@@ -1640,6 +1645,11 @@ class Channel(AbstractChannel):
     def get_secret_and_point(self, subject: HTLCOwner, ctn: int) -> Tuple[Optional[bytes], bytes]:
         assert type(subject) is HTLCOwner
         assert ctn >= 0, ctn
+        key = (subject, ctn)
+        with self._secret_and_point_cache_lock:
+            cached = self._secret_and_point_cache.get(key)
+        if cached is not None:
+            return cached
         offset = ctn - self.get_oldest_unrevoked_ctn(subject)
         if subject == REMOTE:
             if offset > 1:
@@ -1654,9 +1664,13 @@ class Channel(AbstractChannel):
             else:
                 secret = self.revocation_store.retrieve_secret(RevocationStore.START_INDEX - ctn)
                 point = secret_to_pubkey(int.from_bytes(secret, 'big'))
+                with self._secret_and_point_cache_lock:
+                    self._secret_and_point_cache[key] = secret, point
         else:
             secret = get_per_commitment_secret_from_seed(self.config[LOCAL].per_commitment_secret_seed, RevocationStore.START_INDEX - ctn)
             point = secret_to_pubkey(int.from_bytes(secret, 'big'))
+            with self._secret_and_point_cache_lock:
+                self._secret_and_point_cache[key] = secret, point
         return secret, point
 
     def get_secret_and_commitment(self, subject: HTLCOwner, *, ctn: int) -> Tuple[Optional[bytes], PartialTransaction]:
@@ -0,0 +1,192 @@
+"""Index of the lightning history.
+
+LNWallet.get_lightning_history needs the settled htlcs of every payment,
+and the openings and closings of every channel. Scanning the htlc log of
+every channel on each call is slow for nodes with many payments or forwards.
+
+Once an htlc is irrevocably settled or failed, it never changes again.
+HTLCManager calls on_htlc_removed when it stops considering such an htlc
+as active, and the index folds it into per payment hash totals then. When
+a channel is added to the index, its htlcs that are not active anymore are
+folded at once. Htlcs that are still active are few; the settled ones are
+added on top of the totals at query time, so that results are the same as
+scanning all htlcs with Channel.get_payments(status='settled').
+
+The totals, and the history items of channel openings and closings (updated
+by LNWallet when the onchain state of a channel changes), are stored in the
+wallet db. Payments are also kept sorted by timestamp, for time range queries.
+"""
+
+import bisect
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, NamedTuple, Tuple, Optional, List, Sequence
+
+from .lnutil import LOCAL, REMOTE, SENT, RECEIVED, HTLCOwner, UpdateAddHtlc
+from .logging import Logger
+from .util import LightningHistoryItem
+
+if TYPE_CHECKING:
+    from .lnchannel import Channel
+    from .wallet_db import WalletDB
+
+
+class PaymentTotals(NamedTuple):
+    amount_msat: int  # sum of signed htlc amounts, positive if received
+    num_sent: int
+    num_received: int
+    timestamp: int  # of the oldest htlc
+
+    def add_htlc(self, htlc_proposer: HTLCOwner, htlc: UpdateAddHtlc) -> 'PaymentTotals':
+        direction = SENT if htlc_proposer == LOCAL else RECEIVED
+        return PaymentTotals(
+            amount_msat=self.amount_msat + int(direction) * htlc.amount_msat,
+            num_sent=self.num_sent + (direction == SENT),
+            num_received=self.num_received + (direction == RECEIVED),
+            timestamp=min(self.timestamp, htlc.timestamp) if self.num_sent + self.num_received else htlc.timestamp,
+        )
+
+    def __add__(self, other: 'PaymentTotals') -> 'PaymentTotals':
+        return PaymentTotals(
+            amount_msat=self.amount_msat + other.amount_msat,
+            num_sent=self.num_sent + other.num_sent,
+            num_received=self.num_received + other.num_received,
+            timestamp=min(self.timestamp, other.timestamp),
+        )
+
+
+EMPTY_TOTALS = PaymentTotals(0, 0, 0, 0)
+
+
+class LNHistoryIndex(Logger):
+
+    def __init__(self, db: 'WalletDB'):
+        Logger.__init__(self)
+        # HTLCManager calls on_htlc_removed with the channel db lock held, which is this one
+        self.lock = db.lock  # type: threading.RLock
+        self._totals = db.get_dict('lightning_history_totals')  # type: Dict[str, Tuple[int, int, int, int]]  # payment_hash -> PaymentTotals
+        self._htlc_channels = db.get_dict('lightning_history_htlc_channels')  # type: Dict[str, bool]  # channel_id -> whether its inactive htlcs are folded
+        self._channel_items = db.get_dict('lightning_history_channel_items')  # type: Dict[str, List[list]]  # channel_id -> LightningHistoryItems
+        self._by_timestamp = sorted((totals[3], key) for key, totals in self._totals.items())  # type: List[Tuple[int, str]]
+        self._changed_keys = set()  # payment hashes whose totals changed since the last call to pop_changed_keys
+
+    def add_channels(self, channels: Iterable['Channel']) -> None:
+        """Adds the channels of the wallet, when it is loaded."""
+        channels = list(channels)
+        with self.lock:
+            if set(self._htlc_channels.keys()) - set(chan.channel_id.hex() for chan in channels):
+                # a channel was removed, its payments are not part of the history anymore
+                self._reset()
+            for chan in channels:
+                self.add_channel(chan)
+
+    def add_channel(self, chan: 'Channel') -> None:
+        """Folds the htlcs of the channel that are not active anymore,
+        and the ones that stop being active later."""
+        hm = chan.hm
+        with self.lock:
+            chan_key = chan.channel_id.hex()
+            if chan_key not in self._htlc_channels:
+                active_htlc_ids = {htlc_proposer: hm.get_maybe_active_htlc_ids(htlc_proposer) for htlc_proposer in (LOCAL, REMOTE)}
+                for direction, htlc in hm.all_htlcs_ever():
+                    htlc_proposer = LOCAL if direction == SENT else REMOTE
+                    if htlc.htlc_id not in active_htlc_ids[htlc_proposer]:
+                        self._fold_htlc(chan, htlc_proposer, htlc.htlc_id)
+                self._htlc_channels[chan_key] = True
+            hm.on_htlc_removed = lambda htlc_proposer, htlc_id: self._fold_htlc(chan, htlc_proposer, htlc_id)
+
+    def remove_channel(self, channel_id: bytes, channels: Iterable['Channel']) -> None:
+        """Removes a channel or channel backup. channels are the remaining channels."""
+        channels = list(channels)
+        with self.lock:
+            chan_key = channel_id.hex()
+            self._channel_items.pop(chan_key, None)
+            if chan_key in self._htlc_channels:
+                # its payments are not part of the history anymore
+                self._reset()
+                for chan in channels:
+                    self.add_channel(chan)
+
+    def _reset(self) -> None:
+        self.logger.info('rebuilding lightning history index')
+        self._changed_keys.update(self._totals.keys())
+        self._totals.clear()
+        self._htlc_channels.clear()
+        self._by_timestamp.clear()
+
+    def _fold_htlc(self, chan: 'Channel', htlc_proposer: HTLCOwner, htlc_id: int) -> None:
+        hm = chan.hm
+        with self.lock:
+            if not hm.was_htlc_preimage_released(htlc_id=htlc_id, htlc_proposer=htlc_proposer):
+                return
+            if hm.was_htlc_failed(htlc_id=htlc_id, htlc_proposer=htlc_proposer):
+                return
+            htlc = hm.get_htlc_by_id(htlc_proposer, htlc_id)
+            key = htlc.payment_hash.hex()
+            old_totals = self.get_totals(key)
+            totals = (old_totals or EMPTY_TOTALS).add_htlc(htlc_proposer, htlc)
+            self._totals[key] = tuple(totals)
+            if old_totals is None or old_totals.timestamp != totals.timestamp:
+                if old_totals is not None:
+                    del self._by_timestamp[bisect.bisect_left(self._by_timestamp, (old_totals.timestamp, key))]
+                bisect.insort(self._by_timestamp, (totals.timestamp, key))
+            self._changed_keys.add(key)
+
+    def get_pending_totals(self, channels: Iterable['Channel']) -> Dict[str, PaymentTotals]:
+        """Totals of the settled htlcs that are not folded yet."""
+        out = {}
+        with self.lock:
+            for chan in channels:
+                hm = chan.hm
+                for htlc_proposer in (LOCAL, REMOTE):
+                    for htlc_id in hm.get_maybe_active_htlc_ids(htlc_proposer):
+                        if hm.was_htlc_failed(htlc_id=htlc_id, htlc_proposer=htlc_proposer):
+                            continue
+                        if not hm.was_htlc_preimage_released(htlc_id=htlc_id, htlc_proposer=htlc_proposer):
+                            continue
+                        htlc = hm.get_htlc_by_id(htlc_proposer, htlc_id)
+                        key = htlc.payment_hash.hex()
+                        out[key] = out.get(key, EMPTY_TOTALS).add_htlc(htlc_proposer, htlc)
+        return out
+
+    def get_totals(self, key: str) -> Optional[PaymentTotals]:
+        totals = self._totals.get(key)
+        return PaymentTotals(*totals) if totals is not None else None
+
+    def get_keys(self, *, from_timestamp: Optional[int] = None, to_timestamp: Optional[int] = None) -> List[str]:
+        """Payment hashes of the folded payments, by timestamp.
+        from_timestamp is inclusive, to_timestamp exclusive
+        """
+        with self.lock:
+            start = bisect.bisect_left(self._by_timestamp, (from_timestamp,)) if from_timestamp is not None else 0
+            end = bisect.bisect_left(self._by_timestamp, (to_timestamp,)) if to_timestamp is not None else len(self._by_timestamp)
+            return [key for timestamp, key in self._by_timestamp[start:end]]
+
+    def items(self) -> List[Tuple[str, PaymentTotals]]:
+        with self.lock:
+            return [(key, PaymentTotals(*totals)) for key, totals in self._totals.items()]
+
+    def pop_changed_keys(self) -> set:
+        with self.lock:
+            keys = self._changed_keys
+            self._changed_keys = set()
+            return keys
+
+    def set_channel_items(self, channel_id: bytes, items: Sequence[LightningHistoryItem]) -> None:
+        with self.lock:
+            self._channel_items[channel_id.hex()] = [list(item) for item in items]
+
+    def has_channel_items(self, channel_id: bytes) -> bool:
+        return channel_id.hex() in self._channel_items
+
+    def get_channel_items(self) -> List[LightningHistoryItem]:
+        """History items of channel openings and closings. timestamp is None if unconfirmed."""
+        with self.lock:
+            return [LightningHistoryItem(*item) for items in self._channel_items.values() for item in items]
+
+    def retain_channel_items(self, channel_ids: Iterable[bytes]) -> None:
+        """Removes the channel items of the channels that are not in channel_ids."""
+        channel_ids = set(channel_id.hex() for channel_id in channel_ids)
+        with self.lock:
+            for chan_key in list(self._channel_items.keys()):
+                if chan_key not in channel_ids:
+                    self._channel_items.pop(chan_key)
@@ -1,5 +1,5 @@
 from copy import deepcopy
-from typing import Sequence, Tuple, Dict, TYPE_CHECKING, Set
+from typing import Sequence, Tuple, Dict, TYPE_CHECKING, Set, Optional, Callable
 import threading
 
 from .lnutil import SENT, RECEIVED, LOCAL, REMOTE, HTLCOwner, UpdateAddHtlc, Direction, FeeUpdate
@@ -44,6 +44,10 @@ class HTLCManager:
         # Hence, to avoid deadlocks, we reuse this same lock.
         self.lock = lock if lock else threading.RLock()
 
+        # called with (htlc_proposer, htlc_id) when an htlc that was irrevocably
+        # settled or failed stops being active, see LNHistoryIndex
+        self.on_htlc_removed = None  # type: Optional[Callable[[HTLCOwner, int], None]]
+
         self._init_maybe_active_htlc_ids()
 
     @with_lock
@@ -231,6 +235,8 @@ class HTLCManager:
                         if log_action == 'settles':
                             htlc = self.log[htlc_proposer]['adds'][htlc_id]  # type: UpdateAddHtlc
                             self._balance_delta -= htlc.amount_msat * htlc_proposer
+                        if self.on_htlc_removed:
+                            self.on_htlc_removed(htlc_proposer, htlc_id)
 
     @with_lock
     def _init_maybe_active_htlc_ids(self):
@@ -244,6 +250,10 @@ class HTLCManager:
         # remove old htlcs
         self._update_maybe_active_htlc_ids()
 
+    @with_lock
+    def get_maybe_active_htlc_ids(self, htlc_proposer: HTLCOwner) -> Set[int]:
+        return set(self._maybe_active_htlc_ids[htlc_proposer])
+
     @with_lock
     def discard_unsigned_remote_updates(self):
         """Discard updates sent by the remote, that the remote itself
@@ -1,6 +1,8 @@
 import os
 import csv
+import functools
 import io
+import struct
 from typing import Callable, Tuple, Any, Dict, List, Sequence, Union, Optional, Mapping
 from types import MappingProxyType
 from collections import OrderedDict
@@ -395,6 +397,32 @@ def _is_bolt12_signature_tlv_type(tlv_type: int) -> bool:
     return 240 <= tlv_type <= 1000
 
 
+# field types with a fixed size, that the compiled codecs can handle without
+# calling into _read_primitive_field/_write_primitive_field
+_FIXED_SIZE_INT_TYPES = {'u8': 1, 'u16': 2, 'u32': 4, 'u64': 8}
+_FIXED_SIZE_BYTES_TYPES = {
+    'byte': 1, 'chain_hash': 32, 'channel_id': 32, 'sha256': 32,
+    'signature': 64, 'bip340sig': 64, 'point': 33, 'short_channel_id': 8,
+}
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _check_point(point: bytes) -> None:
+    # node ids repeat a lot in gossip. only successful checks get cached.
+    try:
+        ecc.ECPubkey(b=point)
+    except ecc.keys.InvalidECPointException as e:
+        raise MalformedMsg(f"invalid point: {point.hex()}") from e
+
+
+def _check_points(buf: bytes) -> None:
+    if len(buf) == 33:
+        _check_point(buf)
+        return
+    for point in chunks(buf, 33):
+        _check_point(point)
+
+
 class LNSerializer:
 
     def __init__(self, *, name: str = 'peer_wire'):
@@ -409,6 +437,10 @@ class LNSerializer:
 
         self.subtypes = {}  # type: Dict[str, Dict[str, Sequence[str]]]
 
+        # compiled codecs, built on first use of each msg type
+        self._msg_decoders = {}  # type: Dict[bytes, Callable[[bytes], dict]]
+        self._msg_encoders = {}  # type: Dict[str, Callable[[Mapping], bytes]]
+
         path = os.path.join(os.path.dirname(__file__), "lnwire", name + ".csv")
         with open(path, newline='') as f:
             csvreader = csv.reader(f)
@@ -739,11 +771,8 @@ class LNSerializer:
 
         return parsed
 
-    def encode_msg(self, msg_type: str, **kwargs) -> bytes:
-        """
-        Encode kwargs into a Lightning message (bytes)
-        of the type given in the msg_type string
-        """
+    def _encode_msg_interpreted(self, msg_type: str, **kwargs) -> bytes:
+        """Reference implementation of encode_msg, walking the scheme row by row."""
         #print(f">>> encode_msg. msg_type={msg_type}, payload={kwargs!r}")
         msg_type_bytes = self.msg_type_from_name[msg_type]
         scheme = self.msg_scheme_from_type[msg_type_bytes]
@@ -775,14 +804,8 @@ class LNSerializer:
                     raise Exception(f"unexpected row in scheme: {row!r}")
             return fd.getvalue()
 
-    def decode_msg(self, data: bytes) -> Tuple[str, dict]:
-        """
-        Decode Lightning message by reading the first
-        two bytes to determine message type.
-
-        Returns message type string and parsed message contents dict,
-        or raises FailedToParseMsg.
-        """
+    def _decode_msg_interpreted(self, data: bytes) -> Tuple[str, dict]:
+        """Reference implementation of decode_msg, walking the scheme row by row."""
         #print(f"decode_msg >>> {data.hex()}")
         assert len(data) >= 2
         msg_type_bytes = data[:2]
@@ -824,6 +847,198 @@ class LNSerializer:
         return msg_type_name, parsed
 
 
+    def _compile_msg_decoder(self, msg_type_bytes: bytes) -> Callable[[bytes], dict]:
+        """Turns the scheme of a msg type into a decoder closure.
+        Consecutive fixed-size fields are read with a single struct.Struct,
+        variable-length byte fields are sliced out of the message.
+        Anything else goes through _read_primitive_field.
+        """
+        ops = []  # type: List[Callable[[bytes, int, dict], int]]
+        run_fmt, run_names, run_points = [], [], []
+
+        def flush_run():
+            if not run_names:
+                return
+            st = struct.Struct('>' + ''.join(run_fmt))
+            names, points = tuple(run_names), tuple(run_points)
+
+            def read_fixed(data, pos, parsed):
+                parsed.update(zip(names, st.unpack_from(data, pos)))
+                for name in points:
+                    _check_points(parsed[name])
+                return pos + st.size
+            ops.append(read_fixed)
+            run_fmt.clear(); run_names.clear(); run_points.clear()
+
+        def read_slice(field_name, type_len, count_name, is_point):
+            def read(data, pos, parsed):
+                count = _resolve_field_count(count_name, vars_dict=parsed)
+                if count == 0:
+                    parsed[field_name] = b""
+                    return pos
+                end = pos + count * type_len
+                buf = data[pos:end]
+                if len(buf) != end - pos:
+                    raise UnexpectedEndOfStream()
+                if is_point:
+                    _check_points(buf)
+                parsed[field_name] = buf
+                return end
+            return read
+
+        def read_tlvs(tlv_stream_name):
+            def read(data, pos, parsed):
+                if pos == len(data):
+                    parsed[tlv_stream_name] = {}
+                    return pos
+                with io.BytesIO(data) as fd:
+                    fd.seek(pos)
+                    parsed[tlv_stream_name] = self.read_tlv_stream(fd=fd, tlv_stream_name=tlv_stream_name)
+                    return fd.tell()
+            return read
+
+        def read_generic(field_name, field_type, field_count_str):
+            def read(data, pos, parsed):
+                field_count = _resolve_field_count(field_count_str, vars_dict=parsed)
+                with io.BytesIO(data) as fd:
+                    fd.seek(pos)
+                    parsed[field_name] = _read_primitive_field(fd=fd, field_type=field_type, count=field_count)
+                    return fd.tell()
+            return read
+
+        for row in self.msg_scheme_from_type[msg_type_bytes][1:]:
+            # msgdata,<msgname>,<fieldname>,<typename>,[<count>][,<option>]
+            field_name, field_type, field_count_str = row[2], row[3], row[4]
+            if field_name == "tlvs":
+                flush_run()
+                ops.append(read_tlvs(field_type))
+            elif field_type in _FIXED_SIZE_INT_TYPES and field_count_str == "":
+                run_fmt.append({1: 'B', 2: 'H', 4: 'I', 8: 'Q'}[_FIXED_SIZE_INT_TYPES[field_type]])
+                run_names.append(field_name)
+            elif field_type in _FIXED_SIZE_BYTES_TYPES and (field_count_str == "" or field_count_str.isdigit()):
+                size = _FIXED_SIZE_BYTES_TYPES[field_type] * int(field_count_str or 1)
+                if size == 0:
+                    flush_run()
+                    ops.append(read_generic(field_name, field_type, field_count_str))
+                    continue
+                run_fmt.append(f'{size}s')
+                run_names.append(field_name)
+                if field_type == 'point':
+                    run_points.append(field_name)
+            elif field_type in _FIXED_SIZE_BYTES_TYPES and field_count_str.isidentifier():
+                flush_run()
+                ops.append(read_slice(field_name, _FIXED_SIZE_BYTES_TYPES[field_type], field_count_str, field_type == 'point'))
+            else:
+                flush_run()
+                ops.append(read_generic(field_name, field_type, field_count_str))
+        flush_run()
+
+        def decode(data: bytes) -> dict:
+            parsed = {}
+            pos = 2
+            for op in ops:
+                pos = op(data, pos, parsed)
+            return parsed
+        return decode
+
+    def _compile_msg_encoder(self, msg_type: str) -> Callable[[Mapping], bytes]:
+        """Turns the scheme of a msg type into an encoder closure.
+        Common values (ints for int fields, bytes of the expected size for
+        bytes fields) are serialized directly. Anything else goes through
+        _write_primitive_field, so that the output and errors stay the same.
+        """
+        msg_type_bytes = self.msg_type_from_name[msg_type]
+        writers = []  # type: List[Callable[[Mapping], bytes]]
+
+        def write_generic(field_type, count, value) -> bytes:
+            with io.BytesIO() as fd:
+                _write_primitive_field(fd=fd, field_type=field_type, count=count, value=value)
+                return fd.getvalue()
+
+        def write_int(field_name, field_type, type_len):
+            limit = 1 << (8 * type_len)
+
+            def write(kwargs):
+                value = kwargs.get(field_name, 0)
+                if type(value) is int and 0 <= value < limit:
+                    return value.to_bytes(type_len, 'big')
+                return write_generic(field_type, 1, value)
+            return write
+
+        def write_bytes(field_name, field_type, type_len, field_count_str):
+            def write(kwargs):
+                count = _resolve_field_count(field_count_str, vars_dict=kwargs)
+                value = kwargs.get(field_name, 0)
+                if type(value) is bytes and len(value) == count * type_len:
+                    return value
+                return write_generic(field_type, count, value)
+            return write
+
+        def write_tlvs(tlv_stream_name):
+            def write(kwargs):
+                if tlv_stream_name not in kwargs:
+                    return b""
+                with io.BytesIO() as fd:
+                    self.write_tlv_stream(fd=fd, tlv_stream_name=tlv_stream_name, **(kwargs[tlv_stream_name]))
+                    return fd.getvalue()
+            return write
+
+        def write_other(field_name, field_type, field_count_str):
+            def write(kwargs):
+                count = _resolve_field_count(field_count_str, vars_dict=kwargs)
+                return write_generic(field_type, count, kwargs.get(field_name, 0))
+            return write
+
+        for row in self.msg_scheme_from_type[msg_type_bytes][1:]:
+            # msgdata,<msgname>,<fieldname>,<typename>,[<count>][,<option>]
+            field_name, field_type, field_count_str = row[2], row[3], row[4]
+            if field_name == "tlvs":
+                writers.append(write_tlvs(field_type))
+            elif field_type in _FIXED_SIZE_INT_TYPES and field_count_str == "":
+                writers.append(write_int(field_name, field_type, _FIXED_SIZE_INT_TYPES[field_type]))
+            elif field_type in _FIXED_SIZE_BYTES_TYPES:
+                writers.append(write_bytes(field_name, field_type, _FIXED_SIZE_BYTES_TYPES[field_type], field_count_str))
+            else:
+                writers.append(write_other(field_name, field_type, field_count_str))
+
+        def encode(kwargs: Mapping) -> bytes:
+            return msg_type_bytes + b"".join([w(kwargs) for w in writers])
+        return encode
+
+    def encode_msg(self, msg_type: str, **kwargs) -> bytes:
+        """
+        Encode kwargs into a Lightning message (bytes)
+        of the type given in the msg_type string
+        """
+        encoder = self._msg_encoders.get(msg_type)
+        if encoder is None:
+            encoder = self._msg_encoders[msg_type] = self._compile_msg_encoder(msg_type)
+        return encoder(kwargs)
+
+    def decode_msg(self, data: bytes) -> Tuple[str, dict]:
+        """
+        Decode Lightning message by reading the first
+        two bytes to determine message type.
+
+        Returns message type string and parsed message contents dict,
+        or raises FailedToParseMsg.
+        """
+        assert len(data) >= 2
+        data = bytes(data)
+        msg_type_bytes = data[:2]
+        decoder = self._msg_decoders.get(msg_type_bytes)
+        if decoder is None:
+            if msg_type_bytes not in self.msg_scheme_from_type:
+                return self._decode_msg_interpreted(data)  # raises UnknownMsgType
+            decoder = self._msg_decoders[msg_type_bytes] = self._compile_msg_decoder(msg_type_bytes)
+        try:
+            parsed = decoder(data)
+        except Exception:
+            # let the reference implementation raise, so that errors
+            # are reported the same way
+            return self._decode_msg_interpreted(data)
+        return self.msg_scheme_from_type[msg_type_bytes][0][1], parsed
+
 _inst = LNSerializer()
 encode_msg = _inst.encode_msg
 decode_msg = _inst.decode_msg
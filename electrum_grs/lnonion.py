@@ -23,8 +23,12 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
 import io
 import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import cached_property
 from typing import (Sequence, List, Tuple, NamedTuple, TYPE_CHECKING, Dict, Any, Optional, Union,
                     Mapping, Iterator)
@@ -167,21 +171,28 @@ def get_bolt04_onion_key(key_type: bytes, secret: bytes) -> bytes:
 
 def get_shared_secrets_along_route(payment_path_pubkeys: Sequence[bytes],
                                    session_key: bytes) -> Tuple[Sequence[bytes], Sequence[bytes]]:
-    num_hops = len(payment_path_pubkeys)
-    hop_shared_secrets = num_hops * [b'']
-    hop_blinded_node_ids = num_hops * [b'']
+    hop_shared_secrets = _get_hop_shared_secrets(payment_path_pubkeys, session_key)
+    hop_blinded_node_ids = [get_blinded_node_id(node_id, shared_secret)
+                            for node_id, shared_secret in zip(payment_path_pubkeys, hop_shared_secrets)]
+    return hop_shared_secrets, hop_blinded_node_ids
+
+
+def _get_hop_shared_secrets(payment_path_pubkeys: Sequence[bytes], session_key: bytes) -> List[bytes]:
+    """Shared secrets only. Blinding node ids costs another EC multiplication per hop,
+    which onion packets and errors do not need."""
+    hop_shared_secrets = []
     ephemeral_key = session_key
     # compute shared key for each hop
-    for i in range(0, num_hops):
-        hop_shared_secrets[i] = get_ecdh(ephemeral_key, payment_path_pubkeys[i])
-        hop_blinded_node_ids[i] = get_blinded_node_id(payment_path_pubkeys[i], hop_shared_secrets[i])
+    for node_id in payment_path_pubkeys:
+        shared_secret = get_ecdh(ephemeral_key, node_id)
+        hop_shared_secrets.append(shared_secret)
         ephemeral_pubkey = ecc.ECPrivkey(ephemeral_key).get_public_key_bytes()
-        blinding_factor = sha256(ephemeral_pubkey + hop_shared_secrets[i])
+        blinding_factor = sha256(ephemeral_pubkey + shared_secret)
         blinding_factor_int = int.from_bytes(blinding_factor, byteorder="big")
         ephemeral_key_int = int.from_bytes(ephemeral_key, byteorder="big")
         ephemeral_key_int = ephemeral_key_int * blinding_factor_int % ecc.CURVE_ORDER
         ephemeral_key = ephemeral_key_int.to_bytes(32, byteorder="big")
-    return hop_shared_secrets, hop_blinded_node_ids
+    return hop_shared_secrets
 
 
 def get_blinded_node_id(node_id: bytes, shared_secret: bytes):
@@ -223,12 +234,11 @@ def new_onion_packet(
 ) -> OnionPacket:
     num_hops = len(payment_path_pubkeys)
     assert num_hops == len(hops_data)
-    hop_shared_secrets, _ = get_shared_secrets_along_route(payment_path_pubkeys, session_key)
+    hop_shared_secrets = _get_hop_shared_secrets(payment_path_pubkeys, session_key)
 
-    payload_size = 0
-    for i in range(num_hops):
-        # FIXME: serializing here and again below. cache bytes in OnionHopsDataSingle? _raw_bytes_payload?
-        payload_size += len(hops_data[i].to_bytes())
+    # note: the hmac of each hop is only set below, but it has a fixed size
+    hop_sizes = [len(hop_data.to_bytes()) for hop_data in hops_data]
+    payload_size = sum(hop_sizes)
     if trampoline:
         data_size = payload_size
     elif onion_message:
@@ -242,7 +252,10 @@ def new_onion_packet(
     if payload_size > data_size:
         raise InvalidPayloadSize(f'payload too big for onion packet (max={data_size}, required={payload_size})')
 
-    filler = _generate_filler(b'rho', hops_data, hop_shared_secrets, data_size)
+    # the rho stream of a hop obfuscates its routing info, and its tail is used for the filler
+    rho_streams = [generate_cipher_stream(get_bolt04_onion_key(b'rho', hop_shared_secrets[i]), data_size + hop_sizes[i])
+                   for i in range(num_hops)]
+    filler = _generate_filler_from_streams(hop_sizes, rho_streams, data_size)
     next_hmac = bytes(PER_HOP_HMAC_SIZE)
 
     # Our starting packet needs to be filled out with random bytes, we
@@ -252,14 +265,11 @@ def new_onion_packet(
 
     # compute routing info and MAC for each hop
     for i in range(num_hops-1, -1, -1):
-        rho_key = get_bolt04_onion_key(b'rho', hop_shared_secrets[i])
         mu_key = get_bolt04_onion_key(b'mu', hop_shared_secrets[i])
         hops_data[i] = replace(hops_data[i], hmac=next_hmac)
-        stream_bytes = generate_cipher_stream(rho_key, data_size)
         hop_data_bytes = hops_data[i].to_bytes()
-        mix_header = mix_header[:-len(hop_data_bytes)]
-        mix_header = hop_data_bytes + mix_header
-        mix_header = xor_bytes(mix_header, stream_bytes)
+        mix_header = hop_data_bytes + mix_header[:-len(hop_data_bytes)]
+        mix_header = xor_bytes(mix_header, rho_streams[i])
         if i == num_hops - 1 and len(filler) != 0:
             mix_header = mix_header[:-len(filler)] + filler
         packet = mix_header + associated_data
@@ -353,28 +363,30 @@ def calc_hops_data_for_payment(
 
 def _generate_filler(key_type: bytes, hops_data: Sequence[OnionHopsDataSingle],
                      shared_secrets: Sequence[bytes], data_size:int) -> bytes:
-    num_hops = len(hops_data)
+    hop_sizes = [len(hop_data.to_bytes()) for hop_data in hops_data]
+    streams = [generate_cipher_stream(get_bolt04_onion_key(key_type, shared_secrets[i]), data_size + hop_sizes[i])
+               for i in range(len(hops_data) - 1)]
+    return _generate_filler_from_streams(hop_sizes, streams, data_size)
+
+
+def _generate_filler_from_streams(hop_sizes: Sequence[int], streams: Sequence[bytes], data_size: int) -> bytes:
+    """streams[i] is the cipher stream of hop i, at least data_size + hop_sizes[i] bytes long"""
+    num_hops = len(hop_sizes)
 
     # generate filler that matches all but the last hop (no HMAC for last hop)
-    filler_size = 0
-    for hop_data in hops_data[:-1]:
-        filler_size += len(hop_data.to_bytes())
-    filler = bytearray(filler_size)
+    filler_size = sum(hop_sizes[:-1])
+    filler = bytes(filler_size)
 
+    # Sum up how many frames were used by prior hops.
+    filler_start = data_size
     for i in range(0, num_hops-1):  # -1, as last hop does not obfuscate
-        # Sum up how many frames were used by prior hops.
-        filler_start = data_size
-        for hop_data in hops_data[:i]:
-            filler_start -= len(hop_data.to_bytes())
         # The filler is the part dangling off of the end of the
         # routingInfo, so offset it from there, and use the current
         # hop's frame count as its size.
-        filler_end = data_size + len(hops_data[i].to_bytes())
-
-        stream_key = get_bolt04_onion_key(key_type, shared_secrets[i])
-        stream_bytes = generate_cipher_stream(stream_key, 2 * data_size)
-        filler = xor_bytes(filler, stream_bytes[filler_start:filler_end])
+        filler_end = data_size + hop_sizes[i]
+        filler = xor_bytes(filler, streams[i][filler_start:filler_end])
         filler += bytes(filler_size - len(filler))  # right pad with zeroes
+        filler_start -= hop_sizes[i]
 
     return filler
 
@@ -385,6 +397,14 @@ def generate_cipher_stream(stream_key: bytes, num_bytes: int) -> bytes:
                             data=bytes(num_bytes))
 
 
+def xor_cipher_stream(stream_key: bytes, data: bytes) -> bytes:
+    """Same as xor_bytes(data, generate_cipher_stream(stream_key, len(data))),
+    but the cipher does the XOR, without a big-integer round trip."""
+    return chacha20_encrypt(key=stream_key,
+                            nonce=bytes(8),
+                            data=data)
+
+
 class ProcessedOnionPacket(NamedTuple):
     are_we_final: bool
     hop_data: OnionHopsDataSingle
@@ -449,9 +469,8 @@ def process_onion_packet(
     data_size = len(onion_packet.hops_data) if is_trampoline else HOPS_DATA_SIZE
     if is_onion_message and len(onion_packet.hops_data) > HOPS_DATA_SIZE:
         data_size = ONION_MESSAGE_LARGE_SIZE
-    stream_bytes = generate_cipher_stream(rho_key, 2 * data_size)
     padded_header = onion_packet.hops_data + bytes(data_size)
-    next_hops_data = xor_bytes(padded_header, stream_bytes)
+    next_hops_data = xor_cipher_stream(rho_key, padded_header)
     next_hops_data_fd = io.BytesIO(next_hops_data)
     hop_data = OnionHopsDataSingle.from_fd(next_hops_data_fd, tlv_stream_name=tlv_stream_name)
     # trampoline
@@ -476,6 +495,103 @@ def process_onion_packet(
     return ProcessedOnionPacket(are_we_final, hop_data, next_onion_packet, trampoline_onion_packet)
 
 
+class OnionWorkerPool:
+    """Peels and creates onion packets in worker threads, off the event loop.
+
+    The expensive parts (EC multiplications in libsecp256k1, chacha20, hmac) release
+    the GIL, so the workers also run in parallel. Jobs are split in one chunk per worker.
+    At most max_pending onions are queued: when the pool is busy, the methods return None,
+    and the caller should process its onions inline.
+    """
+
+    def __init__(self, *, max_workers: int = None, max_pending: int = 1000):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='onion_worker')
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def _reserve(self, n: int) -> bool:
+        with self._lock:
+            if self._pending + n > self.max_pending:
+                return False
+            self._pending += n
+            return True
+
+    def _release(self, n: int) -> None:
+        with self._lock:
+            self._pending -= n
+
+    async def _map(self, func, jobs: Sequence) -> Optional[list]:
+        """Returns [func(job) for job in jobs], with the exceptions raised by func as results."""
+        if not jobs:
+            return []
+        if not self._reserve(len(jobs)):
+            return None
+        def run_chunk(chunk):
+            results = []
+            for job in chunk:
+                try:
+                    results.append(func(job))
+                except Exception as e:
+                    results.append(e)
+            return results
+        num_chunks = min(self.max_workers, len(jobs))
+        chunks = [jobs[i::num_chunks] for i in range(num_chunks)]
+        loop = asyncio.get_running_loop()
+        try:
+            chunk_results = await asyncio.gather(
+                *[loop.run_in_executor(self._executor, run_chunk, chunk) for chunk in chunks])
+        finally:
+            self._release(len(jobs))
+        results = [None] * len(jobs)
+        for i, chunk_result in enumerate(chunk_results):
+            results[i::num_chunks] = chunk_result
+        return results
+
+    async def process_onion_packets(
+            self,
+            jobs: Sequence[Tuple[OnionPacket, bytes]],  # (onion_packet, associated_data)
+            our_onion_private_key: bytes,
+            *,
+            is_trampoline: bool = False,
+    ) -> Optional[List[Union[ProcessedOnionPacket, Exception]]]:
+        """Peels each packet with process_onion_packet. The result of a packet that
+        fails to process is the exception."""
+        return await self._map(
+            lambda job: process_onion_packet(
+                job[0], our_onion_private_key, associated_data=job[1], is_trampoline=is_trampoline),
+            list(jobs))
+
+    async def new_onion_packets(
+            self,
+            jobs: Sequence[Tuple[Sequence[bytes], bytes, List[OnionHopsDataSingle], bytes]],
+            *,
+            trampoline: bool = False,
+    ) -> Optional[List[Union[OnionPacket, Exception]]]:
+        """Creates a packet with new_onion_packet for each
+        (payment_path_pubkeys, session_key, hops_data, associated_data),
+        e.g. for all the parts of a multi-part payment."""
+        return await self._map(
+            lambda job: new_onion_packet(job[0], job[1], job[2], associated_data=job[3], trampoline=trampoline),
+            list(jobs))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_worker_pool = None  # type: Optional[OnionWorkerPool]
+_worker_pool_lock = threading.Lock()
+
+
+def get_onion_worker_pool() -> OnionWorkerPool:
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = OnionWorkerPool()
+        return _worker_pool
+
+
 def compare_trampoline_onions(
     trampoline_onions: Iterator[Optional[ProcessedOnionPacket]],
     *,
@@ -605,8 +721,7 @@ def construct_onion_error(
 def obfuscate_onion_error(error_packet, their_public_key, our_onion_private_key):
     shared_secret = get_ecdh(our_onion_private_key, their_public_key)
     ammag_key = get_bolt04_onion_key(b'ammag', shared_secret)
-    stream_bytes = generate_cipher_stream(ammag_key, len(error_packet))
-    error_packet = xor_bytes(error_packet, stream_bytes)
+    error_packet = xor_cipher_stream(ammag_key, error_packet)
     return error_packet
 
 
@@ -617,7 +732,7 @@ def _decode_onion_error(error_packet: bytes, payment_path_pubkeys: Sequence[byte
     https://github.com/lightning/bolts/blob/14272b1bd9361750cfdb3e5d35740889a6b510b5/04-onion-routing.md?plain=1#L1096
     """
     num_hops = len(payment_path_pubkeys)
-    hop_shared_secrets, _ = get_shared_secrets_along_route(payment_path_pubkeys, session_key)
+    hop_shared_secrets = _get_hop_shared_secrets(payment_path_pubkeys, session_key)
     result = None
     dummy_secret = bytes(32)
     # SHOULD continue decrypting, until the loop has been repeated 27 times
@@ -630,8 +745,7 @@ def _decode_onion_error(error_packet: bytes, payment_path_pubkeys: Sequence[byte
             ammag_key = get_bolt04_onion_key(b'ammag', dummy_secret)
             um_key = get_bolt04_onion_key(b'um', dummy_secret)
 
-        stream_bytes = generate_cipher_stream(ammag_key, len(error_packet))
-        error_packet = xor_bytes(error_packet, stream_bytes)
+        error_packet = xor_cipher_stream(ammag_key, error_packet)
         hmac_computed = hmac_oneshot(um_key, msg=error_packet[32:], digest=hashlib.sha256)
         hmac_found = error_packet[:32]
         if util.constant_time_compare(hmac_found, hmac_computed) and i < num_hops:
@@ -23,7 +23,7 @@ from aiorpcx import ignore_after
 from .lrucache import LRUCache
 from .crypto import sha256, sha256d, privkey_to_pubkey
 from . import bitcoin, util
-from . import constants
+from . import constants, metrics
 from .util import (log_exceptions, ignore_exceptions, chunks, OldTaskGroup,
                    UnrelatedTransactionException, error_text_bytes_to_safe_str, AsyncHangDetector,
                    NoDynamicFeeEstimates, event_listener, EventListener)
@@ -48,7 +48,7 @@ from .lnutil import (Outpoint, LocalConfig, RECEIVED, UpdateAddHtlc, ChannelConf
                      IncompatibleLightningFeatures, ChannelType, LNProtocolWarning, validate_features,
                      IncompatibleOrInsaneFeatures, ReceivedMPPStatus, ReceivedMPPHtlc,
                      GossipForwardingMessage, GossipTimestampFilter, channel_id_from_funding_tx,
-                     serialize_htlc_key, Keypair, RecvMPPResolution)
+                     serialize_htlc_key, Keypair, RecvMPPResolution, LN_P2P_NETWORK_TIMEOUT)
 from .lntransport import LNTransport, LNTransportBase, LightningPeerConnectionClosed, HandshakeFailed
 from .lnmsg import encode_msg, decode_msg, UnknownOptionalMsgType, FailedToParseMsg
 from .interface import GracefulDisconnect
@@ -63,7 +63,8 @@ if TYPE_CHECKING:
     from .transaction import PartialTransaction
 
 
-LN_P2P_NETWORK_TIMEOUT = 20
+HTLC_SWITCH_ITERATION_LATENCY = metrics.histogram(
+    'electrum_lnpeer_htlc_switch_iteration_seconds', 'Duration of one iteration of the HTLC switch')
 
 
 class Peer(Logger, EventListener):
@@ -1986,21 +1987,24 @@ class Peer(Logger, EventListener):
             min_final_cltv_delta: int,
             payment_secret: bytes,
             trampoline_onion: Optional[OnionPacket] = None,
+            onion: Optional[Tuple[OnionPacket, int, int, bytes]] = None,  # if already created, see LNWallet.create_onions_for_routes
         ) -> UpdateAddHtlc:
 
         assert amount_msat > 0, "amount_msat is not greater zero"
         assert len(route) > 0
         if not chan.can_send_update_add_htlc():
             raise PaymentFailure("Channel cannot send update_add_htlc")
-        onion, amount_msat, cltv_abs, session_key = self.lnworker.create_onion_for_route(
-            route=route,
-            amount_msat=amount_msat,
-            total_msat=total_msat,
-            payment_hash=payment_hash,
-            min_final_cltv_delta=min_final_cltv_delta,
-            payment_secret=payment_secret,
-            trampoline_onion=trampoline_onion
-        )
+        if onion is None:
+            onion = self.lnworker.create_onion_for_route(
+                route=route,
+                amount_msat=amount_msat,
+                total_msat=total_msat,
+                payment_hash=payment_hash,
+                min_final_cltv_delta=min_final_cltv_delta,
+                payment_secret=payment_secret,
+                trampoline_onion=trampoline_onion
+            )
+        onion, amount_msat, cltv_abs, session_key = onion
         htlc = self.send_htlc(
             chan=chan,
             payment_hash=payment_hash,
@@ -2820,10 +2824,12 @@ class Peer(Logger, EventListener):
                 async with OldTaskGroup(wait=any) as group:
                     await group.spawn(self._received_revack_event.wait())
                     await group.spawn(self.downstream_htlc_resolved_event.wait())
+            await self._peel_incoming_onions()
             self._htlc_switch_iterstart_event.set()
             self._htlc_switch_iterstart_event.clear()
             try:
-                self._run_htlc_switch_iteration()
+                with HTLC_SWITCH_ITERATION_LATENCY.time():
+                    self._run_htlc_switch_iteration()
             except Exception as e:
                 # this is code with many asserts and dense logic so it seems useful to allow the user
                 # report to exceptions that otherwise might go unnoticed for some time
@@ -2935,6 +2941,40 @@ class Peer(Logger, EventListener):
                 del self.lnworker.received_mpp_htlcs[payment_key]
                 self.lnworker.maybe_cleanup_forwarding(payment_key)
 
+    async def _peel_incoming_onions(self) -> None:
+        """Peels the onions of new incoming htlcs in the onion worker pool, so that
+        _run_htlc_switch_iteration finds them in _processed_onion_cache and does not
+        block the event loop. Onions that fail to process, or that do not fit in the
+        pool or in the cache, are processed inline by the htlc switch, as before.
+        """
+        jobs = []
+        for chan in self.channels.values():
+            if not chan.can_update_ctx(proposer=LOCAL):
+                continue
+            for htlc_id, onion_packet_hex in list(chan.unfulfilled_htlcs.items()):
+                if len(jobs) >= self._processed_onion_cache.maxsize // 2:
+                    break
+                if not chan.hm.is_htlc_irrevocably_added_yet(htlc_proposer=REMOTE, htlc_id=htlc_id):
+                    continue
+                htlc = chan.hm.get_htlc_by_id(REMOTE, htlc_id)
+                try:
+                    onion_packet = OnionPacket.from_bytes(bytes.fromhex(onion_packet_hex))
+                except Exception:
+                    continue
+                cache_key = self._processed_onion_cache_key(onion_packet, htlc.payment_hash, is_trampoline=False)
+                if cache_key not in self._processed_onion_cache:
+                    jobs.append((cache_key, onion_packet, htlc.payment_hash))
+        if not jobs:
+            return
+        results = await lnonion.get_onion_worker_pool().process_onion_packets(
+            [(onion_packet, payment_hash) for _, onion_packet, payment_hash in jobs],
+            our_onion_private_key=self.privkey)
+        if results is None:  # pool busy
+            return
+        for (cache_key, _, _), result in zip(jobs, results):
+            if isinstance(result, ProcessedOnionPacket):
+                self._processed_onion_cache[cache_key] = result
+
     def _maybe_cleanup_received_htlcs_pending_removal(self) -> None:
         done = set()
         for chan, htlc_id in self.received_htlcs_pending_removal:
@@ -3280,13 +3320,17 @@ class Peer(Logger, EventListener):
             raise onion_parsing_error
         return onion_packet
 
+    @staticmethod
+    def _processed_onion_cache_key(onion_packet: OnionPacket, payment_hash: bytes, *, is_trampoline: bool) -> bytes:
+        return sha256(onion_packet.onion_hash + payment_hash + bytes([is_trampoline]))
+
     def _process_incoming_onion_packet(
             self,
             onion_packet: OnionPacket, *,
             payment_hash: bytes,
             is_trampoline: bool = False) -> ProcessedOnionPacket:
         onion_hash = onion_packet.onion_hash
-        cache_key = sha256(onion_hash + payment_hash + bytes([is_trampoline]))  # type: ignore
+        cache_key = self._processed_onion_cache_key(onion_packet, payment_hash, is_trampoline=is_trampoline)
         if cached_onion := self._processed_onion_cache.get(cache_key):
             return cached_onion
         try:
@@ -34,6 +34,7 @@ from math import inf
 import attr
 
 from .util import profiler, with_lock
+from . import metrics
 from .logging import Logger
 from .lnutil import (NUM_MAX_EDGES_IN_PAYMENT_PATH, ShortChannelID, LnFeatures,
                      NBLOCK_CLTV_DELTA_TOO_FAR_INTO_FUTURE, PaymentFeeBudget)
@@ -46,6 +47,9 @@ DEFAULT_PENALTY_BASE_MSAT = 500  # how much base fee we apply for unknown sendin
 DEFAULT_PENALTY_PROPORTIONAL_MILLIONTH = 100  # how much relative fee we apply for unknown sending capability of a channel
 HINT_DURATION = 3600  # how long (in seconds) a liquidity hint remains valid
 
+FIND_ROUTE_LATENCY = metrics.histogram(
+    'electrum_lnrouter_find_route_seconds', 'Duration of LNPathFinder.find_route', ['result'])
+
 
 class NoChannelPolicy(Exception):
     def __init__(self, short_channel_id: bytes):
@@ -735,6 +739,7 @@ class LNPathFinder(Logger):
             my_sending_channels: Dict[ShortChannelID, 'Channel'] = None,
             private_route_edges: Dict[ShortChannelID, RouteEdge] = None,
     ) -> Optional[LNPaymentRoute]:
+        t0 = time.monotonic()
         route = None
         if not path:
             path = self.find_path_for_payment(
@@ -746,4 +751,5 @@ class LNPathFinder(Logger):
         if path:
             route = self.create_route_from_path(
                 path, my_channels=my_sending_channels, private_route_edges=private_route_edges)
+        FIND_ROUTE_LATENCY.labels(result='found' if route else 'not_found').observe(time.monotonic() - t0)
         return route
@@ -312,12 +312,14 @@ def sweep_our_ctx(
         our_conf.per_commitment_secret_seed, RevocationStore.START_INDEX - ctn)
     our_pcp = ecc.ECPrivkey(our_per_commitment_secret).get_public_key_bytes(compressed=True)
     our_delayed_bp_privkey = ecc.ECPrivkey(our_conf.delayed_basepoint.privkey)
-    our_localdelayed_privkey = derive_privkey(our_delayed_bp_privkey.secret_scalar, our_pcp)
+    our_localdelayed_privkey = derive_privkey(our_delayed_bp_privkey.secret_scalar, our_pcp,
+                                              basepoint=our_conf.delayed_basepoint.pubkey)
     our_localdelayed_privkey = ecc.ECPrivkey.from_secret_scalar(our_localdelayed_privkey)
     their_revocation_pubkey = derive_blinded_pubkey(their_conf.revocation_basepoint.pubkey, our_pcp)
     to_self_delay = their_conf.to_self_delay
     our_htlc_privkey = derive_privkey(secret=int.from_bytes(our_conf.htlc_basepoint.privkey, 'big'),
-                                       per_commitment_point=our_pcp).to_bytes(32, 'big')
+                                       per_commitment_point=our_pcp,
+                                       basepoint=our_conf.htlc_basepoint.pubkey).to_bytes(32, 'big')
     our_localdelayed_pubkey = our_localdelayed_privkey.get_public_key_bytes(compressed=True)
     to_local_witness_script = make_commitment_output_to_local_witness_script(
         their_revocation_pubkey, to_self_delay, our_localdelayed_pubkey)
@@ -747,7 +749,8 @@ def sweep_their_ctx(
                 )
 
     # HTLCs
-    our_htlc_privkey = derive_privkey(secret=int.from_bytes(our_conf.htlc_basepoint.privkey, 'big'), per_commitment_point=their_pcp)
+    our_htlc_privkey = derive_privkey(secret=int.from_bytes(our_conf.htlc_basepoint.privkey, 'big'), per_commitment_point=their_pcp,
+                                      basepoint=our_conf.htlc_basepoint.pubkey)
     our_htlc_privkey = ecc.ECPrivkey.from_secret_scalar(our_htlc_privkey)
     their_htlc_pubkey = derive_pubkey(their_conf.htlc_basepoint.pubkey, their_pcp)
     def tx_htlc(
@@ -489,6 +489,8 @@ class LNProtocolWarning(Exception):
 # TODO make some of these values configurable?
 REDEEM_AFTER_DOUBLE_SPENT_DELAY = 30
 
+LN_P2P_NETWORK_TIMEOUT = 20
+
 # timeout after which we forget incoming channels if the funding tx has no confirmation
 # https://github.com/lightning/bolts/commit/ba00bf8f4cd85f21bacfc03adcafd4acc7d68382
 CHANNEL_OPENING_TIMEOUT_BLOCKS = 2016
@@ -620,20 +622,41 @@ def secret_to_pubkey(secret: int) -> bytes:
     return ecc.ECPrivkey.from_secret_scalar(secret).get_public_key_bytes(compressed=True)
 
 
+# The tweaked keys of a channel are derived again and again, for every HTLC of
+# every state, from the same few basepoints and per-commitment points. The EC
+# operations themselves are done by libsecp256k1, which already multiplies by G
+# with precomputed tables, in constant time; what we can save is redoing them.
+# These caches are keyed by public points only: the result of a derivation that
+# involves a secret is never cached, so there is no lookup that depends on it.
+# note: lru_cache is thread-safe, these are also called from the GUI thread
 def derive_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
+    return _derive_pubkey(bytes(basepoint), bytes(per_commitment_point))
+
+
+@lru_cache(maxsize=10**4)
+def _derive_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
     p = ecc.ECPubkey(basepoint) + ecc.GENERATOR * ecc.string_to_number(sha256(per_commitment_point + basepoint))
     return p.get_public_key_bytes()
 
 
-def derive_privkey(secret: int, per_commitment_point: bytes) -> int:
+def derive_privkey(secret: int, per_commitment_point: bytes, *, basepoint: bytes = None) -> int:
+    """Note: callers that have the keypair should pass its pubkey as `basepoint`,
+    which saves computing it from the secret.
+    """
     assert type(secret) is int
-    basepoint_bytes = secret_to_pubkey(secret)
-    basepoint = secret + ecc.string_to_number(sha256(per_commitment_point + basepoint_bytes))
-    basepoint %= CURVE_ORDER
-    return basepoint
+    if basepoint is None:
+        basepoint = secret_to_pubkey(secret)
+    privkey = secret + ecc.string_to_number(sha256(per_commitment_point + basepoint))
+    privkey %= CURVE_ORDER
+    return privkey
 
 
 def derive_blinded_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
+    return _derive_blinded_pubkey(bytes(basepoint), bytes(per_commitment_point))
+
+
+@lru_cache(maxsize=10**4)
+def _derive_blinded_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
     k1 = ecc.ECPubkey(basepoint) * ecc.string_to_number(sha256(basepoint + per_commitment_point))
     k2 = ecc.ECPubkey(per_commitment_point) * ecc.string_to_number(sha256(per_commitment_point + basepoint))
     return (k1 + k2).get_public_key_bytes()
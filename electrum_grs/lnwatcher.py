@@ -3,7 +3,9 @@
 # file LICENCE or http://www.opensource.org/licenses/mit-license.php
 
 import asyncio
-from typing import TYPE_CHECKING, Optional, Dict, Callable, Awaitable
+import heapq
+from collections import defaultdict
+from typing import TYPE_CHECKING, Optional, Dict, Callable, Awaitable, Set, List, Tuple, Iterable
 
 from . import util
 from .util import (
@@ -12,9 +14,10 @@ from .util import (
 )
 from .transaction import Transaction, TxOutpoint
 from .logging import Logger
-from .address_synchronizer import TX_HEIGHT_LOCAL
+from .lrucache import LRUCache
+from .address_synchronizer import TX_HEIGHT_LOCAL, TX_DEEPLY_MINED_CONF
 from .lnutil import REDEEM_AFTER_DOUBLE_SPENT_DELAY
-from .lnsweep import KeepWatchingTXO, SweepInfo
+from .lnsweep import KeepWatchingTXO, SweepInfo, MaybeSweepInfo
 
 if TYPE_CHECKING:
     from .network import Network
@@ -22,9 +25,65 @@ if TYPE_CHECKING:
     from .lnchannel import AbstractChannel
 
 
+class HeightTimer:
+    """Keys scheduled to be woken up once the chain reaches a given height.
+
+    Keys are kept in one bucket per height, and a heap of the bucket heights
+    gives the next bucket that is due. A key is in at most one bucket.
+    """
+
+    def __init__(self):
+        self._height_of_key = {}  # type: Dict[str, int]
+        self._buckets = {}  # type: Dict[int, Set[str]]
+        self._heights = []  # type: List[int]  # heap of bucket heights
+
+    def schedule(self, key: str, height: int) -> None:
+        old_height = self._height_of_key.get(key)
+        if old_height == height:
+            return
+        if old_height is not None:
+            self._remove(key, old_height)
+        self._height_of_key[key] = height
+        bucket = self._buckets.get(height)
+        if bucket is None:
+            bucket = self._buckets[height] = set()
+            heapq.heappush(self._heights, height)
+        bucket.add(key)
+
+    def cancel(self, key: str) -> None:
+        height = self._height_of_key.pop(key, None)
+        if height is not None:
+            self._remove(key, height)
+
+    def _remove(self, key: str, height: int) -> None:
+        bucket = self._buckets[height]
+        bucket.discard(key)
+        if not bucket:
+            # the height stays in the heap, and is skipped when popped
+            del self._buckets[height]
+
+    def get(self, key: str) -> Optional[int]:
+        return self._height_of_key.get(key)
+
+    def pop_due(self, height: int) -> Set[str]:
+        """Removes and returns the keys scheduled at or below height."""
+        keys = set()
+        while self._heights and self._heights[0] <= height:
+            for key in self._buckets.pop(heapq.heappop(self._heights), ()):
+                del self._height_of_key[key]
+                keys.add(key)
+        return keys
+
+    def __len__(self):
+        return len(self._height_of_key)
+
+
 class LNWatcher(Logger, EventListener):
     MAX_CALLBACK_TRIGGER_DELAY_SEC = 600
     CALLBACK_LOOP_POLL_INTERVAL_SEC = 5
+    # sweep info of a closing tx does not depend on the height. We still
+    # recompute it from time to time, in case the channel learnt something.
+    SWEEP_INFO_CACHE_HEIGHT_BUCKET = 144
 
     def __init__(self, lnworker: 'LNWallet'):
         self.lnworker = lnworker
@@ -32,6 +91,17 @@ class LNWatcher(Logger, EventListener):
         self.adb = lnworker.wallet.adb
         self.config = lnworker.config
         self.callbacks = {}  # type: Dict[str, Callable[[], Awaitable[None]]]  # address -> lambda function
+        # addresses and outpoints whose txs are relevant to a callback, so
+        # that a tx only triggers the callbacks it touches
+        self.keys_by_address = defaultdict(set)  # type: Dict[str, Set[str]]
+        self.keys_by_outpoint = defaultdict(set)  # type: Dict[str, Set[str]]
+        self._watched_by_key = defaultdict(set)  # type: Dict[str, Set[str]]  # callback key -> addresses and outpoints
+        # when a callback has to run again if no relevant tx comes in.
+        # by default, that is at the next block.
+        self.height_timer = HeightTimer()
+        self._last_block_height = None  # type: Optional[int]
+        self._sweep_info_cache = LRUCache(maxsize=4096)  # type: LRUCache[Tuple[str, str, Optional[str], int], Tuple[bool, Dict[str, MaybeSweepInfo]]]
+        self._sweeps_to_retry = set()  # type: Set[str]  # prevouts we could not pass to the txbatcher yet
         self.network = None
         self.register_callbacks()
         self._pending_force_closes = set()
@@ -74,6 +144,15 @@ class LNWatcher(Logger, EventListener):
 
     def remove_callback(self, address: str) -> None:
         self.callbacks.pop(address, None)
+        self.height_timer.cancel(address)
+        for item in self._watched_by_key.pop(address, set()):
+            index = self.keys_by_outpoint if ':' in item else self.keys_by_address
+            keys = index.get(item)
+            if keys is None:
+                continue
+            keys.discard(address)
+            if not keys:
+                del index[item]
 
     def add_callback(
         self,
@@ -91,48 +170,117 @@ class LNWatcher(Logger, EventListener):
             #   (even for old redeemed channels and old swaps)
             self.adb.add_address(address)
         self.callbacks[address] = callback
+        self.watch_address(address, address)
+        self.height_timer.schedule(address, self.adb.get_local_height() + 1)
+
+    def watch_address(self, address: str, key: str) -> None:
+        """Runs the callback of key whenever a tx paying to or spending from address is added or mined."""
+        self.keys_by_address[address].add(key)
+        self._watched_by_key[key].add(address)
+
+    def watch_outpoint(self, outpoint: str, key: str) -> None:
+        """Runs the callback of key whenever a tx spending outpoint is added or mined."""
+        self.keys_by_outpoint[outpoint].add(key)
+        self._watched_by_key[key].add(outpoint)
+
+    def schedule_check(self, key: str, height: int) -> None:
+        """Runs the callback of key at height, instead of at the next block.
+        Meant to be called from the callback itself."""
+        if key in self.callbacks:
+            self.height_timer.schedule(key, height)
 
-    async def trigger_callbacks(self, *, requires_synchronizer: bool = True):
+    def get_keys_touched_by_tx(self, tx: Transaction) -> Set[str]:
+        keys = set()
+        for txin in tx.inputs():
+            keys |= self.keys_by_outpoint.get(txin.prevout.to_str(), set())
+            address = self.adb.get_txin_address(txin)
+            keys |= self.keys_by_address.get(address, set())
+        for txout in tx.outputs():
+            keys |= self.keys_by_address.get(txout.address, set())
+        return keys
+
+    def get_keys_touched_by_txid(self, txid: str) -> Set[str]:
+        tx = self.adb.get_transaction(txid)
+        return self.get_keys_touched_by_tx(tx) if tx else set()
+
+    async def trigger_callbacks(self, keys: Optional[Iterable[str]] = None, *, requires_synchronizer: bool = True):
+        """Runs the given callbacks, or all of them if keys is None."""
         if requires_synchronizer and not self.adb.synchronizer:
             self.logger.debug("synchronizer not set yet")
             return
-        for address, callback in list(self.callbacks.items()):
+        is_full_sweep = keys is None
+        keys = list(self.callbacks) if is_full_sweep else list(keys)
+        if not keys and not is_full_sweep:
+            return
+        next_height = self.adb.get_local_height() + 1
+        for key in keys:
+            callback = self.callbacks.get(key)
+            if callback is None:
+                continue
+            self.height_timer.schedule(key, next_height)
             try:
                 await callback()
             except Exception:
-                self.logger.exception(f"LNWatcher callback failed {address=}")
+                self.logger.exception(f"LNWatcher callback failed address={key}")
         # send callback to GUI
         util.trigger_callback('wallet_updated', self.lnworker.wallet)
-        self._last_callback_trigger_ts = now()
+        if is_full_sweep:
+            self._last_callback_trigger_ts = now()
 
     @event_listener
     async def on_event_blockchain_updated(self, *args):
-        await self.trigger_callbacks()
+        if not self.adb.synchronizer:
+            return
+        height = self.adb.get_local_height()
+        if self._last_block_height is None or height <= self._last_block_height:
+            # first block since we started, or a reorg
+            keys = None
+        else:
+            keys = self.height_timer.pop_due(height)
+        self._last_block_height = height
+        await self.trigger_callbacks(keys)
 
     @event_listener
     async def on_event_adb_added_tx(self, adb, tx_hash, tx):
         # called if we add local tx
         if adb != self.adb:
             return
-        await self.trigger_callbacks()
+        await self.trigger_callbacks(self.get_keys_touched_by_tx(tx))
+
+    @event_listener
+    async def on_event_adb_removed_tx(self, adb, tx_hash, tx):
+        if adb != self.adb:
+            return
+        await self.trigger_callbacks(self.get_keys_touched_by_tx(tx))
 
     @event_listener
     async def on_event_adb_added_verified_tx(self, adb, tx_hash):
         if adb != self.adb:
             return
-        await self.trigger_callbacks()
+        await self.trigger_callbacks(self.get_keys_touched_by_txid(tx_hash))
 
     @event_listener
-    async def on_event_adb_set_up_to_date(self, adb):
+    async def on_event_adb_removed_verified_tx(self, adb, tx_hash):
         if adb != self.adb:
             return
-        await self.trigger_callbacks()
+        await self.trigger_callbacks(self.get_keys_touched_by_txid(tx_hash))
+
+    @event_listener
+    async def on_event_adb_tx_height_changed(self, adb, tx_hash, old_height, tx_height):
+        # e.g. a local tx got broadcast
+        if adb != self.adb:
+            return
+        await self.trigger_callbacks(self.get_keys_touched_by_txid(tx_hash))
+
+    # note: history changes (e.g. a tx dropped from the mempool) do not always come with
+    #       a tx event. Wallet.on_event_adb_set_up_to_date runs all callbacks for those.
 
     def add_channel(self, chan: 'AbstractChannel') -> None:
         outpoint = chan.funding_outpoint.to_str()
         address = chan.get_funding_address()
         callback = lambda: self.check_onchain_situation(address, outpoint)
         self.add_callback(address, callback, subscribe=chan.need_to_subscribe())
+        self.watch_outpoint(outpoint, address)
 
     @ignore_exceptions
     @log_exceptions
@@ -196,17 +344,24 @@ class LNWatcher(Logger, EventListener):
         Side-effects:
           - sets defaults labels
           - populates wallet._accounting_addresses
+          - schedules the next check of the channel, see schedule_check
         """
         assert closing_tx
         chan = self.lnworker.channel_by_txo(funding_outpoint)
         if not chan:
             return False
+        key = chan.get_funding_address()
         local_height = self.adb.get_local_height()
+        # heights at which something might change if no relevant tx comes in
+        check_heights = []  # type: List[int]
+        self.watch_outputs(closing_tx, key)
         # detect who closed and get information about how to claim outputs
-        is_local_ctx, sweep_info_dict = chan.get_ctx_sweep_info(closing_tx)
+        is_local_ctx, sweep_info_dict = self.get_ctx_sweep_info(chan, closing_tx)
         # note: we need to keep watching *at least* until the closing tx is deeply mined,
         #       possibly longer if there are TXOs to sweep
         keep_watching = not self.adb.is_deeply_mined(closing_tx.txid())
+        if keep_watching:
+            check_heights.append(self.get_deeply_mined_height(closing_tx.txid()))
         # create and broadcast transactions
         for prevout, sweep_info in sweep_info_dict.items():
             prev_txid, prev_index = prevout.split(':')
@@ -214,6 +369,8 @@ class LNWatcher(Logger, EventListener):
             self.lnworker.wallet.set_default_label(prevout, name)
             if isinstance(sweep_info, KeepWatchingTXO):  # haven't yet decided if we want to sweep
                 keep_watching |= sweep_info.until_height > local_height
+                # we might learn the preimage at any time
+                check_heights.append(local_height + 1)
                 continue
             assert isinstance(sweep_info, SweepInfo), sweep_info
             if not self.adb.get_transaction(prev_txid):
@@ -225,50 +382,122 @@ class LNWatcher(Logger, EventListener):
             spender_tx = self.adb.get_transaction(spender_txid) if spender_txid else None
             if spender_tx:
                 # the spender might be the remote, revoked or not
-                htlc_sweepinfo = chan.maybe_sweep_htlcs(closing_tx, spender_tx)
+                htlc_sweepinfo = self.get_htlc_sweep_info(chan, closing_tx, spender_tx)
                 if htlc_sweepinfo:
                     self.adb.subscribe_to_outputs(spender_txid)
+                    self.watch_outputs(spender_tx, key)
                 for prevout2, htlc_sweep_info in htlc_sweepinfo.items():
                     self.lnworker.wallet.set_default_label(prevout2, htlc_sweep_info.name)
                     if isinstance(htlc_sweep_info, KeepWatchingTXO):  # haven't yet decided if we want to sweep
                         keep_watching |= htlc_sweep_info.until_height > local_height
+                        check_heights.append(local_height + 1)
                         continue
                     assert isinstance(htlc_sweep_info, SweepInfo), htlc_sweep_info
                     watch_htlc_sweep_info = self.maybe_redeem(htlc_sweep_info)
                     htlc_tx_spender = self.adb.get_spender(prevout2)
                     if htlc_tx_spender:
-                        keep_watching |= not self.adb.is_deeply_mined(htlc_tx_spender)
+                        if not self.adb.is_deeply_mined(htlc_tx_spender):
+                            keep_watching = True
+                            check_heights.append(self.get_deeply_mined_height(htlc_tx_spender))
                         self.maybe_add_accounting_address(htlc_tx_spender, htlc_sweep_info)
                     else:
                         keep_watching |= watch_htlc_sweep_info
-                keep_watching |= not self.adb.is_deeply_mined(spender_txid)
+                        check_heights.append(self.get_sweep_check_height(htlc_sweep_info))
+                if not self.adb.is_deeply_mined(spender_txid):
+                    keep_watching = True
+                    check_heights.append(self.get_deeply_mined_height(spender_txid))
                 self.maybe_extract_preimage(chan, spender_tx, prevout)
                 self.maybe_add_accounting_address(spender_txid, sweep_info)
             else:
                 keep_watching |= watch_sweep_info
+                check_heights.append(self.get_sweep_check_height(sweep_info))
             self.maybe_add_pending_forceclose(
                 chan=chan,
                 spender_txid=spender_txid,
                 is_local_ctx=is_local_ctx,
                 sweep_info=sweep_info,
             )
+        check_heights = [h for h in check_heights if h > local_height]
+        if keep_watching and check_heights:
+            self.schedule_check(key, min(check_heights))
+        elif keep_watching:
+            # nothing to do until a relevant tx comes in
+            self.height_timer.cancel(key)
         return keep_watching
 
+    def watch_outputs(self, tx: Transaction, key: str) -> None:
+        for txout in tx.outputs():
+            if txout.address is not None:
+                self.watch_address(txout.address, key)
+
+    def get_deeply_mined_height(self, txid: str) -> int:
+        """Height at which txid will be deeply mined, or the next block if it is not mined yet."""
+        tx_mined_info = self.adb.get_tx_height(txid)
+        if tx_mined_info.conf > 0:
+            return tx_mined_info.height() + TX_DEEPLY_MINED_CONF
+        return self.adb.get_local_height() + 1
+
+    def get_sweep_check_height(self, sweep_info: 'SweepInfo') -> int:
+        """Height at which we should look at a sweep that has no spender yet:
+        the next block if we have to retry passing it to the txbatcher, else
+        when its CLTV and CSV locks expire."""
+        local_height = self.adb.get_local_height()
+        if sweep_info.txin.prevout.to_str() in self._sweeps_to_retry:
+            return local_height + 1
+        height = sweep_info.cltv_abs or 0
+        if sweep_info.csv_delay:
+            prev_height = self.adb.get_tx_height(sweep_info.txin.prevout.txid.hex()).height()
+            if prev_height > 0:
+                height = max(height, prev_height + sweep_info.csv_delay - 1)
+            else:
+                height = local_height + 1
+        return height
+
+    def _get_sweep_info_cache_key(self, chan: 'AbstractChannel', ctx: Transaction, spender_tx: Optional[Transaction]):
+        height_bucket = self.adb.get_local_height() // self.SWEEP_INFO_CACHE_HEIGHT_BUCKET
+        spender_txid = spender_tx.txid() if spender_tx else None
+        return chan.funding_outpoint.to_str(), ctx.txid(), spender_txid, height_bucket
+
+    def _maybe_cache_sweep_info(self, cache_key, value: Tuple[bool, Dict[str, MaybeSweepInfo]]) -> None:
+        # KeepWatchingTXO depends on preimages we might learn at any time
+        if not any(isinstance(x, KeepWatchingTXO) for x in value[1].values()):
+            self._sweep_info_cache[cache_key] = value
+
+    def get_ctx_sweep_info(self, chan: 'AbstractChannel', ctx: Transaction) -> Tuple[bool, Dict[str, MaybeSweepInfo]]:
+        """Memoized chan.get_ctx_sweep_info"""
+        cache_key = self._get_sweep_info_cache_key(chan, ctx, None)
+        if (value := self._sweep_info_cache.get(cache_key)) is not None:
+            return value
+        value = chan.get_ctx_sweep_info(ctx)
+        self._maybe_cache_sweep_info(cache_key, value)
+        return value
+
+    def get_htlc_sweep_info(self, chan: 'AbstractChannel', ctx: Transaction, htlc_tx: Transaction) -> Dict[str, MaybeSweepInfo]:
+        """Memoized chan.maybe_sweep_htlcs"""
+        cache_key = self._get_sweep_info_cache_key(chan, ctx, htlc_tx)
+        if (value := self._sweep_info_cache.get(cache_key)) is not None:
+            return value[1]
+        value = False, chan.maybe_sweep_htlcs(ctx, htlc_tx)
+        self._maybe_cache_sweep_info(cache_key, value)
+        return value[1]
+
     def get_pending_force_closes(self):
         return self._pending_force_closes
 
     def maybe_redeem(self, sweep_info: 'SweepInfo') -> bool:
         """ returns 'keep_watching' """
+        prevout = sweep_info.txin.prevout.to_str()
         try:
             self.lnworker.wallet.txbatcher.add_sweep_input('lnwatcher', sweep_info)
+            self._sweeps_to_retry.discard(prevout)
         except BelowDustLimit:
             self.logger.debug(f"maybe_redeem: BelowDustLimit: {sweep_info.name}")
             # utxo is considered dust at *current* fee estimates.
             # but maybe the fees atm are very high? We will retry later.
-            pass
+            self._sweeps_to_retry.add(prevout)
         except NoDynamicFeeEstimates:
             self.logger.debug(f"maybe_redeem: NoDynamicFeeEstimates: {sweep_info.name}")
-            pass  # will retry later
+            self._sweeps_to_retry.add(prevout)  # will retry later
         if sweep_info.is_anchor():
             return False
         return True
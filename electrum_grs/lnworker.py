@@ -58,6 +58,7 @@ from .crypto import (
 )
 
 from .onion_message import OnionMessageManager
+from .lnhistory import LNHistoryIndex, PaymentTotals
 from .lntransport import (
     LNTransport, LNResponderTransport, LNTransportBase, LNPeerAddr, split_host_port, extract_nodeid,
     ConnStringFormatError
@@ -77,7 +78,8 @@ from .lnutil import (
 )
 from .lnonion import (
     decode_onion_error, OnionFailureCode, OnionRoutingFailure, OnionPacket,
-    ProcessedOnionPacket, calc_hops_data_for_payment, new_onion_packet,
+    ProcessedOnionPacket, calc_hops_data_for_payment, new_onion_packet, OnionHopsDataSingle,
+    get_onion_worker_pool,
 )
 from .lnmsg import decode_msg
 from .lnrouter import (
@@ -1035,6 +1037,8 @@ class LNWallet(Logger):
         # "RHASH:direction" -> amount_msat, status, min_final_cltv_delta, expiry_delay, creation_ts, invoice_features
         self.payment_info = self.db.get_dict('lightning_payments')  # type: dict[str, Tuple[Optional[int], int, int, int, int, int]]
         self._preimages = self.db.get_dict('lightning_preimages')   # RHASH -> (preimage, is_public)
+        self.history_index = LNHistoryIndex(self.db)
+        self._payment_history_items = {}  # type: Dict[str, LightningHistoryItem]  # payment_hash -> item, of the payments folded in history_index
         self._bolt11_cache = {}
         # note: this sweep_address is only used as fallback; as it might result in address-reuse
         self.logs = defaultdict(list)  # type: Dict[str, List[HtlcLog]]  # key is RHASH  # (not persisted)
@@ -1057,6 +1061,15 @@ class LNWallet(Logger):
                 self._channel_backups[bfh(channel_id)] = cb = ChannelBackup(storage, lnworker=self)
                 self.wallet.set_reserved_addresses_for_chan(cb, reserved=True)
 
+        # lightning history
+        self.history_index.add_channels(self._channels.values())
+        all_channels = list(itertools.chain(self._channels.values(), self._channel_backups.values()))
+        self.history_index.retain_channel_items(chan.channel_id for chan in all_channels)
+        for chan in all_channels:
+            if not self.history_index.has_channel_items(chan.channel_id):
+                self.update_channel_history(chan)
+        self._set_channel_history_labels(self.history_index.get_channel_items())
+
         self._paysessions = dict()                      # type: Dict[bytes, PaySession]
         self.sent_htlcs_info = dict()                   # type: Dict[SentHtlcKey, SentHtlcInfo]
         self.received_mpp_htlcs = self.db.get_dict('received_mpp_htlcs')   # type: Dict[str, ReceivedMPPStatus]  # payment_key -> ReceivedMPPStatus
@@ -1290,10 +1303,100 @@ class LNWallet(Logger):
         timestamp = min([htlc_with_status.htlc.timestamp for htlc_with_status in plist])
         return direction, amount_msat, fee_msat, timestamp
 
-    def get_lightning_history(self) -> Dict[str, LightningHistoryItem]:
+    def get_payment_value_from_totals(
+            self, sent_info: Optional['PaymentInfo'],
+            totals: PaymentTotals,
+    ) -> Tuple[PaymentDirection, int, Optional[int], int]:
+        """Same as get_payment_value, for the totals of the settled htlcs of a payment."""
+        amount_msat = totals.amount_msat
+        if totals.num_received == 0:
+            direction = PaymentDirection.SENT
+            fee_msat = (- sent_info.amount_msat - amount_msat) if sent_info else None
+        elif totals.num_sent == 0:
+            direction = PaymentDirection.RECEIVED
+            fee_msat = None
+        elif amount_msat < 0:
+            direction = PaymentDirection.SELF_PAYMENT
+            fee_msat = - amount_msat
+        else:
+            direction = PaymentDirection.FORWARDING
+            fee_msat = - amount_msat
+        return direction, amount_msat, fee_msat, totals.timestamp
+
+    def _get_payment_history_item(self, key: str, totals: PaymentTotals) -> LightningHistoryItem:
+        payment_hash = bytes.fromhex(key)
+        sent_info = self.get_payment_info(payment_hash, direction=SENT)
+        direction, amount_msat, fee_msat, timestamp = self.get_payment_value_from_totals(sent_info, totals)
+        label = self.wallet.get_label_for_rhash(key)
+        if not label and direction == PaymentDirection.FORWARDING:
+            label = _('Forwarding')
+        preimage = self.get_preimage(payment_hash)
+        group_id = self.swap_manager.get_group_id_for_payment_hash(payment_hash)
+        return LightningHistoryItem(
+            type='payment',
+            payment_hash=key,
+            preimage=preimage.hex() if preimage else None,
+            amount_msat=amount_msat,
+            fee_msat=fee_msat,
+            group_id=group_id,
+            timestamp=timestamp or 0,
+            label=label,
+            direction=direction,
+        )
+
+    def clear_lightning_history_cache(self, key: str) -> None:
+        """To be called when the label or the group_id of a payment changes."""
+        self._payment_history_items.pop(key, None)
+
+    def get_lightning_history(
+            self, *,
+            from_timestamp: Optional[int] = None,
+            to_timestamp: Optional[int] = None,
+    ) -> Dict[str, LightningHistoryItem]:
         """
         side effect: sets defaults labels
         note that the result is not ordered
+        from_timestamp is inclusive, to_timestamp exclusive
+        """
+        def in_range(timestamp: int) -> bool:
+            return (from_timestamp is None or timestamp >= from_timestamp) \
+                and (to_timestamp is None or timestamp < to_timestamp)
+
+        out = {}
+        channels = list(self.channels.values())
+        with self.history_index.lock:
+            for key in self.history_index.pop_changed_keys():
+                self._payment_history_items.pop(key, None)
+            # settled htlcs that are still active
+            pending = self.history_index.get_pending_totals(channels)
+            for key in self.history_index.get_keys(from_timestamp=from_timestamp, to_timestamp=to_timestamp):
+                if key in pending:
+                    continue
+                item = self._payment_history_items.get(key)
+                if item is None:
+                    item = self._get_payment_history_item(key, self.history_index.get_totals(key))
+                    self._payment_history_items[key] = item
+                out[key] = item
+            for key, totals in pending.items():
+                folded_totals = self.history_index.get_totals(key)
+                item = self._get_payment_history_item(key, folded_totals + totals if folded_totals else totals)
+                if in_range(item.timestamp):
+                    out[key] = item
+            channel_items = self.history_index.get_channel_items()
+        now = int(time.time())
+        for item in channel_items:
+            item = item._replace(timestamp=item.timestamp or now)
+            if in_range(item.timestamp):
+                out[item.group_id] = item
+
+        if from_timestamp is None and to_timestamp is None:
+            self._check_lightning_history_balance(out)
+        return out
+
+    def _get_lightning_history_full(self) -> Dict[str, LightningHistoryItem]:
+        """Computes the history from the htlc logs and the onchain state of all channels,
+        without history_index. Reference for get_lightning_history, see check_lightning_history_index.
+        Channel items have no timestamp if unconfirmed.
         """
         out = {}
         for payment_hash, plist in self.get_payments(status='settled').items():
@@ -1309,12 +1412,12 @@ class LNWallet(Logger):
             label = self.wallet.get_label_for_rhash(key)
             if not label and direction == PaymentDirection.FORWARDING:
                 label = _('Forwarding')
-            preimage = self.get_preimage(payment_hash).hex()
+            preimage = self.get_preimage(payment_hash)
             group_id = self.swap_manager.get_group_id_for_payment_hash(payment_hash)
             item = LightningHistoryItem(
                 type='payment',
                 payment_hash=payment_hash.hex(),
-                preimage=preimage,
+                preimage=preimage.hex() if preimage else None,
                 amount_msat=amount_msat,
                 fee_msat=fee_msat,
                 group_id=group_id,
@@ -1323,55 +1426,79 @@ class LNWallet(Logger):
                 direction=direction,
             )
             out[payment_hash.hex()] = item
-        now = int(time.time())
         for chan in itertools.chain(self.channels.values(), self.channel_backups.values()):  # type: AbstractChannel
-            item = chan.get_funding_height()
-            if item is None:
-                continue
-            funding_txid, funding_height, funding_timestamp = item
-            label = _('Open channel') + ' ' + chan.get_id_for_log()
-            self.wallet.set_default_label(funding_txid, label)
-            self.wallet.set_group_label(funding_txid, label)
-            item = LightningHistoryItem(
-                type='channel_opening',
-                label=label,
-                group_id=funding_txid,
-                timestamp=funding_timestamp or now,
-                amount_msat=chan.balance(LOCAL, ctn=0),
-                fee_msat=None,
-                payment_hash=None,
-                preimage=None,
-                direction=None,
-            )
-            out[funding_txid] = item
-            item = chan.get_closing_height()
-            if item is None:
-                continue
-            closing_txid, closing_height, closing_timestamp = item
-            label = _('Close channel') + ' ' + chan.get_id_for_log()
-            self.wallet.set_default_label(closing_txid, label)
-            self.wallet.set_group_label(closing_txid, label)
-            item = LightningHistoryItem(
-                type='channel_closing',
-                label=label,
-                group_id=closing_txid,
-                timestamp=closing_timestamp or now,
-                amount_msat=-chan.balance(LOCAL),
-                fee_msat=None,
-                payment_hash=None,
-                preimage=None,
-                direction=None,
-            )
-            out[closing_txid] = item
+            for item in self._get_channel_history_items(chan):
+                out[item.group_id] = item
+        return out
+
+    def check_lightning_history_index(self) -> List[str]:
+        """Compares get_lightning_history with a full recomputation. Returns the differences."""
+        errors = []
+        indexed = self.get_lightning_history()
+        for item in self.history_index.get_channel_items():
+            # not filled in with the current time
+            indexed[item.group_id] = item
+        full = self._get_lightning_history_full()
+        for key in sorted(set(indexed) | set(full)):
+            if indexed.get(key) != full.get(key):
+                errors.append(f'{key}: index={indexed.get(key)}, full={full.get(key)}')
+        return errors
+
+    def _get_channel_history_items(self, chan: AbstractChannel) -> List[LightningHistoryItem]:
+        """Items of the opening and closing of chan. timestamp is None if unconfirmed."""
+        out = []
+        item = chan.get_funding_height()
+        if item is None:
+            return out
+        funding_txid, funding_height, funding_timestamp = item
+        out.append(LightningHistoryItem(
+            type='channel_opening',
+            label=_('Open channel') + ' ' + chan.get_id_for_log(),
+            group_id=funding_txid,
+            timestamp=funding_timestamp,
+            amount_msat=chan.balance(LOCAL, ctn=0),
+            fee_msat=None,
+            payment_hash=None,
+            preimage=None,
+            direction=None,
+        ))
+        item = chan.get_closing_height()
+        if item is None:
+            return out
+        closing_txid, closing_height, closing_timestamp = item
+        out.append(LightningHistoryItem(
+            type='channel_closing',
+            label=_('Close channel') + ' ' + chan.get_id_for_log(),
+            group_id=closing_txid,
+            timestamp=closing_timestamp,
+            amount_msat=-chan.balance(LOCAL),
+            fee_msat=None,
+            payment_hash=None,
+            preimage=None,
+            direction=None,
+        ))
+        return out
+
+    def _set_channel_history_labels(self, items: Sequence[LightningHistoryItem]) -> None:
+        for item in items:
+            self.wallet.set_default_label(item.group_id, item.label)
+            self.wallet.set_group_label(item.group_id, item.label)
 
+    def update_channel_history(self, chan: AbstractChannel) -> None:
+        """Updates the history items of the opening and closing of chan,
+        to be called when its onchain state changes."""
+        items = self._get_channel_history_items(chan)
+        self.history_index.set_channel_items(chan.channel_id, items)
+        self._set_channel_history_labels(items)
+
+    def _check_lightning_history_balance(self, history: Dict[str, LightningHistoryItem]) -> None:
         # sanity check
-        balance_msat = sum([x.amount_msat for x in out.values()])
+        balance_msat = sum([x.amount_msat for x in history.values()])
         lb = sum(chan.balance(LOCAL) if not chan.is_closed_or_closing() else 0
                  for chan in self.channels.values())
         if balance_msat != lb:
             # this typically happens when a channel is recently force closed
             self.logger.info(f'get_lightning_history: balance mismatch {balance_msat - lb}')
-        return out
 
     def get_groups_for_onchain_history(self) -> Dict[str, str]:
         """
@@ -1439,6 +1566,7 @@ class LNWallet(Logger):
         return None
 
     async def handle_onchain_state(self, chan: Channel):
+        self.update_channel_history(chan)
         if self.network is None:
             # network not started yet
             return
@@ -1660,6 +1788,7 @@ class LNWallet(Logger):
     def add_channel(self, chan: Channel):
         with self.lock:
             self._channels[chan.channel_id] = chan
+        self.history_index.add_channel(chan)
         self.lnwatcher.add_channel(chan)
 
     def add_new_channel(self, temp_chan: Channel) -> Channel:
@@ -2040,20 +2169,24 @@ class LNWallet(Logger):
                             channels=channels,
                             budget=budget._replace(fee_msat=remaining_fee_budget_msat),
                         )
-                        # 2. send htlcs
-                        async for sent_htlc_info, cltv_delta, trampoline_onion in routes:
+                        routes = [route async for route in routes]
+                        # 2. create the onions of all the parts at once
+                        onions = await self.create_onions_for_routes(routes=routes, payment_hash=payment_hash)
+                        # 3. send htlcs
+                        for (sent_htlc_info, cltv_delta, trampoline_onion), onion in zip(routes, onions):
                             await self.pay_to_route(
                                 paysession=paysession,
                                 sent_htlc_info=sent_htlc_info,
                                 min_final_cltv_delta=cltv_delta,
                                 trampoline_onion=trampoline_onion,
                                 fw_payment_key=fw_payment_key,
+                                onion=onion,
                             )
                     # invoice_status is triggered in self.set_invoice_status when it actually changes.
                     # It is also triggered here to update progress for a lightning payment in the GUI
                     # (e.g. attempt counter)
                     util.trigger_callback('invoice_status', self.wallet, payment_hash.hex(), PR_INFLIGHT)
-                # 3. await a queue, collect resolved htlcs
+                # 4. await a queue, collect resolved htlcs
                 htlc_log = await paysession.wait_for_one_htlc_to_resolve()
                 while True:
                     log.append(htlc_log)
@@ -2139,6 +2272,7 @@ class LNWallet(Logger):
             min_final_cltv_delta: int,
             trampoline_onion: Optional[OnionPacket] = None,
             fw_payment_key: str = None,
+            onion: Optional[Tuple[OnionPacket, int, int, bytes]] = None,  # see create_onions_for_routes
     ) -> None:
         """Sends a single HTLC."""
         shi = sent_htlc_info
@@ -2158,7 +2292,8 @@ class LNWallet(Logger):
             payment_hash=paysession.payment_hash,
             min_final_cltv_delta=min_final_cltv_delta,
             payment_secret=shi.payment_secret_bucket,
-            trampoline_onion=trampoline_onion)
+            trampoline_onion=trampoline_onion,
+            onion=onion)
 
         key = (paysession.payment_hash, short_channel_id, htlc.htlc_id)
         self.sent_htlcs_info[key] = shi
@@ -3655,6 +3790,8 @@ class LNWallet(Logger):
         with self.lock:
             self._channels.pop(chan_id)
             self.db.get('channels').pop(chan_id.hex())
+        chan.hm.on_htlc_removed = None
+        self.history_index.remove_channel(chan_id, self.channels.values())
         self.wallet.set_reserved_addresses_for_chan(chan, reserved=False)
 
         util.trigger_callback('channels_updated', self.wallet)
@@ -3810,6 +3947,7 @@ class LNWallet(Logger):
             raise Exception('Channel not found')
         with self.lock:
             self._channel_backups.pop(channel_id)
+        self.history_index.remove_channel(channel_id, self.channels.values())
         self.wallet.set_reserved_addresses_for_chan(chan, reserved=False)
         self.wallet.save_db()
         util.trigger_callback('channels_updated', self.wallet)
@@ -4229,7 +4367,7 @@ class LNWallet(Logger):
         #       also make us fail arbitrary HTLCs.
         return bool(payment_info and self.get_preimage(payment_hash))
 
-    def create_onion_for_route(
+    def _calc_hops_data_for_route(
         self, *,
         route: 'LNPaymentRoute',
         amount_msat: int,
@@ -4238,7 +4376,7 @@ class LNWallet(Logger):
         min_final_cltv_delta: int,
         payment_secret: bytes,
         trampoline_onion: Optional[OnionPacket] = None,
-    ):
+    ) -> Tuple[List[OnionHopsDataSingle], int, int]:
         # add features learned during "init" for direct neighbour:
         route[0].node_features |= self.features
         local_height = self.network.get_local_height()
@@ -4253,7 +4391,6 @@ class LNWallet(Logger):
         for i in range(len(route)):
             self.logger.info(f"  {i}: edge={route[i].short_channel_id} hop_data={hops_data[i]!r}")
         assert final_cltv_abs <= cltv_abs, (final_cltv_abs, cltv_abs)
-        session_key = os.urandom(32) # session_key
         # if we are forwarding a trampoline payment, add trampoline onion
         if trampoline_onion:
             self.logger.info(f'adding trampoline onion to final payload')
@@ -4268,15 +4405,68 @@ class LNWallet(Logger):
                 self.logger.info(f"lnpeer.pay len(t_route)={len(t_route)}")
                 for i in range(len(t_route)):
                     self.logger.info(f"  {i}: t_node={t_route[i].end_node.hex()} hop_data={t_hops_data[i]!r}")
+        if cltv_abs > local_height + lnutil.NBLOCK_CLTV_DELTA_TOO_FAR_INTO_FUTURE:
+            raise PaymentFailure(f"htlc expiry too far into future. (in {cltv_abs-local_height} blocks)")
+        return hops_data, amount_msat, cltv_abs
+
+    def create_onion_for_route(
+        self, *,
+        route: 'LNPaymentRoute',
+        amount_msat: int,
+        total_msat: int,
+        payment_hash: bytes,
+        min_final_cltv_delta: int,
+        payment_secret: bytes,
+        trampoline_onion: Optional[OnionPacket] = None,
+    ) -> Tuple[OnionPacket, int, int, bytes]:
+        hops_data, amount_msat, cltv_abs = self._calc_hops_data_for_route(
+            route=route,
+            amount_msat=amount_msat,
+            total_msat=total_msat,
+            payment_hash=payment_hash,
+            min_final_cltv_delta=min_final_cltv_delta,
+            payment_secret=payment_secret,
+            trampoline_onion=trampoline_onion)
+        session_key = os.urandom(32) # session_key
         # create onion packet
         payment_path_pubkeys = [x.node_id for x in route]
         onion = new_onion_packet(payment_path_pubkeys, session_key, hops_data, associated_data=payment_hash) # must use another sessionkey
         self.logger.info(f"starting payment. len(route)={len(hops_data)}.")
-        # create htlc
-        if cltv_abs > local_height + lnutil.NBLOCK_CLTV_DELTA_TOO_FAR_INTO_FUTURE:
-            raise PaymentFailure(f"htlc expiry too far into future. (in {cltv_abs-local_height} blocks)")
         return onion, amount_msat, cltv_abs, session_key
 
+    async def create_onions_for_routes(
+        self, *,
+        routes: Sequence[Tuple[SentHtlcInfo, int, Optional[OnionPacket]]],
+        payment_hash: bytes,
+    ) -> List[Tuple[OnionPacket, int, int, bytes]]:
+        """Same as create_onion_for_route, for each (sent_htlc_info, min_final_cltv_delta, trampoline_onion)
+        of a payment. The onions of a multi-part payment are created in the onion worker pool."""
+        jobs = []
+        for shi, min_final_cltv_delta, trampoline_onion in routes:
+            hops_data, amount_msat, cltv_abs = self._calc_hops_data_for_route(
+                route=shi.route,
+                amount_msat=shi.amount_msat,
+                total_msat=shi.bucket_msat,
+                payment_hash=payment_hash,
+                min_final_cltv_delta=min_final_cltv_delta,
+                payment_secret=shi.payment_secret_bucket,
+                trampoline_onion=trampoline_onion)
+            payment_path_pubkeys = [x.node_id for x in shi.route]
+            jobs.append((payment_path_pubkeys, os.urandom(32), hops_data, payment_hash, amount_msat, cltv_abs))
+        onions = None
+        if len(jobs) > 1:
+            # None if the pool is busy
+            onions = await get_onion_worker_pool().new_onion_packets([job[:4] for job in jobs])
+        if onions is None:
+            onions = [new_onion_packet(*job[:3], associated_data=payment_hash) for job in jobs]
+        out = []
+        for job, onion in zip(jobs, onions):
+            if isinstance(onion, Exception):
+                raise onion
+            payment_path_pubkeys, session_key, hops_data, _, amount_msat, cltv_abs = job
+            out.append((onion, amount_msat, cltv_abs, session_key))
+        return out
+
     def save_forwarding_failure(
             self,
             payment_key: str,
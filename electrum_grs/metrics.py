@@ -0,0 +1,229 @@
+"""Counters, gauges and histograms, exported in the Prometheus text format.
+
+Metrics are registered once, at import time of the module they instrument:
+
+    REQUESTS = metrics.counter('electrum_foo_requests_total', 'Number of foo requests', ['method'])
+    ...
+    REQUESTS.labels(method='bar').inc()
+
+The daemon serves the default registry on /metrics.
+"""
+
+from abc import ABC, abstractmethod
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Sequence, Tuple, Optional, Iterator, List
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape_label_value(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class _Metric(ABC):
+    TYPE = None  # type: str
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}  # type: Dict[Tuple[str, ...], _Metric]
+        if not self.labelnames:
+            self._init_value()
+
+    @abstractmethod
+    def _init_value(self) -> None:
+        pass
+
+    def labels(self, **labels) -> '_Metric':
+        """Returns the child metric for the given label values."""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name}: expected labels {self.labelnames}, got {tuple(labels)}')
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = type(self)._new_child(self)
+        return child
+
+    def _new_child(self) -> '_Metric':
+        return type(self)(self.name, self.documentation)
+
+    @abstractmethod
+    def _samples(self) -> Iterator[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """Yields (suffix, labelnames, labelvalues, value)."""
+        pass
+
+    def collect(self) -> Iterator[Tuple[str, Sequence[str], Sequence[str], float]]:
+        if not self.labelnames:
+            yield from self._samples()
+            return
+        for key, child in sorted(self._children.items()):
+            for suffix, names, values, value in child._samples():
+                yield suffix, self.labelnames + tuple(names), key + tuple(values), value
+
+
+class Counter(_Metric):
+    TYPE = 'counter'
+
+    def _init_value(self):
+        self._value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        if amount < 0:
+            raise ValueError('counters can only be incremented')
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+    def _samples(self):
+        yield '', (), (), self._value
+
+
+class Gauge(_Metric):
+    TYPE = 'gauge'
+
+    def _init_value(self):
+        self._value = 0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def get(self) -> float:
+        return self._value
+
+    def _samples(self):
+        yield '', (), (), self._value
+
+
+class Histogram(_Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), *,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        buckets = sorted(float(b) for b in buckets)
+        if not buckets or buckets[-1] != math.inf:
+            buckets.append(math.inf)
+        self.buckets = tuple(buckets)
+        _Metric.__init__(self, name, documentation, labelnames)
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def _init_value(self):
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        """Context manager that observes the time spent inside it, in seconds."""
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - t0)
+
+    def get_count(self) -> int:
+        return sum(self._counts)
+
+    def get_sum(self) -> float:
+        return self._sum
+
+    def _samples(self):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield '_bucket', ('le',), (_format_value(bound),), cumulative
+        yield '_sum', (), (), total
+        yield '_count', (), (), cumulative
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # type: Dict[str, _Metric]
+
+    def _register(self, klass, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is not None:
+                # modules can be imported more than once (e.g. plugins); hand out the same metric
+                if type(metric) is not klass or metric.labelnames != tuple(labelnames):
+                    raise ValueError(f'metric {name} already registered with a different type or labels')
+                return metric
+            metric = self._metrics[name] = klass(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), *,
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []  # type: List[str]
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.TYPE}')
+            for suffix, names, values, value in metric.collect():
+                lines.append(f'{metric.name}{suffix}{_format_labels(names, values)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
@@ -30,7 +30,7 @@ import threading
 import json
 from typing import (
     NamedTuple, Optional, Sequence, List, Dict, Tuple, TYPE_CHECKING, Iterable, Set, Any, TypeVar,
-    Callable, Mapping,
+    Callable, Mapping, Awaitable,
 )
 import copy
 import functools
@@ -49,16 +49,19 @@ from .util import (
 from . import constants
 from . import blockchain
 from . import dns_hacks
+from . import metrics
+from . import startup_trace
 from .transaction import Transaction
 from .blockchain import Blockchain
 from .interface import (
-    Interface, PREFERRED_NETWORK_PROTOCOL, RequestTimedOut, NetworkTimeout, BUCKET_NAME_OF_ONION_SERVERS,
+    Interface, RequestOnlyInterface, PREFERRED_NETWORK_PROTOCOL, RequestTimedOut, NetworkTimeout, BUCKET_NAME_OF_ONION_SERVERS,
     NetworkException, RequestCorrupted, ServerAddr, TxBroadcastError, KNOWN_ELEC_PROTOCOL_TRANSPORTS,
 )
 from .version import PROTOCOL_VERSION_MIN
 from .i18n import _
 from .logging import get_logger, Logger
 from .fee_policy import FeeHistogram, FeeTimeEstimates, FEE_ETA_TARGETS
+from .server_scores import ServerScores
 
 
 if TYPE_CHECKING:
@@ -72,6 +75,13 @@ if TYPE_CHECKING:
 
 _logger = get_logger(__name__)
 
+MULTI_REQUEST_LATENCY = metrics.histogram(
+    'electrum_network_multi_request_seconds', 'Duration of Network.send_multiple_requests', ['method'])
+MULTI_REQUEST_SERVERS = metrics.counter(
+    'electrum_network_multi_request_servers_total', 'Servers queried by Network.send_multiple_requests', ['method', 'result'])
+HEDGED_REQUESTS = metrics.counter(
+    'electrum_network_hedged_requests_total', 'Requests also sent to a second server, and how many of those it answered first', ['result'])
+
 
 NUM_TARGET_CONNECTED_SERVERS = 10
 NUM_STICKY_SERVERS = 4
@@ -373,6 +383,7 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
 
         self.server_peers = {}  # returned by interface (servers that the main interface knows about)
         self._recent_servers = self._read_recent_servers()  # note: needs self.recent_servers_lock
+        self.server_scores = ServerScores(os.path.join(self.config.path, "server_scores") if self.config.path else None)
 
         self.banner = ''
         self.donation_address = ''
@@ -392,6 +403,8 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self._connecting_ifaces = set()
         self.interfaces = {}  # these are the ifaces in "initialised and usable" state
         self._closing_ifaces = set()
+        # connections used only by send_multiple_requests. These are not in the sets above.
+        self._request_ifaces = {}  # type: Dict[ServerAddr, RequestOnlyInterface]
 
         # Dump network messages (all interfaces).  Set at runtime from the console.
         self.debug = False
@@ -418,11 +431,12 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         if not self.config.LIGHTNING_USE_GOSSIP:
             return
         if self.lngossip is None:
-            self.channel_db = channel_db.ChannelDB(self)
-            self.path_finder = lnrouter.LNPathFinder(self.channel_db)
-            self.channel_db.load_data()
-            self.lngossip = lnworker.LNGossip(self.config)
-            self.lngossip.start_network(self)
+            with startup_trace.span('gossip'):
+                self.channel_db = channel_db.ChannelDB(self)
+                self.path_finder = lnrouter.LNPathFinder(self.channel_db)
+                self.channel_db.load_data()
+                self.lngossip = lnworker.LNGossip(self.config)
+                self.lngossip.start_network(self)
 
     async def stop_gossip(self, *, full_shutdown: bool = False):
         if self.lngossip:
@@ -698,21 +712,17 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             recent_servers = list(self._recent_servers)
         recent_servers = [s for s in recent_servers if s.protocol in self._allowed_protocols]
         if len(connected_servers & set(recent_servers)) < NUM_STICKY_SERVERS:
-            for server in recent_servers:
+            for server in self.server_scores.sort(recent_servers):
                 if server in connected_servers:
                     continue
                 if not self._can_retry_addr(server, now=now):
                     continue
                 return server
-        # try all servers we know about, pick one at random
+        # try all servers we know about, pick one at random, favouring those with a good score
         hostmap = self.get_servers()
         servers = list(set(filter_protocol(hostmap, allowed_protocols=self._allowed_protocols)) - connected_servers)
-        random.shuffle(servers)
-        for server in servers:
-            if not self._can_retry_addr(server, now=now):
-                continue
-            return server
-        return None
+        servers = [server for server in servers if self._can_retry_addr(server, now=now)]
+        return self.server_scores.choose(servers)
 
     def _set_default_server(self) -> None:
         # Server for addresses and transactions
@@ -834,12 +844,13 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             self.config.NETWORK_BOOKMARKED_SERVERS = bookmarks
 
     async def _switch_to_random_interface(self):
-        '''Switch to a random connected server other than the current one'''
+        '''Switch to a random connected server other than the current one.
+        Servers with a good score are more likely to be picked.'''
         servers = self.get_interfaces()    # Those in connected state
         if self.default_server in servers:
             servers.remove(self.default_server)
         if servers:
-            await self.switch_to_interface(random.choice(servers))
+            await self.switch_to_interface(self.server_scores.choose(servers))
 
     async def switch_lagging_interface(self):
         """If auto_connect and lagging, switch interface (only within fork)."""
@@ -849,8 +860,8 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             with self.interfaces_lock: interfaces = list(self.interfaces.values())
             filtered = list(filter(lambda iface: iface.tip_header == best_header, interfaces))
             if filtered:
-                chosen_iface = random.choice(filtered)
-                await self.switch_to_interface(chosen_iface.server)
+                chosen_server = self.server_scores.choose([iface.server for iface in filtered])
+                await self.switch_to_interface(chosen_server)
 
     async def switch_unwanted_fork_interface(self) -> None:
         """If auto_connect, maybe switch to another fork/chain."""
@@ -874,8 +885,8 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
                         if iface.blockchain == chain]
             if filtered:
                 self.logger.info(f"switching to (more) preferred fork (rank {rank})")
-                chosen_iface = random.choice(filtered)
-                await self.switch_to_interface(chosen_iface.server)
+                chosen_server = self.server_scores.choose([iface.server for iface in filtered])
+                await self.switch_to_interface(chosen_server)
                 return
         self.logger.info("tried to switch to (more) preferred fork but no interfaces are on any")
 
@@ -950,11 +961,24 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self._recent_servers.insert(0, server)
         self._recent_servers = self._recent_servers[:NUM_RECENT_SERVERS]
         self._save_recent_servers()
+        self.server_scores.save()
+
+    def record_header_lags(self) -> None:
+        """Scores the connected servers by how far behind our best chain their tip is."""
+        local_height = self.get_local_height()
+        with self.interfaces_lock:
+            interfaces = list(self.interfaces.values())
+        for iface in interfaces:
+            self.server_scores.record_header_lag(iface.server, local_height - iface.tip)
 
     async def connection_down(self, interface: Interface):
         '''A connection to server either went down, or was never made.
         We distinguish by whether it is in self.interfaces.'''
         if not interface: return
+        if isinstance(interface, RequestOnlyInterface):
+            if self._request_ifaces.get(interface.server) == interface:
+                self._request_ifaces.pop(interface.server)
+            return
         if interface.server == self.default_server:
             self._set_status(ConnectionState.DISCONNECTED)
         await self._close_interface(interface)
@@ -990,6 +1014,8 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             await util.wait_for2(interface.ready, timeout)
         except BaseException as e:
             self.logger.info(f"couldn't launch iface {server} -- {repr(e)}")
+            if not isinstance(e, asyncio.CancelledError):
+                self.server_scores.record_error(server)
             await interface.close()
             return
         else:
@@ -1058,6 +1084,7 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
                 except RequestCorrupted as e:
                     # TODO ban server?
                     iface.logger.exception(f"RequestCorrupted: {e}")
+                    self.server_scores.record_error(iface.server)
                     await iface.close()
                     await iface.got_disconnected.wait()
                     continue  # try again
@@ -1082,12 +1109,52 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
                 raise wrapped_exc from e
         return wrapper
 
+    async def _hedged_request(self, request: Callable[[Interface], Awaitable[T]]) -> T:
+        """Sends an idempotent request to the main interface. If it has not answered
+        after its usual response time (see ServerScores.hedge_delay), the request is
+        also sent to another interface on the same chain, and the first valid answer wins.
+        If both fail, the error of the main interface is raised.
+        """
+        main_iface = self.interface
+        if not self.config.NETWORK_HEDGE_REQUESTS:
+            return await request(main_iface)
+        t0 = time.monotonic()
+        main_task = asyncio.ensure_future(request(main_iface))
+        tasks = {main_task: main_iface}
+        try:
+            done, _ = await asyncio.wait([main_task], timeout=self.server_scores.hedge_delay(main_iface.server))
+            if not done:
+                with self.interfaces_lock:
+                    others = [iface for iface in self.interfaces.values()
+                              if iface != main_iface and iface.blockchain == main_iface.blockchain
+                              and iface.is_connected_and_ready()]
+                other_iface = min(others, key=lambda iface: self.server_scores.score(iface.server), default=None)
+                if other_iface:
+                    HEDGED_REQUESTS.labels(result='sent').inc()
+                    tasks[asyncio.ensure_future(request(other_iface))] = other_iface
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        continue
+                    if task != main_task:
+                        HEDGED_REQUESTS.labels(result='won').inc()
+                        # we do not get to see how long the main interface would have taken
+                        self.server_scores.record_response(main_iface.server, time.monotonic() - t0)
+                    return task.result()
+            return main_task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
     @best_effort_reliable
     @catch_server_exceptions
     async def get_merkle_for_transaction(self, tx_hash: str, tx_height: int) -> dict:
         if self.interface is None:  # handled by best_effort_reliable
             raise RequestTimedOut()
-        return await self.interface.get_merkle_for_transaction(tx_hash=tx_hash, tx_height=tx_height)
+        return await self._hedged_request(
+            lambda iface: iface.get_merkle_for_transaction(tx_hash=tx_hash, tx_height=tx_height))
 
     @best_effort_reliable
     async def broadcast_transaction(self, tx: 'Transaction', *, timeout=None) -> None:
@@ -1111,7 +1178,8 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
     async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
         if self.interface is None:  # handled by best_effort_reliable
             raise RequestTimedOut()
-        return await self.interface.get_transaction(tx_hash=tx_hash, timeout=timeout)
+        return await self._hedged_request(
+            lambda iface: iface.get_transaction(tx_hash=tx_hash, timeout=timeout))
 
     @best_effort_reliable
     @catch_server_exceptions
@@ -1267,6 +1335,8 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.interfaces = {}
         self._connecting_ifaces.clear()
         self._closing_ifaces.clear()
+        self._request_ifaces.clear()
+        self.server_scores.save()
         if not full_shutdown:
             util.trigger_callback('network_updated')
 
@@ -1371,22 +1441,47 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             timeout = self.get_network_timeout_seconds(NetworkTimeout.Urgent)
         responses = dict()
         async def get_response(server: ServerAddr):
-            interface = Interface(network=self, server=server)
             try:
-                await util.wait_for2(interface.ready, timeout)
+                interface = await self._get_interface_for_request(server, timeout=timeout)
             except BaseException as e:
-                await interface.close()
+                MULTI_REQUEST_SERVERS.labels(method=method, result='unreachable').inc()
                 return
             try:
                 res = await interface.session.send_request(method, params, timeout=10)
             except Exception as e:
                 res = e
+            MULTI_REQUEST_SERVERS.labels(method=method, result='error' if isinstance(res, Exception) else 'ok').inc()
             responses[interface.server] = res
-        async with OldTaskGroup() as group:
-            for server in servers:
-                await group.spawn(get_response(server))
+        with MULTI_REQUEST_LATENCY.labels(method=method).time():
+            async with OldTaskGroup() as group:
+                for server in servers:
+                    await group.spawn(get_response(server))
         return responses
 
+    async def _get_interface_for_request(self, server: ServerAddr, *, timeout) -> Interface:
+        """Returns a ready interface to server. If we are connected to server, that
+        interface is reused. Otherwise, a RequestOnlyInterface is opened, which
+        skips the header sync and is kept around for the next requests.
+        """
+        with self.interfaces_lock:
+            interface = self.interfaces.get(server)
+        if interface and interface.is_connected_and_ready():
+            return interface
+        interface = self._request_ifaces.get(server)
+        if interface is None or interface.got_disconnected.is_set() or interface.is_expired():
+            # an expired interface closes itself once idle
+            interface = self._request_ifaces[server] = RequestOnlyInterface(network=self, server=server)
+        interface.touch()
+        try:
+            # note: shield, as other requests might be waiting for the same interface
+            await util.wait_for2(asyncio.shield(interface.ready), timeout)
+        except BaseException:
+            if self._request_ifaces.get(server) == interface:
+                self._request_ifaces.pop(server)
+            await interface.close()
+            raise
+        return interface
+
     async def prune_offline_servers(self, hostmap):
         peers = filter_protocol(hostmap, allowed_protocols=("t", "s",))
         timeout = self.get_network_timeout_seconds(NetworkTimeout.Generic)
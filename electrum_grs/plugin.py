@@ -50,6 +50,7 @@ from .util import (profiler, DaemonThread, UserCancelled, ThreadJob, UserFacingE
                    make_dir, make_aiohttp_session)
 from . import bip32
 from . import plugins
+from . import startup_trace
 from .simple_config import SimpleConfig
 from .logging import get_logger, Logger
 from .crypto import sha256
@@ -608,7 +609,8 @@ class Plugins(DaemonThread):
                 dirname = metadata['dirname']
                 init_spec = zipfile.find_spec(dirname)
 
-            self.exec_module_from_spec(init_spec, base_name)
+            with startup_trace.span(f'plugin.{name}.init'):
+                self.exec_module_from_spec(init_spec, base_name)
 
     def load_plugin_by_name(self, name: str) -> Optional['BasePlugin']:
         if not self.is_authorized(name):
@@ -627,8 +629,9 @@ class Plugins(DaemonThread):
         if spec is None:
             raise RuntimeError(f"{self.gui_name} implementation for {name} plugin not found")
         try:
-            module = self.exec_module_from_spec(spec, full_name)
-            plugin = module.Plugin(self, self.config, name)
+            with startup_trace.span(f'plugin.{name}'):
+                module = self.exec_module_from_spec(spec, full_name)
+                plugin = module.Plugin(self, self.config, name)
         except Exception as e:
             raise Exception(f"Error loading {name} plugin: {repr(e)}") from e
         self.add_jobs(plugin.thread_jobs())
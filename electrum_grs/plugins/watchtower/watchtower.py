@@ -26,8 +26,9 @@
 
 import asyncio
 import os
+from collections import defaultdict
 from typing import TYPE_CHECKING
-from typing import Dict
+from typing import Dict, Set, Iterable, Optional
 
 from electrum_grs.util import log_exceptions, random_shuffled_copy
 from electrum_grs.plugin import BasePlugin
@@ -70,50 +71,112 @@ class WatchTower(Logger, EventListener):
         wallet_db = WalletDB('', storage=None, upgrade=True)
         self.adb = AddressSynchronizer(wallet_db, self.config, name=self.diagnostic_name())
         self.adb.start_network(network)
-        self.callbacks = {}  # address -> lambda function
+        self.callbacks = {}  # funding outpoint -> lambda function
+        # addresses whose history is relevant to a channel, so that we only
+        # re-check the channels touched by a tx
+        self.outpoints_by_address = defaultdict(set)  # type: Dict[str, Set[str]]
+        self.addresses_by_outpoint = defaultdict(set)  # type: Dict[str, Set[str]]
         self.register_callbacks()
         # status gets populated when we run
         self.channel_status = {}
+        # channels that are not known to be open; these are re-checked on every new block
+        self.outpoints_to_recheck = set()  # type: Set[str]
         self.network = network
         self.sweepstore = SweepStore(os.path.join(self.config.path, "watchtower_db"), network)
 
-    def remove_callback(self, address):
-        self.callbacks.pop(address, None)
+    def remove_callback(self, outpoint):
+        self.callbacks.pop(outpoint, None)
+        self.outpoints_to_recheck.discard(outpoint)
+        for address in self.addresses_by_outpoint.pop(outpoint, set()):
+            outpoints = self.outpoints_by_address[address]
+            outpoints.discard(outpoint)
+            if not outpoints:
+                del self.outpoints_by_address[address]
 
-    def add_callback(self, address, callback):
+    def add_callback(self, outpoint, address, callback):
         self.adb.add_address(address)
-        self.callbacks[address] = callback
+        self.callbacks[outpoint] = callback
+        if self.channel_status.get(outpoint) != 'open':
+            self.outpoints_to_recheck.add(outpoint)
+        self.watch_address(address, outpoint)
+
+    def set_channel_status(self, outpoint: str, status: str) -> None:
+        self.channel_status[outpoint] = status
+        if status == 'open':
+            self.outpoints_to_recheck.discard(outpoint)
+        elif outpoint in self.callbacks:
+            self.outpoints_to_recheck.add(outpoint)
+
+    def watch_address(self, address: str, outpoint: str) -> None:
+        """Re-check the channel with funding outpoint whenever
+        a tx touching address is added or verified."""
+        self.outpoints_by_address[address].add(outpoint)
+        self.addresses_by_outpoint[outpoint].add(address)
+
+    def get_outpoints_touched_by_tx(self, tx: Transaction) -> Set[str]:
+        outpoints = set()
+        for txin in tx.inputs():
+            prevout = txin.prevout.to_str()
+            if prevout in self.callbacks:
+                outpoints.add(prevout)
+            address = self.adb.get_txin_address(txin)
+            outpoints |= self.outpoints_by_address.get(address, set())
+        for txout in tx.outputs():
+            outpoints |= self.outpoints_by_address.get(txout.address, set())
+        return outpoints
+
+    def get_outpoints_to_check_on_new_block(self) -> Set[str]:
+        """A new block only changes the situation of channels that are
+        already closing. Open channels get re-checked when their funding
+        output is spent."""
+        return set(self.outpoints_to_recheck)
 
     @event_listener
     async def on_event_blockchain_updated(self, *args):
-        await self.trigger_callbacks()
+        await self.trigger_callbacks(self.get_outpoints_to_check_on_new_block())
 
     @event_listener
     async def on_event_wallet_updated(self, wallet):
         # called if we add local tx
         if wallet.adb != self.adb:
             return
-        await self.trigger_callbacks()
+        await self.trigger_callbacks(self.get_outpoints_to_check_on_new_block())
+
+    @event_listener
+    async def on_event_adb_added_tx(self, adb, tx_hash, tx):
+        if adb != self.adb:
+            return
+        await self.trigger_callbacks(self.get_outpoints_touched_by_tx(tx))
 
     @event_listener
     async def on_event_adb_added_verified_tx(self, adb, tx_hash):
         if adb != self.adb:
             return
-        await self.trigger_callbacks()
+        tx = self.adb.get_transaction(tx_hash)
+        if tx is None:
+            return
+        await self.trigger_callbacks(self.get_outpoints_touched_by_tx(tx))
 
     @event_listener
     async def on_event_adb_set_up_to_date(self, adb):
         if adb != self.adb:
             return
-        await self.trigger_callbacks()
+        # add_address fires this for every watched address while we are syncing
+        if not adb.is_up_to_date():
+            return
+        await self.trigger_callbacks(self.get_outpoints_to_check_on_new_block())
 
     @log_exceptions
-    async def trigger_callbacks(self):
+    async def trigger_callbacks(self, outpoints: Optional[Iterable[str]] = None):
+        """Runs the callbacks of the given channels, or of all channels if outpoints is None."""
         if not self.adb.synchronizer:
             self.logger.info("synchronizer not set yet")
             return
-        for address, callback in list(self.callbacks.items()):
-            await callback()
+        if outpoints is None:
+            outpoints = list(self.callbacks)
+        for outpoint in list(outpoints):
+            if callback := self.callbacks.get(outpoint):
+                await callback()
 
     async def stop(self):
         self.unregister_callbacks()
@@ -121,7 +184,7 @@ class WatchTower(Logger, EventListener):
 
     def add_channel(self, outpoint: str, address: str) -> None:
         callback = lambda: self.check_onchain_situation(address, outpoint)
-        self.add_callback(address, callback)
+        self.add_callback(outpoint, address, callback)
 
     def diagnostic_name(self):
         return "watchtower"
@@ -148,11 +211,12 @@ class WatchTower(Logger, EventListener):
                 self.logger.info(f"channel {funding_outpoint} closed by {closing_txid}. still waiting for tx itself...")
                 keep_watching = True
         else:
+            self.set_channel_status(funding_outpoint, 'open')
             keep_watching = True
         if not keep_watching:
             await self.unwatch_channel(address, funding_outpoint)
 
-    def inspect_tx_candidate(self, outpoint, n: int) -> Dict[str, str]:
+    def inspect_tx_candidate(self, outpoint, n: int, *, funding_outpoint: str = None) -> Dict[str, str]:
         """
         returns a dict of spenders for a transaction of interest.
         subscribes to addresses as a side effect.
@@ -160,16 +224,18 @@ class WatchTower(Logger, EventListener):
         n==1 => outpoint is a commitment or close output: to_local, to_remote or first-stage htlc
         n==2 => outpoint is a second-stage htlc
         """
+        if n == 0:
+            funding_outpoint = outpoint
         prev_txid, index = outpoint.split(':')
         spender_txid = self.adb.db.get_spent_outpoint(prev_txid, int(index))
         result = {outpoint:spender_txid}
         if n == 0:
             if spender_txid is None:
-                self.channel_status[outpoint] = 'open'
+                self.set_channel_status(outpoint, 'open')
             elif not self.adb.is_deeply_mined(spender_txid):
-                self.channel_status[outpoint] = 'closed (%d)' % self.adb.get_tx_height(spender_txid).conf
+                self.set_channel_status(outpoint, 'closed (%d)' % self.adb.get_tx_height(spender_txid).conf)
             else:
-                self.channel_status[outpoint] = 'closed (deep)'
+                self.set_channel_status(outpoint, 'closed (deep)')
         if spender_txid is None:
             return result
         spender_tx = self.adb.get_transaction(spender_txid)
@@ -197,10 +263,11 @@ class WatchTower(Logger, EventListener):
         for i, o in enumerate(spender_tx.outputs()):
             if o.address is None:
                 continue
+            self.watch_address(o.address, funding_outpoint)
             if not self.adb.is_mine(o.address):
                 self.adb.add_address(o.address)
             elif n < 2:
-                r = self.inspect_tx_candidate(spender_txid + ':%d' % i, n + 1)
+                r = self.inspect_tx_candidate(spender_txid + ':%d' % i, n + 1, funding_outpoint=funding_outpoint)
                 result.update(r)
         return result
 
@@ -231,7 +298,7 @@ class WatchTower(Logger, EventListener):
             return txid
 
     async def get_ctn(self, outpoint, addr):
-        if addr not in self.callbacks.keys():
+        if outpoint not in self.callbacks:
             self.logger.info(f'watching new channel: {outpoint} {addr}')
             self.add_channel(outpoint, addr)
         return await self.sweepstore.get_ctn(outpoint, addr)
@@ -252,6 +319,8 @@ class WatchTower(Logger, EventListener):
         return self.network.run_from_another_thread(f())
 
     async def unwatch_channel(self, address, funding_outpoint):
+        self.remove_callback(funding_outpoint)
+        self.channel_status.pop(funding_outpoint, None)
         await self.sweepstore.remove_sweep_tx(funding_outpoint)
         await self.sweepstore.remove_channel(funding_outpoint)
 
@@ -271,9 +340,24 @@ address VARCHAR(32),
 PRIMARY KEY(outpoint)
 )"""
 
+# max(ctn) and count(*) of sweep_txs, per funding outpoint
+create_sweep_ctn="""
+CREATE TABLE IF NOT EXISTS sweep_ctn (
+funding_outpoint VARCHAR(34) NOT NULL,
+ctn INTEGER NOT NULL,
+num_tx INTEGER NOT NULL,
+PRIMARY KEY(funding_outpoint)
+)"""
+
+create_sweep_txs_index="""
+CREATE INDEX IF NOT EXISTS sweep_txs_funding_outpoint_prevout ON sweep_txs (funding_outpoint, prevout)
+"""
+
 
 class SweepStore(SqlDB):
 
+    DB_VERSION = 1
+
     def __init__(self, path, network):
         super().__init__(network.asyncio_loop, path)
 
@@ -282,17 +366,32 @@ class SweepStore(SqlDB):
         c.execute(create_channel_info)
         c.execute(create_sweep_txs)
         self.conn.commit()
+        self.upgrade_database()
 
-    @sql
+    def upgrade_database(self):
+        c = self.conn.cursor()
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            self.logger.info(f"upgrading watchtower db from version {version} to 1")
+            c.execute("BEGIN")
+            c.execute(create_sweep_txs_index)
+            c.execute(create_sweep_ctn)
+            c.execute("DELETE FROM sweep_ctn")
+            c.execute("""INSERT INTO sweep_ctn (funding_outpoint, ctn, num_tx)
+                         SELECT funding_outpoint, max(ctn), count(*) FROM sweep_txs GROUP BY funding_outpoint""")
+            c.execute("PRAGMA user_version = 1")
+        self.conn.commit()
+
+    @sql(readonly=True)
     def get_sweep_tx(self, funding_outpoint, prevout):
         c = self.conn.cursor()
         c.execute("SELECT tx FROM sweep_txs WHERE funding_outpoint=? AND prevout=?", (funding_outpoint, prevout))
         return [Transaction(r[0].hex()) for r in c.fetchall()]
 
-    @sql
+    @sql(readonly=True)
     def list_sweep_tx(self):
         c = self.conn.cursor()
-        c.execute("SELECT funding_outpoint FROM sweep_txs")
+        c.execute("SELECT funding_outpoint FROM sweep_ctn")
         return set([r[0] for r in c.fetchall()])
 
     @sql
@@ -300,38 +399,40 @@ class SweepStore(SqlDB):
         c = self.conn.cursor()
         assert Transaction(raw_tx).is_complete()
         c.execute("""INSERT INTO sweep_txs (funding_outpoint, ctn, prevout, tx) VALUES (?,?,?,?)""", (funding_outpoint, ctn, prevout, bytes.fromhex(raw_tx)))
-        self.conn.commit()
+        c.execute("""INSERT INTO sweep_ctn (funding_outpoint, ctn, num_tx) VALUES (?,?,1)
+                     ON CONFLICT(funding_outpoint) DO UPDATE SET ctn=max(ctn, excluded.ctn), num_tx=num_tx+1""",
+                  (funding_outpoint, ctn))
 
-    @sql
+    @sql(readonly=True)
     def get_num_tx(self, funding_outpoint):
         c = self.conn.cursor()
-        c.execute("SELECT count(*) FROM sweep_txs WHERE funding_outpoint=?", (funding_outpoint,))
-        return int(c.fetchone()[0])
+        c.execute("SELECT num_tx FROM sweep_ctn WHERE funding_outpoint=?", (funding_outpoint,))
+        r = c.fetchone()
+        return int(r[0]) if r else 0
 
     @sql
     def get_ctn(self, outpoint, addr):
         if not self._has_channel(outpoint):
             self._add_channel(outpoint, addr)
         c = self.conn.cursor()
-        c.execute("SELECT max(ctn) FROM sweep_txs WHERE funding_outpoint=?", (outpoint,))
-        return int(c.fetchone()[0] or 0)
+        c.execute("SELECT ctn FROM sweep_ctn WHERE funding_outpoint=?", (outpoint,))
+        r = c.fetchone()
+        return int(r[0]) if r else 0
 
     @sql
     def remove_sweep_tx(self, funding_outpoint):
         c = self.conn.cursor()
         c.execute("DELETE FROM sweep_txs WHERE funding_outpoint=?", (funding_outpoint,))
-        self.conn.commit()
+        c.execute("DELETE FROM sweep_ctn WHERE funding_outpoint=?", (funding_outpoint,))
 
     def _add_channel(self, outpoint, address):
         c = self.conn.cursor()
         c.execute("INSERT INTO channel_info (address, outpoint) VALUES (?,?)", (address, outpoint))
-        self.conn.commit()
 
     @sql
     def remove_channel(self, outpoint):
         c = self.conn.cursor()
         c.execute("DELETE FROM channel_info WHERE outpoint=?", (outpoint,))
-        self.conn.commit()
 
     def _has_channel(self, outpoint):
         c = self.conn.cursor()
@@ -339,14 +440,14 @@ class SweepStore(SqlDB):
         r = c.fetchone()
         return r is not None
 
-    @sql
+    @sql(readonly=True)
     def get_address(self, outpoint):
         c = self.conn.cursor()
         c.execute("SELECT address FROM channel_info WHERE outpoint=?", (outpoint,))
         r = c.fetchone()
         return r[0] if r else None
 
-    @sql
+    @sql(readonly=True)
     def list_channels(self):
         c = self.conn.cursor()
         c.execute("SELECT outpoint, address FROM channel_info")
@@ -0,0 +1,206 @@
+"""Index of the status of payment requests.
+
+Abstract_Wallet.get_invoice_status used to look at the history of the
+address of a request each time it was called, to see whether it was paid.
+Merchant wallets with many requests spent most of their time doing that
+when listing requests.
+
+The on-chain part of the status (is_paid, confirmations and relevant txs,
+see Abstract_Wallet._is_onchain_invoice_paid) only changes when a tx paying
+to the address is added, removed, mined or reorged. The wallet recomputes it
+on these events (see Abstract_Wallet._update_invoices_and_reqs_touched_by_tx),
+and it is stored in the wallet db. Confirmations are stored together with
+the local height they were computed at, and follow the local height.
+Unconfirmed payments are not stored.
+The lightning part of the status is cheap to get from LNWallet, and is not
+stored.
+
+The index also keeps the full status of each request in memory, with the
+requests grouped by status, so that lists filtered by status do not have to
+look at every request. Requests expire with time rather than with an event:
+the expiration dates of unpaid requests are kept in a heap, and requests are
+moved to PR_EXPIRED when the heap is looked at, and by the run() task, which
+sends a 'request_status' notification for them.
+
+check() compares the index with a full recomputation.
+"""
+
+import asyncio
+import heapq
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from aiorpcx import ignore_after, run_in_thread
+
+from . import util
+from .invoices import Request, PR_UNPAID, PR_UNCONFIRMED
+from .logging import Logger
+from .util import log_exceptions
+
+if TYPE_CHECKING:
+    from .wallet import Abstract_Wallet
+
+
+class RequestStatusIndex(Logger):
+
+    MAX_SLEEP = 60  # run() looks at the heap at least that often
+    EXPIRY_MARGIN = 1  # Request.has_expired is strict
+
+    def __init__(self, wallet: 'Abstract_Wallet'):
+        Logger.__init__(self)
+        self.wallet = wallet
+        # note: get_invoice_status takes the wallet lock, we must not use our own
+        self.lock = wallet.lock
+        self._onchain = wallet.db.get_dict('request_onchain_status')  # type: Dict[str, Tuple[bool, Optional[int], int, Sequence[str]]]  # request_id -> (is_paid, conf, local height, txids)
+        self._status = None  # type: Optional[Dict[str, int]]  # request_id -> status. built on first use
+        self._by_status = defaultdict(set)  # type: Dict[int, Set[str]]
+        self._expiry_heap = []  # type: List[Tuple[int, str]]  # (expiration date, request_id) of unpaid requests
+        self._wakeup = asyncio.Event()
+
+    def get_onchain_info(self, req: Request) -> Tuple[bool, Optional[int], Sequence[str]]:
+        """Same as Abstract_Wallet._is_onchain_invoice_paid, for requests."""
+        key = req.get_id()
+        with self.lock:
+            local_height = self.wallet.adb.get_local_height()
+            item = self._onchain.get(key)
+            if item is None:
+                is_paid, conf, txids = self.wallet._is_onchain_invoice_paid(req)
+                # unconfirmed payments are not stored: they are few, and their conf does not
+                # follow the local height (e.g. a tx that is mined but not SPV-verified yet)
+                if conf != 0 and req.get_outputs() and self.wallet.get_request(key) is not None:
+                    self._onchain[key] = (is_paid, conf, local_height, list(txids))
+                return is_paid, conf, txids
+        is_paid, conf, height, txids = item
+        if conf is not None:
+            conf = max(1, conf + local_height - height)
+        return is_paid, conf, list(txids)
+
+    def _load(self) -> None:
+        if self._status is not None:
+            return
+        self._status = {}
+        requests = dict(self.wallet._receive_requests.items())
+        for key in set(self._onchain.keys()) - set(requests):
+            self._onchain.pop(key)
+        for key, req in requests.items():
+            self._set_status(key, req, self.wallet.get_invoice_status(req))
+
+    def _set_status(self, key: str, req: Request, status: int) -> None:
+        old_status = self._status.get(key)
+        if old_status is not None:
+            self._by_status[old_status].discard(key)
+        self._status[key] = status
+        self._by_status[status].add(key)
+        if status == PR_UNPAID and old_status != PR_UNPAID and (exp := req.get_expiration_date()):
+            heapq.heappush(self._expiry_heap, (exp, key))
+            if self._expiry_heap[0][1] == key:
+                self._wakeup_run()
+
+    def _wakeup_run(self) -> None:
+        try:
+            util.run_sync_function_on_asyncio_thread(self._wakeup.set, block=False)
+        except Exception:
+            pass  # no event loop yet. run() has not started
+
+    def refresh(self, keys: Iterable[str], *, onchain: bool) -> Dict[str, int]:
+        """Recomputes the status of requests, and their on-chain status if onchain is set.
+        Returns the requests whose status changed, with their new status."""
+        changed = {}
+        with self.lock:
+            self._load()
+            for key in keys:
+                req = self.wallet.get_request(key)
+                if req is None:
+                    continue
+                if onchain:
+                    self._onchain.pop(key, None)
+                status = self.wallet.get_invoice_status(req)
+                if status != self._status.get(key):
+                    self._set_status(key, req, status)
+                    changed[key] = status
+        return changed
+
+    def refresh_unconfirmed(self) -> Dict[str, int]:
+        """To be called on new blocks: a payment can go from unconfirmed to paid without an event
+        for its tx, if the tx was SPV-verified while the local height was behind."""
+        with self.lock:
+            self._load()
+            return self.refresh(list(self._by_status.get(PR_UNCONFIRMED, ())), onchain=False)
+
+    def add(self, req: Request) -> None:
+        self.refresh([req.get_id()], onchain=True)
+
+    def remove(self, key: str) -> None:
+        with self.lock:
+            self._onchain.pop(key, None)
+            if self._status is not None and (status := self._status.pop(key, None)) is not None:
+                self._by_status[status].discard(key)
+            # entries in the heap are skipped when popped
+
+    def clear(self) -> None:
+        """Forgets everything. The index is rebuilt on first use."""
+        with self.lock:
+            self._onchain.clear()
+            self._status = None
+            self._by_status.clear()
+            self._expiry_heap.clear()
+
+    def expire(self) -> Dict[str, int]:
+        """Moves the requests that expired to PR_EXPIRED.
+        Returns the requests whose status changed, with their new status."""
+        changed = {}
+        with self.lock:
+            self._load()
+            now = Request._get_cur_time()
+            while self._expiry_heap and self._expiry_heap[0][0] < now:
+                exp, key = heapq.heappop(self._expiry_heap)
+                if self._status.get(key) == PR_UNPAID:
+                    changed.update(self.refresh([key], onchain=False))
+        return changed
+
+    def get_keys(self, status: int) -> Set[str]:
+        """Returns the ids of the requests that have status."""
+        self._notify(self.expire())
+        with self.lock:
+            return set(self._by_status.get(status, ()))
+
+    def _notify(self, changed: Dict[str, int]) -> None:
+        for key, status in changed.items():
+            util.trigger_callback('request_status', self.wallet, key, status)
+
+    @log_exceptions
+    async def run(self) -> None:
+        while True:
+            changed = await run_in_thread(self.expire)
+            self._notify(changed)
+            with self.lock:
+                delay = self.MAX_SLEEP
+                if self._expiry_heap:
+                    delay = min(delay, self._expiry_heap[0][0] - Request._get_cur_time() + self.EXPIRY_MARGIN)
+                self._wakeup.clear()
+            await ignore_after(max(0, delay), self._wakeup.wait())
+
+    def check(self) -> List[str]:
+        """Compares the index with a full recomputation. Returns the differences."""
+        errors = []
+        self.expire()
+        with self.lock:
+            requests = dict(self.wallet._receive_requests.items())
+            in_heap = set(key for exp, key in self._expiry_heap)
+            for key in sorted(set(self._status) | set(self._onchain) | set(requests)):
+                req = requests.get(key)
+                if req is None:
+                    errors.append(f'{key}: not a request')
+                    continue
+                indexed_onchain = self.get_onchain_info(req)
+                full_onchain = self.wallet._is_onchain_invoice_paid(req)
+                if (indexed_onchain[0], indexed_onchain[1], sorted(indexed_onchain[2])) \
+                        != (full_onchain[0], full_onchain[1], sorted(full_onchain[2])):
+                    errors.append(f'{key}: onchain index={indexed_onchain}, full={full_onchain}')
+                    continue
+                status = self.wallet.get_invoice_status(req)
+                if self._status.get(key) != status:
+                    errors.append(f'{key}: status index={self._status.get(key)}, full={status}')
+                elif status == PR_UNPAID and req.get_expiration_date() and key not in in_heap:
+                    errors.append(f'{key}: not in expiry heap')
+        return errors
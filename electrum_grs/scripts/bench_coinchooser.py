@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the coin choosers in coinchooser.COIN_CHOOSERS against
+# synthetic UTXO pools. For each chooser this reports the runtime per tx,
+# the average fee waste and the fraction of txs that needed a change output.
+#
+# fee waste is computed as in Bitcoin Core: the excess paid over the fee
+# the estimator asks for, or, if there is a change output, the cost of
+# creating and later spending that change.
+#
+# usage: bench_coinchooser.py [num_utxos ...]
+
+import random
+import sys
+import time
+
+from electrum_grs import bitcoin
+from electrum_grs.coinchooser import COIN_CHOOSERS
+from electrum_grs.fee_policy import FeePolicy
+from electrum_grs.transaction import PartialTxInput, PartialTxOutput, TxOutpoint, Transaction
+
+
+NUM_PAYMENTS = 20
+DUST_THRESHOLD = 546
+FEE_POLICY = FeePolicy('feerate:10000')
+CHANGE_SPEND_WEIGHT = 272  # p2wpkh input
+
+
+def random_address(rnd: random.Random) -> str:
+    return bitcoin.pubkey_to_address('p2wpkh', '02' + rnd.randbytes(32).hex())
+
+
+def make_coin(rnd: random.Random, value: int, address: str) -> PartialTxInput:
+    coin = PartialTxInput(prevout=TxOutpoint(txid=rnd.randbytes(32), out_idx=rnd.randrange(4)))
+    coin._trusted_address = address
+    coin._trusted_value_sats = value
+    coin.script_type = 'p2wpkh'
+    coin.block_height = rnd.randint(1, 500_000)
+    return coin
+
+
+def make_pool(rnd: random.Random, num_utxos: int, distribution: str):
+    if distribution == 'uniform':
+        values = [rnd.randint(10_000, 10_000_000) for _ in range(num_utxos)]
+    elif distribution == 'lognormal':
+        values = [max(1000, int(rnd.lognormvariate(12, 2))) for _ in range(num_utxos)]
+    elif distribution == 'round':
+        values = [rnd.choice([10**5, 2 * 10**5, 5 * 10**5, 10**6, 10**7]) for _ in range(num_utxos)]
+    else:
+        raise ValueError(distribution)
+    # some address reuse, as in real wallets
+    addresses = [random_address(rnd) for _ in range(max(1, num_utxos * 3 // 4))]
+    return [make_coin(rnd, value, rnd.choice(addresses)) for value in values]
+
+
+def fee_waste(tx: Transaction) -> int:
+    fee_estimator = FEE_POLICY.estimate_fee
+    change = [o for o in tx.outputs() if o.is_change]
+    if change:
+        change_weight = sum(4 * Transaction.estimated_output_size_for_script(o.scriptpubkey) for o in change)
+        return fee_estimator(Transaction.virtual_size_from_weight(change_weight + len(change) * CHANGE_SPEND_WEIGHT))
+    return tx.get_fee() - fee_estimator(tx.estimated_size())
+
+
+def run(num_utxos: int, distribution: str):
+    rnd = random.Random(f"{num_utxos}-{distribution}")
+    coins = make_pool(rnd, num_utxos, distribution)
+    change_addr = random_address(rnd)
+    total = sum(c.value_sats() for c in coins)
+    payments = [
+        [PartialTxOutput.from_address_and_value(random_address(rnd), rnd.randint(50_000, max(50_001, total // 50)))]
+        for _ in range(NUM_PAYMENTS)]
+    for name, klass in COIN_CHOOSERS.items():
+        runtime = 0
+        waste = 0
+        num_change = 0
+        for outputs in payments:
+            chooser = klass(enable_output_value_rounding=False)
+            t0 = time.perf_counter()
+            tx = chooser.make_tx(
+                coins=coins,
+                inputs=[],
+                outputs=outputs,
+                change_addrs=[change_addr],
+                fee_estimator_vb=FEE_POLICY.estimate_fee,
+                dust_threshold=DUST_THRESHOLD,
+            )
+            runtime += time.perf_counter() - t0
+            waste += fee_waste(tx)
+            num_change += any(o.is_change for o in tx.outputs())
+        print(f"{num_utxos:>7} {distribution:>10} {name:>15}: "
+              f"{1000 * runtime / NUM_PAYMENTS:9.1f} ms/tx, "
+              f"avg waste {waste // NUM_PAYMENTS:7} sat, "
+              f"change rate {num_change / NUM_PAYMENTS:.2f}")
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [100, 1000, 10_000]
+    for size in sizes:
+        for distribution in ['uniform', 'lognormal', 'round']:
+            run(size, distribution)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the cost basis engine on a synthetic history.
+# For each method, it times a full pass, then the updates a wallet sees
+# most: a new tx at the end of the history, and a tx in the middle changing.
+# For the 'utxo' method, it also times the recursive computation the wallet
+# used to do, with a memo of the acquisition price of each tx.
+#
+# usage: bench_cost_basis.py [num_txs]
+
+import random
+import sys
+import time
+from decimal import Decimal
+
+from electrum_grs.bitcoin import COIN
+from electrum_grs.cost_basis import COST_BASIS_METHODS, CostBasisEngine, CostBasisEvent
+
+
+def price_func(timestamp) -> Decimal:
+    return Decimal(20_000 + int(timestamp) % 1000)
+
+
+def make_events(num_txs: int):
+    rnd = random.Random(0)
+    events = []
+    for i in range(num_txs):
+        if i > 10 and rnd.random() < 0.4:
+            prevs = [events[rnd.randrange(max(0, i - 100), i)] for _ in range(rnd.randint(1, 3))]
+            inputs = tuple((prev.key, rnd.randint(10**5, 10**7)) for prev in prevs)
+            amount = - rnd.randint(10**4, 10**7)
+        else:
+            inputs = ()
+            amount = rnd.randint(10**5, 10**8)
+        events.append(CostBasisEvent('%064x' % i, 1_600_000_000 + 600 * i, amount, None, inputs))
+    return events
+
+
+def recursive_acquisition_prices(events):
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * len(events)))
+    events_by_key = {e.key: e for e in events}
+    memo = {}
+
+    def coin_price(txid, value):
+        event = events_by_key.get(txid)
+        if event is not None and event.inputs:
+            return average_price(txid) * value / Decimal(COIN)
+        return price_func(event.timestamp) * value / Decimal(COIN)
+
+    def average_price(txid):
+        if txid in memo:
+            return memo[txid]
+        input_value = 0
+        total_price = 0
+        for prev, v in events_by_key[txid].inputs:
+            input_value += v
+            total_price += coin_price(prev, v)
+        memo[txid] = total_price / (input_value / Decimal(COIN))
+        return memo[txid]
+
+    acquisition_prices = []
+    for e in events:
+        fiat_value = e.amount_sat / Decimal(COIN) * price_func(e.timestamp)  # the wallet computes it for every tx
+        acquisition_prices.append(- e.amount_sat / Decimal(COIN) * average_price(e.key) if e.amount_sat < 0 else None)
+    return acquisition_prices
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    result = f()
+    return time.perf_counter() - t0, result
+
+
+def run(num_txs: int):
+    events = make_events(num_txs)
+    new_tx = CostBasisEvent('new', None, - COIN // 100, None, ((events[-1].key, COIN // 10),))
+    changed = list(events)
+    changed[num_txs // 2] = changed[num_txs // 2]._replace(fiat_value=Decimal(1))
+    print(f"{num_txs} txs")
+    t_ref, ref = timed(lambda: recursive_acquisition_prices(events))
+    print(f"{'utxo, recursive':>16}: full pass {1000 * t_ref:8.1f} ms")
+    for method in COST_BASIS_METHODS:
+        engine = CostBasisEngine(method, price_func)
+        t_full, results = timed(lambda: engine.update(events))
+        if method == 'utxo':
+            assert [r.acquisition_price for r in results] == ref
+        t_new, _ = timed(lambda: engine.update(events + [new_tx]))
+        t_changed, _ = timed(lambda: engine.update(changed))
+        print(f"{method:>16}: full pass {1000 * t_full:8.1f} ms, "
+              f"new tx {1000 * t_new:7.1f} ms, tx in the middle {1000 * t_changed:7.1f} ms")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
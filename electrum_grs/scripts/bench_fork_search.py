@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+#
+# Simulates a server that switched to a competing branch after a deep reorg:
+# the client has the old branch, and the server sends the tip of the new one.
+# Times Interface.sync_until, which looks for the forkpoint (backward then
+# binary search) and then downloads the new branch, against a server that
+# answers every request after some latency. The server runs in-process, and
+# the headers are synthetic (testnet rules, without proof of work).
+# For comparison, the same is done with NUM_FORK_PROBES = 1, which is a
+# strict binary search, one header at a time, as the forkpoint search used
+# to do. Reports the number of round-trips with the server.
+#
+# usage: bench_fork_search.py [reorg_depth,...] [latency_ms]
+
+import asyncio
+import sys
+import tempfile
+import time
+
+from electrum_grs import blockchain, constants, interface
+from electrum_grs.blockchain import CHUNK_SIZE, serialize_header, hash_raw_header
+from electrum_grs.interface import Interface, ServerAddr
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.util import OldTaskGroup, create_and_start_event_loop, get_asyncio_loop
+
+
+def make_headers(prev_hash: str, start_height: int, count: int, *, branch: int = 0):
+    headers = []
+    for height in range(start_height, start_height + count):
+        raw_header = serialize_header({
+            'version': 1,
+            'prev_block_hash': prev_hash,
+            'merkle_root': '00' * 32,
+            'timestamp': 1_500_000_000 + 60 * height,
+            'bits': 0x1e0fffff,
+            'nonce': branch,
+        })
+        headers.append(raw_header)
+        prev_hash = hash_raw_header(raw_header)
+    return headers
+
+
+GENESIS_HEADER = make_headers('00' * 32, 0, 1)[0]
+
+
+class BenchNet(constants.BitcoinSimnet):
+    GENESIS = hash_raw_header(GENESIS_HEADER)
+
+
+class LocalServerSession:
+    """Serves headers from memory, after some latency. Counts round-trips."""
+
+    def __init__(self, headers, latency: float):
+        self.headers = headers
+        self.latency = latency
+        self.in_flight = 0
+        self.num_round_trips = 0
+        self.num_requests = 0
+
+    async def send_request(self, method, params, timeout=None):
+        self.num_requests += 1
+        if self.in_flight == 0:
+            self.num_round_trips += 1
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        if method == 'blockchain.block.header':
+            return self.headers[params[0]].hex()
+        elif method == 'blockchain.block.headers':
+            start_height, count = params
+            headers = self.headers[start_height:start_height + count]
+            return {'headers': [header.hex() for header in headers], 'count': len(headers), 'max': 2016}
+        raise Exception(f"unexpected request {method}")
+
+
+class MockNetwork:
+
+    def __init__(self, config: SimpleConfig):
+        self.config = config
+        self.asyncio_loop = get_asyncio_loop()
+        self.taskgroup = OldTaskGroup()
+        self.proxy = None
+
+    def get_network_timeout_seconds(self, request_type) -> int:
+        return 10
+
+
+class LocalInterface(Interface):
+
+    async def run(self):
+        return
+
+
+async def sync_to_reorged_branch(depth: int, latency: float, old_branch, new_branch):
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="bench-fork-search-")})
+    blockchain.blockchains = {}
+    blockchain.read_blockchains(config)
+    blockchain.init_headers_file_for_best_chain()
+    chain = blockchain.get_best_chain()
+    for index in range((len(old_branch) + CHUNK_SIZE - 1) // CHUNK_SIZE):
+        assert chain.connect_chunk(index, b"".join(old_branch[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]))
+    ifa = LocalInterface(network=MockNetwork(config), server=ServerAddr('127.0.0.1', 1, protocol='t'))
+    ifa.session = LocalServerSession(new_branch, latency)
+    ifa.active_protocol_tuple = (1, 6)
+    ifa.blockchain = chain
+    ifa.tip = len(new_branch) - 1
+    ifa._headers_cache[ifa.tip] = new_branch[-1]
+    t0 = time.perf_counter()
+    await ifa.sync_until(ifa.tip)
+    t = time.perf_counter() - t0
+    forkpoint = len(old_branch) - depth
+    assert blockchain.get_best_chain().check_hash(ifa.tip, hash_raw_header(new_branch[-1]))
+    assert any(b.forkpoint == forkpoint for b in blockchain.blockchains.values())
+    return t, ifa.session.num_round_trips, ifa.session.num_requests
+
+
+async def run(depths, latency: float):
+    print(f"latency {latency * 1000:.0f} ms")
+    for depth in depths:
+        length = depth + 2 * CHUNK_SIZE
+        old_branch = [GENESIS_HEADER] + make_headers(BenchNet.GENESIS, 1, length - 1)
+        forkpoint = length - depth
+        prev_hash = hash_raw_header(old_branch[forkpoint - 1])
+        new_branch = old_branch[:forkpoint] + make_headers(prev_hash, forkpoint, depth + 10, branch=1)
+        results = {}
+        for num_probes in (1, interface.NUM_FORK_PROBES):
+            orig_num_probes = interface.NUM_FORK_PROBES
+            interface.NUM_FORK_PROBES = num_probes
+            try:
+                results[num_probes] = await sync_to_reorged_branch(depth, latency, old_branch, new_branch)
+            finally:
+                interface.NUM_FORK_PROBES = orig_num_probes
+        line = []
+        for num_probes, (t, num_round_trips, num_requests) in results.items():
+            name = 'binary' if num_probes == 1 else f'{num_probes + 1}-ary'
+            line.append(f"{name} {t:6.2f} s, {num_round_trips:3} round-trips, {num_requests:4} requests")
+        print(f"reorg depth {depth:7}: " + "; ".join(line))
+
+
+if __name__ == '__main__':
+    depths = [int(x) for x in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1_000, 10_000, 100_000]
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.05
+    BenchNet.set_as_network()
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(depths, latency), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+#
+# Benchmarks historical exchange rate lookups, as done for the fiat columns
+# of the history, history export and capital gains: one lookup per tx.
+# It compares the JSON dict of date strings that ExchangeBase used to keep
+# (strftime and Decimal(str) on every lookup) with the day index of
+# fx_history, one timestamp at a time and in a batch. It also times
+# loading ten years of rates from both cache formats.
+#
+# usage: bench_fx_history.py [num_lookups]
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from electrum_grs import fx_history, util
+from electrum_grs.exchange_rate import ExchangeBase, FxThread
+from electrum_grs.fx_history import HistoricalRates
+
+
+NUM_DAYS = 3650
+FIRST_DATE = date(2015, 1, 1)
+
+
+class FakeExchange(ExchangeBase):
+    def __init__(self, history: HistoricalRates):
+        super().__init__(lambda: None, lambda: None)
+        self._history = {'EUR': history}
+
+    def name(self):
+        return 'BenchExchange'
+
+
+class FakeFxThread:
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.ccy = 'EUR'
+
+    history_rate = FxThread.history_rate
+    timestamp_rate = FxThread.timestamp_rate
+    rates_for_timestamps = FxThread.rates_for_timestamps
+    _recent_spot_rate = FxThread._recent_spot_rate
+
+
+def json_timestamp_rate(history: dict, timestamp) -> Decimal:
+    # what FxThread.timestamp_rate used to do
+    d_t = util.timestamp_to_datetime(timestamp)
+    rate = history.get(d_t.strftime('%Y-%m-%d')) or 'NaN'
+    return Decimal(rate)
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    result = f()
+    return time.perf_counter() - t0, result
+
+
+def run(num_lookups: int):
+    rnd = random.Random(0)
+    history = {str(FIRST_DATE + timedelta(days=i)): str(round(rnd.uniform(0.1, 2), rnd.randint(2, 10)))
+               for i in range(NUM_DAYS)}
+    first_ts = int(time.mktime(FIRST_DATE.timetuple()))
+    timestamps = [first_ts + rnd.randrange(NUM_DAYS * 86400) for _ in range(num_lookups)]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        json_filename = os.path.join(cache_dir, 'BenchExchange_EUR')
+        with open(json_filename, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(history, sort_keys=True))
+        t_migrate, h = timed(lambda: fx_history.read_historical_rates(cache_dir, 'BenchExchange', 'EUR'))
+
+        def load_json():
+            with open(json_filename, 'r', encoding='utf-8') as f:
+                return {date_str: str(rate) for (date_str, rate) in json.loads(f.read()).items()}
+
+        t_json, _ = timed(load_json)
+        t_binary, _ = timed(lambda: fx_history.read_historical_rates(cache_dir, 'BenchExchange', 'EUR'))
+    print(f"load {NUM_DAYS} days: json {1000 * t_json:.2f} ms, binary {1000 * t_binary:.2f} ms "
+          f"(conversion from json {1000 * t_migrate:.2f} ms)")
+
+    fx = FakeFxThread(FakeExchange(h))
+    t_old, old = timed(lambda: [json_timestamp_rate(history, ts) for ts in timestamps])
+    t_single, single = timed(lambda: [fx.timestamp_rate(ts) for ts in timestamps])
+    t_batch, batch = timed(lambda: fx.rates_for_timestamps(timestamps))
+    assert old == single == batch
+    print(f"{num_lookups} lookups:")
+    print(f"{'json dict':>20}: {1000 * t_old:8.1f} ms")
+    print(f"{'day index':>20}: {1000 * t_single:8.1f} ms, {t_old / t_single:.1f}x")
+    print(f"{'day index, batched':>20}: {1000 * t_batch:8.1f} ms, {t_old / t_batch:.1f}x")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# Simulates many peers syncing gossip from us at once: each peer sends a
+# query_channel_range for the whole chain and a gossip_timestamp_filter for
+# the last day, as done by lnpeer when replying to them. Queries run in a
+# thread per peer against a synthetic graph, and the latency of each query
+# is reported. For comparison, the same queries are run with the linear
+# scans over copies of the graph that ChannelDB used to do.
+#
+# usage: bench_gossip_serving.py [num_channels] [num_peers]
+
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from electrum_grs import util
+from electrum_grs.channel_db import ChannelDB
+from electrum_grs.lnutil import ShortChannelID, GossipTimestampFilter, GossipForwardingMessage
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.util import create_and_start_event_loop
+
+
+class FakeNetwork:
+    def __init__(self, config):
+        self.config = config
+        self.asyncio_loop = util.get_asyncio_loop()
+        self.interface = None
+
+
+def channels_in_range_by_scan(cdb: ChannelDB, first_blocknum: int, number_of_blocks: int):
+    with cdb.lock:
+        channels = cdb._channels.copy()
+    scids = [scid for scid in channels if first_blocknum <= scid.block_height < first_blocknum + number_of_blocks]
+    scids.sort()
+    return scids
+
+
+def gossip_in_timespan_by_scan(cdb: ChannelDB, timespan: GossipTimestampFilter):
+    forwarding_gossip = []
+    with cdb.lock:
+        chans = cdb._channels.copy()
+        policies = cdb._policies.copy()
+        nodes = cdb._nodes.copy()
+    for short_id, chan in chans.items():
+        updates = []
+        for policy in [policies.get((chan.node1_id, short_id)), policies.get((chan.node2_id, short_id))]:
+            if policy and policy.raw and timespan.in_range(policy.timestamp) and policy.message_flags & 0b10 == 0:
+                updates.append(GossipForwardingMessage(msg=policy.raw, timestamp=policy.timestamp))
+        if not updates or chan.raw is None:
+            continue
+        chan_ann_ts = min(update.timestamp for update in updates)
+        forwarding_gossip.extend([GossipForwardingMessage(msg=chan.raw, timestamp=chan_ann_ts)] + updates)
+    for node_ann in nodes.values():
+        if timespan.in_range(node_ann.timestamp) and node_ann.raw:
+            forwarding_gossip.append(GossipForwardingMessage(msg=node_ann.raw, timestamp=node_ann.timestamp))
+    return forwarding_gossip
+
+
+def fill_graph(cdb: ChannelDB, num_channels: int, now: int):
+    rnd = random.Random(0)
+    nodes = sorted(b'\x02' + rnd.randbytes(32) for _ in range(max(2, num_channels // 5)))
+    for _ in range(num_channels):
+        node1, node2 = sorted(rnd.sample(nodes, 2))
+        scid = ShortChannelID.from_components(rnd.randrange(500_000, 5_000_000), rnd.randrange(3000), 0)
+        cdb.add_verified_channel_info({
+            'node_id_1': node1, 'node_id_2': node2, 'short_channel_id': scid,
+            'features': b'', 'raw': b'chan' + scid,
+        })
+        for direction in (0, 1):
+            # most policies are refreshed every two weeks
+            timestamp = now - rnd.randrange(14 * 86400)
+            cdb.add_channel_update({
+                'short_channel_id': scid, 'message_flags': b'\x00', 'channel_flags': bytes([direction]),
+                'cltv_expiry_delta': 40, 'htlc_minimum_msat': 1000, 'fee_base_msat': 1000,
+                'fee_proportional_millionths': 1, 'timestamp': timestamp,
+                'raw': b'upd' + scid + bytes([direction]),
+            }, verify=False, verbose=False)
+    for node_id in nodes:
+        cdb.add_node_announcements({
+            'node_id': node_id, 'alias': b'', 'addresses': b'', 'features': b'',
+            'timestamp': now - rnd.randrange(14 * 86400), 'raw': b'node' + node_id,
+        })
+
+
+def serve_peers(num_peers: int, query):
+    """Runs query(i) for each peer i, concurrently. Returns the latencies and the result size."""
+    def peer(i):
+        t0 = time.perf_counter()
+        result = query(i)
+        return time.perf_counter() - t0, len(result)
+    with ThreadPoolExecutor(max_workers=num_peers) as executor:
+        results = list(executor.map(peer, range(num_peers)))
+    return [r[0] for r in results], results[0][1]
+
+
+def report(name: str, latencies, size: int):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:>32}: median {1000 * statistics.median(latencies):8.2f} ms, "
+          f"p99 {1000 * p99:8.2f} ms, {size} items")
+
+
+async def run(num_channels: int, num_peers: int):
+    now = int(time.time())
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="bench-gossip-")})
+    cdb = ChannelDB(FakeNetwork(config))
+    try:
+        t0 = time.perf_counter()
+        fill_graph(cdb, num_channels, now)
+        print(f"graph: {len(cdb._channels)} channels, {len(cdb._policies)} policies, {len(cdb._nodes)} nodes "
+              f"(built in {time.perf_counter() - t0:.1f} s)")
+        # peers ask for all channels, and for the gossip of the last day
+        benchmarks = [
+            ('query_channel_range', channels_in_range_by_scan, ChannelDB.get_channels_in_range,
+             lambda f, i: f(cdb, 0, 2 ** 32 - 1)),
+            ('gossip_timestamp_filter', gossip_in_timespan_by_scan, ChannelDB.get_gossip_in_timespan,
+             lambda f, i: f(cdb, GossipTimestampFilter(now - 86400 - i, 2 ** 32 - 1))),
+        ]
+        print(f"{num_peers} peers:")
+        for name, scan, indexed, query in benchmarks:
+            for label, f in (('scan', scan), ('index', indexed)):
+                latencies, size = await asyncio.to_thread(serve_peers, num_peers, lambda i: query(f, i))
+                report(f'{name}, {label}', latencies, size)
+    finally:
+        cdb.stop()
+        await cdb.stopped_event.wait()
+
+
+if __name__ == '__main__':
+    num_channels = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    num_peers = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(num_channels, num_peers), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#
+# Headless benchmark of the Qt HistoryModel, driven by a synthetic wallet.
+# It compares a full rebuild of the model (what every refresh used to do)
+# with the diff-based refresh, for typical wallet updates:
+# a new mempool tx, that tx getting mined, and a label change.
+#
+# usage: QT_QPA_PLATFORM=offscreen bench_history_model.py [num_txs]
+
+import os
+import random
+import sys
+import threading
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtCore import QObject
+from PyQt6.QtWidgets import QApplication, QTreeView, QComboBox, QLabel
+
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.util import OrderedDictWithIndex, Satoshis, timestamp_to_datetime
+from electrum_grs.wallet import Abstract_Wallet
+
+from electrum_grs.gui.qt.history_list import HistoryModel, HistorySortModel
+
+
+class FakeTxDB:
+
+    def get_transaction(self, txid):
+        return None
+
+
+class SyntheticWallet:
+    """Has the parts of Abstract_Wallet used by HistoryModel."""
+
+    get_tx_status = Abstract_Wallet.get_tx_status
+
+    def __init__(self, num_txs: int):
+        rnd = random.Random(0)
+        self.db = FakeTxDB()
+        self.network = None
+        self.tip = 800_000
+        self.labels = {}
+        self.txs = []  # (txid, amount, height, timestamp)
+        height = self.tip - num_txs // 4
+        timestamp = 1_600_000_000
+        for i in range(num_txs):
+            if rnd.random() < 0.25:
+                height += 1
+            timestamp += 150
+            self.txs.append(('%064x' % i, rnd.randint(-10**7, 2 * 10**7), height, timestamp))
+
+    def add_mempool_tx(self):
+        self.txs.append(('%064x' % len(self.txs), 123_456, 0, None))
+
+    def mine_block(self):
+        self.tip += 1
+        self.txs = [(txid, amount, height or self.tip, timestamp or int(time.time()))
+                    for txid, amount, height, timestamp in self.txs]
+
+    def get_full_history(self, **kwargs) -> OrderedDictWithIndex:
+        transactions = OrderedDictWithIndex()
+        balance = 0
+        for txid, amount, height, timestamp in self.txs:
+            balance += amount
+            conf = max(0, self.tip - height + 1) if height > 0 else 0
+            transactions[txid] = {
+                'txid': txid,
+                'amount_sat': amount,
+                'fee_sat': 200,
+                'height': height,
+                'confirmations': conf,
+                'timestamp': timestamp,
+                'monotonic_timestamp': timestamp,
+                'incoming': amount > 0,
+                'bc_value': Satoshis(amount),
+                'bc_balance': Satoshis(balance),
+                'date': timestamp_to_datetime(timestamp),
+                'txpos_in_block': 1 if height > 0 else None,
+                'wanted_height': None,
+                'label': self.labels.get(txid, ''),
+                'group_id': None,
+                'lightning': False,
+                'ln_value': Satoshis(0),
+                'value': Satoshis(amount),
+            }
+        return transactions
+
+
+class DummyHistory:
+    """Returns a precomputed history."""
+
+    def __init__(self, wallet: SyntheticWallet, history: OrderedDictWithIndex):
+        self.wallet = wallet
+        self.history = history
+
+    def get_full_history(self, **kwargs):
+        return self.history
+
+    def __getattr__(self, name):
+        return getattr(self.wallet, name)
+
+
+class FakeWindow(QObject):
+
+    def __init__(self, wallet):
+        QObject.__init__(self)
+        self.wallet = wallet
+        self.fx = None
+        self.config = SimpleConfig({'electrum_path': '/tmp/bench-history-model'})
+        self.gui_thread = threading.current_thread()
+
+    def format_amount(self, x, **kwargs):
+        return str(x)
+
+
+class FakeHistoryList(QTreeView):
+
+    def __init__(self, model: HistoryModel):
+        QTreeView.__init__(self)
+        self.proxy = HistorySortModel(self)
+        self.proxy.setSourceModel(model)
+        self.setModel(self.proxy)
+        self.years = []
+        self.period_combo = QComboBox()
+        self.num_tx_label = QLabel()
+
+    def maybe_defer_update(self):
+        return False
+
+    def filter(self):
+        pass
+
+
+def timed(f) -> float:
+    t0 = time.perf_counter()
+    f()
+    return time.perf_counter() - t0
+
+
+def run(num_txs: int):
+    app = QApplication(sys.argv)
+    wallet = SyntheticWallet(num_txs)
+    models = []
+    for i in range(2):
+        model = HistoryModel(FakeWindow(wallet))
+        model.set_view(FakeHistoryList(model))
+        models.append(model)
+    full_model, diff_model = models
+
+    print(f"initial load of {num_txs} txs: {timed(lambda: diff_model.refresh('initial')):.2f} s")
+    full_model.refresh('initial')
+    updates = [
+        ('new mempool tx', wallet.add_mempool_tx),
+        ('new block', wallet.mine_block),
+        ('label change', lambda: wallet.labels.__setitem__('%064x' % (num_txs // 2), 'rent')),
+    ]
+    for name, update in updates:
+        update()
+        # time the model only, not the wallet
+        full_history = wallet.get_full_history()
+        diff_history = wallet.get_full_history()
+        t_full = timed(lambda: full_model._reset(full_history))
+        diff_model.window.wallet = DummyHistory(wallet, diff_history)
+        t_diff = timed(lambda: diff_model.refresh(name))
+        print(f"{name:>15}: full rebuild {1000 * t_full:7.1f} ms, diff {1000 * t_diff:7.1f} ms")
+    assert list(diff_model.transactions.keys()) == list(full_model.transactions.keys())
+    for a, b in zip(diff_model._root._children, full_model._root._children):
+        assert a.sort_keys == b.sort_keys
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+#
+# Imports many addresses into a watch-only wallet stored on disk, adds
+# transactions that pay to them (some shared between addresses), then
+# deletes a fraction of the addresses. Compares importing and deleting
+# one address at a time (what Imported_Wallet used to do) with the bulk
+# import_addresses/delete_addresses. Deleting one address at a time
+# scans the history of every address, so only a sample of the deletions
+# is timed for it, and the total is extrapolated.
+#
+# usage: bench_imported_wallet.py [num_addresses] [delete_ratio]
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from electrum_grs import bitcoin
+from electrum_grs.bitcoin import script_to_address
+from electrum_grs.i18n import _
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.storage import WalletStorage
+from electrum_grs.transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum_grs.util import UserFacingException, create_and_start_event_loop
+from electrum_grs.wallet import Imported_Wallet
+from electrum_grs.wallet_db import WalletDB
+
+
+OUTPUTS_PER_TX = 10
+MAX_TIMED_SINGLE_DELETIONS = 20
+
+
+def import_addresses_one_by_one(wallet: Imported_Wallet, addresses):
+    """What Imported_Wallet.import_addresses used to do."""
+    for address in addresses:
+        if not bitcoin.is_address(address) or wallet.db.has_imported_address(address):
+            continue
+        wallet.db.add_imported_address(address, {})
+        wallet.adb.add_address(address)
+    wallet.save_db()
+
+
+def delete_address_scanning(wallet: Imported_Wallet, address: str):
+    """What Imported_Wallet.delete_address used to do."""
+    if not wallet.db.has_imported_address(address):
+        return
+    with wallet.lock:
+        if len(wallet.get_addresses()) <= 1:
+            raise UserFacingException(_('Cannot delete last remaining address from wallet'))
+        transactions_to_remove = set()
+        transactions_new = set()
+        for addr in wallet.db.get_history():
+            details = wallet.adb.get_address_history(addr).items()
+            if addr == address:
+                for tx_hash, height in details:
+                    transactions_to_remove.add(tx_hash)
+            else:
+                for tx_hash, height in details:
+                    transactions_new.add(tx_hash)
+        transactions_to_remove -= transactions_new
+        wallet.db.remove_addr_history(address)
+        for tx_hash in transactions_to_remove:
+            wallet.adb._remove_transaction(tx_hash)
+        wallet.set_label(address, None)
+        if req := wallet.get_request_by_addr(address):
+            wallet.delete_request(req.get_id())
+        wallet.set_frozen_state_of_addresses([address], False, write_to_disk=False)
+        wallet.db.remove_imported_address(address)
+        wallet.save_db()
+
+
+def create_wallet(config: SimpleConfig, first_address: str) -> Imported_Wallet:
+    path = os.path.join(config.path, "wallet")
+    storage = WalletStorage(path)
+    db = WalletDB('', storage=storage, upgrade=True)
+    db.put('wallet_type', 'imported')
+    db.put('addresses', {first_address: {}})
+    wallet = Imported_Wallet(db, config=config)
+    wallet.save_db()
+    return wallet
+
+
+def make_tx(i: int, outputs) -> Transaction:
+    txin = PartialTxInput(prevout=TxOutpoint.from_str("%064x:0" % i))
+    txin.script_sig = b''
+    txin.witness = bytes([1, 1, 0x51])
+    tx = PartialTransaction.from_io([txin], [PartialTxOutput.from_address_and_value(addr, 10_000) for addr in outputs])
+    return Transaction(tx.serialize())
+
+
+def add_transactions(wallet: Imported_Wallet, addresses):
+    # each tx pays to OUTPUTS_PER_TX consecutive addresses, and overlaps with the next one.
+    # some addresses also get a tx of their own, which goes away with them
+    step = OUTPUTS_PER_TX // 2
+    i = 0
+    for start in range(0, len(addresses), step):
+        wallet.adb.add_transaction(make_tx(i, addresses[start:start + OUTPUTS_PER_TX]), allow_unrelated=True)
+        wallet.adb.add_transaction(make_tx(i + 1, addresses[start:start + 1]), allow_unrelated=True)
+        i += 2
+    wallet.save_db()
+
+
+def run(num_addresses: int, delete_ratio: float):
+    rnd = random.Random(0)
+    addresses = [script_to_address(bytes([0x00, 0x14]) + rnd.randbytes(20)) for _ in range(num_addresses + 1)]
+    to_delete = rnd.sample(addresses[1:], int(num_addresses * delete_ratio))
+    print(f"{num_addresses} addresses, deleting {len(to_delete)}, {2 * num_addresses // (OUTPUTS_PER_TX // 2)} txs")
+    for name, bulk in (('one by one', False), ('bulk', True)):
+        config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="bench-imported-wallet-")})
+        wallet = create_wallet(config, addresses[0])
+        t0 = time.perf_counter()
+        if bulk:
+            wallet.import_addresses(addresses[1:])
+        else:
+            import_addresses_one_by_one(wallet, addresses[1:])
+        t_import = time.perf_counter() - t0
+        add_transactions(wallet, addresses)
+        num_txs = len(wallet.db.transactions)
+        num_deleted = len(to_delete) if bulk else min(len(to_delete), MAX_TIMED_SINGLE_DELETIONS)
+        t0 = time.perf_counter()
+        if bulk:
+            wallet.delete_addresses(to_delete)
+            t_delete = time.perf_counter() - t0
+        else:
+            sample = to_delete[:MAX_TIMED_SINGLE_DELETIONS]
+            for address in sample:
+                delete_address_scanning(wallet, address)
+            t_delete = (time.perf_counter() - t0) * len(to_delete) / len(sample)
+        print(f"{name:>12}: import {t_import:7.2f} s, delete {t_delete:8.2f} s"
+              f"{' (extrapolated)' if not bulk and len(to_delete) > MAX_TIMED_SINGLE_DELETIONS else ''}, "
+              f"{num_txs - len(wallet.db.transactions)} txs removed for {num_deleted} addresses")
+
+
+if __name__ == '__main__':
+    num_addresses = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    delete_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    # the wallet triggers callbacks, which need an event loop
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        run(num_addresses, delete_ratio)
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
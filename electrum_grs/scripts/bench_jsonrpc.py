@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#
+# Benchmarks the daemon's JSON-RPC server (daemon.AuthenticatedServer) on a
+# large synthetic history, comparing:
+#  - one request returning the full history
+#  - paging through it with limit/cursor
+#  - the same full request, streamed as NDJSON
+#  - a batch of small requests vs the same requests sent one by one
+# It reports wall time and the peak memory allocated by the server.
+#
+# usage: bench_jsonrpc.py [num_items]
+
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from base64 import b64encode
+
+import aiohttp
+from aiohttp import web
+
+from electrum_grs.commands import paginate
+from electrum_grs.daemon import AuthenticatedServer
+
+
+RPC_USER = 'user'
+RPC_PASSWORD = 'password'
+PAGE_SIZE = 1000
+
+
+def make_history(num_items: int):
+    return [{
+        'txid': '%064x' % i,
+        'height': 600_000 + i // 10,
+        'timestamp': 1_600_000_000 + 60 * i,
+        'bc_value': '0.%08d' % (i % 10**8),
+        'label': f'payment {i}',
+        'incoming': bool(i % 2),
+        'fee_sat': 141,
+    } for i in range(num_items)]
+
+
+def make_server(history) -> AuthenticatedServer:
+    server = AuthenticatedServer(RPC_USER, RPC_PASSWORD)
+
+    async def onchain_history(limit=None, cursor=None):
+        if limit is None and cursor is None:
+            return history
+        items, next_cursor = paginate(history, key=lambda x: x['txid'], limit=limit, cursor=cursor)
+        return {'items': items, 'next_cursor': next_cursor}
+
+    async def gettransaction(txid):
+        await asyncio.sleep(0.001)  # stands in for a db/network lookup
+        return {'txid': txid}
+
+    server.register_method('onchain_history', onchain_history)
+    server.register_method('gettransaction', gettransaction)
+    return server
+
+
+async def measure(name, coro):
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    size = await coro
+    dt = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    print(f"{name:>28}: {dt:7.3f} s, peak memory {peak / 2**20:7.1f} MiB, {size / 2**20:7.1f} MiB received")
+
+
+async def run(num_items: int):
+    server = make_server(make_history(num_items))
+    app = web.Application()
+    app.router.add_post("/", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    url = f'http://127.0.0.1:{port}/'
+    auth = b64encode(f'{RPC_USER}:{RPC_PASSWORD}'.encode()).decode()
+    headers = {'Authorization': f'Basic {auth}'}
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+
+        async def post(payload, **kwargs):
+            async with session.post(url, data=json.dumps(payload), **kwargs) as resp:
+                return await resp.read()
+
+        async def full():
+            return len(await post({'id': 0, 'method': 'onchain_history'}))
+
+        async def paged():
+            size, cursor = 0, None
+            while True:
+                raw = await post({'id': 0, 'method': 'onchain_history', 'params': {'limit': PAGE_SIZE, 'cursor': cursor}})
+                size += len(raw)
+                cursor = json.loads(raw)['result']['next_cursor']
+                if cursor is None:
+                    return size
+
+        async def streamed():
+            size = 0
+            async with session.post(url, data=json.dumps({'id': 0, 'method': 'onchain_history'}),
+                                    headers={'Accept': 'application/x-ndjson'}) as resp:
+                async for chunk in resp.content.iter_chunked(2**16):
+                    size += len(chunk)
+            return size
+
+        requests = [{'id': i, 'method': 'gettransaction', 'params': ['%064x' % i]} for i in range(1000)]
+
+        async def one_by_one():
+            size = 0
+            for req in requests:
+                size += len(await post(req))
+            return size
+
+        async def batch():
+            return len(await post(requests))
+
+        tracemalloc.start()
+        await measure(f'full ({num_items} items)', full())
+        await measure(f'paged ({PAGE_SIZE} per page)', paged())
+        await measure('full, NDJSON stream', streamed())
+        await measure('1000 requests, one by one', one_by_one())
+        await measure('1000 requests, one batch', batch())
+        tracemalloc.stop()
+
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    num_items = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    asyncio.run(run(num_items))
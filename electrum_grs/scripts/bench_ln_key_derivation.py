@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# Measures the key derivations of lightning channels (lnutil.derive_pubkey,
+# derive_blinded_pubkey, derive_privkey), in ops/sec, and the derivations
+# done for a state update of a channel with a number of HTLCs: the
+# commitment tx, the output of every HTLC in it, the HTLC txs, and the HTLC
+# signatures, for both commitments, each one computing the per-commitment
+# point again, as lnchannel.Channel does. For comparison, the same is done
+# with the uncached derivations, which is what they used to do.
+#
+# usage: bench_ln_key_derivation.py [num_htlcs] [num_states]
+
+import os
+import sys
+import time
+
+import electrum_ecc as ecc
+
+from electrum_grs import lnutil
+from electrum_grs.crypto import sha256
+from electrum_grs.lnutil import (derive_pubkey, derive_blinded_pubkey, derive_privkey, secret_to_pubkey,
+                                 get_per_commitment_secret_from_seed, RevocationStore)
+from electrum_grs.lrucache import LRUCache
+
+
+def old_derive_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
+    p = ecc.ECPubkey(basepoint) + ecc.GENERATOR * ecc.string_to_number(sha256(per_commitment_point + basepoint))
+    return p.get_public_key_bytes()
+
+
+def old_derive_privkey(secret: int, per_commitment_point: bytes) -> int:
+    basepoint_bytes = secret_to_pubkey(secret)
+    basepoint = secret + ecc.string_to_number(sha256(per_commitment_point + basepoint_bytes))
+    return basepoint % ecc.CURVE_ORDER
+
+
+def old_derive_blinded_pubkey(basepoint: bytes, per_commitment_point: bytes) -> bytes:
+    k1 = ecc.ECPubkey(basepoint) * ecc.string_to_number(sha256(basepoint + per_commitment_point))
+    k2 = ecc.ECPubkey(per_commitment_point) * ecc.string_to_number(sha256(per_commitment_point + basepoint))
+    return (k1 + k2).get_public_key_bytes()
+
+
+class Derivations:
+    """The derivations of a state update, as done by Channel (see make_commitment,
+    possible_output_idxs_of_htlc_in_ctx, make_htlc_tx_with_open_channel, sign_next_commitment).
+    """
+
+    def __init__(self, *, cached: bool):
+        self.cached = cached
+        self.seed = os.urandom(32)
+        self.secrets = {name: ecc.ECPrivkey.generate_random_key() for name in ('htlc', 'delayed', 'revocation')}
+        self.points = {name: secret_to_pubkey(ecc.ECPrivkey.generate_random_key().secret_scalar)
+                       for name in ('htlc', 'delayed', 'revocation')}
+        self.secret_and_point_cache = LRUCache(maxsize=100)
+        if cached:
+            self.derive_pubkey, self.derive_blinded_pubkey = derive_pubkey, derive_blinded_pubkey
+        else:
+            self.derive_pubkey, self.derive_blinded_pubkey = old_derive_pubkey, old_derive_blinded_pubkey
+
+    def get_secret_and_point(self, ctn: int):
+        if self.cached and ctn in self.secret_and_point_cache:
+            return self.secret_and_point_cache[ctn]
+        secret = get_per_commitment_secret_from_seed(self.seed, RevocationStore.START_INDEX - ctn)
+        point = secret_to_pubkey(int.from_bytes(secret, 'big'))
+        self.secret_and_point_cache[ctn] = secret, point
+        return secret, point
+
+    def derive_privkey(self, name: str, pcp: bytes) -> int:
+        privkey = self.secrets[name]
+        if self.cached:
+            return derive_privkey(privkey.secret_scalar, pcp, basepoint=privkey.get_public_key_bytes())
+        return old_derive_privkey(privkey.secret_scalar, pcp)
+
+    def commitment(self, ctn: int, num_htlcs: int):
+        _, pcp = self.get_secret_and_point(ctn)
+        # make_commitment
+        self.derive_pubkey(self.points['htlc'], pcp)
+        self.derive_pubkey(self.secrets['htlc'].get_public_key_bytes(), pcp)
+        self.derive_blinded_pubkey(self.points['revocation'], pcp)
+        self.derive_pubkey(self.secrets['delayed'].get_public_key_bytes(), pcp)
+        for _ in range(num_htlcs):
+            _, pcp = self.get_secret_and_point(ctn)
+            # possible_output_idxs_of_htlc_in_ctx
+            self.derive_blinded_pubkey(self.points['revocation'], pcp)
+            self.derive_pubkey(self.points['htlc'], pcp)
+            self.derive_pubkey(self.secrets['htlc'].get_public_key_bytes(), pcp)
+            # make_htlc_tx_with_open_channel
+            self.derive_pubkey(self.secrets['delayed'].get_public_key_bytes(), pcp)
+            self.derive_blinded_pubkey(self.points['revocation'], pcp)
+            self.derive_pubkey(self.points['htlc'], pcp)
+            self.derive_pubkey(self.secrets['htlc'].get_public_key_bytes(), pcp)
+
+    def state_update(self, ctn: int, num_htlcs: int):
+        # sign_next_commitment
+        _, pcp = self.get_secret_and_point(ctn)
+        self.derive_privkey('htlc', pcp)
+        self.commitment(ctn, num_htlcs)
+        # receive_new_commitment, and the ctx being built again when it is signed and watched
+        for _ in range(2):
+            self.commitment(ctn, num_htlcs)
+        for _ in range(num_htlcs):
+            self.derive_pubkey(self.points['htlc'], pcp)
+
+
+def ops_per_sec(f, *args, n=2000) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        f(*args)
+    return n / (time.perf_counter() - t0)
+
+
+def run(num_htlcs: int, num_states: int):
+    secret = ecc.ECPrivkey.generate_random_key()
+    basepoint = secret.get_public_key_bytes()
+    pcp = secret_to_pubkey(ecc.ECPrivkey.generate_random_key().secret_scalar)
+    assert derive_pubkey(basepoint, pcp) == old_derive_pubkey(basepoint, pcp)
+    assert derive_blinded_pubkey(basepoint, pcp) == old_derive_blinded_pubkey(basepoint, pcp)
+    assert derive_privkey(secret.secret_scalar, pcp, basepoint=basepoint) == old_derive_privkey(secret.secret_scalar, pcp)
+
+    print("ops/sec:          uncached      cached")
+    for name, old, new in (
+            ('derive_pubkey', old_derive_pubkey, derive_pubkey),
+            ('derive_blinded', old_derive_blinded_pubkey, derive_blinded_pubkey)):
+        print(f"{name:>14}: {ops_per_sec(old, basepoint, pcp):11.0f} {ops_per_sec(new, basepoint, pcp):11.0f}")
+    print(f"{'derive_privkey':>14}: {ops_per_sec(old_derive_privkey, secret.secret_scalar, pcp):11.0f} "
+          f"{ops_per_sec(lambda: derive_privkey(secret.secret_scalar, pcp, basepoint=basepoint)):11.0f} (basepoint passed)")
+
+    print(f"{num_states} state updates of a channel with {num_htlcs} HTLCs")
+    for cached in (False, True):
+        lnutil._derive_pubkey.cache_clear()
+        lnutil._derive_blinded_pubkey.cache_clear()
+        derivations = Derivations(cached=cached)
+        t0 = time.perf_counter()
+        for ctn in range(num_states):
+            derivations.state_update(ctn, num_htlcs)
+        t = time.perf_counter() - t0
+        print(f"{'cached' if cached else 'uncached':>14}: {t:6.2f} s ({num_states / t:6.1f} states/s)")
+
+
+if __name__ == '__main__':
+    num_htlcs = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    num_states = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    run(num_htlcs, num_states)
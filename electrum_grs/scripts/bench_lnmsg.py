@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# Benchmarks decoding of gossip messages, comparing the compiled codecs
+# (LNSerializer.decode_msg) with the reference implementation that walks
+# the wire scheme row by row (LNSerializer._decode_msg_interpreted).
+# The mix of message types is roughly what ChannelDB.load_data sees:
+# mostly channel_updates, then channel_announcements and node_announcements.
+#
+# usage: bench_lnmsg.py [num_msgs]
+
+import random
+import sys
+import time
+
+import electrum_ecc as ecc
+
+from electrum_grs.lnmsg import LNSerializer
+
+
+def make_msgs(lnser: LNSerializer, num_msgs: int):
+    rnd = random.Random(0)
+    # a few valid points, as points are checked on decode
+    points = [ecc.ECPrivkey.from_secret_scalar(i + 1).get_public_key_bytes() for i in range(16)]
+    templates = []
+    for _ in range(64):
+        templates.append(lnser.encode_msg(
+            'channel_update',
+            signature=rnd.randbytes(64),
+            chain_hash=rnd.randbytes(32),
+            short_channel_id=rnd.randbytes(8),
+            timestamp=rnd.getrandbits(32),
+            message_flags=b'\x01',
+            channel_flags=rnd.randbytes(1),
+            cltv_expiry_delta=rnd.randrange(1000),
+            htlc_minimum_msat=rnd.randrange(1000),
+            fee_base_msat=rnd.randrange(1000),
+            fee_proportional_millionths=rnd.randrange(1000),
+            htlc_maximum_msat=rnd.getrandbits(40)))
+    for _ in range(16):
+        templates.append(lnser.encode_msg(
+            'channel_announcement',
+            node_signature_1=rnd.randbytes(64),
+            node_signature_2=rnd.randbytes(64),
+            bitcoin_signature_1=rnd.randbytes(64),
+            bitcoin_signature_2=rnd.randbytes(64),
+            len=0,
+            features=b'',
+            chain_hash=rnd.randbytes(32),
+            short_channel_id=rnd.randbytes(8),
+            node_id_1=rnd.choice(points),
+            node_id_2=rnd.choice(points),
+            bitcoin_key_1=rnd.choice(points),
+            bitcoin_key_2=rnd.choice(points)))
+    for _ in range(8):
+        templates.append(lnser.encode_msg(
+            'node_announcement',
+            signature=rnd.randbytes(64),
+            flen=2,
+            features=b'\x88\x00',
+            timestamp=rnd.getrandbits(32),
+            node_id=rnd.choice(points),
+            rgb_color=rnd.randbytes(3),
+            alias=rnd.randbytes(32),
+            addrlen=7,
+            addresses=b'\x01' + rnd.randbytes(6)))
+    return [rnd.choice(templates) for _ in range(num_msgs)]
+
+
+def bench(name, decode, msgs, baseline=None):
+    t0 = time.perf_counter()
+    for msg in msgs:
+        decode(msg)
+    dt = time.perf_counter() - t0
+    speedup = f", {baseline / dt:.1f}x" if baseline else ""
+    print(f"{name:>12}: {dt:7.2f} s, {1e6 * dt / len(msgs):6.2f} us/msg{speedup}")
+    return dt
+
+
+if __name__ == '__main__':
+    num_msgs = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    lnser = LNSerializer()
+    msgs = make_msgs(lnser, num_msgs)
+    print(f"decoding {num_msgs} gossip messages")
+    t_interpreted = bench('interpreted', lnser._decode_msg_interpreted, msgs)
+    bench('compiled', lnser.decode_msg, msgs, baseline=t_interpreted)
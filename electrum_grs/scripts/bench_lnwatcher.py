@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+#
+# Load test for LNWatcher: watches many channels, some of which were force
+# closed, against an in-process fake chain (no server connection). Measures
+# how long the watcher takes to react to new blocks and to new txs. For
+# comparison, it also times a full sweep without the sweep info cache,
+# which is what every event used to trigger.
+# Channels are stand-ins: get_ctx_sweep_info does a few EC multiplications,
+# about what lnsweep needs to derive the keys of a commitment tx.
+#
+# usage: bench_lnwatcher.py [num_channels] [num_closed]
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+import electrum_ecc as ecc
+
+from electrum_grs.address_synchronizer import AddressSynchronizer
+from electrum_grs.bitcoin import script_to_address
+from electrum_grs.lnsweep import SweepInfo
+from electrum_grs.lnwatcher import LNWatcher
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum_grs.util import TxMinedInfo, create_and_start_event_loop
+from electrum_grs.wallet_db import WalletDB
+
+
+HEIGHT = 600_000
+
+
+class FakeSynchronizer:
+
+    def add(self, address):
+        pass
+
+
+class FakeTxBatcher:
+
+    def add_sweep_input(self, key, sweep_info):
+        pass
+
+
+class FakeWallet:
+
+    def __init__(self, adb):
+        self.adb = adb
+        self.txbatcher = FakeTxBatcher()
+        self._accounting_addresses = set()
+
+    def diagnostic_name(self):
+        return "bench"
+
+    def set_default_label(self, key, value):
+        pass
+
+
+class FakeChannel:
+
+    def __init__(self, funding_outpoint: str, funding_address: str):
+        self.funding_outpoint = TxOutpoint.from_str(funding_outpoint)
+        self.funding_address = funding_address
+        self.secret = os.urandom(32)
+
+    def get_funding_address(self):
+        return self.funding_address
+
+    def need_to_subscribe(self):
+        return True
+
+    def get_id_for_log(self):
+        return self.funding_outpoint.to_str()[:8]
+
+    def update_onchain_state(self, **kwargs):
+        pass
+
+    def get_ctx_sweep_info(self, ctx: Transaction):
+        point = ecc.ECPrivkey(self.secret).get_public_key_bytes()
+        for i in range(8):
+            point = (ecc.ECPubkey(point) * (i + 2)).get_public_key_bytes()
+        txin = PartialTxInput(prevout=TxOutpoint(txid=bytes.fromhex(ctx.txid()), out_idx=0))
+        sweep_info = SweepInfo(
+            name='to_local', cltv_abs=None, txin=txin, txout=None, can_be_batched=True, dust_override=False)
+        return True, {txin.prevout.to_str(): sweep_info}
+
+    def maybe_sweep_htlcs(self, ctx, htlc_tx):
+        return {}
+
+
+class FakeLNWallet:
+
+    def __init__(self, config, adb):
+        self.config = config
+        self.wallet = FakeWallet(adb)
+        self.channels = {}  # funding outpoint -> FakeChannel
+
+    def channel_by_txo(self, txo: str):
+        return self.channels.get(txo)
+
+    async def handle_onchain_state(self, chan):
+        pass
+
+
+def random_p2wsh_address(rnd: random.Random) -> str:
+    return script_to_address(bytes([0x00, 0x20]) + rnd.randbytes(32))
+
+
+def make_tx(inputs, outputs) -> Transaction:
+    txins = []
+    for prevout in inputs:
+        txin = PartialTxInput(prevout=TxOutpoint.from_str(prevout))
+        # dummy witness, so that the tx is complete and has a txid
+        txin.script_sig = b''
+        txin.witness = bytes([1, 1, 0x51])
+        txins.append(txin)
+    tx = PartialTransaction.from_io(
+        txins, [PartialTxOutput.from_address_and_value(addr, value) for addr, value in outputs])
+    return Transaction(tx.serialize())
+
+
+def mine(adb: AddressSynchronizer, tx: Transaction, height: int) -> None:
+    adb.receive_tx_callback(tx, tx_height=height)
+    adb.add_verified_tx(tx.txid(), TxMinedInfo(_height=height, timestamp=0, txpos=0, header_hash='00' * 32))
+
+
+async def timed(coro) -> float:
+    t0 = time.perf_counter()
+    await coro
+    return time.perf_counter() - t0
+
+
+async def full_sweep_without_cache(lnwatcher: LNWatcher) -> None:
+    lnwatcher._sweep_info_cache.clear()
+    await lnwatcher.trigger_callbacks()
+
+
+async def run(num_channels: int, num_closed: int):
+    rnd = random.Random(0)
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="bench-lnwatcher-")})
+    adb = AddressSynchronizer(WalletDB('', storage=None, upgrade=True), config, name="bench")
+    adb.synchronizer = FakeSynchronizer()
+    adb.db.put('stored_height', HEIGHT)
+    lnworker = FakeLNWallet(config, adb)
+    lnwatcher = LNWatcher(lnworker)
+    lnwatcher.unregister_callbacks()
+
+    channels = []
+    for i in range(num_channels):
+        address = random_p2wsh_address(rnd)
+        funding_tx = make_tx(["%064x:0" % i], [(address, 1_000_000)])
+        mine(adb, funding_tx, HEIGHT - 1000)
+        outpoint = funding_tx.txid() + ":0"
+        chan = FakeChannel(outpoint, address)
+        lnworker.channels[outpoint] = chan
+        lnwatcher.add_channel(chan)
+        channels.append(chan)
+    for chan in rnd.sample(channels, num_closed):
+        closing_tx = make_tx([chan.funding_outpoint.to_str()], [(random_p2wsh_address(rnd), 990_000)])
+        mine(adb, closing_tx, HEIGHT - 5)
+    print(f"{num_channels} channels, {num_closed} of them force closed")
+
+    print(f"initial check of all channels: {1000 * await timed(lnwatcher.on_event_blockchain_updated()):.1f} ms")
+    full = await timed(full_sweep_without_cache(lnwatcher))
+    print(f"full sweep without sweep info cache: {1000 * full:.1f} ms")
+    cached = await timed(lnwatcher.trigger_callbacks())
+    print(f"full sweep with sweep info cache: {1000 * cached:.1f} ms")
+
+    block = 0
+    num_due = 0
+    num_blocks = 10
+    for i in range(num_blocks):
+        height = HEIGHT + 1 + i
+        adb.db.put('stored_height', height)
+        num_due += sum(1 for key in lnwatcher.callbacks if (lnwatcher.height_timer.get(key) or height + 1) <= height)
+        block += await timed(lnwatcher.on_event_blockchain_updated())
+    print(f"new block: {1000 * block / num_blocks:.1f} ms, {num_due // num_blocks} channels re-checked")
+
+    unrelated = 0
+    for i in range(100):
+        tx = make_tx(["%064x:1" % i], [(random_p2wsh_address(rnd), 1000)])
+        unrelated += await timed(lnwatcher.on_event_adb_added_tx(adb, tx.txid(), tx))
+    print(f"dispatching 100 unrelated txs: {1000 * unrelated / 100:.3f} ms per tx")
+
+    chan = rnd.choice(channels)
+    tx = make_tx([chan.funding_outpoint.to_str()], [(random_p2wsh_address(rnd), 990_000)])
+    print(f"dispatching a closing tx: {1000 * await timed(lnwatcher.on_event_adb_added_tx(adb, tx.txid(), tx)):.2f} ms")
+
+
+if __name__ == '__main__':
+    num_channels = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    num_closed = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(num_channels, num_closed), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# Fans out a request to many local toy servers with Network.send_multiple_requests,
+# a few times in a row, as txbroadcast.py or update_default_servers.py do.
+# Each server delays its responses by a simulated round-trip time. For
+# comparison, the same calls are made opening a new Interface per server and
+# waiting for it to be ready (handshake, header subscription), which is what
+# send_multiple_requests used to do. Reports the duration of each call and
+# the number of connections opened.
+#
+# usage: bench_multiple_requests.py [num_servers] [num_calls] [rtt_ms]
+
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from functools import partial
+
+import aiorpcx
+
+from electrum_grs import constants, util
+from electrum_grs.interface import Interface, ServerAddr
+from electrum_grs.network import Network
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.util import OldTaskGroup, create_and_start_event_loop
+
+
+# calls are spaced out, as PaddedRSTransport holds back bursts of small messages
+CALL_INTERVAL = 1.5
+
+
+class ToyServer:
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.num_connections = 0
+        self.asyncio_server = None
+
+    async def start(self) -> ServerAddr:
+        self.asyncio_server = await aiorpcx.serve_rs(partial(ToySession, toyserver=self), "127.0.0.1")
+        port = self.asyncio_server.sockets[0].getsockname()[1]
+        return ServerAddr("127.0.0.1", port, protocol="t")
+
+    async def stop(self):
+        self.asyncio_server.close()
+        await self.asyncio_server.wait_closed()
+
+
+class ToySession(aiorpcx.RPCSession):
+
+    def __init__(self, *args, toyserver: ToyServer, **kwargs):
+        aiorpcx.RPCSession.__init__(self, *args, **kwargs)
+        self.svr = toyserver
+        self.svr.num_connections += 1
+
+    async def handle_request(self, request):
+        await asyncio.sleep(self.svr.rtt)
+        if request.method == 'server.version':
+            return ['ToyServer', '1.4']
+        elif request.method == 'server.features':
+            return {'genesis_hash': constants.net.GENESIS}
+        elif request.method == 'blockchain.headers.subscribe':
+            height = constants.net.max_checkpoint() + 1000
+            return {'height': height, 'hex': '00' * 80}
+        elif request.method == 'blockchain.estimatefee':
+            return 0.0001
+        elif request.method in ('blockchain.block.header', 'blockchain.block.headers'):
+            # never answer, so that the header sync of the client hangs
+            await asyncio.sleep(3600)
+        return None
+
+
+async def send_multiple_requests_unpooled(network: Network, servers, method, params, *, timeout: int):
+    """What Network.send_multiple_requests used to do."""
+    responses = dict()
+
+    async def get_response(server: ServerAddr):
+        interface = Interface(network=network, server=server)
+        try:
+            await util.wait_for2(interface.ready, timeout)
+        except BaseException:
+            await interface.close()
+            return
+        try:
+            responses[server] = await interface.session.send_request(method, params, timeout=10)
+        except Exception as e:
+            responses[server] = e
+        await interface.close()
+    async with OldTaskGroup() as group:
+        for server in servers:
+            await group.spawn(get_response(server))
+    return responses
+
+
+async def run(num_servers: int, num_calls: int, rtt: float):
+    print(f"{num_servers} servers, {num_calls} calls, {1000 * rtt:.0f} ms simulated rtt")
+    config = SimpleConfig({
+        'electrum_path': tempfile.mkdtemp(prefix="bench-multiple-requests-"),
+        'server': '127.0.0.1:1:t',
+        'oneserver': True,
+        'auto_connect': False,
+    })
+    network = Network(config)
+    network.start()
+    toyservers = [ToyServer(rtt) for _ in range(num_servers)]
+    servers = [await toyserver.start() for toyserver in toyservers]
+    try:
+        for name, pooled in (('new interfaces', False), ('pooled', True)):
+            durations = []
+            num_connections = sum(toyserver.num_connections for toyserver in toyservers)
+            for _ in range(num_calls):
+                t0 = time.perf_counter()
+                if pooled:
+                    responses = await network.send_multiple_requests(servers, 'server.ping', [], timeout=10)
+                else:
+                    responses = await send_multiple_requests_unpooled(network, servers, 'server.ping', [], timeout=10)
+                durations.append(time.perf_counter() - t0)
+                assert len(responses) == num_servers, len(responses)
+                await asyncio.sleep(CALL_INTERVAL)
+            num_connections = sum(toyserver.num_connections for toyserver in toyservers) - num_connections
+            print(f"{name:>16}: first call {1000 * durations[0]:6.0f} ms, median {1000 * statistics.median(durations):6.0f} ms, "
+                  f"{num_connections} connections opened")
+    finally:
+        await network.stop()
+        for toyserver in toyservers:
+            await toyserver.stop()
+
+
+if __name__ == '__main__':
+    num_servers = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    num_calls = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rtt = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.05
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(num_servers, num_calls, rtt), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+#
+# Simulates a client fetching transactions from a set of in-process fake
+# servers (no real connection), each with its own latency distribution:
+# lognormal around a per-server median, some with a heavy tail, some that
+# fail from time to time. Every few requests the client switches to another
+# main server, as it does when a server goes away. The other connected
+# servers get some background traffic (headers, pings), from which the
+# client learns their scores too. The main server is either picked at random
+# (what Network used to do) or using the server scores, and requests are
+# sent with and without hedging (see Network._hedged_request).
+# Reports request latency percentiles and how many requests were sent to a
+# second server.
+#
+# usage: bench_network_selection.py [num_servers] [num_requests] [requests_per_switch]
+
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+
+from electrum_grs import network as network_module
+from electrum_grs.network import Network
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.util import create_and_start_event_loop
+
+
+NUM_CONNECTED = 10
+
+
+class FakeInterface:
+
+    def __init__(self, server: str, network: Network, seed: int):
+        self.server = server
+        self.network = network
+        self.rnd = rnd = random.Random(seed)
+        self.blockchain = None
+        self.median = rnd.uniform(0.002, 0.040)
+        self.tail_probability = rnd.choice([0, 0, 0.02, 0.10])
+        self.error_rate = rnd.choice([0, 0, 0, 0.05])
+        self.num_requests = 0
+
+    def is_connected_and_ready(self):
+        return True
+
+    async def get_transaction(self, tx_hash: str, timeout=None) -> str:
+        # note: the real interface records responses in NotificationSession.send_request
+        self.num_requests += 1
+        t0 = time.monotonic()
+        latency = self.median * self.rnd.lognormvariate(0, 0.3)
+        if self.rnd.random() < self.tail_probability:
+            latency *= 20
+        await asyncio.sleep(latency)
+        if self.rnd.random() < self.error_rate:
+            self.network.server_scores.record_error(self.server)
+            raise Exception('request timed out')
+        self.network.server_scores.record_response(self.server, time.monotonic() - t0)
+        return tx_hash
+
+
+async def run_workload(
+        num_servers: int, num_requests: int, requests_per_switch: int, *, scored: bool, hedged: bool):
+    rnd = random.Random(0)
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="bench-network-")})
+    config.NETWORK_HEDGE_REQUESTS = hedged
+    network = Network(config)
+    try:
+        servers = [FakeInterface(f"server{i}", network, i) for i in range(num_servers)]
+        connected = rnd.sample(servers, NUM_CONNECTED)
+        network.interfaces = {iface.server: iface for iface in connected}
+        latencies = []  # type: List[float]
+        num_failures = 0
+        background = []
+        for i in range(num_requests):
+            background.append(asyncio.ensure_future(rnd.choice(connected).get_transaction('00')))
+            if i % requests_per_switch == 0:
+                if scored:
+                    network.interface = network.server_scores.choose(connected)
+                else:
+                    network.interface = rnd.choice(connected)
+            t0 = time.monotonic()
+            try:
+                await network._hedged_request(lambda iface: iface.get_transaction('00'))
+            except Exception:
+                num_failures += 1
+                continue
+            latencies.append(time.monotonic() - t0)
+        await asyncio.gather(*background, return_exceptions=True)
+        num_sent = sum(iface.num_requests for iface in connected) - len(background)
+        return latencies, num_sent, num_failures
+    finally:
+        network_module._INSTANCE = None
+
+
+async def run(num_servers: int, num_requests: int, requests_per_switch: int):
+    print(f"{num_servers} servers, {NUM_CONNECTED} connected, {num_requests} requests, "
+          f"switching main server every {requests_per_switch} requests")
+    for scored in (False, True):
+        for hedged in (False, True):
+            latencies, num_sent, num_failures = await run_workload(
+                num_servers, num_requests, requests_per_switch, scored=scored, hedged=hedged)
+            latencies.sort()
+            p99 = latencies[int(len(latencies) * 0.99)]
+            name = ('scored' if scored else 'random') + (', hedged' if hedged else '')
+            print(f"{name:>16}: median {1000 * statistics.median(latencies):6.1f} ms, p99 {1000 * p99:6.1f} ms, "
+                  f"{100 * (num_sent - num_requests) / num_requests:5.1f}% extra requests, {num_failures} failed")
+
+
+if __name__ == '__main__':
+    num_servers = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    requests_per_switch = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(num_servers, num_requests, requests_per_switch), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
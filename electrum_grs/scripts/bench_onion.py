@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# Throughput of onion peeling and creation, as done by a forwarding node
+# for incoming htlcs and by a payer for the parts of a multi-part payment.
+# Onions are processed inline on the event loop, as the htlc switch used to
+# do, and in the OnionWorkerPool. For each, it reports onions per second
+# and the longest stall of the event loop, measured by a ticker task.
+#
+# usage: bench_onion.py [num_onions] [num_workers]
+
+import asyncio
+import os
+import sys
+import time
+
+import electrum_ecc as ecc
+
+from electrum_grs.lnonion import OnionHopsDataSingle, OnionWorkerPool, new_onion_packet, process_onion_packet
+from electrum_grs.lnutil import ShortChannelID
+
+
+NUM_HOPS = 5
+TICK = 0.001
+
+
+async def max_loop_lag(coro):
+    """Runs coro, returns (its result, elapsed seconds, longest event loop stall in seconds)"""
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            t0 = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lag = max(lag, time.perf_counter() - t0 - TICK)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    t0 = time.perf_counter()
+    result = await coro
+    elapsed = time.perf_counter() - t0
+    done = True
+    await task
+    return result, elapsed, lag
+
+
+def report(name: str, n: int, elapsed: float, lag: float):
+    print(f"{name:>24}: {n / elapsed:8.0f} onions/s, longest event loop stall {1000 * lag:8.1f} ms")
+
+
+async def run(num_onions: int, num_workers: int):
+    privkeys = [os.urandom(32) for _ in range(NUM_HOPS)]
+    pubkeys = [ecc.ECPrivkey(privkey).get_public_key_bytes() for privkey in privkeys]
+    hops_data = [
+        OnionHopsDataSingle(payload={
+            'amt_to_forward': {'amt_to_forward': 1000 * (NUM_HOPS - i)},
+            'outgoing_cltv_value': {'outgoing_cltv_value': 100 * (NUM_HOPS - i)},
+            'short_channel_id': {'short_channel_id': ShortChannelID.from_components(i, 0, 0)}})
+        for i in range(NUM_HOPS)]
+    payment_hash = os.urandom(32)
+    creations = [(pubkeys, os.urandom(32), list(hops_data), payment_hash) for _ in range(num_onions)]
+
+    async def create_inline():
+        return [new_onion_packet(*job[:3], associated_data=job[3]) for job in creations]
+
+    async def peel_inline(packets):
+        return [process_onion_packet(packet, privkeys[0], associated_data=payment_hash) for packet in packets]
+
+    pool = OnionWorkerPool(max_workers=num_workers, max_pending=num_onions)
+    try:
+        print(f"{num_onions} onions of {NUM_HOPS} hops, {pool.max_workers} workers")
+        packets, elapsed, lag = await max_loop_lag(create_inline())
+        report('create, inline', num_onions, elapsed, lag)
+        _, elapsed, lag = await max_loop_lag(pool.new_onion_packets(creations))
+        report('create, pool', num_onions, elapsed, lag)
+        _, elapsed, lag = await max_loop_lag(peel_inline(packets))
+        report('peel, inline', num_onions, elapsed, lag)
+        # the htlc switch submits the onions of one iteration at a time
+        async def peel_pool():
+            for i in range(0, num_onions, 50):
+                batch = [(packet, payment_hash) for packet in packets[i:i + 50]]
+                await pool.process_onion_packets(batch, privkeys[0])
+        _, elapsed, lag = await max_loop_lag(peel_pool())
+        report('peel, pool', num_onions, elapsed, lag)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    num_onions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    asyncio.run(run(num_onions, num_workers))
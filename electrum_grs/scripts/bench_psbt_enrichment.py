@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+#
+# Builds a PSBT spending many coins of a wallet (a p2wpkh wallet and a
+# 2-of-3 p2wsh multisig wallet), as when consolidating, and times
+# PartialTransaction.add_info_from_wallet, which adds the prev txs, script
+# descriptors and bip32 paths to the inputs and outputs. For comparison,
+# the same PSBT is enriched one txin/txout at a time, without reusing the
+# work done for other txins of the same address, and with Descriptor.expand
+# and PubkeyProvider.get_pubkey_bytes not cached, which is what
+# Abstract_Wallet.add_input_info and add_output_info used to do. Checks that
+# both give the same PSBT.
+#
+# usage: bench_psbt_enrichment.py [num_inputs,...] [coins_per_address]
+
+import asyncio
+import gc
+import sys
+import tempfile
+import time
+
+from electrum_grs import keystore
+from electrum_grs.descriptor import Descriptor
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum_grs.util import create_and_start_event_loop
+from electrum_grs.wallet import Abstract_Wallet, Standard_Wallet, Multisig_Wallet
+from electrum_grs.wallet_db import WalletDB
+
+
+def _disable_caches(desc: Descriptor) -> None:
+    desc.expand = desc._expand
+    for pubkey in desc.pubkeys:
+        pubkey.get_pubkey_bytes = pubkey._get_pubkey_bytes
+    for subdesc in desc.subdescriptors:
+        _disable_caches(subdesc)
+
+
+def add_info_one_by_one(wallet: Abstract_Wallet, tx: PartialTransaction) -> None:
+    """What PartialTransaction.add_info_from_wallet used to do."""
+
+    def set_info(txinout, address):
+        desc = wallet.get_script_descriptor_for_address(address)
+        if desc is not None:
+            _disable_caches(desc)
+        txinout.script_descriptor = desc
+        txinout.is_mine = True
+        for pubkey, path in wallet._get_txinout_derivation_info(address, only_der_suffix=False).items():
+            txinout.bip32_paths[pubkey] = path
+
+    for txin in tx.inputs():
+        if txin.utxo is None:
+            txin.utxo = wallet.db.get_transaction(txin.prevout.txid.hex())
+        address = wallet.adb.get_txin_address(txin)
+        wallet._add_input_utxo_info(txin, address=address)
+        if not wallet.is_mine(address) and not wallet._learn_derivation_path_for_address_from_txinout(txin, address):
+            continue
+        set_info(txin, address)
+        txin.block_height = wallet.adb.get_tx_height(txin.prevout.txid.hex()).height()
+    for txout in tx.outputs():
+        address = txout.address
+        if not wallet.is_mine(address) and not wallet._learn_derivation_path_for_address_from_txinout(txout, address):
+            continue
+        set_info(txout, address)
+        txout.is_change = wallet.is_change(address)
+
+
+def create_wallet(config: SimpleConfig, multisig: bool, num_addresses: int) -> Abstract_Wallet:
+    db = WalletDB('', storage=None, upgrade=True)
+    db.put('gap_limit', num_addresses)
+    if multisig:
+        for i in range(3):
+            ks = keystore.from_bip43_rootseed(bytes([i + 1]) * 32, derivation="m/48'/0'/0'/2'")
+            db.put(f'x{i + 1}', ks.dump())
+        db.put('wallet_type', '2of3')
+        wallet = Multisig_Wallet(db, config=config)
+    else:
+        ks = keystore.from_bip43_rootseed(bytes(32), derivation="m/84'/0'/0'")
+        db.put('keystore', ks.dump())
+        wallet = Standard_Wallet(db, config=config)
+    wallet.synchronize()
+    return wallet
+
+
+def fund_wallet(wallet: Abstract_Wallet, coins_per_address: int) -> None:
+    for i, address in enumerate(wallet.get_receiving_addresses()):
+        txin = PartialTxInput(prevout=TxOutpoint.from_str("%064x:0" % (i + 1)))
+        txin.script_sig = b''
+        txin.witness = bytes([1, 1, 0x51])
+        outputs = [PartialTxOutput.from_address_and_value(address, 10_000 + j) for j in range(coins_per_address)]
+        tx = Transaction(PartialTransaction.from_io([txin], outputs).serialize())
+        wallet.adb.add_transaction(tx)
+
+
+def make_psbt(wallet: Abstract_Wallet) -> str:
+    inputs = [PartialTxInput(prevout=coin.prevout) for coin in wallet.get_spendable_coins()]
+    outputs = [PartialTxOutput.from_address_and_value(wallet.get_change_addresses()[0], 10_000)]
+    return PartialTransaction.from_io(inputs, outputs).serialize()
+
+
+def summary(tx: PartialTransaction):
+    return (
+        tx.serialize(),
+        [(txin.is_mine, txin.block_height) for txin in tx.inputs()],
+        [(txout.is_mine, txout.is_change) for txout in tx.outputs()],
+    )
+
+
+async def run(sizes, coins_per_address: int):
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="bench-psbt-")})
+    print(f"{coins_per_address} coins per address")
+    for multisig in (False, True):
+        for num_inputs in sizes:
+            wallet = create_wallet(config, multisig, num_inputs // coins_per_address)
+            fund_wallet(wallet, coins_per_address)
+            await asyncio.sleep(0.1)  # let the wallet handle its events before timing
+            psbt = make_psbt(wallet)
+            tx1 = PartialTransaction.from_raw_psbt(psbt)
+            gc.collect()
+            t0 = time.perf_counter()
+            add_info_one_by_one(wallet, tx1)
+            t_old = time.perf_counter() - t0
+            tx2 = PartialTransaction.from_raw_psbt(psbt)
+            gc.collect()
+            t0 = time.perf_counter()
+            tx2.add_info_from_wallet(wallet)
+            t_new = time.perf_counter() - t0
+            assert summary(tx1) == summary(tx2)
+            name = '2of3 p2wsh' if multisig else 'p2wpkh'
+            print(f"{name:>10}, {len(tx2.inputs()):6} inputs: one by one {t_old:7.2f} s, batched {t_new:7.2f} s, "
+                  f"same psbt")
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1_000, 10_000]
+    coins_per_address = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    # the wallet triggers callbacks, which need an event loop
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(sizes, coins_per_address), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+#
+# Headless benchmark of the QML history model (QETransactionListModel),
+# driven by a synthetic wallet. It measures opening the history (initModel
+# plus the rows a view shows first), scrolling through it page by page,
+# and the event handlers that update single rows.
+# For comparison, it also times converting every row up front, which is
+# what initModel used to do.
+#
+# usage: bench_qml_history.py [num_txs]
+
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtCore import QCoreApplication, QModelIndex
+
+from electrum_grs.transaction import Transaction
+from electrum_grs.util import OrderedDictWithIndex, Satoshis, TxMinedInfo, timestamp_to_datetime
+from electrum_grs.wallet import Abstract_Wallet
+
+from electrum_grs.gui.qml.qetransactionlistmodel import QETransactionListModel
+
+
+# any complete tx will do
+RAW_TX = "02000000000101956449bdc8059b680a20483e64e139ce63fe64333b92cd7811a1b116d6b967ad0000000000fdffffff024a01000000000000160014a21d1fbcf571153f57b40855e059c134405a89ecd682010000000000160014fd7debf75d6c410bf6ba1c8ba05f90f23ce4646a0247304402207f07ec0c2415b31743527dea2f7bff3868f494dc0a5d45adec5e05031725a0af02202aa0ac7d06dbcad8ac0b9808a829b6bdaa98bc831aef31a5ab4e5d1890f7552101210278a5d9b2796f2743ccf1b36b2bf47695d766d0841c17b00ce83943c8b37dde0ceea60300"
+
+ROWS_ON_SCREEN = 30
+# roles read by HistoryItemDelegate.qml
+DELEGATE_ROLES = ('complete', 'confirmations', 'date', 'key', 'label', 'lightning', 'section', 'timestamp', 'value')
+
+
+class FakeDB:
+
+    def __init__(self):
+        self.tx = Transaction(RAW_TX)
+
+    def get_transaction(self, txid):
+        return self.tx
+
+
+class FakeAddressSynchronizer:
+
+    def get_local_height(self):
+        return 800_000
+
+    def get_tx_fee(self, txid):
+        return 200
+
+
+class SyntheticWallet:
+    """Has the parts of Abstract_Wallet used by QETransactionListModel."""
+
+    get_tx_status = Abstract_Wallet.get_tx_status
+
+    def __init__(self, num_txs: int):
+        rnd = random.Random(0)
+        self.db = FakeDB()
+        self.adb = FakeAddressSynchronizer()
+        self.network = None
+        self.history = OrderedDictWithIndex()
+        tip = self.adb.get_local_height()
+        timestamp = int(time.time()) - 150 * num_txs
+        for i in range(num_txs):
+            mined = i < num_txs - 5  # a few mempool txs at the end
+            height = tip - (num_txs - i) // 4 if mined else 0
+            timestamp += 150
+            txid = '%064x' % i
+            amount = rnd.randint(-10**7, 2 * 10**7)
+            self.history[txid] = {
+                'txid': txid,
+                'fee_sat': 200,
+                'height': height,
+                'confirmations': tip - height + 1 if mined else 0,
+                'timestamp': timestamp if mined else None,
+                'monotonic_timestamp': timestamp,
+                'incoming': amount > 0,
+                'value': Satoshis(amount),
+                'date': timestamp_to_datetime(timestamp),
+                'label': '',
+                'txpos_in_block': 1 if mined else None,
+                'wanted_height': None,
+            }
+
+    def get_full_history(self, **kwargs):
+        # the wallet returns fresh tx_items on every call
+        return OrderedDictWithIndex((k, dict(v)) for k, v in self.history.items())
+
+
+def timed(f) -> float:
+    t0 = time.perf_counter()
+    f()
+    return time.perf_counter() - t0
+
+
+def show_rows(model: QETransactionListModel, start: int, end: int):
+    """Reads the rows [start, end), like the delegates of a view do."""
+    roles = [model._ROLE_RMAP[x] for x in DELEGATE_ROLES]
+    for row in range(start, min(end, model.rowCount(QModelIndex()))):
+        index = model.index(row, 0)
+        for role in roles:
+            model.data(index, role)
+
+
+def scroll_to_end(model: QETransactionListModel):
+    while model.canFetchMore(QModelIndex()):
+        start = model.rowCount(QModelIndex())
+        model.fetchMore(QModelIndex())
+        show_rows(model, start, start + ROWS_ON_SCREEN)
+
+
+def run(num_txs: int):
+    app = QCoreApplication(sys.argv)
+    wallet = SyntheticWallet(num_txs)
+    model = QETransactionListModel(wallet)
+    history = list(wallet.get_full_history().values())
+    txid = history[num_txs // 2]['txid']
+
+    def report(name, dt):
+        print(f"{name:>36}: {1000 * dt:8.2f} ms")
+
+    report(f'convert all {num_txs} rows (previously)', timed(lambda: [model.tx_to_model(x) for x in history]))
+    report('initModel + first screen', timed(lambda: (model.initModel(True), show_rows(model, 0, ROWS_ON_SCREEN))))
+    report('label update', timed(lambda: model.updateTxLabel(txid, 'rent')))
+    report('tx verified', timed(lambda: model.on_tx_verified(txid, TxMinedInfo(_height=1, conf=1, timestamp=1))))
+    report('fee histogram update', timed(lambda: model.on_event_fee_histogram(None)))
+    report('new block', timed(lambda: model.updateBlockchainHeight(800_001)))
+    report('scroll to the end, page by page', timed(lambda: scroll_to_end(model)))
+    assert model.rowCount(QModelIndex()) == num_txs
+    model.unregister_callbacks()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+#
+# Simulates a merchant wallet holding many receive requests, each to its
+# own address of a watch-only wallet. Some of the requests are paid (mined
+# or not), some have expired. Times the calls the GUIs and the daemon make
+# on every refresh: get_unpaid_requests, list_requests filtered by status,
+# delete_expired_requests (without deleting anything), and the export of
+# the paid requests. For comparison, the same calls are made computing the
+# status of every request from the history of its address, which is what
+# get_invoice_status used to do. Also times building the index when the
+# wallet is opened, with and without the on-chain status stored in the db.
+#
+# usage: bench_requests.py [num_requests] [paid_ratio]
+
+import asyncio
+import random
+import sys
+import time
+
+from electrum_grs.address_synchronizer import TX_HEIGHT_UNCONFIRMED
+from electrum_grs.bitcoin import script_to_address
+from electrum_grs.invoices import Request, PR_UNPAID, PR_PAID, PR_UNCONFIRMED, PR_EXPIRED
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum_grs.util import TxMinedInfo, create_and_start_event_loop
+from electrum_grs.wallet import Imported_Wallet, Abstract_Wallet
+from electrum_grs.wallet_db import WalletDB
+
+
+HEIGHT = 600_000
+AMOUNT_SAT = 10_000
+EXPIRED_RATIO = 0.3
+
+
+def get_request_status_scanning(wallet: Abstract_Wallet, req: Request) -> int:
+    """What Abstract_Wallet.get_invoice_status used to do for requests."""
+    paid, conf = wallet.is_onchain_invoice_paid(req)
+    if not paid:
+        status = PR_UNPAID
+    elif conf == 0:
+        status = PR_UNCONFIRMED
+    else:
+        status = PR_PAID
+    return wallet.check_expired_status(req, status)
+
+
+def make_tx(i: int, address: str) -> Transaction:
+    txin = PartialTxInput(prevout=TxOutpoint.from_str("%064x:0" % (i + 1)))
+    txin.script_sig = b''
+    txin.witness = bytes([1, 1, 0x51])
+    tx = PartialTransaction.from_io([txin], [PartialTxOutput.from_address_and_value(address, AMOUNT_SAT)])
+    return Transaction(tx.serialize())
+
+
+def create_wallet(config: SimpleConfig, num_requests: int, paid_ratio: float) -> Imported_Wallet:
+    rnd = random.Random(0)
+    addresses = [script_to_address(bytes([0x00, 0x14]) + rnd.randbytes(20)) for _ in range(num_requests)]
+    db = WalletDB('', storage=None, upgrade=True)
+    db.put('wallet_type', 'imported')
+    db.put('addresses', {addresses[0]: {}})
+    db.put('stored_height', HEIGHT)
+    wallet = Imported_Wallet(db, config=config)
+    wallet.import_addresses(addresses[1:], write_to_disk=False)
+    now = int(time.time())
+    for i, address in enumerate(addresses):
+        created = now - (7200 if rnd.random() < EXPIRED_RATIO else 60)
+        req = Request(
+            outputs=[PartialTxOutput.from_address_and_value(address, AMOUNT_SAT)],
+            message=f"order {i}",
+            time=created,
+            amount_msat=AMOUNT_SAT * 1000,
+            exp=3600,
+            height=HEIGHT - 10,
+            payment_hash=None,
+        )
+        wallet.add_payment_request(req, write_to_disk=False)
+    for i, address in enumerate(rnd.sample(addresses, int(num_requests * paid_ratio))):
+        tx = make_tx(i, address)
+        wallet.adb.receive_tx_callback(tx, tx_height=TX_HEIGHT_UNCONFIRMED)
+        if i % 2:
+            wallet.adb.add_verified_tx(tx.txid(), TxMinedInfo(_height=HEIGHT - 5, timestamp=now, txpos=1, header_hash="01"*32))
+    return wallet
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    result = f()
+    return time.perf_counter() - t0, result
+
+
+async def run(num_requests: int, paid_ratio: float):
+    config = SimpleConfig({'electrum_path': '/tmp/bench-requests'})
+    t, wallet = timed(lambda: create_wallet(config, num_requests, paid_ratio))
+    print(f"{num_requests} requests, {paid_ratio:.0%} paid, about {EXPIRED_RATIO:.0%} past their expiry "
+          f"(wallet created in {t:.1f} s)")
+    reqs = wallet.get_requests()
+
+    def status_filter_scanning(status):
+        return [x for x in wallet.get_sorted_requests() if get_request_status_scanning(wallet, x) == status]
+
+    def export_paid(requests):
+        return [wallet.export_request(x) for x in requests]
+
+    t_unpaid = timed(lambda: [x for x in reqs if get_request_status_scanning(wallet, x) != PR_PAID])[0]
+    t_filter, paid = timed(lambda: status_filter_scanning(PR_PAID))
+    t_expired = timed(lambda: [x for x in reqs if get_request_status_scanning(wallet, x) == PR_EXPIRED])[0]
+    t_export = timed(lambda: export_paid(paid))[0]
+    print(f"{'scanning':>14}: get_unpaid_requests {t_unpaid:6.2f} s, list paid {t_filter:6.2f} s, "
+          f"expired {t_expired:6.2f} s, export paid {t_export:6.2f} s")
+
+    t_unpaid, unpaid = timed(wallet.get_unpaid_requests)
+    t_filter, paid2 = timed(lambda: wallet.get_sorted_requests(status=PR_PAID))
+    t_expired = timed(lambda: wallet.request_index.get_keys(PR_EXPIRED))[0]
+    t_export = timed(lambda: export_paid(paid2))[0]
+    assert set(x.get_id() for x in paid) == set(x.get_id() for x in paid2)
+    print(f"{'index':>14}: get_unpaid_requests {t_unpaid:6.2f} s, list paid {t_filter:6.2f} s, "
+          f"expired {t_expired:6.2f} s, export paid {t_export:6.2f} s")
+    assert wallet.check_request_status_index() == []
+
+    # opening the wallet
+    wallet2 = Imported_Wallet(wallet.db, config=config)
+    t_stored = timed(lambda: wallet2.request_index.get_keys(PR_PAID))[0]
+    wallet.db.get_dict('request_onchain_status').clear()
+    wallet3 = Imported_Wallet(wallet.db, config=config)
+    t_cold = timed(lambda: wallet3.request_index.get_keys(PR_PAID))[0]
+    print(f"{'index build':>14}: {t_stored:6.2f} s with the on-chain status stored, {t_cold:6.2f} s without")
+
+
+if __name__ == '__main__':
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    paid_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(num_requests, paid_ratio), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
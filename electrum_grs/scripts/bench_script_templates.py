@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#
+# Classifies a large corpus of output scripts, as when a wallet or the
+# address synchronizer goes through the outputs of many txs: a mix of
+# p2pkh, p2sh, p2wpkh, p2wsh, p2tr, p2pk and non-standard (OP_RETURN)
+# scripts, some of which appear several times (address reuse, not far apart).
+# Times get_address_from_output_script and get_script_type_from_output_script
+# with the templates compiled into byte matchers, with and without the
+# address cache. For comparison, the same is done decoding each script with
+# script_GetOp and matching it against the templates, which is what these
+# functions used to do. Checks that all give the same results.
+#
+# usage: bench_script_templates.py [num_scripts] [reuse_ratio]
+
+import random
+import sys
+import time
+
+from electrum_grs import bitcoin
+from electrum_grs.bitcoin import opcodes, construct_script
+from electrum_grs import transaction
+from electrum_grs.transaction import (
+    script_GetOp, match_script_against_template, MalformedBitcoinScript, OPPushDataGeneric,
+    SCRIPTPUBKEY_TEMPLATE_P2PK, SCRIPTPUBKEY_TEMPLATE_P2PKH, SCRIPTPUBKEY_TEMPLATE_P2SH,
+    SCRIPTPUBKEY_TEMPLATE_WITNESS_V0, SCRIPTPUBKEY_TEMPLATE_P2WPKH, SCRIPTPUBKEY_TEMPLATE_P2WSH,
+    SCRIPTPUBKEY_TEMPLATE_P2TR)
+
+
+def get_address_generic(script: bytes):
+    """What get_address_from_output_script used to do."""
+    try:
+        decoded = [x for x in script_GetOp(script)]
+    except MalformedBitcoinScript:
+        return None
+    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2PKH):
+        return bitcoin.hash160_to_p2pkh(decoded[2][1])
+    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2SH):
+        return bitcoin.hash160_to_p2sh(decoded[1][1])
+    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_WITNESS_V0):
+        return bitcoin.hash_to_segwit_addr(decoded[1][1], witver=0)
+    for witver, opcode in enumerate(range(opcodes.OP_1, opcodes.OP_16 + 1), start=1):
+        if match_script_against_template(decoded, [opcode, OPPushDataGeneric(lambda x: 2 <= x <= 40)]):
+            return bitcoin.hash_to_segwit_addr(decoded[1][1], witver=witver)
+    return None
+
+
+def get_script_type_generic(script: bytes):
+    """What get_script_type_from_output_script used to do."""
+    try:
+        decoded = [x for x in script_GetOp(script)]
+    except MalformedBitcoinScript:
+        return None
+    for name, template in (
+            ('p2pk', SCRIPTPUBKEY_TEMPLATE_P2PK),
+            ('p2pkh', SCRIPTPUBKEY_TEMPLATE_P2PKH),
+            ('p2sh', SCRIPTPUBKEY_TEMPLATE_P2SH),
+            ('p2wpkh', SCRIPTPUBKEY_TEMPLATE_P2WPKH),
+            ('p2wsh', SCRIPTPUBKEY_TEMPLATE_P2WSH),
+            ('p2tr', SCRIPTPUBKEY_TEMPLATE_P2TR)):
+        if match_script_against_template(decoded, template):
+            return name
+    return None
+
+
+REUSE_WINDOW = 5_000  # reused scripts appeared among the last REUSE_WINDOW scripts
+
+
+def make_corpus(num_scripts: int, reuse_ratio: float):
+    rnd = random.Random(0)
+    makers = [
+        (30, lambda: construct_script([opcodes.OP_DUP, opcodes.OP_HASH160, rnd.randbytes(20), opcodes.OP_EQUALVERIFY, opcodes.OP_CHECKSIG])),
+        (15, lambda: construct_script([opcodes.OP_HASH160, rnd.randbytes(20), opcodes.OP_EQUAL])),
+        (35, lambda: construct_script([opcodes.OP_0, rnd.randbytes(20)])),
+        (8, lambda: construct_script([opcodes.OP_0, rnd.randbytes(32)])),
+        (8, lambda: construct_script([opcodes.OP_1, rnd.randbytes(32)])),
+        (1, lambda: construct_script([rnd.randbytes(33), opcodes.OP_CHECKSIG])),
+        (3, lambda: construct_script([opcodes.OP_RETURN, rnd.randbytes(rnd.randrange(1, 80))])),
+    ]
+    weights = [weight for weight, maker in makers]
+    scripts = []
+    for _ in range(num_scripts):
+        if scripts and rnd.random() < reuse_ratio:
+            scripts.append(rnd.choice(scripts[-REUSE_WINDOW:]))
+        else:
+            scripts.append(rnd.choices(makers, weights)[0][1]())
+    return scripts
+
+
+def timed(f):
+    t0 = time.perf_counter()
+    result = f()
+    return time.perf_counter() - t0, result
+
+
+def run(num_scripts: int, reuse_ratio: float):
+    scripts = make_corpus(num_scripts, reuse_ratio)
+    print(f"{num_scripts} output scripts, {reuse_ratio:.0%} reused")
+
+    t_generic, addresses = timed(lambda: [get_address_generic(x) for x in scripts])
+    t_compiled, addresses2 = timed(lambda: [transaction._get_address_from_output_script(x) for x in scripts])
+    transaction._get_address_from_output_script_cached.cache_clear()
+    t_cached, addresses3 = timed(lambda: [transaction.get_address_from_output_script(x) for x in scripts])
+    assert addresses == addresses2 == addresses3
+    print(f"{'address':>12}: script_GetOp {t_generic:6.2f} s ({num_scripts / t_generic:9.0f}/s), "
+          f"compiled {t_compiled:6.2f} s ({num_scripts / t_compiled:9.0f}/s), "
+          f"compiled+cache {t_cached:6.2f} s ({num_scripts / t_cached:9.0f}/s)")
+
+    t_generic, types = timed(lambda: [get_script_type_generic(x) for x in scripts])
+    t_compiled, types2 = timed(lambda: [transaction.get_script_type_from_output_script(x) for x in scripts])
+    assert types == types2
+    print(f"{'script type':>12}: script_GetOp {t_generic:6.2f} s ({num_scripts / t_generic:9.0f}/s), "
+          f"compiled {t_compiled:6.2f} s ({num_scripts / t_compiled:9.0f}/s)")
+
+
+if __name__ == '__main__':
+    num_scripts = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    reuse_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    run(num_scripts, reuse_ratio)
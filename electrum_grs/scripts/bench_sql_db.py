@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# Mixed read/write throughput of SqlDB. Many clients share one database,
+# as the channels of a watchtower share the SweepStore: each client awaits
+# one request at a time, mostly reads with some writes. The same workload
+# is run with one transaction per write and all reads on the SQL thread
+# (roughly what SqlDB used to do), and with the default engine, which
+# groups writes into transactions and serves reads from a pool of read
+# connections. Reports requests per second and request latencies.
+#
+# usage: bench_sql_db.py [num_clients] [requests_per_client] [write_ratio]
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from electrum_grs.sql_db import SqlDB, sql
+from electrum_grs.util import create_and_start_event_loop
+
+
+class BenchDB(SqlDB):
+
+    def create_database(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS kv (k INTEGER PRIMARY KEY, v BLOB)")
+
+    @sql
+    def put(self, k: int, v: bytes):
+        self.conn.execute("REPLACE INTO kv (k, v) VALUES (?,?)", (k, v))
+
+    @sql(readonly=True)
+    def get(self, k: int):
+        r = self.conn.execute("SELECT v FROM kv WHERE k=?", (k,)).fetchone()
+        return r[0] if r else None
+
+
+class UnbatchedBenchDB(BenchDB):
+    NUM_READ_THREADS = 0
+
+
+async def run_workload(db: BenchDB, num_clients: int, num_requests: int, write_ratio: float):
+    latencies = []
+
+    async def client(i):
+        rnd = random.Random(i)
+        for _ in range(num_requests):
+            k = rnd.randrange(10_000)
+            t0 = time.perf_counter()
+            if rnd.random() < write_ratio:
+                await db.put(k, rnd.randbytes(200))
+            else:
+                await db.get(k)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[client(i) for i in range(num_clients)])
+    return time.perf_counter() - t0, latencies
+
+
+async def run(num_clients: int, num_requests: int, write_ratio: float):
+    print(f"{num_clients} clients, {num_requests} requests each, {100 * write_ratio:.0f}% writes")
+    for name, cls, commit_interval in (('one commit per write', UnbatchedBenchDB, 1), ('grouped commits', BenchDB, None)):
+        path = os.path.join(tempfile.mkdtemp(prefix="bench-sqldb-"), "db")
+        db = cls(asyncio.get_running_loop(), path, commit_interval=commit_interval)
+        try:
+            elapsed, latencies = await run_workload(db, num_clients, num_requests, write_ratio)
+        finally:
+            db.stop()
+            await db.stopped_event.wait()
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)]
+        print(f"{name:>24}: {len(latencies) / elapsed:8.0f} requests/s, "
+              f"median {1000 * statistics.median(latencies):6.2f} ms, p99 {1000 * p99:6.2f} ms")
+
+
+if __name__ == '__main__':
+    num_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    num_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    write_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.2
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(num_clients, num_requests, write_ratio), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
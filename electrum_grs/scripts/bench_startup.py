@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+# Starts `electrum-grs daemon` in a fresh process, with the startup tracer on,
+# and measures the time to first RPC: from spawning the process until the
+# daemon listens for JSON-RPC requests. For comparison, the same is done
+# emulating the old startup path: the lightning modules imported by
+# wallet.py and commands.py are imported upfront, and the fx thread is
+# created before the commands server starts, which is what the daemon used
+# to do. Reports the median over several runs, and the number of modules of
+# the package imported and the time spent importing them, from the tracer
+# report.
+#
+# usage: bench_startup.py [num_runs] [online]
+
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import electrum_grs
+from electrum_grs import startup_trace
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(electrum_grs.__file__)))
+RUN_ELECTRUM = os.path.join(ROOT, 'run_electrum_grs')
+
+OLD_STARTUP = """
+import runpy, sys
+import electrum_grs.lnworker, electrum_grs.lnmsg, electrum_grs.onion_message, electrum_grs.submarine_swaps
+from electrum_grs import daemon
+
+_init = daemon.CommandsServer.__init__
+
+def __init__(self, d, *args, **kwargs):
+    d.fx  # the fx thread used to be created before the commands server
+    _init(self, d, *args, **kwargs)
+
+daemon.CommandsServer.__init__ = __init__
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+
+def time_to_first_rpc(old: bool, online: bool):
+    electrum_path = tempfile.mkdtemp(prefix='bench-startup-')
+    report_path = os.path.join(electrum_path, 'startup.json')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT
+    env[startup_trace.ENV_VAR] = report_path
+    args = [RUN_ELECTRUM, '-D', electrum_path] + ([] if online else ['--offline']) + ['daemon']
+    if old:
+        args = ['-c', OLD_STARTUP] + args
+    t0 = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while not os.path.exists(report_path):
+            if process.poll() is not None:
+                raise Exception('daemon exited')
+            if time.perf_counter() - t0 > 60:
+                raise Exception('timeout')
+            time.sleep(0.002)
+        t = time.perf_counter() - t0
+    finally:
+        process.kill()
+        process.wait()
+    with open(report_path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    shutil.rmtree(electrum_path, ignore_errors=True)
+    return t, report
+
+
+def run(num_runs: int, online: bool):
+    print(f"{'online' if online else 'offline'} daemon, median of {num_runs} runs")
+    results = {True: [], False: []}
+    for _ in range(num_runs):
+        for old in (True, False):
+            results[old].append(time_to_first_rpc(old, online))
+    for old in (True, False):
+        t = statistics.median(x[0] for x in results[old])
+        # note: only count the modules of the package. the old startup is emulated with a
+        # script that also traces the imports that run_electrum_grs does before importing it
+        imports = [x for x in results[old][-1][1]['imports'] if x['name'].startswith('electrum_grs')]
+        import_time = statistics.median(
+            sum(x['self'] for x in report['imports'] if x['name'].startswith('electrum_grs'))
+            for t_, report in results[old])
+        num_ln_modules = len([x for x in imports if x['name'].startswith('electrum_grs.ln')])
+        name = 'old startup' if old else 'lazy startup'
+        print(f"{name:>12}: first RPC after {t:5.3f} s; {len(imports):3} electrum_grs modules imported "
+              f"({num_ln_modules:2} electrum_grs.ln*), {import_time:5.3f} s of import time; "
+              f"spans: " + ", ".join(f"{x['name']} {x['duration']:.3f} s" for x in results[old][-1][1]['spans']))
+
+
+if __name__ == '__main__':
+    num_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    online = len(sys.argv) > 2 and sys.argv[2] == 'online'
+    run(num_runs, online)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+#
+# Adds txs to a watch-only wallet with many addresses, as when it syncs:
+# each tx has a few outputs paying to the wallet, and many paying elsewhere
+# (e.g. the payouts of an exchange), and spends coins that are not ours.
+# Times AddressSynchronizer.add_transaction and the wallet handler of the
+# 'adb_added_tx' event (tx_is_related, requests touched by the tx), with the
+# outputs that are not ours skipped by the scriptpubkey prefilter. For
+# comparison, the same is done with the prefilter disabled, so that the
+# address of every output is derived, which is what they used to do.
+# Also reports the time to build the prefilter, its size, and how many
+# foreign outputs got past it (false positives).
+#
+# usage: bench_tx_prefilter.py [num_addresses] [num_txs] [outputs_per_tx]
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from electrum_grs import transaction
+from electrum_grs.address_synchronizer import AddressSynchronizer
+from electrum_grs.bitcoin import script_to_address
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.storage import WalletStorage
+from electrum_grs.transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum_grs.util import create_and_start_event_loop
+from electrum_grs.wallet import Imported_Wallet
+from electrum_grs.wallet_db import WalletDB
+
+
+OURS_PER_TX = 2
+
+
+def create_wallet(addresses) -> Imported_Wallet:
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="bench-tx-prefilter-")})
+    storage = WalletStorage(os.path.join(config.path, "wallet"))
+    db = WalletDB('', storage=storage, upgrade=True)
+    db.put('wallet_type', 'imported')
+    db.put('addresses', {addresses[0]: {}})
+    wallet = Imported_Wallet(db, config=config)
+    wallet.import_addresses(addresses[1:], write_to_disk=False)
+    for address in addresses[:100]:
+        wallet.create_request(amount_sat=10_000, message='', exp_delay=0, address=address)
+    return wallet
+
+
+def make_txs(rnd: random.Random, addresses, num_txs: int, outputs_per_tx: int):
+    txs = []
+    for i in range(num_txs):
+        txins = []
+        for j in range(3):
+            txin = PartialTxInput(prevout=TxOutpoint(txid=rnd.randbytes(32), out_idx=j))
+            txin.script_sig = b''
+            txin.witness = bytes([1, 1, 0x51])
+            txins.append(txin)
+        scripts = [bytes([0x00, 0x14]) + rnd.randbytes(20) for _ in range(outputs_per_tx - OURS_PER_TX)]
+        outputs = [PartialTxOutput(scriptpubkey=script, value=10_000) for script in scripts]
+        outputs += [PartialTxOutput.from_address_and_value(addr, 10_000) for addr in rnd.sample(addresses, OURS_PER_TX)]
+        txs.append(PartialTransaction.from_io(txins, outputs, BIP69_sort=False).serialize())
+    return txs
+
+
+def add_transactions(wallet: Imported_Wallet, raw_txs):
+    # fresh tx objects, as they come from the network
+    txs = [Transaction(raw_tx) for raw_tx in raw_txs]
+    for tx in txs:
+        tx.deserialize()
+    transaction._get_address_from_output_script_cached.cache_clear()
+    t0 = time.perf_counter()
+    for tx in txs:
+        wallet.adb.add_transaction(tx, is_new=False)
+        wallet.on_event_adb_added_tx(wallet.adb, tx.txid(), tx)
+    return time.perf_counter() - t0
+
+
+def run(num_addresses: int, num_txs: int, outputs_per_tx: int):
+    rnd = random.Random(0)
+    addresses = [script_to_address(bytes([0x00, 0x14]) + rnd.randbytes(20)) for _ in range(num_addresses)]
+    raw_txs = make_txs(rnd, addresses, num_txs, outputs_per_tx)
+    print(f"{num_addresses} addresses, {num_txs} txs with {outputs_per_tx} outputs ({OURS_PER_TX} ours)")
+
+    wallet = create_wallet(addresses)
+    t0 = time.perf_counter()
+    scripts_filter = wallet.adb._get_scripts_filter()
+    t_build = time.perf_counter() - t0
+    t_prefilter = add_transactions(wallet, raw_txs)
+    num_foreign = num_txs * (outputs_per_tx - OURS_PER_TX)
+    false_positives = sum(
+        wallet.adb.is_maybe_mine_script(txo.scriptpubkey) and not wallet.adb.is_mine(txo.address)
+        for raw_tx in raw_txs for txo in Transaction(raw_tx).outputs())
+    balance = wallet.get_balance()
+
+    wallet = create_wallet(addresses)
+    orig_is_maybe_mine_script = AddressSynchronizer.is_maybe_mine_script
+    AddressSynchronizer.is_maybe_mine_script = lambda self, scriptpubkey: True
+    try:
+        t_no_prefilter = add_transactions(wallet, raw_txs)
+    finally:
+        AddressSynchronizer.is_maybe_mine_script = orig_is_maybe_mine_script
+    assert wallet.get_balance() == balance, (wallet.get_balance(), balance)
+
+    print(f"prefilter: built in {t_build:.2f} s, {scripts_filter.size_in_bytes / 1000:.0f} kB, "
+          f"{false_positives} of {num_foreign} foreign outputs got past it (rate of {scripts_filter.error_rate:.1e} expected)")
+    print(f"add txs: no prefilter {t_no_prefilter:6.2f} s ({num_txs / t_no_prefilter:6.0f} tx/s), "
+          f"prefilter {t_prefilter:6.2f} s ({num_txs / t_prefilter:6.0f} tx/s)")
+
+
+if __name__ == '__main__':
+    num_addresses = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    num_txs = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    outputs_per_tx = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    # the wallet triggers callbacks, which need an event loop
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        run(num_addresses, num_txs, outputs_per_tx)
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+#
+# Simulates a merchant wallet that pays out through the TxBatcher, against
+# an in-process fake network (no server connection) and a fee oracle that
+# moves the fee estimates a little at every tick, with an occasional jump.
+# Payment outputs are enqueued at a steady rate; at every block the fake
+# network mines the current batch tx. Reports the CPU time spent per output
+# enqueued, and the number of batch passes and txs built. Each payment is
+# enqueued once the previous one was broadcast, so that the batcher idles
+# for about polls_per_output * SLEEP_INTERVAL between payments.
+# For comparison, the same workload is run with the batcher polling every
+# SLEEP_INTERVAL and reloading its base tx at every pass, which is what it
+# used to do.
+#
+# usage: bench_txbatcher.py [num_outputs] [polls_per_output]
+
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+from electrum_grs import keystore, util
+from electrum_grs.address_synchronizer import TX_HEIGHT_UNCONFIRMED
+from electrum_grs.bitcoin import script_to_address
+from electrum_grs.fee_policy import FeeTimeEstimates, FeeHistogram, FEE_ETA_TARGETS
+from electrum_grs.logging import Logger
+from electrum_grs.mnemonic import Mnemonic
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum_grs.txbatcher import TxBatch
+from electrum_grs.util import TxMinedInfo, create_and_start_event_loop
+from electrum_grs.wallet import Standard_Wallet
+from electrum_grs.wallet_db import WalletDB
+
+
+HEIGHT = 600_000
+SLEEP_INTERVAL = 0.002
+OUTPUTS_PER_BLOCK = 20
+OUTPUTS_PER_FEE_TICK = 5
+
+
+class FakeNetwork(Logger):
+
+    def __init__(self, config):
+        Logger.__init__(self)
+        self.config = config
+        self.asyncio_loop = util.get_asyncio_loop()
+        self.interface = None
+        self.relay_fee = 1000
+        self.fee_estimates = FeeTimeEstimates()
+        self.mempool_fees = FeeHistogram()
+        self.height = HEIGHT
+        self.wallet = None  # type: Optional[Standard_Wallet]
+        self.broadcast = []  # type: List[Transaction]
+        self.broadcast_event = asyncio.Event()
+
+    def get_local_height(self):
+        return self.height
+
+    def blockchain(self):
+        class FakeBlockchain:
+            def is_tip_stale(self):
+                return True
+        return FakeBlockchain()
+
+    def is_connected(self):
+        return True
+
+    async def try_broadcasting(self, tx, name):
+        self.wallet.adb.receive_tx_callback(tx, tx_height=TX_HEIGHT_UNCONFIRMED)
+        self.broadcast.append(tx)
+        self.broadcast_event.set()
+        return tx.txid()
+
+    async def wait_for_output(self, output: PartialTxOutput):
+        while not (self.broadcast and output in self.broadcast[-1].outputs()):
+            self.broadcast_event.clear()
+            await self.broadcast_event.wait()
+
+    def mine_block(self):
+        self.height += 1
+        # mine the last tx we saw, if it was not replaced
+        if self.broadcast and self.wallet.adb.get_transaction(self.broadcast[-1].txid()):
+            mine(self.wallet, self.broadcast[-1], self.height)
+        util.trigger_callback('blockchain_updated')
+
+
+class FeeOracle:
+
+    def __init__(self, network: FakeNetwork, rnd: random.Random):
+        self.network = network
+        self.rnd = rnd
+        self.feerate = 20_000  # sat/kvB, for the next block
+
+    def tick(self):
+        if self.rnd.random() < 0.1:
+            self.feerate *= self.rnd.choice([0.6, 1.5])
+        else:
+            self.feerate *= self.rnd.uniform(0.98, 1.02)
+        self.feerate = max(1000, self.feerate)
+        for target in FEE_ETA_TARGETS:
+            self.network.fee_estimates.set_data(target, int(self.feerate / target ** 0.5))
+        util.trigger_callback('fee', self.network.fee_estimates)
+
+
+def make_tx(inputs, outputs) -> Transaction:
+    txins = []
+    for prevout in inputs:
+        txin = PartialTxInput(prevout=TxOutpoint.from_str(prevout))
+        # dummy witness, so that the tx is complete and has a txid
+        txin.script_sig = b''
+        txin.witness = bytes([1, 1, 0x51])
+        txins.append(txin)
+    tx = PartialTransaction.from_io(
+        txins, [PartialTxOutput.from_address_and_value(addr, value) for addr, value in outputs])
+    return Transaction(tx.serialize())
+
+
+def mine(wallet: Standard_Wallet, tx: Transaction, height: int) -> None:
+    wallet.adb.receive_tx_callback(tx, tx_height=height)
+    wallet.adb.add_verified_tx(tx.txid(), TxMinedInfo(_height=height, timestamp=0, txpos=0, header_hash='00' * 32))
+
+
+def create_wallet(config: SimpleConfig, rnd: random.Random) -> Standard_Wallet:
+    seed = Mnemonic('en').make_seed(seed_type='segwit')
+    ks = keystore.from_seed(seed, passphrase='', for_multisig=False)
+    db = WalletDB('', storage=None, upgrade=True)
+    db.put('keystore', ks.dump())
+    wallet = Standard_Wallet(db, config=config)
+    wallet.synchronize()
+    for i, address in enumerate(wallet.get_receiving_addresses()):
+        mine(wallet, make_tx(["%064x:0" % i], [(address, 10_000_000)]), HEIGHT - 100)
+    return wallet
+
+
+def poll(batch: TxBatch):
+    """Replaces TxBatch._wait_for_trigger with what the batcher used to do."""
+    async def wait_for_trigger():
+        await asyncio.sleep(batch.wallet.txbatcher.SLEEP_INTERVAL)
+        batch._wakeup.set()
+        batch._enriched_base_tx = None
+    return wait_for_trigger
+
+
+async def run_workload(num_outputs: int, polls_per_output: int, *, polling: bool):
+    rnd = random.Random(0)
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="bench-txbatcher-")})
+    network = FakeNetwork(config)
+    oracle = FeeOracle(network, rnd)
+    oracle.tick()
+    wallet = network.wallet = create_wallet(config, rnd)
+    wallet.txbatcher.SLEEP_INTERVAL = SLEEP_INTERVAL
+    wallet.start_network(network)
+    await asyncio.sleep(0.1)
+    address = script_to_address(bytes([0x00, 0x14]) + rnd.randbytes(20))
+    output = PartialTxOutput.from_address_and_value(address, 10_000)
+    wallet.txbatcher.add_payment_output('default', output)
+    await network.wait_for_output(output)
+    batch = wallet.txbatcher.tx_batches['default']
+    num_passes = 0
+    run_iteration = batch.run_iteration
+
+    async def counted_run_iteration():
+        nonlocal num_passes
+        num_passes += 1
+        await run_iteration()
+    batch.run_iteration = counted_run_iteration
+    if polling:
+        batch._wait_for_trigger = poll(batch)
+    t0 = time.process_time()
+    for i in range(num_outputs):
+        address = script_to_address(bytes([0x00, 0x14]) + rnd.randbytes(20))
+        output = PartialTxOutput.from_address_and_value(address, rnd.randrange(10_000, 100_000))
+        wallet.txbatcher.add_payment_output('default', output)
+        await network.wait_for_output(output)
+        # idle until the next payment
+        await asyncio.sleep(polls_per_output * SLEEP_INTERVAL)
+        if i % OUTPUTS_PER_FEE_TICK == 0:
+            oracle.tick()
+        if i % OUTPUTS_PER_BLOCK == 0:
+            network.mine_block()
+    cpu = time.process_time() - t0
+    await wallet.stop()
+    return cpu, num_passes, len(network.broadcast)
+
+
+async def run(num_outputs: int, polls_per_output: int):
+    print(f"{num_outputs} outputs, {polls_per_output} polls per output, a block every {OUTPUTS_PER_BLOCK} outputs")
+    for name, polling in (('polling', True), ('event-driven', False)):
+        cpu, num_passes, num_txs = await run_workload(num_outputs, polls_per_output, polling=polling)
+        print(f"{name:>12}: {1000 * cpu / num_outputs:6.2f} ms CPU per output, "
+              f"{num_passes} passes, {num_txs} txs broadcast")
+
+
+if __name__ == '__main__':
+    num_outputs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    polls_per_output = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(num_outputs, polls_per_output), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
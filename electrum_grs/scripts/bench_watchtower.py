@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+#
+# Load test for the watchtower: watches many channels against an in-process
+# fake chain (no server connection), closes a few of them, and measures how
+# long the watchtower takes to react to new txs and new blocks.
+# For comparison, it also times a full sweep over all channels, which is
+# what every event used to trigger.
+#
+# usage: bench_watchtower.py [num_channels] [num_closed]
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from electrum_grs import util
+from electrum_grs.bitcoin import script_to_address
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum_grs.util import create_and_start_event_loop
+
+from electrum_grs.plugins.watchtower.watchtower import WatchTower
+
+
+class FakeBlockchain:
+
+    def __init__(self):
+        self._height = 600_000
+
+    def height(self):
+        return self._height
+
+
+class FakeChain:
+    """Stands in for the Network. Txs are fed directly into the watchtower's adb."""
+
+    def __init__(self, config):
+        self.config = config
+        self.asyncio_loop = util.get_asyncio_loop()
+        self.interface = None
+        self._blockchain = FakeBlockchain()
+
+    def get_local_height(self):
+        return self._blockchain.height()
+
+    def blockchain(self):
+        return self._blockchain
+
+    async def broadcast_transaction(self, tx):
+        pass
+
+    def mine(self, adb, tx: Transaction) -> None:
+        adb.receive_tx_callback(tx, tx_height=self._blockchain.height())
+
+
+def random_p2wsh_address(rnd: random.Random) -> str:
+    return script_to_address(bytes([0x00, 0x20]) + rnd.randbytes(32))
+
+
+def make_tx(inputs, outputs) -> Transaction:
+    txins = []
+    for prevout in inputs:
+        txin = PartialTxInput(prevout=TxOutpoint.from_str(prevout))
+        # dummy witness, so that the tx is complete and has a txid
+        txin.script_sig = b''
+        txin.witness = bytes([1, 1, 0x51])
+        txins.append(txin)
+    tx = PartialTransaction.from_io(
+        txins, [PartialTxOutput.from_address_and_value(addr, value) for addr, value in outputs])
+    return Transaction(tx.serialize())
+
+
+async def timed(coro) -> float:
+    t0 = time.perf_counter()
+    await coro
+    return time.perf_counter() - t0
+
+
+async def run(num_channels: int, num_closed: int):
+    rnd = random.Random(0)
+    config = SimpleConfig({'electrum_path': tempfile.mkdtemp(prefix="bench-watchtower-")})
+    chain = FakeChain(config)
+    watchtower = WatchTower(chain)
+    adb = watchtower.adb
+
+    t0 = time.perf_counter()
+    channels = []
+    for i in range(num_channels):
+        address = random_p2wsh_address(rnd)
+        funding_tx = make_tx(["%064x:0" % i], [(address, 1_000_000)])
+        outpoint = funding_tx.txid() + ":0"
+        watchtower.add_channel(outpoint, address)
+        channels.append((outpoint, address, funding_tx))
+    print(f"added {num_channels} channels in {time.perf_counter() - t0:.2f} s")
+
+    # first pass, all channels are new
+    print(f"initial check of all channels: {await timed(watchtower.trigger_callbacks()):.2f} s")
+
+    closed = rnd.sample(channels, num_closed)
+    tx_dispatch = 0
+    for outpoint, address, funding_tx in closed:
+        chain.mine(adb, funding_tx)
+        closing_tx = make_tx([outpoint], [(random_p2wsh_address(rnd), 990_000)])
+        chain.mine(adb, closing_tx)
+        tx_dispatch += await timed(watchtower.on_event_adb_added_tx(adb, closing_tx.txid(), closing_tx))
+    print(f"dispatching {num_closed} closing txs: {1000 * tx_dispatch / num_closed:.2f} ms per tx")
+
+    unrelated = 0
+    for i in range(100):
+        tx = make_tx(["%064x:1" % i], [(random_p2wsh_address(rnd), 1000)])
+        unrelated += await timed(watchtower.on_event_adb_added_tx(adb, tx.txid(), tx))
+    print(f"dispatching 100 unrelated txs: {1000 * unrelated / 100:.3f} ms per tx")
+
+    chain._blockchain._height += 1
+    block = await timed(watchtower.on_event_blockchain_updated())
+    print(f"new block, {len(watchtower.get_outpoints_to_check_on_new_block())} channels re-checked: {1000 * block:.1f} ms")
+    full = await timed(watchtower.trigger_callbacks())
+    print(f"full sweep over {len(watchtower.callbacks)} channels: {1000 * full:.1f} ms")
+
+    await watchtower.stop()
+    watchtower.sweepstore.stop()
+    await watchtower.sweepstore.stopped_event.wait()
+
+
+if __name__ == '__main__':
+    num_channels = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    num_closed = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(num_channels, num_closed), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
@@ -0,0 +1,182 @@
+# Keeps track of how the servers we talked to performed: round-trip time,
+# errors and how far behind our best chain their tip was. Network uses the
+# scores to pick the servers it connects to and its main interface, and to
+# decide when to hedge a request (see Network._hedged_request).
+#
+# Scores are exponentially weighted moving averages, so that they follow
+# servers that get slower or faster. They are persisted next to the
+# recent_servers file, and forgotten after MAX_AGE.
+
+import json
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Sequence, TypeVar, Deque
+
+from .logging import Logger
+
+
+_T = TypeVar('_T')
+
+
+class ServerScore:
+
+    __slots__ = ('rtt', 'rtt_dev', 'error_rate', 'header_lag', 'last_seen', 'samples')
+
+    def __init__(self, *, rtt=None, rtt_dev=None, error_rate=0.0, header_lag=0.0, last_seen=0.0):
+        self.rtt = rtt  # type: Optional[float]  # seconds
+        self.rtt_dev = rtt_dev  # type: Optional[float]  # mean deviation of rtt
+        self.error_rate = error_rate  # type: float  # in [0, 1]
+        self.header_lag = header_lag  # type: float  # blocks
+        self.last_seen = last_seen  # type: float  # timestamp
+        self.samples = deque(maxlen=ServerScores.RTT_WINDOW)  # type: Deque[float]  # recent rtts, not persisted
+
+    def to_json(self) -> dict:
+        return {
+            'rtt': self.rtt,
+            'rtt_dev': self.rtt_dev,
+            'error_rate': self.error_rate,
+            'header_lag': self.header_lag,
+            'last_seen': self.last_seen,
+        }
+
+
+class ServerScores(Logger):
+
+    RTT_ALPHA = 1 / 8  # as in TCP (RFC 6298)
+    RTT_DEV_BETA = 1 / 4
+    ERROR_ALPHA = 1 / 10
+    LAG_ALPHA = 1 / 4
+    DEFAULT_RTT = 1.0  # for servers we know nothing about
+    ERROR_PENALTY = 10  # score multiplier for a server that always fails
+    LAG_PENALTY = 0.5  # seconds per block
+    RTT_WINDOW = 64
+    MIN_SAMPLES_FOR_PERCENTILE = 10
+    HEDGE_PERCENTILE = 0.95
+    MIN_HEDGE_DELAY = 0.05
+    MAX_HEDGE_DELAY = 5.0
+    NUM_CHOICES = 3  # see choose()
+    MAX_AGE = 30 * 24 * 3600
+    MAX_ENTRIES = 1000
+    SAVE_INTERVAL = 60
+
+    def __init__(self, path: Optional[str]):
+        """path: file the scores are persisted to, or None"""
+        Logger.__init__(self)
+        self.path = path
+        self.lock = threading.Lock()
+        self._scores = self._read()  # type: Dict[str, ServerScore]
+        self._last_save = time.monotonic()
+
+    def _read(self) -> Dict[str, ServerScore]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, "r", encoding='utf-8') as f:
+                data = json.loads(f.read())
+            min_last_seen = time.time() - self.MAX_AGE
+            return {
+                server: ServerScore(**d) for server, d in data.items()
+                if d.get('last_seen', 0) > min_last_seen}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            self.logger.info(f"cannot read server scores: {e!r}")
+            return {}
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self.lock:
+            items = sorted(self._scores.items(), key=lambda x: x[1].last_seen, reverse=True)
+            data = {server: score.to_json() for server, score in items[:self.MAX_ENTRIES]}
+            self._last_save = time.monotonic()
+        s = json.dumps(data, indent=4, sort_keys=True)
+        try:
+            with open(self.path, "w", encoding='utf-8') as f:
+                f.write(s)
+        except Exception:
+            pass
+
+    def _maybe_save(self) -> None:
+        if time.monotonic() - self._last_save > self.SAVE_INTERVAL:
+            self.save()
+
+    def _get(self, server) -> ServerScore:
+        key = str(server)
+        score = self._scores.get(key)
+        if score is None:
+            score = self._scores[key] = ServerScore()
+        score.last_seen = time.time()
+        return score
+
+    def get(self, server) -> Optional[ServerScore]:
+        return self._scores.get(str(server))
+
+    def record_response(self, server, rtt: float) -> None:
+        with self.lock:
+            s = self._get(server)
+            if s.rtt is None:
+                s.rtt, s.rtt_dev = rtt, rtt / 2
+            else:
+                s.rtt_dev += self.RTT_DEV_BETA * (abs(rtt - s.rtt) - s.rtt_dev)
+                s.rtt += self.RTT_ALPHA * (rtt - s.rtt)
+            s.error_rate -= self.ERROR_ALPHA * s.error_rate
+            s.samples.append(rtt)
+        self._maybe_save()
+
+    def record_error(self, server) -> None:
+        """The server timed out, returned garbage, or we could not connect."""
+        with self.lock:
+            s = self._get(server)
+            s.error_rate += self.ERROR_ALPHA * (1 - s.error_rate)
+        self._maybe_save()
+
+    def record_header_lag(self, server, lag: int) -> None:
+        with self.lock:
+            s = self._get(server)
+            s.header_lag += self.LAG_ALPHA * (max(0, lag) - s.header_lag)
+
+    def score(self, server) -> float:
+        """Expected time to get an answer from server, in seconds.
+        Lower is better. Unknown servers get a neutral score."""
+        s = self._scores.get(str(server))
+        if s is None or s.rtt is None:
+            latency = self.DEFAULT_RTT
+            error_rate = s.error_rate if s else 0
+            header_lag = s.header_lag if s else 0
+        else:
+            latency = s.rtt + 2 * s.rtt_dev
+            error_rate = s.error_rate
+            header_lag = s.header_lag
+        return (latency + self.LAG_PENALTY * header_lag) * (1 + self.ERROR_PENALTY * error_rate)
+
+    def sort(self, servers: Sequence[_T]) -> Sequence[_T]:
+        """Sorts servers by score, best first. The sort is stable."""
+        return sorted(servers, key=self.score)
+
+    def choose(self, servers: Sequence[_T]) -> Optional[_T]:
+        """Returns the best of NUM_CHOICES servers picked at random.
+        This favours good servers, but not always the same ones, so that
+        a server cannot attract all clients by answering fast.
+        """
+        if not servers:
+            return None
+        candidates = random.sample(list(servers), min(self.NUM_CHOICES, len(servers)))
+        return min(candidates, key=self.score)
+
+    def rtt_percentile(self, server, p: float) -> float:
+        s = self._scores.get(str(server))
+        if s is None or s.rtt is None:
+            return self.DEFAULT_RTT
+        if len(s.samples) < self.MIN_SAMPLES_FOR_PERCENTILE:
+            # not enough samples yet, use the TCP retransmission timeout
+            return s.rtt + 4 * s.rtt_dev
+        samples = sorted(s.samples)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def hedge_delay(self, server) -> float:
+        """How long to wait for server before sending the same request to another one."""
+        delay = self.rtt_percentile(server, self.HEDGE_PERCENTILE)
+        return min(self.MAX_HEDGE_DELAY, max(self.MIN_HEDGE_DELAY, delay))
@@ -652,6 +652,9 @@ class SimpleConfig(Logger):
         #   For Bitcoin, that is 4 M weight units, i.e. 4 MB on the p2p wire.
         #   Double that due to our JSON-RPC hex-encoding, plus overhead, that's 8+ MB.
     NETWORK_TIMEOUT = ConfigVar('network_timeout', default=None, type_=int)
+    # send get_transaction/merkle requests also to a second server if the main one is slow.
+    # off by default, as it reveals the txids to more servers.
+    NETWORK_HEDGE_REQUESTS = ConfigVar('network_hedge_requests', default=False, type_=bool)
     NETWORK_BOOKMARKED_SERVERS = ConfigVar('network_bookmarked_servers', default=None)
 
     WALLET_MERGE_DUPLICATE_OUTPUTS = ConfigVar(
@@ -721,6 +724,16 @@ If disabled, the full wallet file is written to disk for every change. Experimen
         'history_rates_capital_gains', default=False, type_=bool,
         short_desc=lambda: _('Show Capital Gains'),
     )
+    FX_CAPITAL_GAINS_METHOD = ConfigVar(
+        'capital_gains_method', default='utxo', type_=str,
+        short_desc=lambda: _('Cost basis method'),
+        long_desc=lambda: _(
+            "How the acquisition price of coins leaving the wallet is computed.\n"
+            "utxo: price of the coins spent by the transaction.\n"
+            "average: average price of all holdings.\n"
+            "fifo/lifo: oldest/newest coins first.\n"
+            "Except for 'utxo', lightning payments are included."),
+    )
     FX_SHOW_FIAT_BALANCE_FOR_ADDRESSES = ConfigVar(
         'fiat_address', default=False, type_=bool,
         short_desc=lambda: _('Show Fiat balances'),
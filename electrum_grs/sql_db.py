@@ -3,74 +3,214 @@ import queue
 import threading
 import asyncio
 import sqlite3
+import time
+from typing import List, Tuple, Any, Optional
 
+from . import metrics
 from .logging import Logger
 from .util import test_read_write_permissions
 
 
-def sql(func):
+QUEUE_DEPTH = metrics.gauge(
+    'electrum_sqldb_queue_depth', 'Number of requests waiting for the SQL thread', ['db'])
+REQUEST_LATENCY = metrics.histogram(
+    'electrum_sqldb_request_seconds', 'Time from queuing a SQL request until its result is available', ['db'])
+
+
+def sql(func=None, *, readonly: bool = False):
     """wrapper for sql methods
 
     returns an awaitable asyncio.Future
+
+    Methods run on the SQL thread, which groups them into transactions.
+    Their result is available once the transaction is committed.
+    Methods decorated with readonly=True run on a pool of read
+    connections instead. They see the writes that were queued before them.
     """
+    if func is None:
+        return lambda f: sql(f, readonly=readonly)
+
     def wrapper(self: 'SqlDB', *args, **kwargs):
-        assert threading.current_thread() != self.sql_thread
+        assert threading.current_thread() not in self._sql_threads
         f = self.asyncio_loop.create_future()
-        self.db_requests.put((f, func, args, kwargs))
+        self._queue_depth.inc()
+        self._submit(f, func, args, kwargs, readonly=readonly)
         return f
     return wrapper
 
 
 class SqlDB(Logger):
+    # max time a write waits for the transaction it is part of to be committed
+    MAX_COMMIT_LATENCY = 0.05
+    MAX_REQUESTS_PER_TRANSACTION = 1000
+    NUM_READ_THREADS = 2
+    MAX_READS_PER_BATCH = 100
 
     def __init__(self, asyncio_loop: asyncio.BaseEventLoop, path, commit_interval=None):
+        """commit_interval: max number of write requests per transaction"""
         Logger.__init__(self)
         self.asyncio_loop = asyncio_loop
         self.stopping = False
         self.stopped_event = asyncio.Event()
         self.path = path
         test_read_write_permissions(path)
-        self.commit_interval = commit_interval
+        self.commit_interval = commit_interval or self.MAX_REQUESTS_PER_TRANSACTION
         self.db_requests = queue.Queue()
+        self.db_read_requests = queue.Queue()
+        self._queue_depth = QUEUE_DEPTH.labels(db=type(self).__name__)
+        self._request_latency = REQUEST_LATENCY.labels(db=type(self).__name__)
+        self._local = threading.local()  # conn of the current thread
+        # write requests are numbered, so that reads can wait for the writes queued before them
+        self._seq_lock = threading.Lock()
+        self._last_write_seq = 0
+        self._committed_seq = 0
+        self._committed = threading.Condition()
+        self._read_threads = []  # type: List[threading.Thread]
         self.sql_thread = threading.Thread(target=self.run_sql)
+        self._sql_threads = {self.sql_thread}
         self.sql_thread.start()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        return self._local.conn
+
     def stop(self):
         self.stopping = True
 
     def filesize(self):
-        return os.stat(self.path).st_size
+        size = os.stat(self.path).st_size
+        wal_path = self.path + '-wal'
+        if os.path.exists(wal_path):
+            size += os.stat(wal_path).st_size
+        return size
+
+    def _submit(self, future, func, args, kwargs, *, readonly: bool) -> None:
+        t0 = time.monotonic()
+        with self._seq_lock:
+            if readonly and self.NUM_READ_THREADS:
+                self.db_read_requests.put([future, func, args, kwargs, t0, self._last_write_seq])
+            else:
+                self._last_write_seq += 1
+                self.db_requests.put([future, func, args, kwargs, t0, self._last_write_seq])
+
+    def _is_running(self) -> bool:
+        return not self.stopping and self.asyncio_loop.is_running()
+
+    def _deliver(self, results: List[Tuple[asyncio.Future, Optional[BaseException], Any]]) -> None:
+        """Sets the results of a batch of requests. Runs on the event loop."""
+        for future, exc, result in results:
+            if future.cancelled():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    def _observe_latency(self, requests) -> None:
+        now = time.monotonic()
+        for request in requests:
+            self._request_latency.observe(now - request[4])
 
     def run_sql(self):
         self.logger.info("SQL thread started")
-        self.conn = sqlite3.connect(self.path)
+        self._local.conn = conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
         self.logger.info("Creating database")
         self.create_database()
-        i = 0
-        while not self.stopping and self.asyncio_loop.is_running():
+        if conn.in_transaction:
+            conn.commit()
+        for i in range(self.NUM_READ_THREADS):
+            t = threading.Thread(target=self.run_sql_reads, name=f"{type(self).__name__}-read-{i}")
+            self._read_threads.append(t)
+            self._sql_threads.add(t)
+            t.start()
+        while self._is_running():
             try:
-                future, func, args, kwargs = self.db_requests.get(timeout=0.1)
+                request = self.db_requests.get(timeout=0.1)
             except queue.Empty:
                 continue
+            # group the requests that are already queued into one transaction
+            deadline = time.monotonic() + self.MAX_COMMIT_LATENCY
+            requests = []
+            conn.execute("BEGIN")
+            while True:
+                requests.append(request)
+                self._run_write(conn, request)
+                if len(requests) >= self.commit_interval or time.monotonic() >= deadline:
+                    break
+                try:
+                    request = self.db_requests.get_nowait()
+                except queue.Empty:
+                    break
             try:
-                result = func(self, *args, **kwargs)
-            except BaseException as e:
-                self.asyncio_loop.call_soon_threadsafe(future.set_exception, e)
-                continue
-            if not future.cancelled():
-                self.asyncio_loop.call_soon_threadsafe(future.set_result, result)
-            # note: in sweepstore session.commit() is called inside
-            # the sql-decorated methods, so committing to disk is awaited
-            if self.commit_interval:
-                i = (i + 1) % self.commit_interval
-                if i == 0:
-                    self.conn.commit()
+                if conn.in_transaction:
+                    conn.commit()
+            except sqlite3.Error as e:
+                self.logger.exception("commit failed")
+                conn.rollback()
+                for r in requests:
+                    r[6:8] = e, None
+            with self._committed:
+                self._committed_seq = requests[-1][5]
+                self._committed.notify_all()
+            self._observe_latency(requests)
+            self.asyncio_loop.call_soon_threadsafe(self._deliver, [(r[0], r[6], r[7]) for r in requests])
         # write
-        self.conn.commit()
-        self.conn.close()
+        if conn.in_transaction:
+            conn.commit()
+        for t in self._read_threads:
+            t.join()
+        conn.close()
 
         self.logger.info("SQL thread terminated")
         self.asyncio_loop.call_soon_threadsafe(self.stopped_event.set)
 
+    def _run_write(self, conn: sqlite3.Connection, request: list) -> None:
+        """Runs a write request in a savepoint, so that it is rolled back if it fails.
+        Appends (exception, result) to request."""
+        future, func, args, kwargs, t0, seq = request
+        self._queue_depth.dec()
+        conn.execute("SAVEPOINT sql_request")
+        try:
+            result = func(self, *args, **kwargs)
+            exc = None
+        except BaseException as e:
+            result, exc = None, e
+            if conn.in_transaction:
+                conn.execute("ROLLBACK TO sql_request")
+        if conn.in_transaction:
+            conn.execute("RELEASE sql_request")
+        else:
+            # the request committed by itself
+            conn.execute("BEGIN")
+        request.extend((exc, result))
+
+    def run_sql_reads(self):
+        self._local.conn = conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA query_only=ON")
+        while self._is_running():
+            try:
+                requests = [self.db_read_requests.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            while len(requests) < self.MAX_READS_PER_BATCH:
+                try:
+                    requests.append(self.db_read_requests.get_nowait())
+                except queue.Empty:
+                    break
+            results = []
+            for future, func, args, kwargs, t0, seq in requests:
+                self._queue_depth.dec()
+                with self._committed:
+                    while self._committed_seq < seq and self._is_running():
+                        self._committed.wait(timeout=0.1)
+                try:
+                    results.append((future, None, func(self, *args, **kwargs)))
+                except BaseException as e:
+                    results.append((future, e, None))
+            self._observe_latency(requests)
+            self.asyncio_loop.call_soon_threadsafe(self._deliver, results)
+        conn.close()
+
     def create_database(self):
         raise NotImplementedError()
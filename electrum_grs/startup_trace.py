@@ -0,0 +1,229 @@
+"""Startup tracer: time spent importing modules and initializing subsystems.
+
+It is enabled by setting ELECTRUM_STARTUP_TRACE to the path of the report file:
+
+    ELECTRUM_STARTUP_TRACE=/tmp/startup.json electrum-grs daemon
+
+The tracer is started by electrum_grs/__init__.py before anything else is
+imported, so it sees every import of the package. Note: this module must only
+import from the standard library.
+
+Subsystems are timed with span(), which does nothing when the tracer is off:
+
+    with startup_trace.span('network'):
+        self.network = Network(config, daemon=self)
+
+Imports and spans nest: the time of a record includes the time of the records
+opened while it was open (in the same thread), and its self time does not.
+
+The report is written when the daemon listens for JSON-RPC requests (the
+'jsonrpc_ready' event, i.e. the time to first RPC), and again when the daemon
+stops, to include the subsystems that were initialized later, on first use.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib.machinery import SourceFileLoader, SourcelessFileLoader, ExtensionFileLoader
+from typing import Optional, List, Dict, Any
+
+
+ENV_VAR = 'ELECTRUM_STARTUP_TRACE'
+
+
+class _Record:
+
+    __slots__ = ('kind', 'name', 'thread', 'parent', 'start', 'duration', 'children_time')
+
+    def __init__(self, kind: str, name: str, parent: Optional['_Record'], start: float):
+        self.kind = kind  # 'import' or 'span'
+        self.name = name
+        self.thread = threading.current_thread().name
+        self.parent = parent
+        self.start = start
+        self.duration = None  # type: Optional[float]
+        self.children_time = 0.0
+
+    def to_json(self, t0: float) -> Dict[str, Any]:
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'thread': self.thread,
+            'parent': self.parent.name if self.parent else None,
+            'start': round(self.start - t0, 6),
+            'duration': round(self.duration, 6),
+            'self': round(self.duration - self.children_time, 6),
+        }
+
+
+class _ImportHook:
+    """Meta path finder that times the execution of the modules found by the other finders.
+
+    Only modules with their own loader instance (source, bytecode and extension
+    modules) are timed: the loader of builtin and frozen modules is shared.
+    """
+
+    def __init__(self, tracer: 'StartupTracer'):
+        self.tracer = tracer
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        if isinstance(loader, (SourceFileLoader, SourcelessFileLoader, ExtensionFileLoader)):
+            exec_module = loader.exec_module
+            tracer = self.tracer
+
+            def traced_exec_module(module):
+                with tracer.record('import', fullname):
+                    exec_module(module)
+            loader.exec_module = traced_exec_module
+        return spec
+
+    def invalidate_caches(self):
+        pass
+
+
+class StartupTracer:
+
+    def __init__(self, report_path: Optional[str] = None):
+        self.report_path = report_path
+        self.t0 = time.perf_counter()
+        self._records = []  # type: List[_Record]
+        self._events = {}  # type: Dict[str, float]
+        self._local = threading.local()
+        self._hook = None  # type: Optional[_ImportHook]
+
+    def install_import_hook(self) -> None:
+        if self._hook is None:
+            self._hook = _ImportHook(self)
+            sys.meta_path.insert(0, self._hook)
+
+    def uninstall_import_hook(self) -> None:
+        if self._hook is not None:
+            sys.meta_path.remove(self._hook)
+            self._hook = None
+
+    def _stack(self) -> List[_Record]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def record(self, kind: str, name: str):
+        stack = self._stack()
+        rec = _Record(kind, name, stack[-1] if stack else None, time.perf_counter())
+        stack.append(rec)
+        try:
+            yield rec
+        finally:
+            rec.duration = time.perf_counter() - rec.start
+            stack.pop()
+            if rec.parent is not None:
+                rec.parent.children_time += rec.duration
+            self._records.append(rec)
+
+    def mark(self, name: str) -> None:
+        """Records the time of an event, the first time it happens."""
+        self._events.setdefault(name, time.perf_counter() - self.t0)
+
+    def get_records(self, kind: str = None) -> List[_Record]:
+        return [rec for rec in list(self._records) if kind is None or rec.kind == kind]
+
+    def get_report(self) -> Dict[str, Any]:
+        records = sorted(self.get_records(), key=lambda rec: rec.start)
+        imports = [rec.to_json(self.t0) for rec in records if rec.kind == 'import']
+        spans = [rec.to_json(self.t0) for rec in records if rec.kind == 'span']
+        return {
+            'elapsed': round(time.perf_counter() - self.t0, 6),
+            'events': dict(self._events),
+            'import_time': round(sum(x['self'] for x in imports), 6),
+            'num_imports': len(imports),
+            'spans': spans,
+            'imports': imports,
+        }
+
+    def write_report(self, path: str = None) -> Optional[str]:
+        path = path or self.report_path
+        if not path:
+            return None
+        report = self.get_report()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+        os.replace(tmp_path, path)
+        from .logging import get_logger
+        slowest = sorted(report['imports'], key=lambda x: x['self'], reverse=True)[:5]
+        get_logger(__name__).info(
+            f"startup report written to {path}: {report['num_imports']} modules imported "
+            f"in {report['import_time']:.3f} s. slowest: "
+            + ", ".join(f"{x['name']} {x['self']:.3f} s" for x in slowest))
+        return path
+
+
+_tracer = None  # type: Optional[StartupTracer]
+
+
+def start(report_path: str = None) -> StartupTracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = StartupTracer(report_path)
+        _tracer.install_import_hook()
+    return _tracer
+
+
+def start_from_env() -> Optional[StartupTracer]:
+    report_path = os.environ.get(ENV_VAR)
+    if report_path:
+        return start(report_path)
+    return None
+
+
+def stop() -> Optional[StartupTracer]:
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.uninstall_import_hook()
+    return tracer
+
+
+def get_tracer() -> Optional[StartupTracer]:
+    return _tracer
+
+
+@contextmanager
+def span(name: str):
+    """Times the initialization of a subsystem. Can also be used as a decorator."""
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    with tracer.record('span', name):
+        yield
+
+
+def mark(name: str) -> None:
+    if _tracer is not None:
+        _tracer.mark(name)
+
+
+def write_report() -> Optional[str]:
+    """Writes the report, if the tracer is on. Errors are logged: tracing must not break startup."""
+    if _tracer is None:
+        return None
+    try:
+        return _tracer.write_report()
+    except Exception as e:
+        from .logging import get_logger
+        get_logger(__name__).warning(f"could not write startup report: {e!r}")
+        return None
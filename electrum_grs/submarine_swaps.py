@@ -543,6 +543,7 @@ class SwapManager(Logger):
             spent_height = txin.spent_height
             # set spending_txid (even if tx is local), for GUI grouping
             swap.spending_txid = txin.spent_txid
+            self._clear_history_cache(swap)
             # discard local spenders
             if spent_height in [TX_HEIGHT_LOCAL, TX_HEIGHT_FUTURE]:
                 spent_height = None
@@ -1064,6 +1065,7 @@ class SwapManager(Logger):
                 self.logger.error(f"failed to broadcast swap funding transaction: {e}")
             finally:
                 swap.funding_txid = tx.txid()
+                self._clear_history_cache(swap)
                 funding_broadcast.set()
 
         self.lnworker.register_hold_invoice(payment_hash, lightning_payment_callback)
@@ -1279,6 +1281,13 @@ class SwapManager(Logger):
             if swap._funding_prevout:
                 self._swaps_by_funding_outpoint[swap._funding_prevout] = swap
             self._swaps_by_lockup_address[swap.lockup_address] = swap
+        self._clear_history_cache(swap)
+
+    def _clear_history_cache(self, swap: SwapData) -> None:
+        # the group_id of the swap payments changed, see get_group_id_for_payment_hash
+        for payment_hash in (swap.payment_hash, swap.prepay_hash):
+            if payment_hash:
+                self.lnworker.clear_lightning_history_cache(payment_hash.hex())
 
     def server_update_pairs(self) -> None:
         """ for server """
@@ -24,7 +24,7 @@
 # SOFTWARE.
 import asyncio
 import hashlib
-from typing import Dict, List, TYPE_CHECKING, Tuple, Set, Optional, Sequence
+from typing import Dict, List, TYPE_CHECKING, Tuple, Set, Optional, Sequence, Iterable
 from collections import defaultdict
 import logging
 
@@ -87,6 +87,15 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         if not is_address(addr): raise ValueError(f"invalid groestlcoin address {neuter_bitcoin_address(addr)}")
         self._adding_addrs.add(addr)  # this lets is_up_to_date already know about addr
 
+    def remove(self, addrs: Iterable[str]) -> None:
+        """Ignore status updates for addrs from now on.
+        note: the server-side subscriptions are only dropped when we reconnect.
+        """
+        for addr in addrs:
+            self._adding_addrs.discard(addr)
+            self.requested_addrs.discard(addr)
+            self.scripthash_to_address.pop(address_to_scripthash(addr), None)
+
     async def _add_address(self, addr: str):
         try:
             if not is_address(addr): raise ValueError(f"invalid groestlcoin address {neuter_bitcoin_address(addr)}")
@@ -103,6 +112,8 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         raise NotImplementedError()  # implemented by subclasses
 
     async def _subscribe_to_address(self, addr):
+        if addr not in self.requested_addrs:  # removed in the meantime
+            return
         h = address_to_scripthash(addr)
         self.scripthash_to_address[h] = addr
         self._requests_sent += 1
@@ -118,7 +129,9 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
     async def handle_status(self):
         while True:
             h, status = await self.status_queue.get()
-            addr = self.scripthash_to_address[h]
+            addr = self.scripthash_to_address.get(h)
+            if addr is None:  # removed
+                continue
             self._handling_addr_statuses.add(addr)
             self.requested_addrs.discard(addr)  # ok for addr not to be present
             await self.taskgroup.spawn(self._on_address_status, addr, status)
@@ -37,11 +37,12 @@ import itertools
 import binascii
 import copy
 import re
+from functools import lru_cache
 
 import electrum_ecc as ecc
 from electrum_ecc.util import bip340_tagged_hash
 
-from . import bitcoin, bip32
+from . import bitcoin, bip32, constants
 from .bip32 import BIP32Node
 from .util import to_bytes, bfh, chunks, is_hex_str, parse_max_spend
 from .bitcoin import (
@@ -757,6 +758,97 @@ SCRIPTPUBKEY_TEMPLATE_P2TR = [opcodes.OP_1, OPPushDataGeneric(lambda x: x == 32)
 SCRIPTPUBKEY_TEMPLATE_ANYSEGWIT = [OP_ANYSEGWIT_VERSION, OPPushDataGeneric(lambda x: x in list(range(2, 40 + 1)))]
 
 
+class CompiledScriptTemplate:
+    """A script template compiled into a matcher working on the script bytes.
+
+    The opcodes accepted by each item of the template are computed once. Matching then
+    walks the script: the opcode of a direct push is the length of its data, so the script
+    does not need to be decoded with script_GetOp, and scripts of the wrong length are
+    rejected right away. Templates accepting OP_PUSHDATA1/2/4 cannot be compiled, and are
+    matched by the generic matcher.
+    """
+
+    def __init__(self, template: Sequence):
+        self.template = template
+        self._accepted = []  # type: List[Sequence[bool]]  # for each item: opcode -> accepted
+        for item in template:
+            self._accepted.append([self._item_accepts(item, opcode) for opcode in range(256)])
+        self.is_compiled = not any(
+            accepted[opcode] for accepted in self._accepted
+            for opcode in (opcodes.OP_PUSHDATA1, opcodes.OP_PUSHDATA2, opcodes.OP_PUSHDATA4))
+        sizes = [[self._item_size(opcode) for opcode in range(256) if accepted[opcode]] for accepted in self._accepted]
+        self.min_len = sum(min(x, default=0) for x in sizes)
+        self.max_len = sum(max(x, default=0) for x in sizes)
+
+    @classmethod
+    def _item_accepts(cls, item, opcode: int) -> bool:
+        # same as match_script_against_template
+        if OPPushDataGeneric.is_instance(item) and item.check_data_len(opcode):
+            return True
+        if OPGeneric.is_instance(item) and item.match(opcode):
+            return True
+        return item == opcode
+
+    @classmethod
+    def _item_size(cls, opcode: int) -> int:
+        return 1 + opcode if opcode < opcodes.OP_PUSHDATA1 else 1
+
+    def decode(self, script: bytes) -> Optional[List[Tuple[int, Optional[bytes]]]]:
+        """Returns the (opcode, data) items of script, like script_GetOp,
+        if script matches the template. Otherwise returns None.
+        """
+        assert self.is_compiled
+        if not self.min_len <= len(script) <= self.max_len:
+            return None
+        items = []
+        i = 0
+        for accepted in self._accepted:
+            if i >= len(script):
+                return None
+            opcode = script[i]
+            if not accepted[opcode]:
+                return None
+            i += 1
+            data = None
+            if opcode < opcodes.OP_PUSHDATA1:
+                data = script[i:i + opcode]
+                i += opcode
+            items.append((opcode, data))
+        if i != len(script):
+            return None
+        return items
+
+    def match(self, script) -> bool:
+        if not self.is_compiled or not isinstance(script, (bytes, bytearray)):
+            return match_script_against_template(script, self.template)
+        return self.decode(script) is not None
+
+
+# id(template) -> compiled template. note: the compiled template keeps a reference to the
+# template, so the id cannot be reused by another object
+_compiled_script_templates = {}  # type: Dict[int, CompiledScriptTemplate]
+
+
+def compile_script_template(template: Sequence) -> CompiledScriptTemplate:
+    """Compiles template, which match_script_against_template then uses.
+    Meant for templates that are module-level constants: compiled templates are never freed.
+    """
+    compiled = _compiled_script_templates.get(id(template))
+    if compiled is None:
+        compiled = _compiled_script_templates[id(template)] = CompiledScriptTemplate(template)
+    return compiled
+
+
+_P2PK = compile_script_template(SCRIPTPUBKEY_TEMPLATE_P2PK)
+_P2PKH = compile_script_template(SCRIPTPUBKEY_TEMPLATE_P2PKH)
+_P2SH = compile_script_template(SCRIPTPUBKEY_TEMPLATE_P2SH)
+_WITNESS_V0 = compile_script_template(SCRIPTPUBKEY_TEMPLATE_WITNESS_V0)
+_P2WPKH = compile_script_template(SCRIPTPUBKEY_TEMPLATE_P2WPKH)
+_P2WSH = compile_script_template(SCRIPTPUBKEY_TEMPLATE_P2WSH)
+_P2TR = compile_script_template(SCRIPTPUBKEY_TEMPLATE_P2TR)
+_ANYSEGWIT = compile_script_template(SCRIPTPUBKEY_TEMPLATE_ANYSEGWIT)
+
+
 def check_scriptpubkey_template_and_dust(scriptpubkey, amount: Optional[int]):
     if match_script_against_template(scriptpubkey, SCRIPTPUBKEY_TEMPLATE_P2PKH):
         dust_limit = bitcoin.DUST_LIMIT_P2PKH
@@ -792,6 +884,9 @@ def match_script_against_template(script, template, debug=False) -> bool:
         return False
     # optionally decode script now:
     if isinstance(script, (bytes, bytearray)):
+        compiled = _compiled_script_templates.get(id(template))
+        if compiled is not None and compiled.is_compiled and not debug:
+            return compiled.decode(script) is not None
         try:
             script = [x for x in script_GetOp(script)]
         except MalformedBitcoinScript:
@@ -821,49 +916,48 @@ def match_script_against_template(script, template, debug=False) -> bool:
 def get_script_type_from_output_script(scriptpubkey: bytes) -> Optional[str]:
     if scriptpubkey is None:
         return None
-    try:
-        decoded = [x for x in script_GetOp(scriptpubkey)]
-    except MalformedBitcoinScript:
-        return None
-    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2PK):
+    if _P2PK.match(scriptpubkey):
         return 'p2pk'
-    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2PKH):
+    if _P2PKH.match(scriptpubkey):
         return 'p2pkh'
-    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2SH):
+    if _P2SH.match(scriptpubkey):
         return 'p2sh'
-    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2WPKH):
+    if _P2WPKH.match(scriptpubkey):
         return 'p2wpkh'
-    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2WSH):
+    if _P2WSH.match(scriptpubkey):
         return 'p2wsh'
-    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2TR):
+    if _P2TR.match(scriptpubkey):
         return 'p2tr'
     return None
 
 
 def get_address_from_output_script(_bytes: bytes, *, net=None) -> Optional[str]:
-    try:
-        decoded = [x for x in script_GetOp(_bytes)]
-    except MalformedBitcoinScript:
-        return None
+    return _get_address_from_output_script_cached(bytes(_bytes), net or constants.net)
+
+
+# note: called from the GUI, network and asyncio threads. lru_cache is thread-safe
+@lru_cache(maxsize=10**4)
+def _get_address_from_output_script_cached(_bytes: bytes, net) -> Optional[str]:
+    return _get_address_from_output_script(_bytes, net=net)
 
+
+def _get_address_from_output_script(_bytes: bytes, *, net=None) -> Optional[str]:
     # p2pkh
-    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2PKH):
+    if (decoded := _P2PKH.decode(_bytes)) is not None:
         return hash160_to_p2pkh(decoded[2][1], net=net)
 
     # p2sh
-    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_P2SH):
+    if (decoded := _P2SH.decode(_bytes)) is not None:
         return hash160_to_p2sh(decoded[1][1], net=net)
 
     # segwit address (version 0)
-    if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_WITNESS_V0):
+    if (decoded := _WITNESS_V0.decode(_bytes)) is not None:
         return hash_to_segwit_addr(decoded[1][1], witver=0, net=net)
 
     # segwit address (version 1-16)
-    future_witness_versions = list(range(opcodes.OP_1, opcodes.OP_16 + 1))
-    for witver, opcode in enumerate(future_witness_versions, start=1):
-        match = [opcode, OPPushDataGeneric(lambda x: 2 <= x <= 40)]
-        if match_script_against_template(decoded, match):
-            return hash_to_segwit_addr(decoded[1][1], witver=witver, net=net)
+    if (decoded := _ANYSEGWIT.decode(_bytes)) is not None:
+        witver = decoded[0][0] - opcodes.OP_1 + 1
+        return hash_to_segwit_addr(decoded[1][1], witver=witver, net=net)
 
     return None
 
@@ -1257,8 +1351,7 @@ class Transaction:
 
     def add_info_from_wallet(self, wallet: 'Abstract_Wallet', **kwargs) -> None:
         # populate prev_txs
-        for txin in self.inputs():
-            wallet.add_input_info(txin)
+        wallet.add_inputs_and_outputs_info(self.inputs(), [])
 
     async def add_info_from_network(
         self,
@@ -2015,19 +2108,12 @@ class PartialTxInput(TxInput, PSBTSection):
                 if self.address != bitcoin.hash160_to_p2sh(hash_160(self.redeem_script)):
                     # not p2sh address
                     return False
-                try:
-                    decoded = [x for x in script_GetOp(self.redeem_script)]
-                except MalformedBitcoinScript:
-                    decoded = None
                 # witness version 0
-                if match_script_against_template(decoded, SCRIPTPUBKEY_TEMPLATE_WITNESS_V0):
+                if _WITNESS_V0.match(self.redeem_script):
                     return True
                 # witness version 1-16
-                future_witness_versions = list(range(opcodes.OP_1, opcodes.OP_16 + 1))
-                for witver, opcode in enumerate(future_witness_versions, start=1):
-                    match = [opcode, OPPushDataGeneric(lambda x: 2 <= x <= 40)]
-                    if match_script_against_template(decoded, match):
-                        return True
+                if _ANYSEGWIT.match(self.redeem_script):
+                    return True
                 return False
 
             self._is_p2sh_segwit = calc_if_p2sh_segwit_now()
@@ -2612,16 +2698,11 @@ class PartialTransaction(Transaction):
                     xpub = ks.get_xpub_to_be_used_in_partial_tx(only_der_suffix=False)
                     bip32node = BIP32Node.from_xkey(xpub)
                     self.xpubs[bip32node] = (fp_bytes, der_full)
-        for txin in self.inputs():
-            wallet.add_input_info(
-                txin,
-                only_der_suffix=False,
-            )
-        for txout in self.outputs():
-            wallet.add_output_info(
-                txout,
-                only_der_suffix=False,
-            )
+        wallet.add_inputs_and_outputs_info(
+            self.inputs(),
+            self.outputs(),
+            only_der_suffix=False,
+        )
 
     def remove_xpubs_and_bip32_paths(self) -> None:
         self.xpubs.clear()
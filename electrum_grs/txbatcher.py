@@ -73,6 +73,7 @@ from . import util
 from .bitcoin import dust_threshold
 from .logging import Logger
 from .util import log_exceptions, NotEnoughFunds, BelowDustLimit, NoDynamicFeeEstimates, OldTaskGroup
+from .util import EventListener, event_listener
 from .transaction import PartialTransaction, PartialTxOutput, Transaction, TxOutpoint, PartialTxInput
 from .address_synchronizer import TX_HEIGHT_LOCAL, TX_HEIGHT_FUTURE
 from .lnsweep import SweepInfo
@@ -83,9 +84,15 @@ if TYPE_CHECKING:
     from .wallet import Abstract_Wallet
 
 
-class TxBatcher(Logger):
+class TxBatcher(Logger, EventListener):
+    # Batches do not poll. They wait until something that may change their next
+    # transaction happens: a new payment or sweep, one of their txs (or the tx
+    # of an input they sweep) being added, mined or reorged, a timelock expiring,
+    # or the fee estimates moving by more than FEE_REPLAN_THRESHOLD.
 
-    SLEEP_INTERVAL = 1
+    SLEEP_INTERVAL = 1       # triggers received within that delay are handled in one pass
+    MAX_IDLE_INTERVAL = 60   # max time a batch waits for a trigger
+    FEE_REPLAN_THRESHOLD = 0.1
 
     def __init__(self, wallet: 'Abstract_Wallet'):
         Logger.__init__(self)
@@ -160,10 +167,57 @@ class TxBatcher(Logger):
     @log_exceptions
     async def run(self):
         self.taskgroup = OldTaskGroup()
-        for key, batch in self.tx_batches.items():
-            await self.taskgroup.spawn(self.run_batch(key, batch))
-        async with self.taskgroup as group:
-            await group.spawn(self.redeem_legacy_htlcs())
+        self.register_callbacks()
+        try:
+            for key, batch in self.tx_batches.items():
+                await self.taskgroup.spawn(self.run_batch(key, batch))
+            async with self.taskgroup as group:
+                await group.spawn(self.redeem_legacy_htlcs())
+        finally:
+            self.unregister_callbacks()
+
+    def _trigger_batches_for_tx(self, txid: str, tx: Optional[Transaction]) -> None:
+        for batch in list(self.tx_batches.values()):
+            if batch.is_affected_by_tx(txid, tx):
+                batch.trigger()
+
+    @event_listener
+    def on_event_adb_added_tx(self, adb, txid: str, tx: Transaction):
+        if adb == self.wallet.adb:
+            self._trigger_batches_for_tx(txid, tx)
+
+    @event_listener
+    def on_event_adb_removed_tx(self, adb, txid: str, tx: Transaction):
+        if adb == self.wallet.adb:
+            self._trigger_batches_for_tx(txid, tx)
+
+    @event_listener
+    def on_event_adb_added_verified_tx(self, adb, txid: str):
+        if adb == self.wallet.adb:
+            self._trigger_batches_for_tx(txid, adb.get_transaction(txid))
+
+    @event_listener
+    def on_event_adb_removed_verified_tx(self, adb, txid: str):
+        if adb == self.wallet.adb:
+            self._trigger_batches_for_tx(txid, adb.get_transaction(txid))
+
+    @event_listener
+    def on_event_blockchain_updated(self, *args):
+        if not self.wallet.network:
+            return
+        local_height = self.wallet.network.get_local_height()
+        for batch in list(self.tx_batches.values()):
+            batch.on_new_block(local_height)
+
+    @event_listener
+    def on_event_fee(self, *args):
+        for batch in list(self.tx_batches.values()):
+            batch.on_fee_update()
+
+    @event_listener
+    def on_event_fee_histogram(self, *args):
+        for batch in list(self.tx_batches.values()):
+            batch.on_fee_update()
 
     async def redeem_legacy_htlcs(self) -> None:
         while True:
@@ -242,6 +296,14 @@ class TxBatch(Logger):
         self._base_tx = None  # type: Optional[PartialTransaction]   # current batch tx. last element of batch_txids
         self._parent_tx = None  # type: Optional[PartialTransaction]
         self._unconfirmed_sweeps = set()  # type: Set[TxOutpoint]  # inputs we are sweeping (until spending tx is confirmed)
+        # scheduling. the first pass runs right away, e.g. to rebroadcast after a restart
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._wake_height = None  # type: Optional[int]  # height at which a sweep we wait for can be broadcast
+        self._planned_feerate = None  # type: Optional[int]  # sat/kvB, at the last pass
+        self._waiting_for_funds = False
+        # base tx from the wallet db, with wallet info added. reused as long as it is the base tx
+        self._enriched_base_tx = None  # type: Optional[PartialTransaction]
 
     @property
     def fee_policy(self) -> FeePolicy:
@@ -253,15 +315,61 @@ class TxBatch(Logger):
     @log_exceptions
     async def run(self) -> None:
         while not self.is_done():
-            await asyncio.sleep(self.wallet.txbatcher.SLEEP_INTERVAL)
+            await self._wait_for_trigger()
             if not (self.wallet.network and self.wallet.network.is_connected()):
                 continue
+            self._wakeup.clear()
             try:
                 await self.run_iteration()
             except Exception as e:
                 self.logger.exception(f'TxBatch error: {repr(e)}')
                 break
 
+    async def _wait_for_trigger(self) -> None:
+        try:
+            await util.wait_for2(self._wakeup.wait(), timeout=self.wallet.txbatcher.MAX_IDLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        # let triggers that arrive together be handled in one pass
+        await asyncio.sleep(self.wallet.txbatcher.SLEEP_INTERVAL)
+
+    def trigger(self) -> None:
+        self._wakeup.set()
+
+    def is_affected_by_tx(self, txid: str, tx: Optional[Transaction]) -> bool:
+        if self.is_done():
+            return False
+        if self.is_mine(txid) or self._waiting_for_funds:
+            return True
+        # a tx we sweep from, or the parent of our change
+        if any(prevout.txid.hex() == txid for prevout in list(self.batch_inputs)):
+            return True
+        if self._parent_tx and self._parent_tx.txid() == txid:
+            return True
+        # a tx that spends our inputs, e.g. a replacement of the base tx
+        if tx is not None:
+            for txin in tx.inputs():
+                if txin.prevout.to_str() == self._prevout or txin.prevout in self.batch_inputs:
+                    return True
+        return False
+
+    def on_new_block(self, local_height: int) -> None:
+        if self._wake_height is not None and local_height >= self._wake_height:
+            self.trigger()
+        elif self._batch_txids and self.wallet.adb.get_tx_height(self._batch_txids[-1]).height() == TX_HEIGHT_LOCAL:
+            # try to rebroadcast
+            self.trigger()
+
+    def on_fee_update(self) -> None:
+        if self.is_done():
+            return
+        feerate = self.fee_policy.fee_per_kb(self.wallet.network)
+        if feerate is None:
+            return
+        planned = self._planned_feerate
+        if planned is None or abs(feerate - planned) > planned * self.wallet.txbatcher.FEE_REPLAN_THRESHOLD:
+            self.trigger()
+
     def is_mine(self, txid: str) -> bool:
         return txid in self._batch_txids
 
@@ -269,6 +377,7 @@ class TxBatch(Logger):
     def add_payment_output(self, output: 'PartialTxOutput') -> None:
         # todo: maybe we should raise NotEnoughFunds here
         self.batch_payments.append(output)
+        self.trigger()
 
     def is_dust(self, sweep_info: SweepInfo) -> bool:
         """Can raise NoDynamicFeeEstimates."""
@@ -306,6 +415,7 @@ class TxBatch(Logger):
         self._unconfirmed_sweeps.add(txin.prevout)
         self.logger.info(f'add_sweep_info: {sweep_info.name} {sweep_info.txin.prevout.to_str()}')
         self.batch_inputs[txin.prevout] = sweep_info
+        self.trigger()
 
     @locked
     def _to_pay_after(self, tx: Optional[PartialTransaction]) -> Sequence[PartialTxOutput]:
@@ -382,11 +492,15 @@ class TxBatch(Logger):
             return None
         prev_txid, index = self._prevout.split(':')
         txid = self.wallet.adb.db.get_spent_outpoint(prev_txid, int(index))
-        tx = self.wallet.adb.get_transaction(txid) if txid else None
-        if not tx:
-            return None
-        tx = PartialTransaction.from_tx(tx)
-        tx.add_info_from_wallet(self.wallet)  # this sets is_change
+        if self._enriched_base_tx is not None and self._enriched_base_tx.txid() == txid:
+            tx = self._enriched_base_tx
+        else:
+            tx = self.wallet.adb.get_transaction(txid) if txid else None
+            if not tx:
+                return None
+            tx = PartialTransaction.from_tx(tx)
+            tx.add_info_from_wallet(self.wallet)  # this sets is_change
+            self._enriched_base_tx = tx
 
         if self.is_mine(txid):
             if self._base_tx is None:
@@ -410,6 +524,7 @@ class TxBatch(Logger):
         return self._base_tx
 
     async def run_iteration(self) -> None:
+        self._planned_feerate = self.fee_policy.fee_per_kb(self.wallet.network)
         base_tx = await self.find_base_tx()
         try:
             tx = self.create_next_transaction(base_tx)
@@ -486,18 +601,23 @@ class TxBatch(Logger):
         to_pay = self._to_pay_after(base_tx)
         to_sweep = self._to_sweep_after(base_tx)
         to_sweep_now = []  # type: list[SweepInfo]
+        self._wake_height = None
+        self._waiting_for_funds = False
         for k, v in to_sweep.items():
             can_broadcast, wanted_height = self._can_broadcast(v, base_tx)
             if can_broadcast:
                 to_sweep_now.append(v)
             else:
                 self.wallet.add_future_tx(v, wanted_height)
+                self._wake_height = min(wanted_height, self._wake_height or wanted_height)
         while True:
             if not to_pay and not to_sweep_now and not self._should_bump_fee(base_tx):
                 return None
             try:
                 tx = self._create_batch_tx(base_tx=base_tx, to_sweep=to_sweep_now, to_pay=to_pay)
             except NotEnoughFunds:
+                # retry when the coins of the wallet change
+                self._waiting_for_funds = True
                 if to_pay:
                     k = max(to_pay, key=lambda x: x.value)
                     self.logger.info(f'Not enough funds, removing output {k}')
@@ -553,7 +673,8 @@ class TxBatch(Logger):
         tx = self.wallet.make_unsigned_transaction(
             coins=coins,
             fee_policy=self.fee_policy,
-            base_tx=base_tx,
+            # base_tx gets its signatures removed, and its inputs are reused. keep ours for the next bump
+            base_tx=copy.deepcopy(base_tx),
             inputs=inputs,
             outputs=outputs,
             locktime=locktime,
@@ -580,6 +701,8 @@ class TxBatch(Logger):
         self._base_tx = None
         self._parent_tx = tx if use_change else None
         self._prevout = None
+        self._enriched_base_tx = None
+        self.trigger()
 
     @locked
     def _new_base_tx(self, tx: PartialTransaction) -> None:
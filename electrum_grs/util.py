@@ -1787,63 +1787,142 @@ def run_sync_function_on_asyncio_thread(func: Callable[[], Any], *, block: bool)
 class OrderedDictWithIndex(OrderedDict):
     """An OrderedDict that keeps track of the positions of keys.
 
-    Note: very inefficient to modify contents, except to add new items.
+    Positions are maintained lazily: removing or moving a key only
+    invalidates the positions of the keys after it, which get
+    recomputed on the next lookup. Appending and popping the last
+    item are O(1).
     """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, *args, **kwargs):
+        self._keys = []  # pos -> key
         self._key_to_pos = {}
-        self._pos_to_key = {}
+        self._num_valid = 0  # positions of self._keys[:self._num_valid] are up to date
+        super().__init__(*args, **kwargs)
 
-    def _recalc_index(self):
-        self._key_to_pos = {key: pos for (pos, key) in enumerate(self.keys())}
-        self._pos_to_key = {pos: key for (pos, key) in enumerate(self.keys())}
+    def _reindex(self):
+        key_to_pos = self._key_to_pos
+        keys = self._keys
+        for pos in range(self._num_valid, len(keys)):
+            key_to_pos[keys[pos]] = pos
+        self._num_valid = len(keys)
 
-    def pos_from_key(self, key):
-        return self._key_to_pos[key]
+    def _invalidate_from(self, pos: int):
+        self._num_valid = min(self._num_valid, pos)
 
-    def value_from_pos(self, pos):
-        key = self._pos_to_key[pos]
-        return self[key]
+    def _forget_key(self, key):
+        if key not in self._key_to_pos:
+            return  # already forgotten, e.g. pop() calling __delitem__
+        pos = self.pos_from_key(key)
+        del self._keys[pos]
+        del self._key_to_pos[key]
+        self._invalidate_from(pos)
 
-    def popitem(self, *args, **kwargs):
-        ret = super().popitem(*args, **kwargs)
-        self._recalc_index()
-        return ret
+    def pos_from_key(self, key):
+        pos = self._key_to_pos[key]
+        if pos >= self._num_valid:
+            self._reindex()
+            pos = self._key_to_pos[key]
+        return pos
 
-    def move_to_end(self, *args, **kwargs):
-        ret = super().move_to_end(*args, **kwargs)
-        self._recalc_index()
-        return ret
+    def value_from_pos(self, pos):
+        if not 0 <= pos < len(self._keys):
+            raise KeyError(pos)
+        return self[self._keys[pos]]
+
+    def key_from_pos(self, pos):
+        if not 0 <= pos < len(self._keys):
+            raise KeyError(pos)
+        return self._keys[pos]
+
+    def popitem(self, last=True):
+        key, value = super().popitem(last=last)
+        self._forget_key(key)
+        return key, value
+
+    def move_to_end(self, key, last=True):
+        super().move_to_end(key, last=last)
+        pos = self.pos_from_key(key)
+        del self._keys[pos]
+        if last:
+            self._keys.append(key)
+            self._invalidate_from(pos)
+        else:
+            self._keys.insert(0, key)
+            self._invalidate_from(0)
+        self._key_to_pos[key] = len(self._keys)  # stale on purpose, recomputed on lookup
 
     def clear(self):
-        ret = super().clear()
-        self._recalc_index()
+        super().clear()
+        self._keys.clear()
+        self._key_to_pos.clear()
+        self._num_valid = 0
+
+    def pop(self, key, *args):
+        is_present = key in self
+        ret = super().pop(key, *args)
+        if is_present:
+            self._forget_key(key)
         return ret
 
-    def pop(self, *args, **kwargs):
-        ret = super().pop(*args, **kwargs)
-        self._recalc_index()
-        return ret
-
-    def update(self, *args, **kwargs):
-        ret = super().update(*args, **kwargs)
-        self._recalc_index()
-        return ret
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._forget_key(key)
 
-    def __delitem__(self, *args, **kwargs):
-        ret = super().__delitem__(*args, **kwargs)
-        self._recalc_index()
-        return ret
-
-    def __setitem__(self, key, *args, **kwargs):
+    def __setitem__(self, key, value):
         is_new_key = key not in self
-        ret = super().__setitem__(key, *args, **kwargs)
+        super().__setitem__(key, value)
         if is_new_key:
-            pos = len(self) - 1
+            pos = len(self._keys)
+            self._keys.append(key)
             self._key_to_pos[key] = pos
-            self._pos_to_key[pos] = key
-        return ret
+            if self._num_valid == pos:
+                self._num_valid += 1
+
+    def __reduce__(self):
+        return type(self), (list(self.items()),)
+
+
+def keyed_diff(old_keys: Sequence, new_keys: Sequence) -> List[Tuple[str, int, int]]:
+    """Returns the row operations that turn the list old_keys into new_keys.
+
+    Operations are ('remove', pos, count) and ('insert', pos, count), with
+    positions in the list as it is after applying the previous operations.
+    An insert at pos inserts new_keys[pos:pos+count]. Keys present in both
+    lists and in the same relative order are kept; keys that moved are
+    removed and inserted again. Runs in O(len(old_keys) + len(new_keys)).
+    """
+    ops = []
+    new_set = set(new_keys)
+    pending = {key for key in old_keys if key in new_set}  # old keys that are yet to be matched
+    i = j = 0
+    while i < len(old_keys) or j < len(new_keys):
+        if i < len(old_keys) and old_keys[i] not in pending:
+            start = i
+            while i < len(old_keys) and old_keys[i] not in pending:
+                i += 1
+            ops.append(('remove', j, i - start))
+        elif i < len(old_keys) and j < len(new_keys) and old_keys[i] == new_keys[j]:
+            pending.discard(old_keys[i])
+            i += 1
+            j += 1
+        elif j < len(new_keys) and new_keys[j] not in pending:
+            start = j
+            while j < len(new_keys) and new_keys[j] not in pending:
+                j += 1
+            ops.append(('insert', start, j - start))
+        else:
+            # old_keys[i] shows up later in new_keys: it moved
+            pending.discard(old_keys[i])
+            ops.append(('remove', j, 1))
+            i += 1
+    # merge adjacent removes
+    merged = []
+    for op in ops:
+        if merged and op[0] == 'remove' and merged[-1][0] == 'remove' and merged[-1][1] == op[1]:
+            merged[-1] = ('remove', op[1], merged[-1][2] + op[2])
+        else:
+            merged.append(op)
+    return merged
 
 
 T = typing.TypeVar("T")
@@ -2217,6 +2296,8 @@ class JsonRPCError(Exception):
         # application-specific error codes
         USERFACING = 1
         INTERNAL = 2
+        # JSON-RPC 2.0 error codes
+        INVALID_REQUEST = -32600
 
     def __init__(self, *, code: int, message: str, data: Optional[dict] = None):
         Exception.__init__(self)
@@ -34,7 +34,7 @@ import math
 from functools import partial
 from collections import defaultdict
 from decimal import Decimal
-from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable, Mapping
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable, Mapping, Callable
 from abc import ABC, abstractmethod
 import itertools
 import threading
@@ -46,7 +46,7 @@ import electrum_ecc as ecc
 from aiorpcx import ignore_after, run_in_thread
 
 from . import util, keystore, transaction, bitcoin, coinchooser, bip32, descriptor
-from . import constants
+from . import constants, startup_trace
 from .i18n import _
 from .bip32 import BIP32Node, convert_bip32_intpath_to_strpath, convert_bip32_strpath_to_intpath
 from .logging import get_logger, Logger
@@ -77,16 +77,17 @@ from .address_synchronizer import (
 from .invoices import BaseInvoice, Invoice, Request, PR_PAID, PR_UNPAID, PR_EXPIRED, PR_UNCONFIRMED
 from .contacts import Contacts
 from .mnemonic import Mnemonic
-from .lnworker import LNWallet
 from .lnutil import MIN_FUNDING_SAT, RECEIVED, SENT
 from .lntransport import extract_nodeid
 from .descriptor import Descriptor
 from .txbatcher import TxBatcher
-from .submarine_swaps import MIN_SWAP_AMOUNT_SAT
+from .request_index import RequestStatusIndex
+from .cost_basis import CostBasisEngine, CostBasisEvent, CostBasisResult
 
 if TYPE_CHECKING:
     from .network import Network
     from .exchange_rate import FxThread
+    from .lnworker import LNWallet
     from .submarine_swaps import SwapData
     from .lnchannel import AbstractChannel
     from .lnsweep import SweepInfo
@@ -424,6 +425,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         self._tx_parents_cache = {}
         self._paid_invoice_keys_cache = set()  # type: Set[str]
         self._coin_price_cache = {}
+        self._cost_basis_engines = {}  # type: Dict[Tuple[str, str, bool], CostBasisEngine]  # (method, ccy, include_lightning) -> engine
+        self._cost_basis_lock = threading.RLock()
         self._default_labels = {}
         self._accounting_addresses = set()  # addresses counted as ours after successful sweep
 
@@ -446,6 +449,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         self.load_keystore()
         self.txbatcher = TxBatcher(self)
         self._init_lnworker()
+        self.request_index = RequestStatusIndex(self)
         self._init_requests_rhash_index()
         self._prepare_onchain_invoice_paid_detection()
         self._calc_unused_change_addresses()
@@ -476,6 +480,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 await group.spawn(asyncio.Event().wait)  # run forever (until cancel)
                 await group.spawn(self.do_synchronize_loop())
                 await group.spawn(self.txbatcher.run())
+                await group.spawn(self.request_index.run())
         except Exception as e:
             self.logger.exception("taskgroup died.")
         finally:
@@ -558,10 +563,14 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             node = BIP32Node.from_rootseed(seed, xtype='standard')
             ln_xprv = node.to_xprv()
             self.db.put('lightning_privkey2', ln_xprv)
-        self.lnworker = LNWallet(self, ln_xprv)
+        from .lnworker import LNWallet
+        with startup_trace.span('lnworker'):
+            self.lnworker = LNWallet(self, ln_xprv)
         self.save_db()
         if self.network:
             self._start_network_lightning()
+            # prepare lightning functionality, also load channel db (see Daemon.add_wallet)
+            self.network.start_gossip()
 
     async def stop(self):
         """Stop all networking and save DB to disk."""
@@ -589,8 +598,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         return self._up_to_date
 
     def tx_is_related(self, tx):
-        is_mine = any([self.is_mine(out.address) for out in tx.outputs()])
-        is_mine |= any([self.is_mine(self.adb.get_txin_address(txin)) for txin in tx.inputs()])
+        is_mine = any([self.is_mine(self.adb.get_txout_address(out, prefilter=True)) for out in tx.outputs()])
+        is_mine |= any([self.is_mine(self.adb.get_txin_address(txin, prefilter=True)) for txin in tx.inputs()])
         return is_mine
 
     def clear_tx_parents_cache(self):
@@ -660,6 +669,18 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         if tx := self.db.get_transaction(tx_hash):
             self._update_invoices_and_reqs_touched_by_tx(tx)
 
+    @event_listener
+    def on_event_blockchain_updated(self, *args):
+        for key, status in self.request_index.refresh_unconfirmed().items():
+            util.trigger_callback('request_status', self, key, status)
+
+    @event_listener
+    def on_event_request_status(self, wallet, key, status):
+        # e.g. paid on lightning
+        if wallet != self:
+            return
+        self.request_index.refresh([key], onchain=False)
+
     @event_listener
     def on_event_invoice_status(self, wallet, key, status):
         # keep _paid_invoice_keys_cache in sync with all invoice status changes
@@ -673,6 +694,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
     def clear_history(self):
         self.adb.clear_history()
         self._paid_invoice_keys_cache.clear()
+        self.request_index.clear()
         self.save_db()
 
     def start_network(self, network: 'Network'):
@@ -762,6 +784,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     self._labels.pop(name)
                     changed = True
         if changed:
+            if self.lnworker:
+                self.lnworker.clear_lightning_history_cache(name)
             run_hook('set_label', self, name, text)
         return changed
 
@@ -1101,7 +1125,10 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         return self.adb.get_balance(domain, **kwargs)
 
     def anchor_reserve(self) -> int:
-        if self.lnworker is None or not isinstance(self.lnworker, LNWallet):
+        if self.lnworker is None:
+            return 0
+        from .lnworker import LNWallet
+        if not isinstance(self.lnworker, LNWallet):
             return 0
         if not self.lnworker.has_anchor_channels():
             return 0
@@ -1311,6 +1338,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
     def clear_requests(self):
         self._receive_requests.clear()
         self._requests_addr_to_key.clear()
+        self.request_index.clear()
         self.save_db()
 
     def get_invoices(self) -> List[Invoice]:
@@ -1366,9 +1394,29 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         # self._requests_addr_to_key may contain addresses that can be reused
         # this is checked in get_request_by_address
         self._requests_addr_to_key = defaultdict(set)  # type: Dict[str, Set[str]]
+        # scripts of the addresses of requests that are not in adb (e.g. imported requests).
+        # see _get_txo_address_of_request
+        self._foreign_requests_scripts = set()  # type: Set[bytes]
         for req in self._receive_requests.values():
             if addr := req.get_address():
-                self._requests_addr_to_key[addr].add(req.get_id())
+                self._add_request_address(addr, req.get_id())
+
+    def _add_request_address(self, addr: str, request_id: str) -> None:
+        self._requests_addr_to_key[addr].add(request_id)
+        if not self.adb.is_mine(addr):
+            try:
+                self._foreign_requests_scripts.add(bitcoin.address_to_script(addr))
+            except BitcoinException:
+                pass  # not an address of this chain: no output pays to it
+
+    def _get_txo_address_of_request(self, txo: TxOutput) -> Optional[str]:
+        """Returns the address of txo if it might be the address of a request.
+        Outputs that pay neither to our addresses nor to a foreign request are
+        skipped without deriving their address.
+        """
+        if txo.scriptpubkey in self._foreign_requests_scripts:
+            return txo.address
+        return self.adb.get_txout_address(txo, prefilter=True)
 
     def _prepare_onchain_invoice_paid_detection(self):
         self._invoices_from_txid_map = defaultdict(set)  # type: Dict[str, Set[str]]
@@ -1531,30 +1579,132 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             item['value'] = item.get('bc_value', Satoshis(0)) + item.get('ln_value', Satoshis(0))
             for child in item.get('children', []):
                 child['value'] = child.get('bc_value', Satoshis(0)) + child.get('ln_value', Satoshis(0))
-            if not include_fiat:
-                continue
+        if not include_fiat:
+            return transactions
+        cost_basis = self.get_cost_basis(
+            fx, include_lightning=include_lightning,
+            full_history=transactions if onchain_domain is None and include_lightning else None)
+        price_func = self.get_batched_price_func(
+            fx, [x['timestamp'] or now for item in transactions.values() for x in [item] + item.get('children', [])])
+        for key, item in transactions.items():
+            children = item.get('children', [])
             # add fiat values to both the root item and its children
             for add_fiat_item in [item] + children:
                 value = add_fiat_item['value'].value
                 txid = add_fiat_item.get('txid')
+                # events of the 'utxo' method are on-chain txs, the other methods use the rows of the history
+                item_cost_basis = cost_basis.get(key) if add_fiat_item is item else None
+                if item_cost_basis is None and txid:
+                    item_cost_basis = cost_basis.get(txid)
                 if not add_fiat_item.get('lightning') and txid:
-                    fiat_fields = self.get_tx_item_fiat(tx_hash=txid, amount_sat=value, fx=fx, tx_fee=add_fiat_item['fee_sat'])
+                    fiat_fields = self.get_tx_item_fiat(
+                        tx_hash=txid, amount_sat=value, fx=fx, tx_fee=add_fiat_item['fee_sat'], cost_basis=item_cost_basis,
+                        price_func=price_func)
                     add_fiat_item.update(fiat_fields)
                 else:
                     timestamp = add_fiat_item['timestamp'] or now
-                    fiat_value = value / Decimal(bitcoin.COIN) * fx.timestamp_rate(timestamp)
+                    fiat_value = value / Decimal(bitcoin.COIN) * price_func(timestamp)
                     add_fiat_item['fiat_value'] = Fiat(fiat_value, fx.ccy)
                     add_fiat_item['fiat_default'] = True
+                    if item_cost_basis is not None and item_cost_basis.acquisition_price is not None:
+                        add_fiat_item['acquisition_price'] = Fiat(item_cost_basis.acquisition_price, fx.ccy)
+                        add_fiat_item['capital_gain'] = Fiat(item_cost_basis.capital_gain, fx.ccy)
         return transactions
 
+    def get_cost_basis_events(
+            self,
+            fx: 'FxThread',
+            *,
+            method: str,
+            include_lightning: bool,
+            full_history: OrderedDictWithIndex = None,  # get_full_history(include_lightning=True), if already built
+    ) -> List[CostBasisEvent]:
+        """Returns the balance changes of the wallet, oldest first, see cost_basis.py"""
+        events = []
+        if method != 'utxo' and include_lightning and self.lnworker:
+            if full_history is None:
+                full_history = self.get_full_history(include_lightning=True)
+            # channel opens/closes and swaps are netted with their on-chain tx, as in the history
+            for key, item in full_history.items():
+                txid = item.get('txid') if not item.get('lightning') and 'children' not in item else None
+                events.append(CostBasisEvent(
+                    key=key,
+                    timestamp=item.get('timestamp') or None,
+                    amount_sat=item['value'].value,
+                    fiat_value=self.get_fiat_value(txid, fx.ccy) if txid else None,
+                ))
+            return events
+        for txid, hist_item in self.get_onchain_history().items():
+            inputs = ()
+            if method == 'utxo':
+                inputs = tuple(
+                    (ser.split(':')[0], v)
+                    for addr in self.db.get_txi_addresses(txid)
+                    for ser, v in self.db.get_txi_addr(txid, addr))
+            events.append(CostBasisEvent(
+                key=txid,
+                timestamp=hist_item.tx_mined_status.timestamp,
+                amount_sat=hist_item.amount_sat,
+                fiat_value=self.get_fiat_value(txid, fx.ccy),
+                inputs=inputs,
+            ))
+        return events
+
+    def _update_cost_basis(
+            self,
+            fx: 'FxThread',
+            *,
+            method: str = None,
+            include_lightning: bool = False,
+            full_history: OrderedDictWithIndex = None,
+    ) -> Tuple[CostBasisEngine, List[CostBasisEvent], List[CostBasisResult]]:
+        if method is None:
+            method = self.config.FX_CAPITAL_GAINS_METHOD
+        if method == 'utxo':
+            include_lightning = False
+        events = self.get_cost_basis_events(
+            fx, method=method, include_lightning=include_lightning, full_history=full_history)
+        with self._cost_basis_lock:
+            engine_key = (method, fx.ccy, include_lightning)
+            engine = self._cost_basis_engines.get(engine_key)
+            if engine is None:
+                engine = self._cost_basis_engines[engine_key] = CostBasisEngine(method, fx.timestamp_rate)
+            engine.price_func = fx.timestamp_rate
+            engine.rates_func = fx.rates_for_timestamps
+            results = engine.update(events)
+        return engine, events, results
+
+    def get_cost_basis(
+            self,
+            fx: 'FxThread',
+            *,
+            method: str = None,
+            include_lightning: bool = False,
+            full_history: OrderedDictWithIndex = None,  # see get_cost_basis_events
+    ) -> Dict[str, CostBasisResult]:
+        """Returns the cost basis result of each history item, by txid (or history key).
+        method defaults to the one set in the config.
+        """
+        engine, events, results = self._update_cost_basis(
+            fx, method=method, include_lightning=include_lightning, full_history=full_history)
+        return {event.key: result for event, result in zip(events, results)}
+
     @profiler
-    def get_onchain_capital_gains(self, fx, **kwargs):
-        # History with capital gains, using utxo pricing
-        # FIXME: Lightning capital gains would requires FIFO
+    def get_onchain_capital_gains(self, fx, *, method: str = None, **kwargs):
+        # History with capital gains. method defaults to the one set in the config, see cost_basis.py
+        # note: this only considers on-chain txs, also with methods that could include lightning
         from_timestamp = kwargs.get('from_timestamp')
         to_timestamp = kwargs.get('to_timestamp')
         history = self.get_onchain_history(**kwargs)
         show_fiat = fx and fx.is_enabled() and fx.has_history()
+        if show_fiat:
+            # the cost basis depends on the history before the requested range
+            if method is None:
+                method = self.config.FX_CAPITAL_GAINS_METHOD
+            engine, events, results = self._update_cost_basis(fx, method=method)
+            cost_basis = {event.key: result for event, result in zip(events, results)}
+            event_pos = {event.key: i for i, event in enumerate(events)}
+            price_func = self.get_batched_price_func(fx, [hitem.tx_mined_status.timestamp for hitem in history.values()])
         out = []
         income = 0
         expenditures = 0
@@ -1576,7 +1726,9 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 income += value
             # fiat computations
             if show_fiat:
-                fiat_fields = self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee)
+                fiat_fields = self.get_tx_item_fiat(
+                    tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee, cost_basis=cost_basis.get(tx_hash),
+                    price_func=price_func)
                 fiat_value = fiat_fields['fiat_value'].value
                 if value < 0:
                     capital_gains += fiat_fields['capital_gain'].value
@@ -1614,7 +1766,15 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 confirmed_spending_only=True,
                 nonlocal_only=True)
 
-            def summary_point(timestamp, height, balance, coins):
+            def acquisition_price(coins, last_event_pos: int) -> Decimal:
+                if method == 'utxo':
+                    with self._cost_basis_lock:
+                        return Decimal(sum(
+                            engine.coin_cost(coin.prevout.txid.hex(), self.adb.get_txin_value(coin))
+                            for coin in coins))
+                return results[last_event_pos].holding_cost if last_event_pos >= 0 else Decimal(0)
+
+            def summary_point(timestamp, height, balance, coins, last_event_pos):
                 date = timestamp_to_datetime(timestamp)
                 out = {
                     'date': date,
@@ -1622,7 +1782,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     'GRS_balance': Satoshis(balance),
                 }
                 if show_fiat:
-                    ap = self.acquisition_price(coins, fx.timestamp_rate, fx.ccy)
+                    ap = acquisition_price(coins, last_event_pos)
                     lp = self.liquidation_price(coins, fx.timestamp_rate, timestamp)
                     out['acquisition_price'] = Fiat(ap, fx.ccy)
                     out['liquidation_price'] = Fiat(lp, fx.ccy)
@@ -1631,8 +1791,10 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     out['GRS_fiat_price'] = Fiat(fx.historical_value(COIN, date), fx.ccy)
                 return out
 
-            summary_start = summary_point(start_timestamp, start_height, start_balance, start_coins)
-            summary_end = summary_point(end_timestamp, end_height, end_balance, end_coins)
+            start_pos = event_pos[first_item['txid']] - 1 if show_fiat else None
+            end_pos = event_pos[last_item['txid']] if show_fiat else None
+            summary_start = summary_point(start_timestamp, start_height, start_balance, start_coins, start_pos)
+            summary_end = summary_point(end_timestamp, end_height, end_balance, end_coins, end_pos)
             flow = {
                 'GRS_incoming': Satoshis(income),
                 'GRS_outgoing': Satoshis(expenditures)
@@ -1642,6 +1804,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 flow['fiat_incoming'] = Fiat(fiat_income, fx.ccy)
                 flow['fiat_outgoing'] = Fiat(fiat_expenditures, fx.ccy)
                 flow['realized_capital_gains'] = Fiat(capital_gains, fx.ccy)
+                flow['cost_basis_method'] = method
             summary = {
                 'begin': summary_start,
                 'end': summary_end,
@@ -1659,8 +1822,19 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         p = price_func(timestamp)
         return sum([coin.value_sats() for coin in coins]) * p / Decimal(COIN)
 
-    def default_fiat_value(self, tx_hash, fx, value_sat):
-        return value_sat / Decimal(COIN) * self.price_at_timestamp(tx_hash, fx.timestamp_rate)
+    def default_fiat_value(self, tx_hash, fx, value_sat, *, price_func=None):
+        return value_sat / Decimal(COIN) * self.price_at_timestamp(tx_hash, price_func or fx.timestamp_rate)
+
+    @staticmethod
+    def get_batched_price_func(fx: 'FxThread', timestamps: Iterable[Optional[float]]) -> Callable[[float], Decimal]:
+        """Returns fx.timestamp_rate, with the rates for the given timestamps looked up at once."""
+        timestamps = list({ts for ts in timestamps if ts})
+        rates = dict(zip(timestamps, fx.rates_for_timestamps(timestamps)))
+
+        def price_func(timestamp: float) -> Decimal:
+            rate = rates.get(timestamp)
+            return rate if rate is not None else fx.timestamp_rate(timestamp)
+        return price_func
 
     def get_tx_item_fiat(
             self,
@@ -1669,12 +1843,16 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             amount_sat: int,
             fx: 'FxThread',
             tx_fee: Optional[int],
+            cost_basis: Optional[CostBasisResult] = None,  # see get_cost_basis
+            price_func: Callable[[float], Decimal] = None,  # see get_batched_price_func
     ) -> Dict[str, Any]:
+        if price_func is None:
+            price_func = fx.timestamp_rate
         item = {}
         fiat_value = self.get_fiat_value(tx_hash, fx.ccy)
         fiat_default = fiat_value is None
-        fiat_rate = self.price_at_timestamp(tx_hash, fx.timestamp_rate)
-        fiat_value = fiat_value if fiat_value is not None else self.default_fiat_value(tx_hash, fx, amount_sat)
+        fiat_rate = self.price_at_timestamp(tx_hash, price_func)
+        fiat_value = fiat_value if fiat_value is not None else self.default_fiat_value(tx_hash, fx, amount_sat, price_func=price_func)
         fiat_fee = tx_fee / Decimal(COIN) * fiat_rate if tx_fee is not None else None
         item['fiat_currency'] = fx.ccy
         item['fiat_rate'] = Fiat(fiat_rate, fx.ccy)
@@ -1682,7 +1860,10 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         item['fiat_fee'] = Fiat(fiat_fee, fx.ccy) if fiat_fee is not None else None
         item['fiat_default'] = fiat_default
         if amount_sat < 0:
-            acquisition_price = - amount_sat / Decimal(COIN) * self.average_price(tx_hash, fx.timestamp_rate, fx.ccy)
+            if cost_basis is not None and cost_basis.acquisition_price is not None:
+                acquisition_price = cost_basis.acquisition_price
+            else:
+                acquisition_price = - amount_sat / Decimal(COIN) * self.average_price(tx_hash, price_func, fx.ccy)
             liquidation_price = - fiat_value
             item['acquisition_price'] = Fiat(acquisition_price, fx.ccy)
             cg = liquidation_price - acquisition_price
@@ -2017,8 +2198,8 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 i_max_sum += weight
                 i_max.append((weight, i))
 
+        self.add_inputs_and_outputs_info(coins, [])
         for txin in coins:
-            self.add_input_info(txin)
             nSequence = 0xffffffff - (2 if rbf else 1)
             txin.nsequence = nSequence
 
@@ -2411,7 +2592,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                  if c.prevout.txid.hex() not in self.adb.get_conflicting_transactions(tx, include_self=True)]
         for item in coins:
             item.nsequence = 0xffffffff - 2
-            self.add_input_info(item)
+        self.add_inputs_and_outputs_info(coins, [])
         def fee_estimator(size):
             return FeePolicy.estimate_fee_for_feerate(fee_per_kb=new_fee_rate*1000, size=size)
         coin_chooser = coinchooser.get_coin_chooser(self.config)
@@ -2633,9 +2814,14 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         tx_new.add_info_from_wallet(self)
         return tx_new
 
-    def _add_txinout_derivation_info(self, txinout: Union[PartialTxInput, PartialTxOutput],
-                                     address: str, *, only_der_suffix: bool) -> None:
-        pass  # implemented by subclasses
+    def _get_txinout_derivation_info(
+            self,
+            address: str,
+            *,
+            only_der_suffix: bool,
+    ) -> Dict[bytes, Tuple[bytes, Sequence[int]]]:
+        """Returns the bip32_paths of a txin/txout of address: pubkey -> (fingerprint, derivation)"""
+        return {}  # implemented by subclasses
 
     def _add_input_utxo_info(
             self,
@@ -2684,22 +2870,68 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         That is, network requests are *not* done to fetch missing prev txs!
         For that, use txin.add_info_from_network.
         """
-        # note: we add input utxos regardless of is_mine
-        if txin.utxo is None:
-            txin.utxo = self.db.get_transaction(txin.prevout.txid.hex())
-        if not isinstance(txin, PartialTxInput):
-            return
-        address = self.adb.get_txin_address(txin)
-        self._add_input_utxo_info(txin, address=address)
-        is_mine = self.is_mine(address)
-        if not is_mine:
-            is_mine = self._learn_derivation_path_for_address_from_txinout(txin, address)
-        if not is_mine:
-            return
-        txin.script_descriptor = self.get_script_descriptor_for_address(address)
-        txin.is_mine = True
-        self._add_txinout_derivation_info(txin, address, only_der_suffix=only_der_suffix)
-        txin.block_height = self.adb.get_tx_height(txin.prevout.txid.hex()).height()
+        self.add_inputs_and_outputs_info([txin], [], only_der_suffix=only_der_suffix)
+
+    def add_inputs_and_outputs_info(
+            self,
+            txins: Sequence[TxInput],
+            txouts: Sequence[PartialTxOutput],
+            *,
+            only_der_suffix: bool = False,
+    ) -> None:
+        """Same as add_input_info and add_output_info, for many txins and txouts.
+        The script descriptor and bip32 paths of an address, and the prev tx and
+        height of a txid, are looked up once, for all the txins/txouts that have them.
+        """
+        addr_info = {}  # type: Dict[str, Tuple[Optional[Descriptor], Dict[bytes, Tuple[bytes, Sequence[int]]]]]
+        prev_txs = {}  # type: Dict[str, Optional[Transaction]]
+        tx_heights = {}  # type: Dict[str, int]
+
+        def get_addr_info(txinout: Union[PartialTxInput, PartialTxOutput], address: Optional[str]):
+            if address and (info := addr_info.get(address)):
+                return info
+            if not self.is_mine(address):
+                if not self._learn_derivation_path_for_address_from_txinout(txinout, address):
+                    return None
+            info = (
+                self.get_script_descriptor_for_address(address),
+                self._get_txinout_derivation_info(address, only_der_suffix=only_der_suffix),
+            )
+            if address:
+                addr_info[address] = info
+            return info
+
+        def set_addr_info(txinout: Union[PartialTxInput, PartialTxOutput], info) -> None:
+            desc, bip32_paths = info
+            # note: descriptors are not modified, they can be shared
+            txinout.script_descriptor = desc
+            txinout.is_mine = True
+            for pubkey, (fp_bytes, der_full) in bip32_paths.items():
+                txinout.bip32_paths[pubkey] = (fp_bytes, list(der_full))
+
+        for txin in txins:
+            txid = txin.prevout.txid.hex()
+            # note: we add input utxos regardless of is_mine
+            if txin.utxo is None:
+                if txid not in prev_txs:
+                    prev_txs[txid] = self.db.get_transaction(txid)
+                txin.utxo = prev_txs[txid]
+            if not isinstance(txin, PartialTxInput):
+                continue
+            address = self.adb.get_txin_address(txin)
+            self._add_input_utxo_info(txin, address=address)
+            if (info := get_addr_info(txin, address)) is None:
+                continue
+            set_addr_info(txin, info)
+            if txid not in tx_heights:
+                tx_heights[txid] = self.adb.get_tx_height(txid).height()
+            txin.block_height = tx_heights[txid]
+        for txout in txouts:
+            address = txout.address
+            if (info := get_addr_info(txout, address)) is None:
+                continue
+            set_addr_info(txout, info)
+            txout.is_change = self.is_change(address)
 
     def has_support_for_slip_19_ownership_proofs(self) -> bool:
         return False
@@ -2760,15 +2992,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         return False
 
     def add_output_info(self, txout: PartialTxOutput, *, only_der_suffix: bool = False) -> None:
-        address = txout.address
-        if not self.is_mine(address):
-            is_mine = self._learn_derivation_path_for_address_from_txinout(txout, address)
-            if not is_mine:
-                return
-        txout.script_descriptor = self.get_script_descriptor_for_address(address)
-        txout.is_mine = True
-        txout.is_change = self.is_change(address)
-        self._add_txinout_derivation_info(txout, address, only_der_suffix=only_der_suffix)
+        self.add_inputs_and_outputs_info([], [txout], only_der_suffix=only_der_suffix)
 
     def sign_transaction(
             self,
@@ -2878,6 +3102,9 @@ class Abstract_Wallet(ABC, Logger, EventListener):
     def delete_address(self, address: str) -> None:
         raise UserFacingException("this wallet cannot delete addresses")
 
+    def delete_addresses(self, addresses: Iterable[str]) -> None:
+        raise UserFacingException("this wallet cannot delete addresses")
+
     def get_request_URI(self, req: Request) -> Optional[str]:
         return req.get_bip21_URI(lightning_invoice=None)
 
@@ -2898,7 +3125,10 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             status = self.lnworker.get_invoice_status(invoice)
             if status != PR_UNPAID:
                 return self.check_expired_status(invoice, status)
-        paid, conf = self.is_onchain_invoice_paid(invoice)
+        if isinstance(invoice, Request):
+            paid, conf, _ = self.request_index.get_onchain_info(invoice)
+        else:
+            paid, conf = self.is_onchain_invoice_paid(invoice)
         if not paid:
             if isinstance(invoice, Invoice):
                 if status := invoice.get_broadcasting_status():
@@ -2965,7 +3195,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             d['URI'] = self.get_request_URI(x)
             # if request was paid onchain, add relevant fields
             # note: addr is reused when getting paid on LN! so we check for that.
-            _, conf, tx_hashes = self._is_onchain_invoice_paid(x)
+            _, conf, tx_hashes = self.request_index.get_onchain_info(x)
             if not x.is_lightning() or not self.lnworker or self.lnworker.get_invoice_status(x) != PR_PAID:
                 if conf is not None:
                     d['confirmations'] = conf
@@ -2997,7 +3227,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         invoice_keys = set()
         with self.lock:
             for txo in tx.outputs():
-                addr = txo.address
+                addr = self._get_txo_address_of_request(txo)
                 if request := self.get_request_by_addr(addr):
                     request_keys.add(request.get_id())
                 for invoice_key in self._invoices_from_scriptpubkey_map.get(txo.scriptpubkey, set()):
@@ -3008,8 +3238,14 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         # FIXME in some cases if tx2 replaces unconfirmed tx1 in the mempool, we are not called.
         #       For a given receive request, if tx1 touches it but tx2 does not, then
         #       we were called when tx1 was added, but we will not get called when tx2 replaces tx1.
+        # update the status index first. expired requests are included, as they can still get paid
+        with self.lock:
+            keys = set()
+            for txo in tx.outputs():
+                keys.update(self._requests_addr_to_key.get(self._get_txo_address_of_request(txo), ()))
+        changed = self.request_index.refresh(keys, onchain=True)
         request_keys, invoice_keys = self.get_invoices_and_requests_touched_by_tx(tx)
-        for key in request_keys:
+        for key in request_keys | set(changed):
             request = self.get_request(key)
             if not request:
                 continue
@@ -3082,7 +3318,11 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         request_id = req.get_id()
         self._receive_requests[request_id] = req
         if addr := req.get_address():
-            self._requests_addr_to_key[addr].add(request_id)
+            self._add_request_address(addr, request_id)
+        self.request_index.add(req)
+        if req.is_lightning() and self.lnworker:
+            # default label, see get_label_for_rhash
+            self.lnworker.clear_lightning_history_cache(req.rhash)
         if write_to_disk:
             self.save_db()
         return request_id
@@ -3095,8 +3335,11 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         self._receive_requests.pop(request_id, None)
         if addr := req.get_address():
             self._requests_addr_to_key[addr].discard(request_id)
+        self.request_index.remove(request_id)
         if req.is_lightning() and self.lnworker:
             self.lnworker.delete_payment_info(req.rhash, direction=RECEIVED)
+            # default label, see get_label_for_rhash
+            self.lnworker.clear_lightning_history_cache(req.rhash)
         if write_to_disk:
             self.save_db()
 
@@ -3116,22 +3359,32 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         out = [x for x in out if x is not None]
         return out
 
-    def get_sorted_requests(self) -> List[Request]:
-        """ sorted by timestamp """
-        out = self.get_requests()
+    def get_sorted_requests(self, *, status: Optional[int] = None) -> List[Request]:
+        """ sorted by timestamp. if status is set, only requests with that status """
+        if status is None:
+            out = self.get_requests()
+        else:
+            out = [self.get_request(x) for x in self.request_index.get_keys(status)]
+            out = [x for x in out if x is not None]
         out.sort(key=lambda x: x.time)
         return out
 
     def get_unpaid_requests(self) -> List[Request]:
-        out = [x for x in self._receive_requests.values() if self.get_invoice_status(x) != PR_PAID]
+        paid_keys = self.request_index.get_keys(PR_PAID)
+        out = [x for k, x in self._receive_requests.items() if k not in paid_keys]
         out.sort(key=lambda x: x.time)
         return out
 
     def delete_expired_requests(self):
-        keys = [k for k, v in self._receive_requests.items() if self.get_invoice_status(v) == PR_EXPIRED]
+        keys = [k for k in self.request_index.get_keys(PR_EXPIRED)
+                if (req := self.get_request(k)) and self.get_invoice_status(req) == PR_EXPIRED]
         self.delete_requests(keys)
         return keys
 
+    def check_request_status_index(self) -> List[str]:
+        """Compares the request status index with a full recomputation. Returns the differences."""
+        return self.request_index.check()
+
     def delete_requests(self, keys):
         for key in keys:
             self.delete_request(key, write_to_disk=False)
@@ -3519,6 +3772,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     ln_is_error = True
                     ln_help = _('You must be online to receive Lightning payments.')
                 elif not can_receive_lightning or (amount_sat <= 0 and not lightning_has_channels):
+                    from .submarine_swaps import MIN_SWAP_AMOUNT_SAT
                     ln_rebalance_suggestion = self.lnworker.suggest_rebalance_to_receive(amount_sat)
                     ln_swap_suggestion = self.lnworker.suggest_swap_to_receive(max(amount_sat, MIN_SWAP_AMOUNT_SAT))
                     # prefer to use swaps over JIT channels if possible
@@ -3840,7 +4094,7 @@ class Imported_Wallet(Simple_Wallet):
                 continue
             good_addr.append(address)
             self.db.add_imported_address(address, {})
-            self.adb.add_address(address)
+        self.adb.add_addresses(good_addr)
         if write_to_disk:
             self.save_db()
         return good_addr, bad_addr
@@ -3853,37 +4107,43 @@ class Imported_Wallet(Simple_Wallet):
             raise BitcoinException(str(bad_addr[0][1]))
 
     def delete_address(self, address: str) -> None:
-        if not self.db.has_imported_address(address):
+        self.delete_addresses([address])
+
+    def delete_addresses(self, addresses: Iterable[str]) -> None:
+        addresses = set(filter(self.db.has_imported_address, addresses))
+        if not addresses:
             return
         with self.lock:
-            if len(self.get_addresses()) <= 1:  # check this inside lock
+            if len(addresses) >= self.db.num_imported_addresses():  # check this inside lock
                 raise UserFacingException(_('Cannot delete last remaining address from wallet'))
-            transactions_to_remove = set()  # only referred to by this address
-            transactions_new = set()  # txs that are not only referred to by address
-            # rm txs from history
-            for addr in self.db.get_history():
-                details = self.adb.get_address_history(addr).items()
-                if addr == address:
-                    for tx_hash, height in details:
+            self.adb.remove_addresses(addresses)
+            # rm txs that are only referred to by the deleted addresses
+            transactions_to_remove = set()
+            for address in addresses:
+                for tx_hash in self.adb.get_address_history(address):
+                    if tx_hash in transactions_to_remove:
+                        continue
+                    if all(addr in addresses or not self.db.is_addr_in_history(addr)
+                           for addr in self.db.get_tx_addresses(tx_hash)):
                         transactions_to_remove.add(tx_hash)
-                else:
-                    for tx_hash, height in details:
-                        transactions_new.add(tx_hash)
-            transactions_to_remove -= transactions_new
-            self.db.remove_addr_history(address)
+            for address in addresses:
+                self.db.remove_addr_history(address)
             for tx_hash in transactions_to_remove:
                 self.adb._remove_transaction(tx_hash)
-            # rm label for addr
-            # TODO rm label for txids?
-            self.set_label(address, None)
-            # rm receive requests for addr
-            if req := self.get_request_by_addr(address):
-                self.delete_request(req.get_id())
-            self.set_frozen_state_of_addresses([address], False, write_to_disk=False)
-            # rm corresponding key from keystore
-            pubkey = self.get_public_key(address)
-            self.db.remove_imported_address(address)
-            if pubkey:
+            for address in addresses:
+                # rm label for addr
+                # TODO rm label for txids?
+                self.set_label(address, None)
+                # rm receive requests for addr
+                if req := self.get_request_by_addr(address):
+                    self.delete_request(req.get_id())
+            self.set_frozen_state_of_addresses(addresses, False, write_to_disk=False)
+            # rm corresponding keys from keystore
+            pubkeys = set(filter(None, map(self.get_public_key, addresses)))
+            for address in addresses:
+                self.db.remove_imported_address(address)
+            keystore_changed = False
+            for pubkey in pubkeys:
                 # delete key iff no other address uses it (e.g. p2pkh and p2wpkh for same key)
                 for txin_type in bitcoin.WIF_SCRIPT_TYPES.keys():
                     try:
@@ -3895,7 +4155,9 @@ class Imported_Wallet(Simple_Wallet):
                             break
                 else:
                     self.keystore.delete_imported_key(pubkey)
-                    self.save_keystore()
+                    keystore_changed = True
+            if keystore_changed:
+                self.save_keystore()
             self.save_db()
 
     def get_change_addresses_for_new_transaction(self, *args, **kwargs) -> List[str]:
@@ -3934,10 +4196,12 @@ class Imported_Wallet(Simple_Wallet):
         return x.get('pubkey') if x else None
 
     def _add_imported_addresses(self, good_inputs):
+        addresses = []
         for txin_type, pubkey in good_inputs:
             addr = bitcoin.pubkey_to_address(txin_type, pubkey)
             self.db.add_imported_address(addr, {'type': txin_type, 'pubkey': pubkey})
-            self.adb.add_address(addr)
+            addresses.append(addr)
+        self.adb.add_addresses(addresses)
 
     def import_private_keys(self, keys: Sequence[str], password: Optional[str], *,
                             write_to_disk=True) -> Tuple[List[str], List[Tuple[str, str]]]:
@@ -4016,7 +4280,12 @@ class Deterministic_Wallet(Abstract_Wallet):
         ln_xprv = self.db.get('lightning_xprv') or self.db.get('lightning_privkey2')
         # lnworker can only be initialized once receiving addresses are available
         # therefore we instantiate lnworker in DeterministicWallet
-        self.lnworker = LNWallet(self, ln_xprv) if ln_xprv else None
+        self.lnworker = None
+        if ln_xprv:
+            # note: the lightning modules are only imported when a wallet uses lightning
+            from .lnworker import LNWallet
+            with startup_trace.span('lnworker'):
+                self.lnworker = LNWallet(self, ln_xprv)
 
     def has_seed(self):
         return self.keystore.has_seed()
@@ -4118,15 +4387,17 @@ class Deterministic_Wallet(Abstract_Wallet):
         return {k.derive_pubkey(*der_suffix): (k, der_suffix)
                 for k in self.get_keystores()}
 
-    def _add_txinout_derivation_info(self, txinout, address, *, only_der_suffix):
+    def _get_txinout_derivation_info(self, address, *, only_der_suffix):
         if not self.is_mine(address):
-            return
+            return {}
+        bip32_paths = {}
         pubkey_deriv_info = self.get_public_keys_with_deriv_info(address)
         for pubkey in pubkey_deriv_info:
             ks, der_suffix = pubkey_deriv_info[pubkey]
             fp_bytes, der_full = ks.get_fp_and_derivation_to_be_used_in_partial_tx(der_suffix,
                                                                                    only_der_suffix=only_der_suffix)
-            txinout.bip32_paths[pubkey] = (fp_bytes, der_full)
+            bip32_paths[pubkey] = (fp_bytes, der_full)
+        return bip32_paths
 
     def create_new_address(self, for_change: bool = False):
         assert type(for_change) is bool
@@ -1607,6 +1607,15 @@ class WalletDB(JsonDB):
         assert isinstance(tx_hash, str)
         return list(self.txo.get(tx_hash, {}).keys())
 
+    @locked
+    def get_tx_addresses(self, tx_hash: str) -> Set[str]:
+        """Returns the is_mine addresses that appear as inputs or outputs in tx.
+        These are the addresses whose history refers to tx, so a tx can be
+        removed from the wallet once none of them is left.
+        """
+        assert isinstance(tx_hash, str)
+        return set(self.txi.get(tx_hash, {})) | set(self.txo.get(tx_hash, {}))
+
     @locked
     def get_txi_addr(self, tx_hash: str, address: str) -> Iterable[Tuple[str, int]]:
         """Returns an iterable of (prev_outpoint, value)."""
@@ -1927,6 +1936,10 @@ class WalletDB(JsonDB):
         assert isinstance(addr, str)
         return addr in self.imported_addresses
 
+    @locked
+    def num_imported_addresses(self) -> int:
+        return len(self.imported_addresses)
+
     @locked
     def get_imported_addresses(self) -> Sequence[str]:
         return list(sorted(self.imported_addresses.keys()))
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+
+from electrum_grs import util
+from electrum_grs.bitcoin import script_to_address
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+
+from electrum_grs.plugins.watchtower.watchtower import SweepStore, WatchTower
+
+from .. import ElectrumTestCase
+
+
+# any complete tx will do, the sweepstore does not look inside
+RAW_TX = "02000000000101956449bdc8059b680a20483e64e139ce63fe64333b92cd7811a1b116d6b967ad0000000000fdffffff024a01000000000000160014a21d1fbcf571153f57b40855e059c134405a89ecd682010000000000160014fd7debf75d6c410bf6ba1c8ba05f90f23ce4646a0247304402207f07ec0c2415b31743527dea2f7bff3868f494dc0a5d45adec5e05031725a0af02202aa0ac7d06dbcad8ac0b9808a829b6bdaa98bc831aef31a5ab4e5d1890f7552101210278a5d9b2796f2743ccf1b36b2bf47695d766d0841c17b00ce83943c8b37dde0ceea60300"
+
+
+class MockBlockchain:
+
+    def height(self):
+        return 600_000
+
+
+class MockNetwork:
+
+    def __init__(self, *, config: SimpleConfig):
+        self.config = config
+        self.asyncio_loop = util.get_asyncio_loop()
+        self.interface = None
+        self._blockchain = MockBlockchain()
+
+    def get_local_height(self):
+        return self.blockchain().height()
+
+    def blockchain(self):
+        return self._blockchain
+
+
+def p2wsh_address(n: int) -> str:
+    return script_to_address(bytes([0x00, 0x20]) + bytes([n]) * 32)
+
+
+class TestSweepStore(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.db_path = os.path.join(self.electrum_path, "watchtower_db")
+
+    async def _open_sweepstore(self) -> SweepStore:
+        sweepstore = SweepStore(self.db_path, MockNetwork(config=self.config))
+        self._sweepstores.append(sweepstore)
+        return sweepstore
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self._sweepstores = []
+
+    async def asyncTearDown(self):
+        for sweepstore in self._sweepstores:
+            sweepstore.stop()
+            await sweepstore.stopped_event.wait()
+        await super().asyncTearDown()
+
+    async def test_ctn_and_num_tx(self):
+        sweepstore = await self._open_sweepstore()
+        self.assertEqual(0, await sweepstore.get_ctn("aa:0", p2wsh_address(1)))
+        await sweepstore.add_sweep_tx("aa:0", 3, "bb:0", RAW_TX)
+        await sweepstore.add_sweep_tx("aa:0", 5, "bb:1", RAW_TX)
+        await sweepstore.add_sweep_tx("aa:0", 4, "bb:2", RAW_TX)
+        await sweepstore.add_sweep_tx("cc:1", 7, "dd:0", RAW_TX)
+        self.assertEqual(5, await sweepstore.get_ctn("aa:0", p2wsh_address(1)))
+        self.assertEqual(3, await sweepstore.get_num_tx("aa:0"))
+        self.assertEqual(1, await sweepstore.get_num_tx("cc:1"))
+        self.assertEqual({"aa:0", "cc:1"}, await sweepstore.list_sweep_tx())
+        self.assertEqual(1, len(await sweepstore.get_sweep_tx("aa:0", "bb:1")))
+        await sweepstore.remove_sweep_tx("aa:0")
+        self.assertEqual(0, await sweepstore.get_ctn("aa:0", p2wsh_address(1)))
+        self.assertEqual(0, await sweepstore.get_num_tx("aa:0"))
+        self.assertEqual({"cc:1"}, await sweepstore.list_sweep_tx())
+
+    async def test_upgrade_from_unversioned_db(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE sweep_txs (funding_outpoint VARCHAR(34) NOT NULL, ctn INTEGER NOT NULL, prevout VARCHAR(34), tx VARCHAR)")
+        conn.execute("CREATE TABLE channel_info (outpoint VARCHAR(34) NOT NULL, address VARCHAR(32), PRIMARY KEY(outpoint))")
+        for ctn in (1, 9, 4):
+            conn.execute("INSERT INTO sweep_txs VALUES (?,?,?,?)", ("aa:0", ctn, "bb:%d" % ctn, bytes.fromhex(RAW_TX)))
+        conn.commit()
+        conn.close()
+
+        sweepstore = await self._open_sweepstore()
+        self.assertEqual(9, await sweepstore.get_ctn("aa:0", p2wsh_address(1)))
+        self.assertEqual(3, await sweepstore.get_num_tx("aa:0"))
+        sweepstore.stop()
+        await sweepstore.stopped_event.wait()
+        self._sweepstores.remove(sweepstore)
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(SweepStore.DB_VERSION, conn.execute("PRAGMA user_version").fetchone()[0])
+        indexes = [r[1] for r in conn.execute("PRAGMA index_list(sweep_txs)")]
+        self.assertIn("sweep_txs_funding_outpoint_prevout", indexes)
+        conn.close()
+
+
+class TestWatchTowerDispatch(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.watchtower = WatchTower(MockNetwork(config=self.config))
+
+    async def asyncTearDown(self):
+        await self.watchtower.stop()
+        self.watchtower.sweepstore.stop()
+        await self.watchtower.sweepstore.stopped_event.wait()
+        await super().asyncTearDown()
+
+    async def test_outpoints_touched_by_tx(self):
+        wt = self.watchtower
+        for n in range(1, 4):
+            wt.add_channel(f"{n:02x}" * 32 + ":0", p2wsh_address(n))
+        outpoint1 = "01" * 32 + ":0"
+        outpoint2 = "02" * 32 + ":0"
+        # spending a funding outpoint
+        tx = PartialTransaction.from_io(
+            [PartialTxInput(prevout=TxOutpoint.from_str(outpoint1))],
+            [PartialTxOutput.from_address_and_value(p2wsh_address(100), 10_000)])
+        self.assertEqual({outpoint1}, wt.get_outpoints_touched_by_tx(tx))
+        # paying to an address we watch on behalf of a channel
+        wt.watch_address(p2wsh_address(100), outpoint2)
+        self.assertEqual({outpoint1, outpoint2}, wt.get_outpoints_touched_by_tx(tx))
+        # unrelated tx
+        tx = PartialTransaction.from_io(
+            [PartialTxInput(prevout=TxOutpoint.from_str("ff" * 32 + ":1"))],
+            [PartialTxOutput.from_address_and_value(p2wsh_address(200), 10_000)])
+        self.assertEqual(set(), wt.get_outpoints_touched_by_tx(tx))
+
+    async def test_new_block_only_rechecks_closing_channels(self):
+        wt = self.watchtower
+        outpoints = [f"{n:02x}" * 32 + ":0" for n in range(1, 4)]
+        for n, outpoint in enumerate(outpoints, start=1):
+            wt.add_channel(outpoint, p2wsh_address(n))
+        self.assertEqual(set(outpoints), wt.get_outpoints_to_check_on_new_block())
+        wt.set_channel_status(outpoints[0], 'open')
+        wt.set_channel_status(outpoints[1], 'closed (3)')
+        self.assertEqual({outpoints[1], outpoints[2]}, wt.get_outpoints_to_check_on_new_block())
+        wt.remove_callback(outpoints[1])
+        self.assertEqual({outpoints[2]}, wt.get_outpoints_to_check_on_new_block())
+        self.assertNotIn(p2wsh_address(2), wt.outpoints_by_address)
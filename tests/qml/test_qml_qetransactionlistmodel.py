@@ -1,11 +1,61 @@
 from datetime import datetime
 from unittest.mock import patch
 
+from PyQt6.QtCore import QModelIndex
+
+from electrum_grs.address_synchronizer import TX_HEIGHT_FUTURE
 from electrum_grs.gui.qml.qetransactionlistmodel import QETransactionListModel
+from electrum_grs.util import OrderedDictWithIndex, Satoshis, TxMinedInfo
 
 from .. import ElectrumTestCase
 
 
+class TxMock:
+    def is_complete(self):
+        return True
+
+
+class DBMock:
+    def get_transaction(self, txid):
+        return TxMock()
+
+
+class AdbMock:
+    def __init__(self):
+        self.tx_heights = {}
+
+    def get_tx_height(self, txid):
+        return self.tx_heights[txid]
+
+
+class WalletMock:
+    def __init__(self, num_txs):
+        self.db = DBMock()
+        self.adb = AdbMock()
+        self.num_txs = num_txs
+        self.get_tx_status_calls = 0
+
+    def get_full_history(self, **kwargs):
+        history = OrderedDictWithIndex()
+        for i in range(self.num_txs):
+            txid = '%064x' % i
+            mined = i < self.num_txs - 1
+            history[txid] = {
+                'txid': txid,
+                'height': 1000 + i if mined else TX_HEIGHT_FUTURE,
+                'confirmations': self.num_txs - i if mined else 0,
+                'timestamp': 1_600_000_000 + i if mined else None,
+                'wanted_height': None if mined else 5000,
+                'value': Satoshis(i),
+                'label': '',
+            }
+        return history
+
+    def get_tx_status(self, txid, tx_mined_info):
+        self.get_tx_status_calls += 1
+        return 2, f'status {tx_mined_info.height()} {tx_mined_info.wanted_height}'
+
+
 class TestQETransactionListModel(ElectrumTestCase):
 
     def test_get_section_by_timestamp(self):
@@ -68,3 +118,55 @@ class TestQETransactionListModel(ElectrumTestCase):
 
         result = f('unknown_section', test_date)
         self.assertEqual(result, '2023-06-15 14:30')
+
+    def test_paging_and_updates(self):
+        wallet = WalletMock(250)
+        model = QETransactionListModel(wallet)
+        try:
+            self._test_paging_and_updates(model, wallet)
+        finally:
+            model.unregister_callbacks()
+
+    def _test_paging_and_updates(self, model, wallet):
+        def get(row, role):
+            return model.data(model.index(row, 0), model._ROLE_RMAP[role])
+
+        # rows are handed out one page at a time, newest first
+        self.assertEqual(250, model.count)
+        self.assertEqual(model.PAGE_SIZE, model.rowCount(QModelIndex()))
+        self.assertTrue(model.canFetchMore(QModelIndex()))
+        model.fetchMore(QModelIndex())
+        model.fetchMore(QModelIndex())
+        self.assertEqual(250, model.rowCount(QModelIndex()))
+        self.assertFalse(model.canFetchMore(QModelIndex()))
+        # rows are only converted when read
+        self.assertEqual(0, wallet.get_tx_status_calls)
+        self.assertEqual('%064x' % 249, get(0, 'txid'))
+        self.assertEqual('local', get(0, 'section'))
+        self.assertEqual(f'status {TX_HEIGHT_FUTURE} 5000', get(0, 'date'))
+        self.assertEqual(1, wallet.get_tx_status_calls)
+        self.assertEqual(248, get(1, 'value'))
+
+        updated_rows = []
+        model.dataChanged.connect(lambda top_left, bottom_right, roles: updated_rows.append(top_left.row()))
+        # label update, by key
+        model.updateTxLabel('%064x' % 10, 'rent')
+        self.assertEqual([239], updated_rows)
+        self.assertEqual('rent', get(239, 'label'))
+        # future tx
+        wallet.adb.tx_heights['%064x' % 249] = TxMinedInfo(_height=TX_HEIGHT_FUTURE, wanted_height=6000)
+        model.on_event_adb_set_future_tx(wallet.adb, '%064x' % 249)
+        self.assertEqual([239, 0], updated_rows)
+        self.assertEqual(f'status {TX_HEIGHT_FUTURE} 6000', get(0, 'date'))
+        # getting verified
+        model.on_tx_verified('%064x' % 249, TxMinedInfo(_height=2000, conf=1, timestamp=1_600_001_000))
+        self.assertEqual([239, 0, 0], updated_rows)
+        self.assertEqual(1, get(0, 'confirmations'))
+        self.assertEqual('older', get(0, 'section'))
+        # unknown txid
+        model.on_tx_verified('ff' * 32, TxMinedInfo(_height=2000, conf=1, timestamp=1_600_001_000))
+        self.assertEqual([239, 0, 0], updated_rows)
+        # new block
+        model.updateBlockchainHeight(2001)
+        self.assertEqual(2, get(0, 'confirmations'))
+        self.assertEqual(2001 - 1000 + 1, get(249, 'confirmations'))
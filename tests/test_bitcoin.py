@@ -546,6 +546,30 @@ class Test_bitcoin(ElectrumTestCase):
         self.assertEqual(address_to_script('2NE4ZdmxFmUgwu5wtfoN2gVniyMgRDYq1kk', net=constants.BitcoinTestnet).hex(), 'a914e4567743d378957cd2ee7072da74b1203c1a7a0b87')
 
 
+    def test_address_to_script_unchecked(self):
+        scripts = [
+            bitcoin.pubkeyhash_to_p2pkh_script(bytes(range(20))),
+            bitcoin.construct_script([opcodes.OP_HASH160, bytes(range(20)), opcodes.OP_EQUAL]),
+            bitcoin.construct_script([0, bytes(range(20))]),
+            bitcoin.construct_script([0, bytes(range(32))]),
+            bitcoin.construct_script([1, bytes(range(32))]),
+            bitcoin.construct_script([16, bytes(range(2))]),
+            bitcoin.construct_script([2, bytes(range(40))]),
+        ]
+        for net in [constants.BitcoinMainnet, constants.BitcoinTestnet]:
+            for script in scripts:
+                addr = bitcoin.script_to_address(script, net=net)
+                self.assertEqual(script, address_to_script(addr, net=net))
+                self.assertEqual(script, bitcoin.address_to_script_unchecked(addr, net=net))
+                if bitcoin.is_segwit_address(addr, net=net):
+                    self.assertEqual(script, bitcoin.address_to_script_unchecked(addr.upper(), net=net))
+        # the checksum is not verified
+        addr = bitcoin.script_to_address(scripts[2])
+        self.assertEqual(scripts[2], bitcoin.address_to_script_unchecked(addr[:-1] + ('q' if addr[-1] != 'q' else 'p')))
+        # invalid addresses do not raise
+        for addr in ['', 'garbage', '0OIl', 'grs1', 'grs1qqqqqqq', 'tgrs1qw508d6qejxtdg4y5r3zarvary0c5xw7kxm5fk5', 'é']:
+            bitcoin.address_to_script_unchecked(addr)
+
     def test_address_to_payload(self):
         # bech32 P2WPKH
         self.assertEqual(
@@ -1,15 +1,42 @@
 import shutil
 import tempfile
 import os
+from typing import List
 
 from electrum_grs import constants, blockchain
 from electrum_grs.simple_config import SimpleConfig
-from electrum_grs.blockchain import Blockchain, deserialize_header, hash_header, InvalidHeader
+from electrum_grs.blockchain import (Blockchain, deserialize_header, hash_header, InvalidHeader, serialize_header,
+                                     hash_raw_header, CHUNK_SIZE, HEADER_SIZE)
 from electrum_grs.util import bfh, make_dir
 
 from . import ElectrumTestCase
 
 
+def make_toy_headers(prev_hash: str, start_height: int, count: int, *, branch: int = 0) -> List[bytes]:
+    """Returns count raw headers following prev_hash. Different branches give different headers."""
+    headers = []
+    for height in range(start_height, start_height + count):
+        raw_header = serialize_header({
+            'version': 1,
+            'prev_block_hash': prev_hash,
+            'merkle_root': '00' * 32,
+            'timestamp': 1_500_000_000 + 60 * height,
+            'bits': 0x1e0fffff,
+            'nonce': branch,
+        })
+        headers.append(raw_header)
+        prev_hash = hash_raw_header(raw_header)
+    return headers
+
+
+TOY_GENESIS_HEADER = make_toy_headers('00' * 32, 0, 1)[0]
+
+
+class ToyNet(constants.BitcoinSimnet):
+    """Testnet without checkpoints, whose genesis is TOY_GENESIS_HEADER."""
+    GENESIS = hash_raw_header(TOY_GENESIS_HEADER)
+
+
 class TestBlockchain(ElectrumTestCase):
 
     HEADERS = {
@@ -458,3 +485,89 @@ class TestVerifyHeader(ElectrumTestCase):
         with self.assertRaises(InvalidHeader):
             self.header["nonce"] = 42
             Blockchain.verify_header(self.header, self.prev_hash, self.target)
+
+
+class TestSyncJournal(ElectrumTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ToyNet.set_as_network()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        constants.BitcoinMainnet.set_as_network()
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.headers = [TOY_GENESIS_HEADER] + make_toy_headers(ToyNet.GENESIS, 1, 3 * CHUNK_SIZE)
+        blockchain.blockchains = {}
+        blockchain.read_blockchains(self.config)
+        blockchain.init_headers_file_for_best_chain()
+
+    def tearDown(self):
+        blockchain.blockchains = {}
+        super().tearDown()
+
+    def _restart(self) -> Blockchain:
+        blockchain.blockchains = {}
+        blockchain._sync_journals.clear()
+        blockchain.read_blockchains(self.config)
+        return blockchain.get_best_chain()
+
+    def _save_headers(self, chain: Blockchain, start_height: int, end_height: int) -> None:
+        for height in range(start_height, end_height + 1):
+            chain.save_header(deserialize_header(self.headers[height], height))
+
+    def test_replay_truncates_headers_that_do_not_connect(self):
+        chain = blockchain.get_best_chain()
+        self.assertTrue(chain.connect_chunk(0, b"".join(self.headers[:CHUNK_SIZE])))
+        self._save_headers(chain, CHUNK_SIZE, CHUNK_SIZE + 100)
+        # the last headers were not flushed to disk before a crash
+        chain.write(bytes(10 * HEADER_SIZE), (CHUNK_SIZE + 91) * HEADER_SIZE)
+        chain = self._restart()
+        self.assertEqual(CHUNK_SIZE + 90, chain.height())
+        self.assertTrue(chain.check_hash(CHUNK_SIZE + 90, hash_raw_header(self.headers[CHUNK_SIZE + 90])))
+
+    def test_replay_keeps_verified_headers(self):
+        chain = blockchain.get_best_chain()
+        self._save_headers(chain, 0, 2 * CHUNK_SIZE - 1)
+        chain = self._restart()
+        self.assertEqual(2 * CHUNK_SIZE - 1, chain.height())
+        self.assertEqual([2 * CHUNK_SIZE - 1, hash_raw_header(self.headers[2 * CHUNK_SIZE - 1])],
+                         blockchain.get_sync_journal(self.config)._entries['blockchain_headers']['verified'])
+
+    def test_replay_undoes_interrupted_chunk_write(self):
+        chain = blockchain.get_best_chain()
+        self.assertTrue(chain.connect_chunk(0, b"".join(self.headers[:CHUNK_SIZE])))
+        # crash while writing the second chunk
+        blockchain.get_sync_journal(self.config).begin_write(chain, CHUNK_SIZE, 2 * CHUNK_SIZE - 1)
+        chain.write(b"".join(self.headers[CHUNK_SIZE:CHUNK_SIZE + 1000]), CHUNK_SIZE * HEADER_SIZE)
+        chain = self._restart()
+        self.assertEqual(CHUNK_SIZE - 1, chain.height())
+        self.assertEqual([], blockchain.get_sync_journal(self.config)._entries['blockchain_headers']['pending'])
+        # syncing resumes
+        self.assertTrue(chain.connect_chunk(1, b"".join(self.headers[CHUNK_SIZE:2 * CHUNK_SIZE])))
+        self.assertEqual(2 * CHUNK_SIZE - 1, chain.height())
+
+    def test_replay_deletes_fork_that_does_not_match_journal(self):
+        chain = blockchain.get_best_chain()
+        self._save_headers(chain, 0, 2 * CHUNK_SIZE + 100)
+        forkpoint = CHUNK_SIZE + 50
+        fork_headers = make_toy_headers(chain.get_hash(forkpoint - 1), forkpoint, CHUNK_SIZE - 50, branch=1)
+        fork = chain.fork(deserialize_header(fork_headers[0], forkpoint))
+        for i, raw_header in enumerate(fork_headers[1:], start=1):
+            fork.save_header(deserialize_header(raw_header, forkpoint + i))
+        self.assertEqual(2 * CHUNK_SIZE - 1, fork.height())
+        self.assertEqual(chain, fork.parent)
+        fork_path = fork.path()
+        self._restart()
+        self.assertEqual(2, len(blockchain.blockchains))
+        # the header at the verified height of the fork gets overwritten
+        fork.write(bytes(HEADER_SIZE), (fork.height() - forkpoint) * HEADER_SIZE, truncate=False)
+        self._restart()
+        self.assertEqual(1, len(blockchain.blockchains))
+        self.assertFalse(os.path.exists(fork_path))
+        self.assertEqual(2 * CHUNK_SIZE + 100, blockchain.get_best_chain().height())
@@ -0,0 +1,56 @@
+import random
+
+from electrum_grs.bloom_filter import BloomFilter
+
+from . import ElectrumTestCase
+
+
+class TestBloomFilter(ElectrumTestCase):
+
+    def measure_false_positive_rate(self, bloom: BloomFilter, rnd: random.Random, num_tries: int) -> float:
+        false_positives = sum(rnd.randbytes(22) in bloom for _ in range(num_tries))
+        return false_positives / num_tries
+
+    def test_no_false_negatives(self):
+        rnd = random.Random(0)
+        items = [rnd.randbytes(rnd.randrange(1, 40)) for _ in range(5000)]
+        bloom = BloomFilter(capacity=100, error_rate=0.01)
+        bloom.update(items)
+        self.assertTrue(all(item in bloom for item in items))
+        self.assertLessEqual(len(bloom), len(items))
+        self.assertGreater(len(bloom), 0.95 * len(items))
+
+    def test_false_positive_rate(self):
+        rnd = random.Random(1)
+        for error_rate in (0.01, 0.001):
+            bloom = BloomFilter(capacity=10_000, error_rate=error_rate)
+            bloom.update(rnd.randbytes(22) for _ in range(10_000))
+            self.assertEqual(1, len(bloom._slices))
+            self.assertLess(bloom.error_rate, error_rate)
+            rate = self.measure_false_positive_rate(bloom, rnd, 100_000)
+            self.assertLess(rate, 1.5 * error_rate)
+
+    def test_false_positive_rate_stays_bounded_as_filter_grows(self):
+        rnd = random.Random(2)
+        error_rate = 0.01
+        bloom = BloomFilter(capacity=100, error_rate=error_rate)
+        bloom.update(rnd.randbytes(22) for _ in range(20_000))
+        self.assertGreater(len(bloom._slices), 5)
+        self.assertLess(bloom.error_rate, error_rate)
+        rate = self.measure_false_positive_rate(bloom, rnd, 100_000)
+        self.assertLess(rate, 1.5 * error_rate)
+        # a set of 22-byte items would take more than 20_000 * 55 bytes
+        self.assertLess(bloom.size_in_bytes, 100_000)
+
+    def test_empty_and_clear(self):
+        bloom = BloomFilter()
+        self.assertFalse(b'' in bloom)
+        self.assertFalse(b'\x00' * 22 in bloom)
+        self.assertEqual(0, bloom.error_rate)
+        bloom.add(b'\x00' * 22)
+        bloom.add(b'\x00' * 22)
+        self.assertTrue(b'\x00' * 22 in bloom)
+        self.assertEqual(1, len(bloom))
+        bloom.clear()
+        self.assertFalse(b'\x00' * 22 in bloom)
+        self.assertEqual(0, len(bloom))
@@ -0,0 +1,156 @@
+import random
+import time
+from typing import Optional
+
+from electrum_grs import util
+from electrum_grs.channel_db import ChannelDB, SortedIndex
+from electrum_grs.constants import BitcoinTestnet
+from electrum_grs.lnutil import ShortChannelID, GossipTimestampFilter
+from electrum_grs.simple_config import SimpleConfig
+
+from . import ElectrumTestCase
+
+
+def node(i: int) -> bytes:
+    return b'\x02' + i.to_bytes(32, 'big')
+
+
+def gossip_in_timespan_by_scan(cdb: ChannelDB, timespan: GossipTimestampFilter) -> list:
+    """what get_gossip_in_timespan used to do, as sorted (msg, timestamp) pairs"""
+    out = []
+    for short_id, chan in cdb._channels.items():
+        updates = []
+        for node_id in (chan.node1_id, chan.node2_id):
+            policy = cdb._policies.get((node_id, short_id))
+            if policy and policy.raw and timespan.in_range(policy.timestamp) and policy.message_flags & 0b10 == 0:
+                updates.append((policy.raw, policy.timestamp))
+        if not updates or chan.raw is None:
+            continue
+        out.append((chan.raw, min(ts for raw, ts in updates)))
+        out.extend(updates)
+    for node_ann in cdb._nodes.values():
+        if timespan.in_range(node_ann.timestamp) and node_ann.raw:
+            out.append((node_ann.raw, node_ann.timestamp))
+    return sorted(out)
+
+
+class TestSortedIndex(ElectrumTestCase):
+
+    def test_sorted_index(self):
+        index = SortedIndex([5, 1, 3, 3])
+        self.assertEqual(3, len(index))
+        index.add(4)
+        index.add(4)
+        index.discard(1)
+        index.discard(2)
+        self.assertEqual([3, 4, 5], index.range(0, 100))
+        self.assertEqual([4], index.range(4, 5))
+        self.assertEqual([], index.range(6, 100))
+        # tuples, ranges on the first element
+        index = SortedIndex([(2, b'b'), (1, b'a'), (2, b'a'), (3, b'a')])
+        self.assertEqual([(2, b'a'), (2, b'b')], index.range((2,), (3,)))
+
+
+class TestChannelDBIndexes(ElectrumTestCase):
+    TESTNET = True
+
+    cdb = None  # type: Optional[ChannelDB]
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+
+    async def asyncTearDown(self):
+        if self.cdb:
+            self.cdb.stop()
+            await self.cdb.stopped_event.wait()
+        await super().asyncTearDown()
+
+    def create_channel_db(self) -> ChannelDB:
+        class fake_network:
+            config = self.config
+            asyncio_loop = util.get_asyncio_loop()
+            trigger_callback = lambda *args: None
+            register_callback = lambda *args: None
+            interface = None
+        self.cdb = ChannelDB(fake_network())
+        self.cdb.data_loaded.set()
+        return self.cdb
+
+    def add_channel(self, scid: ShortChannelID, node1: bytes, node2: bytes, *, raw=True):
+        self.cdb.add_channel_announcements({
+            'node_id_1': node1, 'node_id_2': node2,
+            'bitcoin_key_1': node1, 'bitcoin_key_2': node2,
+            'short_channel_id': scid,
+            'chain_hash': BitcoinTestnet.rev_genesis_bytes(),
+            'len': 0, 'features': b'',
+            **({'raw': b'chan' + scid} if raw else {}),
+        }, trusted=True)
+
+    def add_policy(self, scid: ShortChannelID, direction: int, timestamp: int, *, dont_forward=False):
+        self.cdb.add_channel_update({
+            'short_channel_id': scid,
+            'message_flags': b'\x02' if dont_forward else b'\x00',
+            'channel_flags': bytes([direction]),
+            'cltv_expiry_delta': 10, 'htlc_minimum_msat': 250, 'fee_base_msat': 100,
+            'fee_proportional_millionths': timestamp % 1000,
+            'chain_hash': BitcoinTestnet.rev_genesis_bytes(),
+            'timestamp': timestamp,
+            'raw': b'upd' + scid + bytes([direction]) + timestamp.to_bytes(4, 'big'),
+        }, verify=False, verbose=False)
+
+    def add_node(self, node_id: bytes, timestamp: int):
+        self.cdb.add_node_announcements({
+            'node_id': node_id, 'alias': b'', 'addresses': b'', 'features': b'',
+            'timestamp': timestamp,
+            'raw': b'node' + node_id + timestamp.to_bytes(4, 'big'),
+        })
+
+    def check_queries(self, rnd: random.Random, now: int):
+        channels = list(self.cdb._channels)
+        for _ in range(20):
+            first_blocknum = rnd.randrange(0, 1200)
+            number_of_blocks = rnd.choice([1, 10, 100, 1000, 2 ** 32 - 1])
+            expected = sorted(
+                scid for scid in channels
+                if first_blocknum <= scid.block_height < first_blocknum + number_of_blocks)
+            self.assertEqual(expected, self.cdb.get_channels_in_range(first_blocknum, number_of_blocks))
+        for _ in range(20):
+            first_timestamp = now - rnd.randrange(0, 20_000)
+            timespan = GossipTimestampFilter(first_timestamp, rnd.choice([60, 3600, 2 ** 32 - 1]))
+            result = sorted((msg.msg, msg.timestamp) for msg in self.cdb.get_gossip_in_timespan(timespan))
+            self.assertEqual(gossip_in_timespan_by_scan(self.cdb, timespan), result)
+
+    async def test_indexes_follow_updates(self):
+        rnd = random.Random(0)
+        now = int(time.time())
+        self.create_channel_db()
+        nodes = sorted(node(i) for i in range(30))
+        for i in range(200):
+            node1, node2 = sorted(rnd.sample(nodes, 2))
+            scid = ShortChannelID.from_components(rnd.randrange(100, 1100), rnd.randrange(10), rnd.randrange(2))
+            self.add_channel(scid, node1, node2, raw=rnd.random() < 0.9)
+        for node_id in nodes:
+            self.add_node(node_id, now - rnd.randrange(20_000))
+        for scid in list(self.cdb._channels):
+            for direction in (0, 1):
+                if rnd.random() < 0.8:
+                    self.add_policy(scid, direction, now - rnd.randrange(20_000), dont_forward=rnd.random() < 0.1)
+        self.check_queries(rnd, now)
+        # newer policies and node announcements replace the old ones
+        for (node_id, scid), policy in list(self.cdb._policies.items())[::3]:
+            direction = 0 if node_id == self.cdb._channels[scid].node1_id else 1
+            self.add_policy(scid, direction, min(now, policy.timestamp + rnd.randrange(100, 20_000)))
+        for node_id in nodes[::2]:
+            self.add_node(node_id, now - rnd.randrange(100))
+        self.check_queries(rnd, now)
+        # pruning
+        self.cdb.prune_old_policies(10_000)
+        self.assertTrue(all(p.timestamp > now - 10_000 for p in self.cdb._policies.values()))
+        self.cdb.prune_orphaned_channels()
+        for scid in list(self.cdb._channels)[::4]:
+            self.cdb.remove_channel(scid)
+        self.check_queries(rnd, now)
+        self.assertEqual(len(self.cdb._channels), len(self.cdb._scid_index))
+        self.assertEqual(len(self.cdb._policies), len(self.cdb._policy_ts_index))
+        self.assertEqual(len(self.cdb._nodes), len(self.cdb._node_ts_index))
@@ -1,4 +1,5 @@
-from electrum_grs.coinchooser import CoinChooserPrivacy
+from electrum_grs.coinchooser import CoinChooserPrivacy, CoinChooserBranchAndBound
+from electrum_grs import bitcoin
 from electrum_grs.util import NotEnoughFunds
 from electrum_grs.transaction import PartialTxInput, TxOutpoint, Transaction, PartialTxOutput
 from electrum_grs.fee_policy import FeePolicy, FixedFeePolicy
@@ -109,3 +110,72 @@ class TestCoinChooser(ElectrumTestCase):
         assert tx.get_fee() == 0, f"fee should be 0, is {tx.get_fee()}"
         assert len(tx.outputs()) == 2, f"expected 2 output got {len(tx.outputs())}"
         assert len(tx.inputs()) == 1, f"expected 1 input got {len(tx.inputs())}"
+
+
+class TestCoinChooserBranchAndBound(ElectrumTestCase):
+
+    @staticmethod
+    def make_coin(value: int, *, n: int, block_height: int = 100) -> PartialTxInput:
+        coin = PartialTxInput(
+            prevout=TxOutpoint(txid=bytes([n % 256]) * 32, out_idx=n // 256),
+        )
+        coin._trusted_address = bitcoin.pubkey_to_address('p2wpkh', '02' + bytes([n % 256]).hex() * 32)
+        coin._trusted_value_sats = value
+        coin.script_type = 'p2wpkh'
+        coin.block_height = block_height
+        return coin
+
+    @staticmethod
+    def make_output(value: int) -> PartialTxOutput:
+        return PartialTxOutput.from_address_and_value(
+            bitcoin.pubkey_to_address('p2wpkh', '03' + 'ab' * 32), value)
+
+    def make_tx(self, coins, outputs, *, feerate=1000):
+        return CoinChooserBranchAndBound(enable_output_value_rounding=False).make_tx(
+            coins=coins,
+            inputs=[],
+            outputs=outputs,
+            change_addrs=[bitcoin.pubkey_to_address('p2wpkh', '03' + 'cd' * 32)],
+            fee_estimator_vb=FeePolicy(f'feerate:{feerate}').estimate_fee,
+            dust_threshold=546,
+        )
+
+    def test_finds_changeless_selection(self):
+        coins = [self.make_coin(v, n=i) for i, v in enumerate([
+            70_000, 500_000, 110_000, 1_000_000, 30_000, 260_000])]
+        # 110_000 + 260_000 pays for the output plus the fee of a 2-input tx
+        tx = self.make_tx(coins, [self.make_output(369_700)])
+        self.assertEqual(1, len(tx.outputs()))
+        self.assertEqual({110_000, 260_000}, {txin.value_sats() for txin in tx.inputs()})
+        self.assertTrue(0 <= tx.get_fee() - tx.estimated_size() < 546)
+
+    def test_falls_back_to_change(self):
+        coins = [self.make_coin(v, n=i) for i, v in enumerate([
+            1_000_000, 2_000_000, 3_000_000])]
+        tx = self.make_tx(coins, [self.make_output(1_500_000)])
+        self.assertEqual(2, len(tx.outputs()))
+        self.assertEqual(1, len([o for o in tx.outputs() if o.is_change]))
+        self.assertEqual(tx.estimated_size(), tx.get_fee())
+
+    def test_not_enough_funds(self):
+        coins = [self.make_coin(v, n=i) for i, v in enumerate([10_000, 20_000])]
+        with self.assertRaises(NotEnoughFunds):
+            self.make_tx(coins, [self.make_output(30_000)])
+
+    def test_prefers_confirmed_coins(self):
+        coins = [
+            self.make_coin(400_000, n=0, block_height=0),
+            self.make_coin(600_000, n=1),
+            self.make_coin(700_000, n=2),
+        ]
+        tx = self.make_tx(coins, [self.make_output(250_000)])
+        self.assertEqual([600_000], [txin.value_sats() for txin in tx.inputs()])
+        self.assertTrue(all(txin.block_height > 0 for txin in tx.inputs()))
+
+    def test_deterministic_on_large_pool(self):
+        coins = [self.make_coin(10_000 + (i * 7919) % 1_000_000, n=i) for i in range(600)]
+        outputs = [self.make_output(12_345_678)]
+        tx1 = self.make_tx(coins, outputs, feerate=5000)
+        tx2 = self.make_tx(list(reversed(coins)), outputs, feerate=5000)
+        self.assertEqual(tx1.txid(), tx2.txid())
+        self.assertGreaterEqual(tx1.input_value(), 12_345_678 + tx1.get_fee())
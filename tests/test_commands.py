@@ -9,7 +9,7 @@ from os import urandom
 import shutil
 
 import electrum_grs
-from electrum_grs.commands import Commands, eval_bool
+from electrum_grs.commands import Commands, eval_bool, paginate
 from electrum_grs import storage, wallet
 from electrum_grs.lnutil import RECEIVED, channel_id_from_funding_tx
 from electrum_grs.lnworker import RecvMPPResolution
@@ -185,6 +185,39 @@ class TestCommands(ElectrumTestCase):
         self.assertEqual(format_satoshis(Decimal(123.789)), "0.00000124")
         self.assertEqual(format_satoshis(41754.681), "0.00041755")
 
+    def test_paginate(self):
+        items = [{'txid': f'{i:02x}'} for i in range(10)]
+        key = lambda x: x['txid']
+        self.assertEqual((items, None), paginate(items, key=key, limit=None, cursor=None))
+        page, cursor = paginate(items, key=key, limit=4, cursor=None)
+        self.assertEqual(items[:4], page)
+        page, cursor = paginate(items, key=key, limit=4, cursor=cursor)
+        self.assertEqual(items[4:8], page)
+        page, cursor2 = paginate(items, key=key, limit=4, cursor=cursor)
+        self.assertEqual(items[8:], page)
+        self.assertIsNone(cursor2)
+        # an item was inserted before the cursor: the position is stale, the key is not
+        items.insert(0, {'txid': 'ff'})
+        page, _ = paginate(items, key=key, limit=4, cursor=cursor)
+        self.assertEqual(items[9:], page)
+        with self.assertRaises(UserFacingException):
+            paginate(items, key=key, limit=4, cursor='3:zz')
+        with self.assertRaises(UserFacingException):
+            paginate(items, key=key, limit=4, cursor='xyz')
+        with self.assertRaises(UserFacingException):
+            paginate(items, key=key, limit=0, cursor=None)
+        # items are only iterated until the page is full
+        consumed = []
+        def gen():
+            for item in items:
+                consumed.append(item)
+                yield item
+        page, cursor = paginate(gen(), key=key, limit=4, cursor=None)
+        self.assertEqual(items[:4], page)
+        self.assertEqual(5, len(consumed))
+        page, _ = paginate(gen(), key=key, limit=4, cursor=cursor)
+        self.assertEqual(items[4:8], page)
+
 
 class TestCommandsTestnet(ElectrumTestCase):
     TESTNET = True
@@ -860,3 +893,42 @@ class TestCommandsTestnet(ElectrumTestCase):
         result = await cmds.delete_channel_backup(self._CHANNEL_POINT, wallet=w)
         self.assertIsNone(result)
         w.lnworker.remove_channel_backup.assert_called_once_with(chan_id)
+
+    async def test_list_channel_backups(self):
+        w = restore_wallet_from_text__for_unittest(
+            'disagree rug lemon bean unaware square alone beach tennis exhibit fix mimic',
+            path=None,
+            config=self.config)['wallet']
+        cmds = Commands(config=self.config)
+
+        self.mock_lnworker(w)
+        self.assertEqual([], await cmds.list_channel_backups(wallet=w))
+
+        channel_backups = {}
+        for index in range(2):
+            channel_point = f"{self._CHANNEL_POINT.split(':')[0]}:{index}"
+            chan_id = self._chan_id_for(channel_point)
+            chan = self._mock_channel(is_backup=True, can_be_deleted=True)
+            chan.short_channel_id = None
+            chan.channel_id = chan_id
+            chan.funding_outpoint.to_str.return_value = channel_point
+            chan.get_closing_height.return_value = None
+            chan.get_state.return_value.name = 'OPEN'
+            channel_backups[chan_id] = chan
+        self.mock_lnworker(w, None, channel_backups)
+        expected = [
+            {
+                'short_channel_id': None,
+                'channel_id': chan.channel_id.hex(),
+                'channel_point': chan.funding_outpoint.to_str(),
+                'closing_txid': None,
+                'state': 'OPEN',
+            } for chan in channel_backups.values()
+        ]
+        self.assertEqual(expected, await cmds.list_channel_backups(wallet=w))
+
+        page = await cmds.list_channel_backups(limit=1, wallet=w)
+        self.assertEqual(expected[:1], page['items'])
+        self.assertIsNotNone(page['next_cursor'])
+        page = await cmds.list_channel_backups(limit=1, cursor=page['next_cursor'], wallet=w)
+        self.assertEqual({'items': expected[1:], 'next_cursor': None}, page)
@@ -0,0 +1,208 @@
+import random
+from decimal import Decimal
+
+from electrum_grs.bitcoin import COIN
+from electrum_grs.cost_basis import CostBasisEngine, CostBasisEvent
+
+from . import ElectrumTestCase
+
+
+def price_func(timestamp) -> Decimal:
+    # one fiat unit per coin per second, so that results are easy to check
+    return Decimal(int(timestamp))
+
+
+def make_utxo_history(num_txs: int, seed: int = 0):
+    """Random history where txs spend coins created by earlier txs."""
+    rnd = random.Random(seed)
+    events = []
+    for i in range(num_txs):
+        txid = '%064x' % i
+        inputs = ()
+        amount = rnd.randint(1, 10**8)
+        if events and rnd.random() < 0.5:
+            prevs = rnd.sample(events, min(len(events), rnd.randint(1, 3)))
+            inputs = tuple((prev.key, rnd.randint(1, 10**8)) for prev in prevs)
+            amount = - rnd.randint(1, 10**8)
+        fiat_value = Decimal(rnd.randint(1, 1000)) if rnd.random() < 0.1 else None
+        events.append(CostBasisEvent(txid, 1000 + i, amount, fiat_value, inputs))
+    return events
+
+
+def reference_acquisition_price(events, txid) -> Decimal:
+    """Recursive definition of the 'utxo' acquisition price, as in Abstract_Wallet.average_price."""
+    events_by_key = {e.key: e for e in events}
+
+    def coin_price(txid, value):
+        event = events_by_key.get(txid)
+        if event is not None and event.inputs:
+            return average_price(txid) * value / Decimal(COIN)
+        if event is not None and event.fiat_value is not None:
+            return event.fiat_value
+        return price_func(event.timestamp) * value / Decimal(COIN)
+
+    def average_price(txid):
+        input_value = 0
+        total_price = 0
+        for prev, v in events_by_key[txid].inputs:
+            input_value += v
+            total_price += coin_price(prev, v)
+        return total_price / (input_value / Decimal(COIN))
+
+    event = events_by_key[txid]
+    return - event.amount_sat / Decimal(COIN) * average_price(txid)
+
+
+class TestCostBasisEngine(ElectrumTestCase):
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            CostBasisEngine('hifo', price_func)
+
+    def test_utxo_matches_recursive_definition(self):
+        events = make_utxo_history(300)
+        results = CostBasisEngine('utxo', price_func).update(events)
+        self.assertEqual(len(events), len(results))
+        for event, result in zip(events, results):
+            if event.amount_sat < 0:
+                self.assertEqual(reference_acquisition_price(events, event.key), result.acquisition_price)
+                self.assertEqual(- result.fiat_value - result.acquisition_price, result.capital_gain)
+            else:
+                self.assertIsNone(result.acquisition_price)
+                self.assertIsNone(result.capital_gain)
+            self.assertIsNone(result.holding_sat)
+
+    def test_utxo_long_chain_of_self_spends(self):
+        events = [CostBasisEvent('%064x' % 0, 1000, COIN)]
+        for i in range(1, 20_000):
+            events.append(CostBasisEvent('%064x' % i, 1000 + i, -1000, inputs=((events[-1].key, COIN),)))
+        results = CostBasisEngine('utxo', price_func).update(events)
+        # every coin of the chain goes back to the first tx
+        self.assertEqual(Decimal(1000) * 1000 / COIN, results[-1].acquisition_price)
+
+    def test_average(self):
+        events = [
+            CostBasisEvent('a', 10, 2 * COIN),
+            CostBasisEvent('b', 40, 2 * COIN),
+            CostBasisEvent('c', 50, - COIN),
+            CostBasisEvent('d', 60, - COIN, fiat_value=Decimal(-70)),
+        ]
+        results = CostBasisEngine('average', price_func).update(events)
+        self.assertEqual([Decimal(20), Decimal(80), Decimal(-50), Decimal(-70)], [r.fiat_value for r in results])
+        self.assertEqual([None, None, Decimal(25), Decimal(25)], [r.acquisition_price for r in results])
+        self.assertEqual([None, None, Decimal(25), Decimal(45)], [r.capital_gain for r in results])
+        self.assertEqual([2 * COIN, 4 * COIN, 3 * COIN, 2 * COIN], [r.holding_sat for r in results])
+        self.assertEqual(Decimal(50), results[-1].holding_cost)
+
+    def test_fifo_and_lifo(self):
+        events = [
+            CostBasisEvent('a', 10, COIN),
+            CostBasisEvent('b', 20, COIN),
+            CostBasisEvent('c', 30, COIN),
+            CostBasisEvent('d', 40, - COIN // 2),
+            CostBasisEvent('e', 50, - COIN),
+        ]
+        fifo = CostBasisEngine('fifo', price_func).update(events)
+        self.assertEqual(Decimal(5), fifo[3].acquisition_price)
+        self.assertEqual(Decimal(5 + 10), fifo[4].acquisition_price)
+        self.assertEqual(Decimal(10 + 30), fifo[4].holding_cost)
+        lifo = CostBasisEngine('lifo', price_func).update(events)
+        self.assertEqual(Decimal(15), lifo[3].acquisition_price)
+        self.assertEqual(Decimal(15 + 10), lifo[4].acquisition_price)
+        self.assertEqual(Decimal(10 + 10), lifo[4].holding_cost)
+        for results in (fifo, lifo):
+            self.assertEqual(COIN * 3 // 2, results[-1].holding_sat)
+
+    def test_lifo_acquisition_after_partial_disposal(self):
+        # a partially consumed lot keeps its remainder when a newer lot is pushed on top of it
+        events = [
+            CostBasisEvent('a', 1, 100 * COIN),
+            CostBasisEvent('b', 2, - 30 * COIN),
+            CostBasisEvent('c', 10, 50 * COIN),
+            CostBasisEvent('d', 20, - 50 * COIN),
+            CostBasisEvent('e', 30, - 20 * COIN),
+        ]
+        lifo = CostBasisEngine('lifo', price_func).update(events)
+        self.assertEqual(Decimal(30), lifo[1].acquisition_price)
+        self.assertEqual(Decimal(500), lifo[3].acquisition_price)
+        self.assertEqual(Decimal(70), lifo[3].holding_cost)
+        self.assertEqual(Decimal(20), lifo[4].acquisition_price)
+        self.assertEqual(Decimal(50), lifo[4].holding_cost)
+        fifo = CostBasisEngine('fifo', price_func).update(events)
+        self.assertEqual(Decimal(50), fifo[3].acquisition_price)
+        self.assertEqual(Decimal(20), fifo[4].acquisition_price)
+        self.assertEqual(Decimal(500), fifo[4].holding_cost)
+
+    def test_disposing_more_than_holdings(self):
+        events = [
+            CostBasisEvent('a', 10, COIN),
+            CostBasisEvent('b', 20, - 2 * COIN),
+            CostBasisEvent('c', 30, - COIN),
+        ]
+        for method in ('average', 'fifo', 'lifo'):
+            results = CostBasisEngine(method, price_func).update(events)
+            self.assertEqual(Decimal(10), results[1].acquisition_price)
+            self.assertEqual(Decimal(0), results[2].acquisition_price)
+            self.assertEqual(0, results[2].holding_sat)
+
+    def test_incremental_update_equals_full_pass(self):
+        rnd = random.Random(1)
+        events = [CostBasisEvent('%064x' % i, 1000 + i, rnd.randint(-COIN, 2 * COIN)) for i in range(1000)]
+        for method in ('average', 'fifo', 'lifo'):
+            engine = CostBasisEngine(method, price_func)
+            engine.CHECKPOINT_INTERVAL = 64
+            engine.update(events)
+            # a tx in the middle changes, txs get added and removed at the end
+            changed = list(events)
+            changed[500] = changed[500]._replace(amount_sat=- 3 * COIN)
+            changed = changed[:-10] + [CostBasisEvent('new', 5000, COIN), CostBasisEvent('new2', None, - COIN)]
+            for history in (changed, events, events[:300], changed):
+                self.assertEqual(CostBasisEngine(method, price_func).update(history), engine.update(history))
+        engine = CostBasisEngine('utxo', price_func)
+        events = make_utxo_history(500)
+        engine.update(events)
+        changed = list(events)
+        changed[100] = changed[100]._replace(fiat_value=Decimal(42))
+        self.assertEqual(CostBasisEngine('utxo', price_func).update(changed), engine.update(changed))
+
+    def test_prices_are_looked_up_in_one_batch(self):
+        rnd = random.Random(2)
+        events = [CostBasisEvent('%064x' % i, 1000 + i // 2, rnd.randint(-COIN, 2 * COIN)) for i in range(200)]
+        events.append(CostBasisEvent('unconfirmed', None, - COIN))
+        batches = []
+
+        def rates_func(timestamps):
+            batches.append(list(timestamps))
+            return [price_func(ts) for ts in timestamps]
+
+        for method in ('average', 'fifo', 'lifo', 'utxo'):
+            batches.clear()
+            engine = CostBasisEngine(method, price_func, rates_func)
+            engine.CHECKPOINT_INTERVAL = 50
+            # note: NaN != NaN, coins spent without known inputs have no 'utxo' acquisition price
+            self.assertEqual(repr(CostBasisEngine(method, price_func).update(events)), repr(engine.update(events)))
+            self.assertEqual(1, len(batches))
+            self.assertEqual(100, len(batches[0]))
+            if method == 'utxo':
+                continue
+            # only the events replayed from the last checkpoint are looked up again
+            engine.update(events + [CostBasisEvent('new', 5000, COIN)])
+            self.assertEqual([[5000]], batches[1:])
+
+    def test_missing_exchange_rate_is_retried(self):
+        rates = {}
+
+        def partial_price_func(timestamp):
+            return rates.get(int(timestamp), Decimal('NaN'))
+
+        events = [CostBasisEvent('%064x' % i, i + 1, COIN if i < 5 else - COIN) for i in range(10)]
+        rates.update({i + 1: Decimal(i + 1) for i in range(10) if i != 2})
+        engine = CostBasisEngine('fifo', partial_price_func)
+        results = engine.update(events)
+        self.assertTrue(results[2].fiat_value.is_nan())
+        self.assertTrue(results[7].acquisition_price.is_nan())
+        # the rate becomes available, the history does not change
+        rates[3] = Decimal(3)
+        results = engine.update(events)
+        self.assertEqual(CostBasisEngine('fifo', partial_price_func).update(events), results)
+        self.assertEqual(Decimal(3), results[7].acquisition_price)
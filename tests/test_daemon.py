@@ -1,16 +1,28 @@
 import asyncio
+import json
 from collections import defaultdict
 import os
+import time
+from base64 import b64encode
+import subprocess
+import sys
+import textwrap
 from typing import Optional, Iterable
 from unittest import mock
 
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+
+from electrum_grs.bip32 import BIP32Node
 from electrum_grs.commands import Commands
-from electrum_grs.daemon import Daemon
+from electrum_grs.daemon import Daemon, AuthenticatedServer, CommandsServer
 from electrum_grs.simple_config import SimpleConfig
 from electrum_grs.wallet import Abstract_Wallet
 from electrum_grs.lnworker import LNWallet, LNPeerManager
 from electrum_grs.lnwatcher import LNWatcher
-from electrum_grs import util
+import electrum_grs
+from electrum_grs import util, keystore, startup_trace
+from electrum_grs.util import UserFacingException, JsonRPCError
 from electrum_grs.utils.memory_leak import count_objects_in_memory
 from electrum_grs import constants
 
@@ -373,3 +385,221 @@ class TestLoadWallet(DaemonTestCase):
         # path = self.get_wallet_file_path("client_3_3_8_xpub_with_realistic_history")
         # with self.assertRaises(util.WalletFileException):
         #     wallet = self.daemon.load_wallet(path, password=None, upgrade=True)
+
+
+class MockRequest:
+
+    def __init__(self, body, *, headers=None, password='secret'):
+        self._body = json.dumps(body)
+        auth = b64encode(f'user:{password}'.encode()).decode()
+        self.headers = {'Authorization': f'Basic {auth}', **(headers or {})}
+
+    async def text(self):
+        return self._body
+
+
+class TestAuthenticatedServer(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server = AuthenticatedServer('user', 'secret')
+
+        async def add(a, b):
+            return a + b
+
+        async def slow(delay):
+            await asyncio.sleep(delay)
+            return delay
+
+        async def fail():
+            raise UserFacingException('nope')
+
+        self.server.register_method('add', add)
+        self.server.register_method('slow', slow)
+        self.server.register_method('fail', fail)
+
+    async def test_single_request(self):
+        resp = await self.server.handle(MockRequest({'id': 1, 'method': 'add', 'params': [1, 2]}))
+        self.assertEqual({'id': 1, 'jsonrpc': '2.0', 'result': 3}, json.loads(resp.text))
+        resp = await self.server.handle(MockRequest({'id': 1, 'method': 'nonexistent'}))
+        self.assertEqual(500, resp.status)
+
+    async def test_wrong_password(self):
+        resp = await self.server.handle(MockRequest({'id': 1, 'method': 'add', 'params': [1, 2]}, password='wrong'))
+        self.assertEqual(403, resp.status)
+
+    async def test_batch(self):
+        batch = [
+            {'id': 1, 'method': 'slow', 'params': [0.2]},
+            {'id': 2, 'method': 'slow', 'params': {'delay': 0.2}},
+            {'id': 3, 'method': 'fail'},
+            {'id': 4, 'method': 'nonexistent'},
+            'garbage',
+        ]
+        t0 = time.monotonic()
+        resp = await self.server.handle(MockRequest(batch))
+        # requests in a batch run concurrently
+        self.assertLess(time.monotonic() - t0, 0.4)
+        responses = json.loads(resp.text)
+        self.assertEqual([1, 2, 3, 4, None], [r['id'] for r in responses])
+        self.assertEqual(0.2, responses[0]['result'])
+        self.assertEqual(0.2, responses[1]['result'])
+        self.assertEqual(JsonRPCError.Codes.USERFACING, responses[2]['error']['code'])
+        self.assertEqual(JsonRPCError.Codes.INVALID_REQUEST, responses[3]['error']['code'])
+        self.assertEqual(JsonRPCError.Codes.INVALID_REQUEST, responses[4]['error']['code'])
+        resp = await self.server.handle(MockRequest([]))
+        self.assertEqual(500, resp.status)
+
+    async def test_ndjson_stream(self):
+        app = web.Application()
+        app.router.add_post("/", self.server.handle)
+        async with TestServer(app) as test_server, TestClient(test_server) as client:
+            batch = [
+                {'id': 1, 'method': 'slow', 'params': [0.1]},
+                {'id': 2, 'method': 'add', 'params': ['a' * 100_000, 'b']},
+            ]
+            resp = await client.post(
+                "/", data=json.dumps(batch),
+                headers={**MockRequest(None).headers, 'Accept': 'application/x-ndjson'})
+            self.assertEqual('application/x-ndjson', resp.headers['Content-Type'])
+            lines = (await resp.text()).splitlines()
+        # responses are written as they complete
+        responses = [json.loads(line) for line in lines]
+        self.assertEqual([2, 1], [r['id'] for r in responses])
+        self.assertEqual('a' * 100_000 + 'b', responses[0]['result'])
+
+
+class TestMetricsEndpoint(DaemonTestCase):
+
+    async def test_scrape_metrics(self):
+        self.config.RPC_USERNAME = 'user'
+        self.config.RPC_PASSWORD = 'secret'
+        server = CommandsServer(self.daemon, fd=None, only_minimal_jsonrpc=False)
+        ks = keystore.from_master_key(BIP32Node.from_rootseed(bytes(32), xtype='standard').to_xpub())
+
+        async def scrape() -> dict:
+            async with TestServer(server.app) as test_server, TestClient(test_server) as client:
+                resp = await client.get("/metrics", headers=MockRequest(None).headers)
+                self.assertEqual(200, resp.status)
+                self.assertEqual('text/plain', resp.content_type)
+                text = await resp.text()
+            return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+                    for line in text.splitlines() if not line.startswith('#')}
+
+        before = await scrape()
+        ks.derive_pubkey(0, 123456)
+        ks.derive_pubkey(0, 123456)
+        after = await scrape()
+        key = 'electrum_keystore_pubkey_cache_lookups_total{result="%s"}'
+        self.assertEqual(1, after[key % 'miss'] - before.get(key % 'miss', 0))
+        self.assertEqual(1, after[key % 'hit'] - before.get(key % 'hit', 0))
+
+    async def test_metrics_require_auth(self):
+        self.config.RPC_USERNAME = 'user'
+        self.config.RPC_PASSWORD = 'secret'
+        server = CommandsServer(self.daemon, fd=None, only_minimal_jsonrpc=False)
+        async with TestServer(server.app) as test_server, TestClient(test_server) as client:
+            resp = await client.get("/metrics")
+            self.assertEqual(401, resp.status)
+            resp = await client.get("/metrics", headers=MockRequest(None, password='wrong').headers)
+            self.assertEqual(403, resp.status)
+
+
+class TestLazyFx(DaemonTestCase):
+
+    async def test_run_fx_waits_for_fx_creation(self):
+        with mock.patch('electrum_grs.exchange_rate.FxThread.run', new=mock.AsyncMock()) as run:
+            task = asyncio.create_task(self.daemon._run_fx())
+            await asyncio.sleep(0.01)
+            self.assertFalse(task.done())
+            self.assertIsNone(self.daemon._fx)
+            self.daemon.fx
+            await asyncio.wait_for(task, timeout=1)
+            run.assert_awaited_once()
+
+    async def test_enabling_exchange_rates_creates_fx(self):
+        commands = Commands(config=self.config, daemon=self.daemon)
+        self.assertIsNone(self.daemon._fx)
+        with mock.patch('electrum_grs.exchange_rate.FxThread.trigger_update') as trigger_update:
+            await commands.setconfig('use_exchange_rate', True)
+        self.assertIsNotNone(self.daemon._fx)
+        trigger_update.assert_called()
+
+
+class TestStartup(ElectrumTestCase):
+
+    # modules that a daemon without lightning wallets, fx or plugins must not import
+    LAZY_MODULES = [
+        'electrum_grs.lnworker', 'electrum_grs.lnpeer', 'electrum_grs.lnchannel', 'electrum_grs.channel_db',
+        'electrum_grs.lnrouter', 'electrum_grs.lnonion', 'electrum_grs.lnmsg', 'electrum_grs.onion_message',
+        'electrum_grs.submarine_swaps', 'electrum_grs.trampoline', 'electrum_grs.lnwatcher',
+        'electrum_grs.lnverifier', 'electrum_grs.sql_db', 'electrum_grs.gui', 'electrum_grs.plugins.',
+    ]
+
+    def _run_daemon_in_subprocess(self, report_path: str) -> dict:
+        # note: in a fresh interpreter, as the other tests import everything
+        script = textwrap.dedent("""
+            import asyncio, json, os, sys
+            from electrum_grs import util
+            from electrum_grs.bip32 import BIP32Node
+            from electrum_grs.daemon import Daemon
+            from electrum_grs.simple_config import SimpleConfig
+            from electrum_grs.wallet import restore_wallet_from_text
+
+            loop, stopping_fut, loop_thread = util.create_and_start_event_loop()
+            config = SimpleConfig({'electrum_path': sys.argv[1]})
+            config.NETWORK_OFFLINE = True
+            daemon = Daemon(config, listen_jsonrpc=False)
+            xpub = BIP32Node.from_rootseed(bytes(32), xtype='standard').to_xpub()
+            path = os.path.join(sys.argv[1], 'watching_only')
+            restore_wallet_from_text(xpub, path=path, config=config, gap_limit=2, gap_limit_for_change=1)
+            daemon.load_wallet(path, None)
+            fx_created = daemon._fx is not None
+            asyncio.run_coroutine_threadsafe(daemon.stop(), loop).result()
+            loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+            loop_thread.join(timeout=1)
+            print(json.dumps({'modules': sorted(sys.modules), 'fx_created': fx_created}))
+        """)
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(electrum_grs.__file__))
+        env[startup_trace.ENV_VAR] = report_path
+        out = subprocess.run(
+            [sys.executable, '-c', script, self.electrum_path],
+            env=env, capture_output=True, text=True, timeout=120, check=True)
+        return json.loads(out.stdout.splitlines()[-1])
+
+    def test_minimal_daemon_import_graph(self):
+        report_path = os.path.join(self.electrum_path, 'startup.json')
+        result = self._run_daemon_in_subprocess(report_path)
+        modules = result['modules']
+        self.assertIn('electrum_grs.wallet', modules)
+        for prefix in self.LAZY_MODULES:
+            self.assertEqual([], [m for m in modules if m == prefix or m.startswith(prefix)])
+        self.assertFalse(result['fx_created'])
+        # the tracer saw the same imports
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        traced = set(x['name'] for x in report['imports'])
+        self.assertIn('electrum_grs.wallet', traced)
+        self.assertIn('electrum_grs.daemon', traced)
+        self.assertLessEqual(traced, set(modules))
+        self.assertEqual(['wallet'], [x['name'] for x in report['spans']])
+
+    def test_tracer_records_nested_spans(self):
+        tracer = startup_trace.StartupTracer()
+        with tracer.record('span', 'outer'):
+            with tracer.record('span', 'inner'):
+                time.sleep(0.01)
+            tracer.mark('ready')
+            tracer.mark('ready')  # only the first time counts
+        report = tracer.get_report()
+        outer, inner = report['spans']
+        self.assertEqual(('outer', None), (outer['name'], outer['parent']))
+        self.assertEqual(('inner', 'outer'), (inner['name'], inner['parent']))
+        self.assertGreaterEqual(inner['duration'], 0.01)
+        self.assertAlmostEqual(outer['duration'] - inner['duration'], outer['self'], places=5)
+        self.assertEqual(['ready'], list(report['events']))
+        # span() does nothing when the tracer is off
+        self.assertIsNone(startup_trace.get_tracer())
+        with startup_trace.span('x'):
+            pass
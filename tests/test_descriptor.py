@@ -383,6 +383,21 @@ class TestDescriptor(ElectrumTestCase):
         desc = parse_descriptor(f"sh(wsh(multi(2,[00000001/48h/0h/0h/2h]{xpub1}/0/1,[00000002/48h/0h/0h/2h]{xpub2}/0/1)))")
         self.assertEqual([xpub1, xpub2], [pk.pubkey for pk in desc.subdescriptors[0].subdescriptors[0].pubkeys])
 
+    @as_testnet
+    def test_expand_is_cached_if_not_ranged(self):
+        xpub1 = "tpubDDwf2gdFxFahr9RUtDQCuZmsx34CfdZ7RALAirwC2FGeLBzW1TDiEpqFeRdxLdZD7rfsbZHYwSaT6CLM3TAcYRw6xfRv4U6KCQt4Zq39fXA"
+        xpub2 = "tpubDEXiq2SVhhqALktxfVFgj3C9M3T2G7xL11iezYg2LJAf245YkNyqp2K9TrvHABDCp2232k34UegU4aKEtUZNigit8EEqoLNe2JKMzKD41qJ"
+        desc = parse_descriptor(f"wsh(sortedmulti(2,[00000001/48h/1h/0h/2h]{xpub1}/0/7,[00000002/48h/1h/0h/2h]{xpub2}/0/7))")
+        e = desc.expand()
+        self.assertIs(e, desc.expand())
+        self.assertIs(e, desc.expand(pos=3))  # pos is ignored
+        self.assertIs(e.witness_script, desc.subdescriptors[0].expand().output_script)
+        # ranged: not cached, and depends on pos
+        desc = parse_descriptor(f"wsh(sortedmulti(2,[00000001/48h/1h/0h/2h]{xpub1}/0/*,[00000002/48h/1h/0h/2h]{xpub2}/0/*))")
+        self.assertEqual(e.output_script, desc.expand(pos=7).output_script)
+        self.assertNotEqual(e.output_script, desc.expand(pos=8).output_script)
+        self.assertIsNot(desc.expand(pos=7), desc.expand(pos=7))
+
     def test_pubkey_provider_deriv_path(self):
         xpub = "xpub68W3CJPrQzHhTQcHM6tbCvNVB9ih4tbzsFBLwe7zZUj5uHuhxBUhvnXe1RQhbKCTiTj3D7kXni6yAD88i2xnjKHaJ5NqTtHawKnPFCDnmo4"
         # valid:
@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from electrum_grs import fx_history
+from electrum_grs import util
+from electrum_grs.exchange_rate import ExchangeBase, FxThread
+from electrum_grs.fx_history import HistoricalRates, encode_rate, decode_rate, timestamps_to_days
+from electrum_grs.wallet import Abstract_Wallet
+
+from . import ElectrumTestCase
+
+
+FX_DATA_DIR = Path(__file__).parent / "fiat_fx_data"
+
+
+class FakeExchange(ExchangeBase):
+    def __init__(self, history: HistoricalRates, spot: Decimal):
+        super().__init__(lambda: None, lambda: None)
+        self._history = {'EUR': history}
+        self._quotes = {'EUR': spot}
+        self._quotes_timestamp = float("inf")
+
+    def name(self):
+        return 'BitFinex'
+
+
+class FakeFxThread:
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.ccy = 'EUR'
+
+    history_rate = FxThread.history_rate
+    timestamp_rate = FxThread.timestamp_rate
+    rates_for_timestamps = FxThread.rates_for_timestamps
+    _recent_spot_rate = FxThread._recent_spot_rate
+
+
+class TestHistoricalRates(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = os.path.join(self.electrum_path, "cache")
+        shutil.copytree(FX_DATA_DIR, self.cache_dir)
+        with open(FX_DATA_DIR / "BitFinex_EUR", 'r', encoding='utf-8') as f:
+            self.json_history = json.loads(f.read())
+
+    def test_encode_rate(self):
+        for rate in ('1775.9515356', '1809.3', '0', '100', '1E+2', '0.000012345', '-1.5', 1234.5678):
+            value = encode_rate(rate)
+            self.assertEqual(Decimal(str(rate)), decode_rate(value))
+            self.assertEqual(str(Decimal(str(rate))), str(decode_rate(value)))
+        self.assertEqual(Decimal('1.234567890123457'), decode_rate(encode_rate('1.23456789012345678')))
+        for garbage in ('', 'garbage', 'NaN', 'Infinity', None, '1E+200'):
+            self.assertEqual(fx_history.NO_RATE, encode_rate(garbage))
+        self.assertTrue(decode_rate(fx_history.NO_RATE).is_nan())
+
+    def test_json_cache_is_converted(self):
+        h = fx_history.read_historical_rates(self.cache_dir, 'BitFinex', 'EUR')
+        filename = fx_history.rates_filename(self.cache_dir, 'BitFinex', 'EUR')
+        self.assertTrue(os.path.exists(filename))
+        self.assertEqual(os.stat(FX_DATA_DIR / "BitFinex_EUR").st_mtime, os.stat(filename).st_mtime)
+        self.assertEqual(h.values, HistoricalRates.read(filename).values)
+        for date_str, rate in self.json_history.items():
+            d_t = datetime.strptime(date_str, '%Y-%m-%d')
+            self.assertEqual(Decimal(rate), h.rate_for_day(fx_history.datetime_to_day(d_t)))
+        # days without rate
+        first_day = fx_history.date_to_day(min(self.json_history))
+        self.assertTrue(h.rate_for_day(first_day - 1).is_nan())
+        self.assertTrue(h.rate_for_day(first_day + len(h)).is_nan())
+        self.assertTrue(h.rate_for_day(None).is_nan())
+        self.assertIsNone(fx_history.read_historical_rates(self.cache_dir, 'BitFinex', 'USD'))
+
+    def test_merge_and_write(self):
+        h_old = HistoricalRates.from_dict({'2020-01-01': '1', '2020-01-02': '2', '2020-01-03': '3'})
+        filename = os.path.join(self.cache_dir, 'test.rates')
+        h_old.write(filename)
+        # overlapping and newer days, the new data wins
+        h_new = HistoricalRates.from_dict({'2020-01-03': '3.5', '2020-01-05': '5', '2020-01-02': 'garbage'})
+        h, first_change = h_old.merge(h_new)
+        self.assertEqual(2, first_change)
+        h.write(filename, start=first_change)
+        h_read = HistoricalRates.read(filename)
+        self.assertEqual(h.values, h_read.values)
+        self.assertEqual(
+            [Decimal(1), Decimal(2), Decimal('3.5')],
+            h_read.rates_for_days([fx_history.date_to_day(f'2020-01-0{i}') for i in (1, 2, 3)]))
+        self.assertTrue(h_read.rate_for_day(fx_history.date_to_day('2020-01-04')).is_nan())
+        # nothing new
+        h_same, first_change = h.merge(HistoricalRates.from_dict({'2020-01-01': '1'}))
+        self.assertIsNone(first_change)
+        self.assertEqual(h.values, h_same.values)
+        # older days: the whole file is written
+        h_new = HistoricalRates.from_dict({'2019-12-31': '0.5'})
+        h2, first_change = h.merge(h_new)
+        self.assertEqual(0, first_change)
+        h2.write(filename, start=first_change)
+        self.assertEqual(Decimal('0.5'), HistoricalRates.read(filename).rate_for_day(fx_history.date_to_day('2019-12-31')))
+        self.assertEqual(Decimal(5), HistoricalRates.read(filename).rate_for_day(fx_history.date_to_day('2020-01-05')))
+        # a partially written value at the end is ignored
+        with open(filename, 'ab') as f:
+            f.write(b'\x01\x02')
+        self.assertEqual(h2.values, HistoricalRates.read(filename).values)
+        with open(filename, 'wb') as f:
+            f.write(b'garbage')
+        self.assertIsNone(HistoricalRates.read(filename))
+
+    def test_timestamps_to_days(self):
+        timestamps = [0, 86399, 86400, 1_600_000_000, 1_600_000_000.5, None]
+        self.assertEqual([0, 0, 1, 18518, 18518, None], timestamps_to_days(timestamps, timezone.utc))
+        tz = timezone(timedelta(hours=-5))
+        self.assertEqual([-1, 0, 0, 18518, 18518, None], timestamps_to_days(timestamps, tz))
+        try:
+            with mock.patch.dict(os.environ, {'TZ': 'CET-1CEST,M3.5.0,M10.5.0/3'}):
+                time.tzset()
+                # one summer and one winter timestamp, each close to midnight
+                timestamps = [1_593_554_399, 1_593_554_400, 1_609_455_599, 1_609_455_600]
+                expected = [fx_history.datetime_to_day(datetime.fromtimestamp(ts)) for ts in timestamps]
+                self.assertEqual(expected, timestamps_to_days(timestamps, None))
+                self.assertEqual(expected[0] + 1, expected[1])
+                self.assertEqual(expected[2] + 1, expected[3])
+        finally:
+            time.tzset()
+
+    def test_fx_thread_rates_for_timestamps(self):
+        h = fx_history.read_historical_rates(self.cache_dir, 'BitFinex', 'EUR')
+        fx = FakeFxThread(FakeExchange(h, spot=Decimal('42')))
+        with mock.patch.object(util, 'DEFAULT_TIMEZONE', timezone.utc):
+            timestamps = [int(datetime.strptime(d, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp()) + 3600
+                          for d in list(self.json_history)[::50]]
+            timestamps += [None, 0, int(time.time())]
+            rates = fx.rates_for_timestamps(timestamps)
+            self.assertEqual(len(timestamps), len(rates))
+            for ts, rate in zip(timestamps, rates):
+                # same as the rate for the datetime
+                expected = fx.history_rate(util.timestamp_to_datetime(ts, utc=True))
+                self.assertTrue(expected.is_nan() if rate.is_nan() else expected == rate)
+                self.assertEqual(str(rate), str(fx.timestamp_rate(ts)))
+            self.assertEqual(Decimal(self.json_history[list(self.json_history)[0]]), rates[0])
+            self.assertTrue(rates[-3].is_nan())
+            self.assertTrue(rates[-2].is_nan())
+            # no rate for today yet, use the spot rate
+            self.assertEqual(Decimal('42'), rates[-1])
+
+    def test_wallet_batched_price_func(self):
+        h = fx_history.read_historical_rates(self.cache_dir, 'BitFinex', 'EUR')
+        fx = FakeFxThread(FakeExchange(h, spot=Decimal('42')))
+        with mock.patch.object(util, 'DEFAULT_TIMEZONE', timezone.utc):
+            timestamps = [int(datetime.strptime(d, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp()) + 3600
+                          for d in list(self.json_history)[::50]]
+            now = int(time.time())
+            with mock.patch.object(fx, 'rates_for_timestamps', wraps=fx.rates_for_timestamps) as rates_for_timestamps:
+                price_func = Abstract_Wallet.get_batched_price_func(fx, timestamps + [None, now, now])
+            rates_for_timestamps.assert_called_once()
+            self.assertEqual(len(timestamps) + 1, len(rates_for_timestamps.call_args[0][0]))
+            # timestamps that were not in the batch are looked up one by one
+            for ts in timestamps + [now, timestamps[0] + 86400 * 3]:
+                self.assertEqual(str(fx.timestamp_rate(ts)), str(price_func(ts)))
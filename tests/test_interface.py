@@ -13,6 +13,7 @@ from electrum_grs.transaction import Transaction, TxOutput
 from electrum_grs.wallet import Abstract_Wallet
 from electrum_grs.address_synchronizer import TX_HEIGHT_UNCONFIRMED
 from electrum_grs.blockchain import Blockchain
+from electrum_grs.server_scores import ServerScores
 
 from . import ElectrumTestCase
 from . import restore_wallet_from_text__for_unittest
@@ -76,6 +77,7 @@ class MockNetwork:
         self.debug = True
         self.bhi_lock = asyncio.Lock()
         self.interface = None  # type: Interface | None
+        self.server_scores = ServerScores(None)
 
     async def connection_down(self, interface: Interface):
         pass
@@ -89,6 +91,8 @@ class MockNetwork:
         pass
     async def switch_lagging_interface(self):
         pass
+    def record_header_lags(self):
+        pass
     def blockchain(self) -> Blockchain:
         return self.interface.blockchain
     def get_local_height(self) -> int:
@@ -4,9 +4,9 @@ import time
 from electrum_grs import util
 from electrum_grs.simple_config import SimpleConfig
 from electrum_grs.wallet import Standard_Wallet, Abstract_Wallet
-from electrum_grs.invoices import PR_UNPAID, PR_PAID, PR_UNCONFIRMED, PR_BROADCASTING, BaseInvoice, Invoice, LN_EXPIRY_NEVER
+from electrum_grs.invoices import PR_UNPAID, PR_PAID, PR_UNCONFIRMED, PR_BROADCASTING, PR_EXPIRED, BaseInvoice, Invoice, LN_EXPIRY_NEVER
 from electrum_grs.address_synchronizer import TX_HEIGHT_UNCONFIRMED
-from electrum_grs.transaction import Transaction, PartialTxOutput
+from electrum_grs.transaction import Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
 from electrum_grs.util import TxMinedInfo, InvoiceError
 from electrum_grs.fee_policy import FixedFeePolicy
 
@@ -471,3 +471,133 @@ class TestOutgoingInvoicesPaidCache(ElectrumTestCase):
         wallet.clear_history()
         self.assertNotIn(inv.get_id(), wallet._paid_invoice_keys_cache)
         self.assertNotEqual(PR_PAID, wallet.get_invoice_status(inv))
+
+
+class TestRequestStatusIndex(ElectrumTestCase):
+    """test the status index of incoming requests"""
+    TESTNET = True
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.wallet_path = os.path.join(self.electrum_path, "somewallet")
+        self._orig_get_cur_time = BaseInvoice._get_cur_time
+
+    def tearDown(self):
+        super().tearDown()
+        BaseInvoice._get_cur_time = staticmethod(self._orig_get_cur_time)
+
+    def _make_wallet(self) -> Standard_Wallet:
+        text = 'cycle rocket west magnet parrot shuffle foot correct salt library feed song'
+        d = restore_wallet_from_text__for_unittest(text, path=self.wallet_path, gap_limit=20, config=self.config)
+        wallet = d['wallet']  # type: Standard_Wallet
+        wallet.db.put('stored_height', 1000)
+        return wallet
+
+    def _pay(self, wallet, req, *, n: int = 0) -> Transaction:
+        txin = PartialTxInput(prevout=TxOutpoint.from_str("%064x:0" % (n + 1)))
+        txin.script_sig = b''
+        txin.witness = bytes([1, 1, 0x51])
+        outputs = [PartialTxOutput.from_address_and_value(req.get_address(), req.get_amount_sat())]
+        tx = Transaction(PartialTransaction.from_io([txin], outputs).serialize())
+        wallet.adb.receive_tx_callback(tx, tx_height=TX_HEIGHT_UNCONFIRMED)
+        return tx
+
+    def _mine(self, wallet, tx, height):
+        wallet.adb.add_verified_tx(tx.txid(), TxMinedInfo(_height=height, timestamp=1700000001, txpos=1, header_hash="01"*32))
+
+    async def test_status_follows_payment_and_confirmations(self):
+        wallet = self._make_wallet()
+        keys = [wallet.create_request(amount_sat=10000, message="", address=wallet.get_unused_address(), exp_delay=0)
+                for _ in range(3)]
+        self.assertEqual(set(keys), wallet.request_index.get_keys(PR_UNPAID))
+        req = wallet.get_request(keys[1])
+        tx = self._pay(wallet, req)
+        self.assertEqual({keys[1]}, wallet.request_index.get_keys(PR_UNCONFIRMED))
+        self.assertEqual([req], wallet.get_sorted_requests(status=PR_UNCONFIRMED))
+        # mined, but our local height is behind
+        self._mine(wallet, tx, 1001)
+        self.assertEqual(PR_UNCONFIRMED, wallet.get_invoice_status(req))
+        wallet.db.put('stored_height', 1001)
+        util.trigger_callback('blockchain_updated')
+        self.assertEqual(PR_PAID, wallet.get_invoice_status(req))
+        self.assertEqual([req], wallet.get_sorted_requests(status=PR_PAID))
+        self.assertEqual(1, wallet.export_request(req)['confirmations'])
+        self.assertEqual(sorted([keys[0], keys[2]]), sorted(r.get_id() for r in wallet.get_unpaid_requests()))
+        # confirmations follow the local height
+        wallet.db.put('stored_height', 1010)
+        self.assertEqual(10, wallet.export_request(req)['confirmations'])
+        self.assertEqual([tx.txid()], wallet.export_request(req)['tx_hashes'])
+        self.assertEqual([], wallet.check_request_status_index())
+        # reorg
+        wallet.adb.db.remove_verified_tx(tx.txid())
+        util.trigger_callback('adb_removed_verified_tx', wallet.adb, tx.txid())
+        self.assertEqual(PR_UNCONFIRMED, wallet.get_invoice_status(req))
+        # tx dropped
+        wallet.adb.remove_transaction(tx.txid())
+        self.assertEqual(PR_UNPAID, wallet.get_invoice_status(req))
+        self.assertEqual(set(keys), wallet.request_index.get_keys(PR_UNPAID))
+        self.assertEqual([], wallet.check_request_status_index())
+
+    async def test_status_is_not_recomputed(self):
+        wallet = self._make_wallet()
+        keys = [wallet.create_request(amount_sat=10000, message="", address=wallet.get_unused_address(), exp_delay=0)
+                for _ in range(5)]
+        wallet.db.put('stored_height', 1010)
+        self._mine(wallet, self._pay(wallet, wallet.get_request(keys[0])), 1001)
+        called = []
+        orig = wallet._is_onchain_invoice_paid
+        def spy(invoice):
+            called.append(invoice.get_id())
+            return orig(invoice)
+        wallet._is_onchain_invoice_paid = spy
+        self.assertEqual(4, len(wallet.get_unpaid_requests()))
+        self.assertEqual([PR_PAID] + 4 * [PR_UNPAID], [wallet.get_invoice_status(wallet.get_request(k)) for k in keys])
+        self.assertEqual(4, len(wallet.get_sorted_requests(status=PR_UNPAID)))
+        for key in keys:
+            wallet.export_request(wallet.get_request(key))
+        self.assertEqual([], called)
+
+    async def test_expiry(self):
+        wallet = self._make_wallet()
+        key1 = wallet.create_request(amount_sat=10000, message="", address=wallet.get_unused_address(), exp_delay=100)
+        key2 = wallet.create_request(amount_sat=10000, message="", address=wallet.get_unused_address(), exp_delay=1000)
+        key3 = wallet.create_request(amount_sat=10000, message="", address=wallet.get_unused_address(), exp_delay=0)
+        events = []
+        def on_status(w, key, status):
+            events.append((key, status))
+        util.register_callback(on_status, ['request_status'])
+        try:
+            self.assertEqual({key1, key2, key3}, wallet.request_index.get_keys(PR_UNPAID))
+            now = time.time()
+            BaseInvoice._get_cur_time = lambda *args: now + 500
+            self.assertEqual({key1}, wallet.request_index.get_keys(PR_EXPIRED))
+            self.assertEqual([(key1, PR_EXPIRED)], events)
+            BaseInvoice._get_cur_time = lambda *args: now + 5000
+            self.assertEqual({key3}, wallet.request_index.get_keys(PR_UNPAID))
+            self.assertEqual([(key1, PR_EXPIRED), (key2, PR_EXPIRED)], events)
+            # an expired request can still get paid
+            tx = self._pay(wallet, wallet.get_request(key2))
+            self.assertIn((key2, PR_UNCONFIRMED), events)
+            self.assertEqual({key2}, wallet.request_index.get_keys(PR_UNCONFIRMED))
+            self.assertEqual([key1], wallet.delete_expired_requests())
+            self.assertEqual(None, wallet.get_request(key1))
+            self.assertEqual([], wallet.check_request_status_index())
+        finally:
+            util.unregister_callback(on_status)
+
+    async def test_index_is_persisted_and_checked(self):
+        wallet = self._make_wallet()
+        key = wallet.create_request(amount_sat=10000, message="", address=wallet.get_unused_address(), exp_delay=0)
+        wallet.db.put('stored_height', 1010)
+        self._mine(wallet, self._pay(wallet, wallet.get_request(key)), 1001)
+        self.assertEqual(PR_PAID, wallet.get_invoice_status(wallet.get_request(key)))
+        wallet.save_db()
+        wallet2 = Standard_Wallet(wallet.db, config=self.config)
+        wallet2._is_onchain_invoice_paid = lambda invoice: self.fail("status was recomputed")
+        self.assertEqual(PR_PAID, wallet2.get_invoice_status(wallet2.get_request(key)))
+        self.assertEqual([wallet2.get_request(key)], wallet2.get_sorted_requests(status=PR_PAID))
+        # a stale index is reported
+        wallet.db.get_dict('request_onchain_status')[key] = (False, None, 1000, [])
+        self.assertEqual(PR_UNPAID, wallet.get_invoice_status(wallet.get_request(key)))
+        self.assertEqual(1, len(wallet.check_request_status_index()))
@@ -0,0 +1,297 @@
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from unittest import mock
+
+from electrum_grs.lnutil import LOCAL, REMOTE, SENT, UpdateAddHtlc
+from electrum_grs.lnhtlc import HTLCManager
+from electrum_grs.lnchannel import Channel
+from electrum_grs.lnhistory import LNHistoryIndex, PaymentTotals, EMPTY_TOTALS
+from electrum_grs.lnworker import PaymentDirection
+from electrum_grs.json_db import StoredDict
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.util import LightningHistoryItem
+
+from . import ElectrumTestCase, restore_wallet_from_text__for_unittest
+
+
+class FakeDB:
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.RLock()
+
+    def get_dict(self, name):
+        return self.data.setdefault(name, {})
+
+
+class FakeChannel:
+    get_payments = Channel.get_payments
+
+    def __init__(self, i: int):
+        self.channel_id = bytes([i]) * 32
+        self.hm = HTLCManager(StoredDict({}, None))  # ours
+        self.peer_hm = HTLCManager(StoredDict({}, None))
+        self.hm.channel_open_finished()
+        self.peer_hm.channel_open_finished()
+        self.funding_height = None  # type: Optional[Tuple[str, int, Optional[int]]]
+        self.closing_height = None  # type: Optional[Tuple[str, int, Optional[int]]]
+
+    def commit(self, n=1):
+        for _ in range(n):
+            self._commit()
+
+    def _commit(self):
+        A, B = self.hm, self.peer_hm
+        A.send_ctx(); B.recv_ctx(); B.send_rev(); A.recv_rev()
+        B.send_ctx(); A.recv_ctx(); A.send_rev(); B.recv_rev()
+
+    def get_funding_height(self):
+        return self.funding_height
+
+    def get_closing_height(self):
+        return self.closing_height
+
+    def balance(self, whose, *, ctn=None):
+        return 10**9 if ctn == 0 else self.hm.get_balance_msat(whose, initial_balance_msat=10**9)
+
+    def is_closed_or_closing(self):
+        return self.closing_height is not None
+
+    def get_id_for_log(self):
+        return self.channel_id.hex()[:8]
+
+
+def add_htlc(chan: FakeChannel, htlc_proposer, *, amount_msat: int, payment_hash: bytes, timestamp: int) -> int:
+    sender, receiver = (chan.hm, chan.peer_hm) if htlc_proposer == LOCAL else (chan.peer_hm, chan.hm)
+    htlc = UpdateAddHtlc(
+        amount_msat=amount_msat,
+        payment_hash=payment_hash,
+        cltv_abs=500_000,
+        htlc_id=sender.get_next_htlc_id(LOCAL),
+        timestamp=timestamp)
+    receiver.recv_htlc(sender.send_htlc(htlc))
+    chan.commit()
+    return htlc.htlc_id
+
+
+def remove_htlc(chan: FakeChannel, htlc_proposer, htlc_id: int, *, settle: bool):
+    # the receiver of the htlc settles or fails it
+    if htlc_proposer == LOCAL:
+        remover, other = chan.peer_hm, chan.hm
+    else:
+        remover, other = chan.hm, chan.peer_hm
+    if settle:
+        remover.send_settle(htlc_id)
+        other.recv_settle(htlc_id)
+    else:
+        remover.send_fail(htlc_id)
+        other.recv_fail(htlc_id)
+
+
+def settled_totals(channels) -> Dict[str, PaymentTotals]:
+    """Same as LNWallet.get_payments(status='settled'), as totals"""
+    out = {}
+    for chan in channels:
+        for direction, htlc in chan.hm.all_htlcs_ever():
+            htlc_proposer = LOCAL if direction == SENT else REMOTE
+            if chan.hm.was_htlc_failed(htlc_id=htlc.htlc_id, htlc_proposer=htlc_proposer):
+                continue
+            if not chan.hm.was_htlc_preimage_released(htlc_id=htlc.htlc_id, htlc_proposer=htlc_proposer):
+                continue
+            key = htlc.payment_hash.hex()
+            out[key] = out.get(key, EMPTY_TOTALS).add_htlc(htlc_proposer, htlc)
+    return out
+
+
+def indexed_totals(index: LNHistoryIndex, channels) -> Dict[str, PaymentTotals]:
+    out = dict(index.items())
+    for key, pending in index.get_pending_totals(channels).items():
+        out[key] = out[key] + pending if key in out else pending
+    return out
+
+
+class TestLNHistoryIndex(ElectrumTestCase):
+
+    def test_random_htlcs(self):
+        rnd = random.Random(0)
+        channels = [FakeChannel(i) for i in range(3)]
+        payment_hashes = [bytes([i]) * 32 for i in range(20)]
+        db = FakeDB()
+        index = LNHistoryIndex(db)
+        index.add_channels(channels[:2])
+        active = []  # (chan, htlc_proposer, htlc_id)
+        for step in range(400):
+            chan = rnd.choice(channels)
+            action = rnd.random()
+            if action < 0.4:
+                htlc_proposer = rnd.choice((LOCAL, REMOTE))
+                htlc_id = add_htlc(
+                    chan, htlc_proposer,
+                    amount_msat=rnd.randint(1, 10**6),
+                    payment_hash=rnd.choice(payment_hashes),
+                    timestamp=1_700_000_000 + rnd.randrange(10**6))
+                active.append((chan, htlc_proposer, htlc_id))
+            elif action < 0.8 and active:
+                remove_htlc(*active.pop(rnd.randrange(len(active))), settle=rnd.random() < 0.7)
+            else:
+                chan.commit()
+            if step == 200:
+                # the htlcs of a channel are folded when it is added
+                self.assertNotEqual({}, settled_totals(channels[2:]))
+                index.add_channel(channels[2])
+            if step % 5 == 0:
+                indexed_channels = channels if step >= 200 else channels[:2]
+                self.assertEqual(settled_totals(indexed_channels), indexed_totals(index, indexed_channels))
+        for item in active:
+            remove_htlc(*item, settle=True)
+        self.assertNotEqual({}, index.get_pending_totals(channels))
+        for chan in channels:
+            # HTLCManager stops considering htlcs as active one commitment after they are irrevocably removed
+            chan.commit(3)
+        self.assertEqual(settled_totals(channels), indexed_totals(index, channels))
+        self.assertEqual({}, index.get_pending_totals(channels))
+        # the index is stored in the db
+        index2 = LNHistoryIndex(db)
+        self.assertEqual(index.items(), index2.items())
+        self.assertEqual(index.get_keys(), index2.get_keys())
+        index2.add_channels(channels)
+        self.assertEqual(settled_totals(channels), indexed_totals(index2, channels))
+        self.assertEqual(set(), index2.pop_changed_keys())
+        # without a channel, the index gets rebuilt
+        index2.remove_channel(channels[0].channel_id, channels[1:])
+        self.assertEqual(set(dict(index.items())), index2.pop_changed_keys())
+        self.assertEqual(settled_totals(channels[1:]), indexed_totals(index2, channels[1:]))
+        index3 = LNHistoryIndex(db)
+        index3.add_channels(channels[1:])
+        self.assertEqual(settled_totals(channels[1:]), indexed_totals(index3, channels[1:]))
+
+    def test_htlcs_are_folded_when_removed(self):
+        chan = FakeChannel(0)
+        index = LNHistoryIndex(FakeDB())
+        index.add_channel(chan)
+        htlc_ids = [add_htlc(chan, REMOTE, amount_msat=1000, payment_hash=bytes([i]) * 32, timestamp=10 + i) for i in range(3)]
+        remove_htlc(chan, REMOTE, htlc_ids[0], settle=True)
+        remove_htlc(chan, REMOTE, htlc_ids[2], settle=False)
+        chan.commit()
+        self.assertEqual([], index.items())
+        self.assertEqual([bytes([0]).hex() * 32], list(index.get_pending_totals([chan])))
+        chan.commit()
+        # folded by the HTLCManager callback, even with an htlc in flight before it
+        self.assertEqual([(bytes([0]).hex() * 32, PaymentTotals(1000, 0, 1, 10))], index.items())
+        self.assertEqual({}, index.get_pending_totals([chan]))
+        self.assertEqual({bytes([0]).hex() * 32}, index.pop_changed_keys())
+
+    def test_time_range(self):
+        chan = FakeChannel(0)
+        index = LNHistoryIndex(FakeDB())
+        index.add_channel(chan)
+        for i, timestamp in enumerate([30, 10, 20, 10]):
+            htlc_id = add_htlc(chan, LOCAL, amount_msat=1000, payment_hash=bytes([i]) * 32, timestamp=timestamp)
+            remove_htlc(chan, LOCAL, htlc_id, settle=True)
+        # an older htlc of the same payment
+        htlc_id = add_htlc(chan, LOCAL, amount_msat=1000, payment_hash=bytes([0]) * 32, timestamp=5)
+        remove_htlc(chan, LOCAL, htlc_id, settle=True)
+        chan.commit(3)
+        keys = [bytes([i]).hex() * 32 for i in range(4)]
+        self.assertEqual([keys[0], keys[1], keys[3], keys[2]], index.get_keys())
+        self.assertEqual([keys[1], keys[3], keys[2]], index.get_keys(from_timestamp=10))
+        self.assertEqual([keys[1], keys[3]], index.get_keys(from_timestamp=10, to_timestamp=20))
+        self.assertEqual([keys[0]], index.get_keys(to_timestamp=10))
+        self.assertEqual([], index.get_keys(from_timestamp=21))
+
+    def test_channel_items(self):
+        index = LNHistoryIndex(FakeDB())
+        item = LightningHistoryItem(
+            type='channel_opening', label='Open channel', group_id='ab' * 32, timestamp=None,
+            amount_msat=1000, fee_msat=None, payment_hash=None, preimage=None, direction=None)
+        index.set_channel_items(bytes(32), [item])
+        index.set_channel_items(bytes([1]) * 32, [])
+        self.assertTrue(index.has_channel_items(bytes([1]) * 32))
+        self.assertEqual([item], index.get_channel_items())
+        index.retain_channel_items([bytes([1]) * 32])
+        self.assertFalse(index.has_channel_items(bytes(32)))
+        self.assertEqual([], index.get_channel_items())
+        index.remove_channel(bytes([1]) * 32, [])
+        self.assertFalse(index.has_channel_items(bytes([1]) * 32))
+
+    def test_payment_totals(self):
+        t = EMPTY_TOTALS
+        t = t.add_htlc(LOCAL, UpdateAddHtlc(amount_msat=1000, payment_hash=bytes(32), cltv_abs=1, htlc_id=0, timestamp=20))
+        t = t.add_htlc(REMOTE, UpdateAddHtlc(amount_msat=1500, payment_hash=bytes(32), cltv_abs=1, htlc_id=0, timestamp=10))
+        self.assertEqual(PaymentTotals(amount_msat=500, num_sent=1, num_received=1, timestamp=10), t)
+        self.assertEqual(PaymentTotals(amount_msat=1000, num_sent=2, num_received=2, timestamp=10), t + t)
+
+
+class TestLightningHistory(ElectrumTestCase):
+    TESTNET = True
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.wallet = restore_wallet_from_text__for_unittest(
+            'disagree rug lemon bean unaware square alone beach tennis exhibit fix mimic',
+            path=None,
+            config=self.config)['wallet']
+        self.lnworker = self.wallet.lnworker
+        self.channels = [FakeChannel(i) for i in range(2)]
+        with mock.patch.object(self.lnworker.lnwatcher, 'add_channel'):
+            for chan in self.channels:
+                self.lnworker.add_channel(chan)
+
+    def pay(self, chan: FakeChannel, htlc_proposer, payment_hash: bytes, *, timestamp: int, settle=True):
+        htlc_id = add_htlc(chan, htlc_proposer, amount_msat=10_000, payment_hash=payment_hash, timestamp=timestamp)
+        remove_htlc(chan, htlc_proposer, htlc_id, settle=settle)
+
+    def test_payments(self):
+        chan1, chan2 = self.channels
+        forwarded = bytes([1]) * 32
+        self.pay(chan1, REMOTE, forwarded, timestamp=100)
+        self.pay(chan2, LOCAL, forwarded, timestamp=101)
+        self.pay(chan1, LOCAL, bytes([2]) * 32, timestamp=200)
+        self.pay(chan2, REMOTE, bytes([3]) * 32, timestamp=300, settle=False)
+        # not irrevocably settled yet
+        history = self.lnworker.get_lightning_history()
+        self.assertEqual([], self.lnworker.check_lightning_history_index())
+        self.assertEqual({forwarded.hex(), (bytes([2]) * 32).hex()}, set(history))
+        self.assertEqual(PaymentDirection.FORWARDING, history[forwarded.hex()].direction)
+        self.assertEqual('Forwarding', history[forwarded.hex()].label)
+        self.assertEqual(PaymentDirection.SENT, history[(bytes([2]) * 32).hex()].direction)
+        for chan in self.channels:
+            chan.commit(3)
+        self.assertEqual(history, self.lnworker.get_lightning_history())
+        self.assertEqual([], self.lnworker.check_lightning_history_index())
+        self.assertEqual({forwarded.hex()}, set(self.lnworker.get_lightning_history(from_timestamp=100, to_timestamp=200)))
+        self.assertEqual({(bytes([2]) * 32).hex()}, set(self.lnworker.get_lightning_history(from_timestamp=101)))
+        # labels are cached along with the items
+        self.wallet.set_label(forwarded.hex(), 'my label')
+        self.assertEqual('my label', self.lnworker.get_lightning_history()[forwarded.hex()].label)
+        self.assertEqual([], self.lnworker.check_lightning_history_index())
+        # the payments of a removed channel are removed too
+        self.lnworker._channels.pop(chan1.channel_id)
+        self.lnworker.history_index.remove_channel(chan1.channel_id, self.lnworker.channels.values())
+        history = self.lnworker.get_lightning_history()
+        self.assertEqual({forwarded.hex()}, set(history))
+        self.assertEqual(PaymentDirection.SENT, history[forwarded.hex()].direction)
+        self.assertEqual([], self.lnworker.check_lightning_history_index())
+
+    def test_channel_opening_and_closing(self):
+        chan = self.channels[0]
+        self.assertEqual({}, self.lnworker.get_lightning_history())
+        chan.funding_height = ('aa' * 32, -1, None)
+        self.lnworker.update_channel_history(chan)
+        now = int(time.time())
+        history = self.lnworker.get_lightning_history()
+        self.assertEqual(['aa' * 32], list(history))
+        self.assertEqual('channel_opening', history['aa' * 32].type)
+        self.assertLessEqual(now, history['aa' * 32].timestamp)
+        self.assertEqual(self.wallet.get_label_for_txid('aa' * 32), history['aa' * 32].label)
+        self.assertEqual([], self.lnworker.check_lightning_history_index())
+        chan.funding_height = ('aa' * 32, 100, 1000)
+        chan.closing_height = ('bb' * 32, 200, 2000)
+        self.assertNotEqual([], self.lnworker.check_lightning_history_index())
+        self.lnworker.update_channel_history(chan)
+        self.assertEqual([], self.lnworker.check_lightning_history_index())
+        history = self.lnworker.get_lightning_history(from_timestamp=1500)
+        self.assertEqual(['bb' * 32], list(history))
+        self.assertEqual(-10**9, history['bb' * 32].amount_msat)
@@ -3,6 +3,9 @@ import unittest
 from math import inf
 from typing import Optional
 from os import urandom
+from unittest import mock
+
+from electrum_ecc import ECPrivkey
 
 from electrum_grs import util
 from electrum_grs.channel_db import NodeInfo
@@ -11,16 +14,18 @@ from electrum_grs.trampoline import (create_trampoline_onion, _allocate_fee_budg
                                  get_trampoline_budget)
 from electrum_grs.util import bfh
 from electrum_grs.lnutil import ShortChannelID, LnFeatures, PaymentFeeBudget
-from electrum_grs.lnonion import (OnionHopsDataSingle, new_onion_packet,
+from electrum_grs.lnonion import (OnionHopsDataSingle, new_onion_packet, OnionPacket,
                               process_onion_packet, _decode_onion_error, decode_onion_error,
-                              OnionFailureCode)
+                              OnionFailureCode, OnionWorkerPool, InvalidOnionMac)
 from electrum_grs import bitcoin, lnrouter
 from electrum_grs.constants import BitcoinTestnet
 from electrum_grs.simple_config import SimpleConfig
 from electrum_grs.lnrouter import (PathEdge, LiquidityHintMgr, DEFAULT_PENALTY_PROPORTIONAL_MILLIONTH,
-                               DEFAULT_PENALTY_BASE_MSAT, fee_for_edge_msat, LNPaymentTRoute, TrampolineEdge)
+                               DEFAULT_PENALTY_BASE_MSAT, fee_for_edge_msat, LNPaymentTRoute, TrampolineEdge,
+                               RouteEdge)
+from electrum_grs.lnworker import SentHtlcInfo
 
-from . import ElectrumTestCase
+from . import ElectrumTestCase, restore_wallet_from_text__for_unittest
 from .test_bitcoin import needs_test_with_all_chacha20_implementations
 
 
@@ -457,6 +462,91 @@ class Test_LNRouter(ElectrumTestCase):
             self.assertEqual(hops_data[i].to_bytes(), processed_packet.hop_data.to_bytes())
             packet = processed_packet.next_packet
 
+    async def test_onion_worker_pool(self):
+        privkeys = [urandom(32) for _ in range(4)]
+        pubkeys = [ECPrivkey(privkey).get_public_key_bytes() for privkey in privkeys]
+        hops_data = [
+            OnionHopsDataSingle(payload={
+                'amt_to_forward': {'amt_to_forward': 1000 * (5 - i)},
+                'outgoing_cltv_value': {'outgoing_cltv_value': 100 * (5 - i)},
+                'short_channel_id': {'short_channel_id': channel(i)}})
+            for i in range(4)]
+        associated_data = urandom(32)
+        session_keys = [urandom(32) for _ in range(6)]  # one per part of a payment
+        pool = OnionWorkerPool(max_workers=3)
+        try:
+            packets = await pool.new_onion_packets(
+                [(pubkeys, session_key, list(hops_data), associated_data) for session_key in session_keys])
+            for session_key, packet in zip(session_keys, packets):
+                self.assertEqual(
+                    new_onion_packet(pubkeys, session_key, list(hops_data), associated_data=associated_data).to_bytes(),
+                    packet.to_bytes())
+            # the first hop peels all of them, and fails on a tampered one
+            tampered = OnionPacket.from_bytes(packets[0].to_bytes()[:-1] + b'\x00')
+            results = await pool.process_onion_packets(
+                [(packet, associated_data) for packet in packets + [tampered]], privkeys[0])
+            for packet, result in zip(packets, results):
+                expected = process_onion_packet(packet, privkeys[0], associated_data=associated_data)
+                self.assertEqual(hops_data[0].payload, result.hop_data.payload)
+                self.assertEqual(expected.next_packet.to_bytes(), result.next_packet.to_bytes())
+            self.assertIsInstance(results[-1], InvalidOnionMac)
+        finally:
+            pool.shutdown()
+        # the pool refuses jobs above max_pending
+        pool = OnionWorkerPool(max_workers=1, max_pending=2)
+        try:
+            self.assertIsNone(await pool.process_onion_packets([(packet, associated_data) for packet in packets], privkeys[0]))
+            self.assertEqual(2, len(await pool.process_onion_packets([(packet, associated_data) for packet in packets[:2]], privkeys[0])))
+        finally:
+            pool.shutdown()
+
+    async def test_create_onions_for_routes(self):
+        wallet = restore_wallet_from_text__for_unittest(
+            'disagree rug lemon bean unaware square alone beach tennis exhibit fix mimic',
+            path=None,
+            config=self.config)['wallet']
+        lnworker = wallet.lnworker
+        privkeys = [urandom(32) for _ in range(3)]
+        pubkeys = [ECPrivkey(privkey).get_public_key_bytes() for privkey in privkeys]
+        payment_hash = urandom(32)
+        payment_secret = urandom(32)
+        routes = []
+        for i in range(3):  # the parts of a payment, over different first hops
+            route = [
+                RouteEdge(start_node=lnworker.node_keypair.pubkey, end_node=pubkeys[i], short_channel_id=channel(i),
+                          fee_base_msat=0, fee_proportional_millionths=0, cltv_delta=0, node_features=0),
+                RouteEdge(start_node=pubkeys[i], end_node=pubkeys[2], short_channel_id=channel(10 + i),
+                          fee_base_msat=1000, fee_proportional_millionths=0, cltv_delta=40, node_features=0)]
+            shi = SentHtlcInfo(
+                route=route, payment_secret_orig=payment_secret, payment_secret_bucket=payment_secret,
+                amount_msat=100_000, bucket_msat=300_000, amount_receiver_msat=100_000,
+                trampoline_fee_level=None, trampoline_route=None)
+            routes.append((shi, 144, None))
+        pool = OnionWorkerPool(max_workers=2)
+        network = mock.Mock()
+        network.get_local_height.return_value = 1000
+        try:
+            with mock.patch.object(lnworker.lnpeermgr, 'network', network), \
+                    mock.patch('electrum_grs.lnworker.get_onion_worker_pool', return_value=pool), \
+                    mock.patch.object(pool, 'new_onion_packets', wraps=pool.new_onion_packets) as new_onion_packets:
+                onions = await lnworker.create_onions_for_routes(routes=routes, payment_hash=payment_hash)
+                new_onion_packets.assert_awaited_once()
+                # a single part is done inline
+                self.assertEqual(1, len(await lnworker.create_onions_for_routes(routes=routes[:1], payment_hash=payment_hash)))
+                new_onion_packets.assert_awaited_once()
+        finally:
+            pool.shutdown()
+        self.assertEqual(3, len(onions))
+        for i, (onion, amount_msat, cltv_abs, session_key) in enumerate(onions):
+            self.assertEqual((101_000, 1000 + 144 + 40), (amount_msat, cltv_abs))
+            processed = process_onion_packet(onion, privkeys[i], associated_data=payment_hash)
+            self.assertEqual(channel(10 + i), processed.hop_data.payload['short_channel_id']['short_channel_id'])
+            processed = process_onion_packet(processed.next_packet, privkeys[2], associated_data=payment_hash)
+            self.assertTrue(processed.are_we_final)
+            self.assertEqual(100_000, processed.hop_data.payload['amt_to_forward']['amt_to_forward'])
+            self.assertEqual(payment_secret, processed.hop_data.payload['payment_data']['payment_secret'])
+        self.assertEqual(3, len(set(session_key for _, _, _, session_key in onions)))
+
     def test_create_legacy_trampoline_onion_multiple_rtags(self):
         """Test to verify we don't overfill the trampoline onion with r_tags if there are more tags than available space"""
         dummy_route: LNPaymentTRoute = [
@@ -2,7 +2,7 @@ import os
 import json
 from typing import Dict, List
 
-from electrum_grs import bitcoin
+from electrum_grs import bitcoin, lnutil
 from electrum_grs.json_db import StoredDict
 from electrum_grs.lnutil import (
     RevocationStore, get_per_commitment_secret_from_seed, make_offered_htlc, make_received_htlc, make_commitment,
@@ -761,6 +761,30 @@ class TestLNUtil(ElectrumTestCase):
         revocationpubkey = derive_blinded_pubkey(revocation_basepoint, per_commitment_point)
         self.assertEqual(revocationpubkey, bfh('02916e326636d19c33f13e8c0c3a03dd157f332f3e99c317c141dd865eb01f8ff0'))
 
+    def test_key_derivation_cached(self):
+        # BOLT3, Appendix E. derived pubkeys are cached, by basepoint and per-commitment point
+        base_secret = 0x000102030405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f
+        base_point = bfh('036d6caac248af96f6afa7f904f550253a0f3ef3f5aa2fe6838a95b216691468e2')
+        per_commitment_point = bfh('025f7117a78150fe2ef97db7cfc83bd57b2e2c0d0dd25eaf467a4a1c2a45ce1486')
+        other_point = secret_to_pubkey(0x1f1e1d1c1b1a191817161514131211100f0e0d0c0b0a09080706050403020101)
+        lnutil._derive_pubkey.cache_clear()
+        lnutil._derive_blinded_pubkey.cache_clear()
+        for _ in range(2):
+            self.assertEqual(bfh('0235f2dbfaa89b57ec7b055afe29849ef7ddfeb1cefdb9ebdc43f5494984db29e5'),
+                             derive_pubkey(base_point, per_commitment_point))
+            self.assertEqual(bfh('02916e326636d19c33f13e8c0c3a03dd157f332f3e99c317c141dd865eb01f8ff0'),
+                             derive_blinded_pubkey(base_point, per_commitment_point))
+            # not the result cached for another point
+            self.assertEqual(secret_to_pubkey(derive_privkey(base_secret, other_point)),
+                             derive_pubkey(base_point, other_point))
+            self.assertNotEqual(derive_blinded_pubkey(base_point, other_point),
+                                derive_blinded_pubkey(base_point, per_commitment_point))
+        self.assertEqual(2, lnutil._derive_pubkey.cache_info().currsize)
+        self.assertEqual(2, lnutil._derive_blinded_pubkey.cache_info().currsize)
+        # passing the basepoint saves computing it from the secret
+        self.assertEqual(0xcbced912d3b21bf196a766651e436aff192362621ce317704ea2f75d87e7be0f,
+                         derive_privkey(base_secret, per_commitment_point, basepoint=base_point))
+
     def test_simple_commitment_tx_with_no_HTLCs(self):
         to_local_msat = 7000000000
         to_remote_msat = 3000000000
@@ -0,0 +1,153 @@
+from electrum_grs.address_synchronizer import AddressSynchronizer
+from electrum_grs.bitcoin import script_to_address
+from electrum_grs.lnsweep import KeepWatchingTXO
+from electrum_grs.lnwatcher import LNWatcher, HeightTimer
+from electrum_grs.simple_config import SimpleConfig
+from electrum_grs.transaction import PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint
+from electrum_grs.wallet_db import WalletDB
+
+from . import ElectrumTestCase
+
+
+def p2wsh_address(n: int) -> str:
+    return script_to_address(bytes([0x00, 0x20]) + bytes([n]) * 32)
+
+
+def make_tx(prevout: str, address: str) -> PartialTransaction:
+    return PartialTransaction.from_io(
+        [PartialTxInput(prevout=TxOutpoint.from_str(prevout))],
+        [PartialTxOutput.from_address_and_value(address, 10_000)])
+
+
+class MockWallet:
+
+    def __init__(self, adb):
+        self.adb = adb
+
+    def diagnostic_name(self):
+        return "mock_wallet"
+
+
+class MockLNWallet:
+
+    def __init__(self, config):
+        self.config = config
+        adb = AddressSynchronizer(WalletDB('', storage=None, upgrade=True), config, name="mock_adb")
+        adb.synchronizer = object()  # trigger_callbacks requires one
+        self.wallet = MockWallet(adb)
+
+
+class MockChannel:
+
+    def __init__(self, funding_outpoint: str, sweep_info):
+        self.funding_outpoint = TxOutpoint.from_str(funding_outpoint)
+        self.sweep_info = sweep_info
+        self.num_calls = 0
+
+    def get_ctx_sweep_info(self, ctx):
+        self.num_calls += 1
+        return False, self.sweep_info
+
+
+class TestHeightTimer(ElectrumTestCase):
+
+    def test_height_timer(self):
+        timer = HeightTimer()
+        timer.schedule('a', 10)
+        timer.schedule('b', 12)
+        timer.schedule('c', 10)
+        timer.schedule('a', 15)  # reschedule
+        self.assertEqual(3, len(timer))
+        self.assertEqual(set(), timer.pop_due(9))
+        self.assertEqual({'c'}, timer.pop_due(10))
+        timer.cancel('b')
+        timer.schedule('c', 12)
+        self.assertEqual({'c'}, timer.pop_due(14))
+        self.assertEqual(None, timer.get('c'))
+        self.assertEqual(15, timer.get('a'))
+        self.assertEqual({'a'}, timer.pop_due(100))
+        self.assertEqual(0, len(timer))
+
+
+class TestLNWatcherDispatch(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.lnworker = MockLNWallet(self.config)
+        self.adb = self.lnworker.wallet.adb
+        self.set_height(100)
+        self.lnwatcher = LNWatcher(self.lnworker)
+        # events are sent by the tests
+        self.lnwatcher.unregister_callbacks()
+        self.calls = []
+
+    def set_height(self, height: int):
+        self.adb.db.put('stored_height', height)
+
+    def add_callback(self, n: int, *, check_height: int = None):
+        address = p2wsh_address(n)
+
+        async def callback():
+            self.calls.append(n)
+            if check_height is not None:
+                self.lnwatcher.schedule_check(address, check_height)
+        self.lnwatcher.add_callback(address, callback, subscribe=False)
+
+    def pop_calls(self):
+        calls, self.calls = self.calls, []
+        return sorted(calls)
+
+    async def test_tx_only_triggers_touched_callbacks(self):
+        for n in range(1, 4):
+            self.add_callback(n)
+        self.lnwatcher.watch_outpoint("01" * 32 + ":0", p2wsh_address(1))
+        # spending a watched outpoint
+        tx = make_tx("01" * 32 + ":0", p2wsh_address(100))
+        await self.lnwatcher.on_event_adb_added_tx(self.adb, tx.txid(), tx)
+        self.assertEqual([1], self.pop_calls())
+        # paying to a watched address
+        self.lnwatcher.watch_address(p2wsh_address(100), p2wsh_address(2))
+        await self.lnwatcher.on_event_adb_added_tx(self.adb, tx.txid(), tx)
+        self.assertEqual([1, 2], self.pop_calls())
+        # unrelated tx
+        tx = make_tx("ff" * 32 + ":1", p2wsh_address(200))
+        await self.lnwatcher.on_event_adb_added_tx(self.adb, tx.txid(), tx)
+        self.assertEqual([], self.pop_calls())
+        # removed callbacks stop watching
+        self.lnwatcher.remove_callback(p2wsh_address(2))
+        self.assertNotIn(p2wsh_address(100), self.lnwatcher.keys_by_address)
+        self.assertEqual(2, len(self.lnwatcher.height_timer))
+
+    async def test_new_block_triggers_due_callbacks(self):
+        self.add_callback(1, check_height=105)
+        self.add_callback(2)
+        self.add_callback(3)
+        # the first block since start runs everything
+        await self.lnwatcher.on_event_blockchain_updated()
+        self.assertEqual([1, 2, 3], self.pop_calls())
+        self.set_height(101)
+        await self.lnwatcher.on_event_blockchain_updated()
+        self.assertEqual([2, 3], self.pop_calls())
+        self.set_height(105)
+        await self.lnwatcher.on_event_blockchain_updated()
+        self.assertEqual([1, 2, 3], self.pop_calls())
+        # a reorg runs everything
+        await self.lnwatcher.on_event_blockchain_updated()
+        self.assertEqual([1, 2, 3], self.pop_calls())
+
+    async def test_sweep_info_is_memoized(self):
+        ctx = make_tx("aa" * 32 + ":0", p2wsh_address(1))
+        chan = MockChannel("aa" * 32 + ":0", {})
+        self.lnwatcher.get_ctx_sweep_info(chan, ctx)
+        self.lnwatcher.get_ctx_sweep_info(chan, ctx)
+        self.assertEqual(1, chan.num_calls)
+        # recomputed in the next height bucket
+        self.set_height(100 + LNWatcher.SWEEP_INFO_CACHE_HEIGHT_BUCKET)
+        self.lnwatcher.get_ctx_sweep_info(chan, ctx)
+        self.assertEqual(2, chan.num_calls)
+        # results that depend on preimages are not cached
+        chan = MockChannel("cc" * 32 + ":0", {"bb" * 32 + ":0": KeepWatchingTXO(name="received-htlc", until_height=500)})
+        self.lnwatcher.get_ctx_sweep_info(chan, ctx)
+        self.lnwatcher.get_ctx_sweep_info(chan, ctx)
+        self.assertEqual(2, chan.num_calls)
@@ -0,0 +1,71 @@
+import math
+
+from electrum_grs.metrics import MetricsRegistry
+
+from . import ElectrumTestCase
+
+
+def parse_samples(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        name, value = line.rsplit(' ', 1)
+        samples[name] = float(value)
+    return samples
+
+
+class TestMetrics(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry = MetricsRegistry()
+
+    def test_counter(self):
+        c = self.registry.counter('test_requests_total', 'Requests', ['method'])
+        c.labels(method='a').inc()
+        c.labels(method='a').inc(2)
+        c.labels(method='b').inc()
+        with self.assertRaises(ValueError):
+            c.labels(method='a').inc(-1)
+        with self.assertRaises(ValueError):
+            c.labels(foo='a')
+        text = self.registry.render()
+        self.assertIn('# HELP test_requests_total Requests\n# TYPE test_requests_total counter\n', text)
+        samples = parse_samples(text)
+        self.assertEqual(3, samples['test_requests_total{method="a"}'])
+        self.assertEqual(1, samples['test_requests_total{method="b"}'])
+
+    def test_gauge(self):
+        g = self.registry.gauge('test_queue_depth', 'Queue depth')
+        g.inc(5)
+        g.dec(2)
+        self.assertEqual(3, parse_samples(self.registry.render())['test_queue_depth'])
+        g.set(0.5)
+        self.assertEqual(0.5, parse_samples(self.registry.render())['test_queue_depth'])
+
+    def test_histogram(self):
+        h = self.registry.histogram('test_latency_seconds', 'Latency', buckets=[0.1, 1])
+        for value in (0.05, 0.1, 0.5, 5):
+            h.observe(value)
+        samples = parse_samples(self.registry.render())
+        self.assertEqual(2, samples['test_latency_seconds_bucket{le="0.1"}'])
+        self.assertEqual(3, samples['test_latency_seconds_bucket{le="1"}'])
+        self.assertEqual(4, samples['test_latency_seconds_bucket{le="+Inf"}'])
+        self.assertEqual(4, samples['test_latency_seconds_count'])
+        self.assertTrue(math.isclose(5.65, samples['test_latency_seconds_sum']))
+        with h.time():
+            pass
+        self.assertEqual(5, h.get_count())
+
+    def test_register_twice(self):
+        c1 = self.registry.counter('test_total', 'Test')
+        c2 = self.registry.counter('test_total', 'Test')
+        self.assertIs(c1, c2)
+        with self.assertRaises(ValueError):
+            self.registry.gauge('test_total', 'Test')
+
+    def test_label_values_are_escaped(self):
+        c = self.registry.counter('test_total', 'Test', ['method'])
+        c.labels(method='a"b\\c\nd').inc()
+        self.assertIn('test_total{method="a\\"b\\\\c\\nd"} 1\n', self.registry.render())
@@ -1,17 +1,27 @@
 import asyncio
+import os
 import tempfile
 import unittest
-from typing import List
+from functools import partial
+from typing import Dict, List
+from unittest import mock
+
+import aiorpcx
 
 from electrum_grs import constants
 from electrum_grs.simple_config import SimpleConfig
 from electrum_grs import blockchain
-from electrum_grs.interface import Interface, ServerAddr, ChainResolutionMode
+from electrum_grs import network
+from electrum_grs import interface
+from electrum_grs.interface import Interface, ServerAddr, ChainResolutionMode, RequestOnlyInterface, PaddedRSTransport
+from electrum_grs.network import Network
 from electrum_grs.crypto import sha256
 from electrum_grs.util import OldTaskGroup
+from electrum_grs.server_scores import ServerScores
 from electrum_grs import util
 
 from . import ElectrumTestCase
+from .test_blockchain import ToyNet, TOY_GENESIS_HEADER, make_toy_headers
 
 
 CRM = ChainResolutionMode
@@ -60,6 +70,7 @@ class MockNetwork:
         self.asyncio_loop = util.get_asyncio_loop()
         self.taskgroup = OldTaskGroup()
         self.proxy = None
+        self.server_scores = ServerScores(None)
 
 class MockInterface(Interface):
     def __init__(self, config: SimpleConfig):
@@ -82,6 +93,9 @@ class MockInterface(Interface):
     async def _maybe_warm_headers_cache(self, *args, **kwargs):
         return
 
+    async def _prefetch_block_headers(self, *args, **kwargs):
+        return
+
 
 class TestHeaderChainResolution(ElectrumTestCase):
 
@@ -264,6 +278,218 @@ class TestHeaderChainResolution(ElectrumTestCase):
         self.assertEqual(len(blockchain.blockchains), 2)
 
 
+
+class ToyServerSession(aiorpcx.RPCSession):
+
+    def __init__(self, *args, methods: List[str], **kwargs):
+        aiorpcx.RPCSession.__init__(self, *args, **kwargs)
+        self.methods = methods
+
+    async def handle_request(self, request):
+        self.methods.append(request.method)
+        if request.method == 'server.version':
+            return ['ToyServer', '1.4']
+        elif request.method == 'server.features':
+            return {'genesis_hash': constants.net.GENESIS}
+        elif request.method == 'server.banner':
+            return 'hello'
+        raise aiorpcx.RPCError(aiorpcx.JSONRPC.METHOD_NOT_FOUND, 'unknown method')
+
+
+class TestSendMultipleRequests(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.config = SimpleConfig({
+            'electrum_path': self.electrum_path,
+            'server': '127.0.0.1:1:t',
+            'oneserver': True,
+            'auto_connect': False,
+        })
+        self.network = Network(self.config)
+        self.network.start()
+        self.methods = []  # type: List[str]
+        self.toyserver = await aiorpcx.serve_rs(partial(ToyServerSession, methods=self.methods), "127.0.0.1")
+        port = self.toyserver.sockets[0].getsockname()[1]
+        self.server = ServerAddr("127.0.0.1", port, protocol="t")
+
+    async def asyncTearDown(self):
+        await self.network.stop()
+        network._INSTANCE = None
+        self.toyserver.close()
+        await self.toyserver.wait_closed()
+        await super().asyncTearDown()
+
+    async def send_request(self):
+        responses = await self.network.send_multiple_requests([self.server], 'server.banner', [], timeout=5)
+        self.assertEqual({self.server: 'hello'}, responses)
+
+    async def test_connection_is_reused(self):
+        await self.send_request()
+        await self.send_request()
+        # no header subscription, a single handshake
+        self.assertEqual(['server.version', 'server.features', 'server.banner', 'server.banner'], self.methods)
+
+    async def test_idle_connection_is_closed(self):
+        with mock.patch.object(RequestOnlyInterface, 'IDLE_TIMEOUT', 0.1):
+            await self.send_request()
+            interface = self.network._request_ifaces[self.server]
+            await asyncio.wait_for(interface.got_disconnected.wait(), 1)
+            await self.send_request()
+        self.assertEqual(2, self.methods.count('server.version'))
+
+    async def test_expired_connection_is_not_reused(self):
+        with mock.patch.object(RequestOnlyInterface, 'MAX_LIFETIME', 0):
+            await self.send_request()
+            await self.send_request()
+        self.assertEqual(2, self.methods.count('server.version'))
+
+
+class ToyHeadersServer:
+    """Serves the headers of one of several competing branches."""
+
+    def __init__(self, branches: Dict[str, List[bytes]], *, latency: float = 0.01):
+        self.branches = branches
+        self.active = next(iter(branches))
+        self.latency = latency  # of block header requests
+        self.sessions = set()  # type: set[ToyHeadersServerSession]
+        self.num_requests_in_flight = 0
+        self.max_requests_in_flight = 0
+
+    @property
+    def headers(self) -> List[bytes]:
+        return self.branches[self.active]
+
+    async def switch_branch(self, name: str) -> None:
+        self.active = name
+        for session in self.sessions:
+            await session.send_notification('blockchain.headers.subscribe', (session.get_tip(),))
+
+
+class ToyHeadersServerSession(aiorpcx.RPCSession):
+
+    def __init__(self, *args, toyserver: ToyHeadersServer, **kwargs):
+        aiorpcx.RPCSession.__init__(self, *args, **kwargs)
+        self.svr = toyserver
+        self.svr.sessions.add(self)
+
+    async def connection_lost(self):
+        await super().connection_lost()
+        self.svr.sessions.discard(self)
+
+    def get_tip(self) -> dict:
+        height = len(self.svr.headers) - 1
+        return {'hex': self.svr.headers[height].hex(), 'height': height}
+
+    async def get_block_header(self, height: int) -> str:
+        self.svr.num_requests_in_flight += 1
+        self.svr.max_requests_in_flight = max(self.svr.max_requests_in_flight, self.svr.num_requests_in_flight)
+        try:
+            await asyncio.sleep(self.svr.latency)
+            return self.svr.headers[height].hex()
+        finally:
+            self.svr.num_requests_in_flight -= 1
+
+    async def handle_request(self, request):
+        args = request.args
+        if request.method == 'server.version':
+            return ['ToyServer', '1.6']
+        elif request.method == 'server.features':
+            return {'genesis_hash': constants.net.GENESIS}
+        elif request.method in ('server.ping', 'server.banner', 'server.donation_address'):
+            return ''
+        elif request.method in ('server.peers.subscribe', 'mempool.get_fee_histogram'):
+            return []
+        elif request.method == 'blockchain.estimatefee':
+            return -1
+        elif request.method == 'mempool.get_info':
+            return {'minrelaytxfee': 0.00001}
+        elif request.method == 'blockchain.headers.subscribe':
+            return self.get_tip()
+        elif request.method == 'blockchain.block.header':
+            return await self.get_block_header(args[0])
+        elif request.method == 'blockchain.block.headers':
+            start_height, count = args
+            headers = self.svr.headers[start_height:start_height + count]
+            return {'headers': [header.hex() for header in headers], 'count': len(headers), 'max': 2016}
+        raise aiorpcx.RPCError(aiorpcx.JSONRPC.METHOD_NOT_FOUND, 'unknown method')
+
+
+class TestForkResolution(ElectrumTestCase):
+    """The client follows a server that switches to a competing branch."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        ToyNet.set_as_network()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        constants.BitcoinMainnet.set_as_network()
+
+    def setUp(self):
+        super().setUp()
+        self._orig_WAIT_FOR_BUFFER_GROWTH_SECONDS = PaddedRSTransport.WAIT_FOR_BUFFER_GROWTH_SECONDS
+        PaddedRSTransport.WAIT_FOR_BUFFER_GROWTH_SECONDS = 0
+
+    def tearDown(self):
+        PaddedRSTransport.WAIT_FOR_BUFFER_GROWTH_SECONDS = self._orig_WAIT_FOR_BUFFER_GROWTH_SECONDS
+        super().tearDown()
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        blockchain.blockchains = {}
+        self.branch_a = [TOY_GENESIS_HEADER] + make_toy_headers(ToyNet.GENESIS, 1, 10_000)
+        self.forkpoint = 5_000
+        prev_hash = blockchain.hash_raw_header(self.branch_a[self.forkpoint - 1])
+        self.branch_b = self.branch_a[:self.forkpoint] + make_toy_headers(prev_hash, self.forkpoint, 5_010, branch=1)
+        self.toyserver = ToyHeadersServer({'a': self.branch_a, 'b': self.branch_b})
+        self.asyncio_server = await aiorpcx.serve_rs(partial(ToyHeadersServerSession, toyserver=self.toyserver), "127.0.0.1")
+        port = self.asyncio_server.sockets[0].getsockname()[1]
+        self.config = SimpleConfig({
+            'electrum_path': self.electrum_path,
+            'server': f'127.0.0.1:{port}:t',
+            'oneserver': True,
+            'auto_connect': False,
+        })
+        self.network = Network(self.config)
+        self.network.start()
+
+    async def asyncTearDown(self):
+        await self.network.stop()
+        network._INSTANCE = None
+        self.asyncio_server.close()
+        await self.asyncio_server.wait_closed()
+        blockchain.blockchains = {}
+        await super().asyncTearDown()
+
+    async def wait_for_tip(self, headers: List[bytes]) -> None:
+        tip_hash = blockchain.hash_raw_header(headers[-1])
+        async with util.async_timeout(30):
+            while not (self.network.interface and self.network.blockchain().check_hash(len(headers) - 1, tip_hash)):
+                await asyncio.sleep(0.05)
+
+    async def test_switch_to_competing_branch(self):
+        await self.wait_for_tip(self.branch_a)
+        self.assertEqual(1, len(blockchain.blockchains))
+        self.toyserver.max_requests_in_flight = 0
+        await self.toyserver.switch_branch('b')
+        await self.wait_for_tip(self.branch_b)
+        self.assertEqual(2, len(blockchain.blockchains))
+        # the old branch became a fork of the best chain
+        fork = [chain for chain in blockchain.blockchains.values() if chain.parent is not None][0]
+        self.assertEqual(self.forkpoint, fork.forkpoint)
+        self.assertEqual(len(self.branch_a) - 1, fork.height())
+        # the interval between the backward and binary phases was too large for a single request
+        self.assertEqual(interface.NUM_FORK_PROBES, self.toyserver.max_requests_in_flight)
+        # the journal follows both chain files
+        journal = blockchain.get_sync_journal(self.config)
+        self.assertEqual({'blockchain_headers', os.path.relpath(fork.path(), journal.headers_dir)},
+                         set(journal._entries))
+        self.assertTrue(all(entry['pending'] == [] for entry in journal._entries.values()))
+
+
 if __name__ == "__main__":
     constants.BitcoinRegtest.set_as_network()
     unittest.main()
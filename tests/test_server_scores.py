@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+
+from electrum_grs import network
+from electrum_grs.network import Network
+from electrum_grs.server_scores import ServerScores
+from electrum_grs.simple_config import SimpleConfig
+
+from . import ElectrumTestCase
+
+
+class TestServerScores(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.electrum_path, "server_scores")
+        self.scores = ServerScores(self.path)
+
+    def test_rtt_is_smoothed(self):
+        self.scores.record_response('a', 0.1)
+        self.assertEqual(0.1, self.scores.get('a').rtt)
+        self.scores.record_response('a', 0.9)
+        self.assertAlmostEqual(0.2, self.scores.get('a').rtt)
+        for _ in range(100):
+            self.scores.record_response('a', 0.5)
+        self.assertAlmostEqual(0.5, self.scores.get('a').rtt, places=5)
+        self.assertAlmostEqual(0.5, self.scores.score('a'), places=3)
+
+    def test_errors_and_lag_are_penalized(self):
+        for server in 'abc':
+            self.scores.record_response(server, 0.2)
+        self.scores.record_error('b')
+        self.scores.record_header_lag('c', 4)
+        self.assertEqual(['a', 'b', 'c', 'd'], self.scores.sort(['d', 'c', 'b', 'a']))
+        # errors are forgotten as the server answers again
+        for _ in range(50):
+            self.scores.record_response('b', 0.2)
+        self.assertLess(self.scores.get('b').error_rate, 0.01)
+        # unknown servers get a neutral score
+        self.assertEqual(ServerScores.DEFAULT_RTT, self.scores.score('d'))
+        self.assertEqual(None, self.scores.choose([]))
+
+    def test_choose_favours_good_servers(self):
+        servers = [str(i) for i in range(10)]
+        for i, server in enumerate(servers):
+            self.scores.record_response(server, 0.1 * (i + 1))
+        chosen = [self.scores.choose(servers) for _ in range(1000)]
+        # the worst NUM_CHOICES - 1 servers can never win
+        self.assertEqual(0, chosen.count('9') + chosen.count('8'))
+        self.assertGreater(chosen.count('0'), chosen.count('5'))
+        self.assertGreater(chosen.count('5'), 0)
+
+    def test_hedge_delay(self):
+        self.assertEqual(ServerScores.DEFAULT_RTT, self.scores.hedge_delay('a'))
+        for i in range(100):
+            self.scores.record_response('a', 0.1 if i % 10 else 2.0)
+        self.assertAlmostEqual(2.0, self.scores.hedge_delay('a'))
+        for i in range(100):
+            self.scores.record_response('b', 100)
+        self.assertEqual(ServerScores.MAX_HEDGE_DELAY, self.scores.hedge_delay('b'))
+
+    def test_persistence(self):
+        self.scores.record_response('a', 0.3)
+        self.scores.record_error('b')
+        self.scores._get('c').last_seen = time.time() - ServerScores.MAX_AGE - 1
+        self.scores.save()
+        scores = ServerScores(self.path)
+        self.assertEqual(0.3, scores.get('a').rtt)
+        self.assertEqual(self.scores.score('b'), scores.score('b'))
+        self.assertEqual(None, scores.get('c'))
+        # a corrupt file is ignored
+        with open(self.path, "w") as f:
+            f.write("{")
+        self.assertEqual(None, ServerScores(self.path).get('a'))
+
+
+class MockInterface:
+
+    def __init__(self, server, latency, *, fail=False):
+        self.server = server
+        self.latency = latency
+        self.fail = fail
+        self.blockchain = None
+        self.num_requests = 0
+
+    def is_connected_and_ready(self):
+        return True
+
+    async def get_transaction(self, tx_hash):
+        self.num_requests += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise Exception(f"{self.server} failed")
+        return self.server
+
+
+class TestHedgedRequests(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.config.NETWORK_HEDGE_REQUESTS = True
+        self.network = Network(self.config)
+        self.network.server_scores.MIN_HEDGE_DELAY = 0.01
+
+    async def asyncTearDown(self):
+        network._INSTANCE = None
+        await super().asyncTearDown()
+
+    def set_interfaces(self, *interfaces):
+        self.network.interfaces = {iface.server: iface for iface in interfaces}
+        self.network.interface = interfaces[0]
+        for _ in range(ServerScores.MIN_SAMPLES_FOR_PERCENTILE):
+            self.network.server_scores.record_response(interfaces[0].server, 0.02)
+
+    async def test_fast_main_interface_is_not_hedged(self):
+        main, other = MockInterface('main', 0.001), MockInterface('other', 0.001)
+        self.set_interfaces(main, other)
+        self.assertEqual('main', await self.network._hedged_request(lambda iface: iface.get_transaction('00')))
+        self.assertEqual(0, other.num_requests)
+
+    async def test_slow_main_interface_is_hedged(self):
+        main, other = MockInterface('main', 1), MockInterface('other', 0.001)
+        self.set_interfaces(main, other)
+        self.assertEqual('other', await self.network._hedged_request(lambda iface: iface.get_transaction('00')))
+        self.assertEqual(1, other.num_requests)
+
+    async def test_failed_hedge_does_not_win(self):
+        main, other = MockInterface('main', 0.1), MockInterface('other', 0.001, fail=True)
+        self.set_interfaces(main, other)
+        self.assertEqual('main', await self.network._hedged_request(lambda iface: iface.get_transaction('00')))
+        self.assertEqual(1, other.num_requests)
+        # if both fail, the error of the main interface is raised
+        main.fail = True
+        with self.assertRaisesRegex(Exception, "main failed"):
+            await self.network._hedged_request(lambda iface: iface.get_transaction('00'))
+
+    async def test_hedging_is_off_by_default(self):
+        self.config.NETWORK_HEDGE_REQUESTS = False
+        main, other = MockInterface('main', 0.1), MockInterface('other', 0.001)
+        self.set_interfaces(main, other)
+        self.assertEqual('main', await self.network._hedged_request(lambda iface: iface.get_transaction('00')))
+        self.assertEqual(0, other.num_requests)
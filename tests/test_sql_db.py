@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sqlite3
+
+from electrum_grs import util
+from electrum_grs.sql_db import SqlDB, sql
+
+from . import ElectrumTestCase
+
+
+class KeyValueDB(SqlDB):
+
+    def __init__(self, path):
+        self.num_commits = 0
+        super().__init__(util.get_asyncio_loop(), path)
+
+    def create_database(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS kv (k TEXT PRIMARY KEY, v INTEGER)")
+        self.conn.set_trace_callback(self._trace)
+
+    def _trace(self, statement):
+        if statement == 'COMMIT':
+            self.num_commits += 1
+
+    @sql
+    def put(self, k, v):
+        self.conn.execute("REPLACE INTO kv (k, v) VALUES (?,?)", (k, v))
+
+    @sql
+    def put_then_fail(self, k, v):
+        self.conn.execute("REPLACE INTO kv (k, v) VALUES (?,?)", (k, v))
+        raise ValueError(k)
+
+    @sql(readonly=True)
+    def get(self, k):
+        r = self.conn.execute("SELECT v FROM kv WHERE k=?", (k,)).fetchone()
+        return r[0] if r else None
+
+    @sql(readonly=True)
+    def put_readonly(self, k, v):
+        self.conn.execute("REPLACE INTO kv (k, v) VALUES (?,?)", (k, v))
+
+
+class TestSqlDB(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.path = os.path.join(self.electrum_path, "kv_db")
+        self.db = KeyValueDB(self.path)
+
+    async def asyncTearDown(self):
+        self.db.stop()
+        await self.db.stopped_event.wait()
+        await super().asyncTearDown()
+
+    async def test_reads_see_queued_writes(self):
+        # writes are not awaited before reading
+        for i in range(200):
+            self.db.put('a', i)
+        self.assertEqual(199, await self.db.get('a'))
+        self.assertEqual(None, await self.db.get('b'))
+        conn = sqlite3.connect(self.path)
+        self.assertEqual('wal', conn.execute("PRAGMA journal_mode").fetchone()[0])
+        # awaited writes are committed
+        self.assertEqual((199,), conn.execute("SELECT v FROM kv WHERE k='a'").fetchone())
+        conn.close()
+
+    async def test_writes_are_grouped_into_transactions(self):
+        await self.db.put('x', 0)
+        num_commits = self.db.num_commits
+        await asyncio.gather(*[self.db.put(str(i), i) for i in range(500)])
+        self.assertLess(self.db.num_commits - num_commits, 50)
+        self.assertEqual(499, await self.db.get('499'))
+
+    async def test_failed_request_is_rolled_back(self):
+        f1 = self.db.put('a', 1)
+        f2 = self.db.put_then_fail('b', 2)
+        f3 = self.db.put('c', 3)
+        await f1
+        with self.assertRaises(ValueError):
+            await f2
+        await f3
+        self.assertEqual([1, None, 3], [await self.db.get(k) for k in 'abc'])
+
+    async def test_readonly_requests_cannot_write(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            await self.db.put_readonly('a', 1)
+        self.assertEqual(None, await self.db.get('a'))
@@ -1,5 +1,6 @@
 import json
 import os
+import random
 from typing import NamedTuple, Union
 
 from electrum_ecc import ECPrivkey
@@ -92,6 +93,77 @@ class TestTransaction(ElectrumTestCase):
         script = construct_script([opcodes.OP_0, bytes(50)])
         self.assertFalse(match_script_against_template(script, SCRIPTPUBKEY_TEMPLATE_ANYSEGWIT))
 
+    def _random_scripts(self, rnd: random.Random, num: int):
+        templates = [compiled.template for compiled in transaction._compiled_script_templates.values()]
+        for _ in range(num):
+            # scripts close to a template, with a few mutations
+            items = []
+            for item in rnd.choice(templates):
+                if isinstance(item, int):
+                    items.append(item)
+                elif transaction.OPPushDataGeneric.is_instance(item):
+                    items.append(rnd.randbytes(rnd.choice([2, 20, 32, 33, 40, 65])))
+                else:
+                    items.append(rnd.choice([opcodes.OP_1, opcodes.OP_16, opcodes.OP_NOP]))
+            script = bytearray(construct_script(items))
+            for _ in range(rnd.choice([0, 0, 1, 2])):
+                mutation = rnd.randrange(3)
+                i = rnd.randrange(len(script) + 1)
+                if mutation == 0 and i < len(script):
+                    script[i] = rnd.choice([rnd.randrange(256), opcodes.OP_PUSHDATA1, opcodes.OP_0, 20, 32])
+                elif mutation == 1:
+                    script.insert(i, rnd.randrange(256))
+                else:
+                    del script[i:i + rnd.randrange(1, 4)]
+            yield bytes(script)
+        for _ in range(num):
+            yield rnd.randbytes(rnd.randrange(50))
+
+    def test_compiled_script_templates_match_generic_matcher(self):
+        rnd = random.Random(0)
+        for script in self._random_scripts(rnd, 3000):
+            try:
+                decoded = [x for x in script_GetOp(script)]
+            except MalformedBitcoinScript:
+                decoded = None
+            for compiled in transaction._compiled_script_templates.values():
+                self.assertTrue(compiled.is_compiled)
+                # a decoded script is matched by the generic matcher
+                expected = match_script_against_template(decoded, compiled.template)
+                self.assertEqual(expected, match_script_against_template(script, compiled.template), script.hex())
+                self.assertEqual(expected, compiled.match(script), script.hex())
+                if expected:
+                    self.assertEqual([(op, data) for op, data, i in decoded], compiled.decode(script))
+
+    def test_compiled_get_address_from_output_script_matches_generic(self):
+
+        def get_address_generic(script):
+            # what get_address_from_output_script did before templates were compiled
+            try:
+                decoded = [x for x in script_GetOp(script)]
+            except MalformedBitcoinScript:
+                return None
+            if match_script_against_template(decoded, transaction.SCRIPTPUBKEY_TEMPLATE_P2PKH):
+                return bitcoin.hash160_to_p2pkh(decoded[2][1])
+            if match_script_against_template(decoded, transaction.SCRIPTPUBKEY_TEMPLATE_P2SH):
+                return bitcoin.hash160_to_p2sh(decoded[1][1])
+            if match_script_against_template(decoded, transaction.SCRIPTPUBKEY_TEMPLATE_WITNESS_V0):
+                return bitcoin.hash_to_segwit_addr(decoded[1][1], witver=0)
+            for witver, opcode in enumerate(range(opcodes.OP_1, opcodes.OP_16 + 1), start=1):
+                if match_script_against_template(decoded, [opcode, transaction.OPPushDataGeneric(lambda x: 2 <= x <= 40)]):
+                    return bitcoin.hash_to_segwit_addr(decoded[1][1], witver=witver)
+            return None
+
+        rnd = random.Random(1)
+        num_addresses = 0
+        for script in self._random_scripts(rnd, 3000):
+            expected = get_address_generic(script)
+            num_addresses += expected is not None
+            self.assertEqual(expected, transaction.get_address_from_output_script(script), script.hex())
+            # cached
+            self.assertEqual(expected, transaction.get_address_from_output_script(bytearray(script)), script.hex())
+        self.assertGreater(num_addresses, 500)
+
     def test_script_GetOp(self):
         # TODO add more test cases for script_GetOp
         # cases from https://github.com/bitcoinj/bitcoinj/blob/09defa626648687f8bd6ea7d197818249eebd3c8/core/src/test/resources/org/bitcoinj/script/script_tests.json#L721-L723
@@ -14,7 +14,7 @@ from electrum_grs.transaction import Transaction, PartialTxInput, PartialTxOutpu
 from electrum_grs.logging import console_stderr_handler, Logger
 from electrum_grs.submarine_swaps import SwapManager, SwapData
 from electrum_grs.lnsweep import SweepInfo, sweep_ctx_anchor
-from electrum_grs.fee_policy import FeeTimeEstimates
+from electrum_grs.fee_policy import FeeTimeEstimates, FEE_ETA_TARGETS
 
 from . import ElectrumTestCase
 from .test_wallet_vertical import WalletIntegrityHelper, read_test_vector
@@ -250,6 +250,39 @@ class TestTxBatcher(ElectrumTestCase):
         assert new_tx.inputs()[0].prevout == tx.inputs()[0].prevout == txin.prevout
         assert output1 in new_tx.outputs()
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_batch_waits_for_triggers(self, mock_save_db):
+        self.config.FEE_POLICY = 'eta:2'
+        for target in FEE_ETA_TARGETS:
+            self.network.fee_estimates.set_data(target, 5000)
+        wallet = self._create_wallet()
+        funding_tx = Transaction(WALLET_DATA["funding_tx"])
+        await self.network.try_broadcasting(funding_tx, 'funding')
+        await self.network.next_tx()
+        output1 = PartialTxOutput.from_address_and_value('tgrs1qqyqszqgpqyqszqgpqyqszqgpqyqszqgpw2qar6', 10_000)
+        wallet.txbatcher.add_payment_output('default', output1)
+        tx1 = await self.network.next_tx()
+        tx1_fee = wallet.adb.get_tx_fee(tx1.txid())
+        batch = wallet.txbatcher.tx_batches['default']
+        await asyncio.sleep(10 * wallet.txbatcher.SLEEP_INTERVAL)
+        with mock.patch.object(batch, 'run_iteration', wraps=batch.run_iteration) as run_iteration:
+            # nothing to do, the batch sleeps
+            await asyncio.sleep(10 * wallet.txbatcher.SLEEP_INTERVAL)
+            self.assertEqual(0, run_iteration.call_count)
+            # small fee changes are ignored
+            self.network.fee_estimates.set_data(2, 5200)
+            util.trigger_callback('fee', self.network.fee_estimates)
+            await asyncio.sleep(10 * wallet.txbatcher.SLEEP_INTERVAL)
+            self.assertEqual(0, run_iteration.call_count)
+            # a fee spike bumps the fee of the base tx
+            self.network.fee_estimates.set_data(2, 20000)
+            util.trigger_callback('fee', self.network.fee_estimates)
+            tx1_prime = await self.network.next_tx()
+            self.assertGreater(run_iteration.call_count, 0)
+        self.assertEqual(tx1.inputs()[0].prevout, tx1_prime.inputs()[0].prevout)
+        self.assertIn(output1, tx1_prime.outputs())
+        self.assertGreater(wallet.adb.get_tx_fee(tx1_prime.txid()), tx1_fee)
+
     async def test_to_sweep_after_anchor_sweep_conditions(self):
         # create wallet
         wallet = self._create_wallet()
@@ -6,7 +6,7 @@ from electrum_grs import util
 from electrum_grs.util import (format_satoshis, format_fee_satoshis, is_hash256_str, chunks, is_ip_address,
                            list_enabled_bits, format_satoshis_plain, is_private_netaddress, is_hex_str,
                            is_integer, is_non_negative_integer, is_int_or_float, is_non_negative_int_or_float,
-                           ShortID)
+                           ShortID, OrderedDictWithIndex, keyed_diff)
 from electrum_grs.bip21 import parse_bip21_URI, InvalidBitcoinURI
 from . import ElectrumTestCase, as_testnet
 
@@ -480,6 +480,75 @@ class TestUtil(ElectrumTestCase):
         self.assertTrue(ShortID.from_components(3, 30, 300) > ShortID.from_components(3, 1, 999))
         self.assertTrue(ShortID.from_components(3, 30, 300) < ShortID.from_components(3, 999, 1))
 
+    def test_ordered_dict_with_index(self):
+        d = OrderedDictWithIndex()
+        for k in "abcdef":
+            d[k] = k.upper()
+        self.assertEqual(2, d.pos_from_key("c"))
+        self.assertEqual("C", d.value_from_pos(2))
+        self.assertEqual("c", d.key_from_pos(2))
+        # overwriting a value keeps its position
+        d["c"] = "CC"
+        self.assertEqual(2, d.pos_from_key("c"))
+        # removals shift the positions of later keys
+        del d["b"]
+        self.assertEqual(1, d.pos_from_key("c"))
+        self.assertEqual("D", d.value_from_pos(2))
+        self.assertEqual("A", d.pop("a"))
+        self.assertEqual(0, d.pos_from_key("c"))
+        self.assertEqual(("f", "F"), d.popitem())
+        d.move_to_end("c")
+        self.assertEqual(["d", "e", "c"], list(d.keys()))
+        self.assertEqual([0, 1, 2], [d.pos_from_key(k) for k in d])
+        d.move_to_end("e", last=False)
+        self.assertEqual(["e", "d", "c"], [d.key_from_pos(i) for i in range(len(d))])
+        with self.assertRaises(KeyError):
+            d.pos_from_key("a")
+        with self.assertRaises(KeyError):
+            d.value_from_pos(3)
+        # copies are indexed too
+        import copy, pickle
+        for d2 in (copy.copy(d), copy.deepcopy(d), pickle.loads(pickle.dumps(d))):
+            self.assertIsInstance(d2, OrderedDictWithIndex)
+            self.assertEqual(d, d2)
+            self.assertEqual(1, d2.pos_from_key("d"))
+        d.clear()
+        self.assertEqual(0, len(d))
+        d["x"] = 1
+        self.assertEqual(0, d.pos_from_key("x"))
+
+    def test_keyed_diff(self):
+        def apply(old, ops):
+            old = list(old)
+            for op, pos, count in ops:
+                if op == 'remove':
+                    del old[pos:pos + count]
+                else:
+                    old[pos:pos] = [None] * count
+            return old
+
+        cases = [
+            ("", "abc"),
+            ("abc", ""),
+            ("abc", "abc"),
+            ("abc", "abcd"),
+            ("abcd", "abd"),
+            ("abcdef", "axbcef"),
+            ("abcdef", "fedcba"),
+            ("abcdef", "abdcef"),
+        ]
+        for old, new in cases:
+            ops = keyed_diff(list(old), list(new))
+            result = apply(old, ops)
+            self.assertEqual(len(new), len(result), msg=(old, new, ops))
+            # rows that were kept line up with the same keys
+            for key, new_key in zip(result, new):
+                if key is not None:
+                    self.assertEqual(key, new_key, msg=(old, new, ops))
+        self.assertEqual([], keyed_diff(list("abc"), list("abc")))
+        self.assertEqual([('insert', 3, 1)], keyed_diff(list("abc"), list("abcd")))
+        self.assertEqual([('remove', 2, 1)], keyed_diff(list("abcd"), list("abd")))
+
     async def test_custom_task_factory(self):
         loop = util.get_running_loop()
         # set our factory.  note: this does not leak into other unit tests
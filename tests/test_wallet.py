@@ -159,6 +159,8 @@ class FakeFxThread:
 
     remove_thousands_separator = staticmethod(FxThread.remove_thousands_separator)
     timestamp_rate = FxThread.timestamp_rate
+    rates_for_timestamps = FxThread.rates_for_timestamps
+    _recent_spot_rate = FxThread._recent_spot_rate
     ccy_amount_str = FxThread.ccy_amount_str
     history_rate = FxThread.history_rate
 
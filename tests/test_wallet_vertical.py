@@ -6,7 +6,7 @@ from typing import Sequence
 import asyncio
 import copy
 
-from electrum_grs import bitcoin, keystore, bip32, slip39
+from electrum_grs import bitcoin, keystore, bip32, slip39, transaction
 from electrum_grs.wallet_db import WalletDB
 from electrum_grs.storage import WalletStorage
 from electrum_grs import SimpleConfig
@@ -19,7 +19,8 @@ from electrum_grs.wallet import (sweep, Multisig_Wallet, Standard_Wallet, Import
                              TxSighashRiskLevel, CannotDoubleSpendTx)
 from electrum_grs.util import bfh, NotEnoughFunds, UnrelatedTransactionException, UserFacingException, TxMinedInfo
 from electrum_grs.fee_policy import FixedFeePolicy
-from electrum_grs.transaction import Transaction, PartialTxOutput, tx_from_any, Sighash
+from electrum_grs.transaction import (Transaction, PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint,
+                                      tx_from_any, Sighash)
 from electrum_grs.mnemonic import calc_seed_type
 from electrum_grs.network import Network
 
@@ -4394,6 +4395,46 @@ class TestWalletOfflineSigning(ElectrumTestCase):
         self.assertEqual('32e946761b4e718c1fa8d044db9e72d5831f6395eb284faf2fb5c4af0743e501', tx.txid())
         self.assertEqual('4376fa5f1f6cb37b1f3956175d3bd4ef6882169294802b250a3c672f3ff431c1', tx.wtxid())
 
+    async def test_add_info_from_wallet_same_as_one_txin_at_a_time(self):
+        keystores = [keystore.from_bip43_rootseed(bytes([i]) * 32, derivation="m/48'/1'/0'/2'") for i in (1, 2)]
+        w = WalletIntegrityHelper.create_multisig_wallet(keystores, '2of2', config=self.config, gap_limit=2)
+        addr0, addr1 = w.get_receiving_addresses()[:2]
+        other_addr = bitcoin.script_to_address(bytes([0x00, 0x14]) + bytes(20))
+        # fund: two coins to addr0, one to addr1
+        txin = PartialTxInput(prevout=TxOutpoint.from_str("%064x:0" % 1))
+        txin.script_sig = b''
+        txin.witness = bytes([1, 1, 0x51])
+        funding_tx = Transaction(PartialTransaction.from_io(
+            [txin], [PartialTxOutput.from_address_and_value(addr, 10_000) for addr in (addr0, addr0, addr1)],
+            BIP69_sort=False).serialize())
+        w.adb.receive_tx_callback(funding_tx, tx_height=TX_HEIGHT_UNCONFIRMED)
+        # spend them, with an input and an output that are not ours
+        inputs = [PartialTxInput(prevout=TxOutpoint.from_str(f"{funding_tx.txid()}:{i}")) for i in range(3)]
+        inputs.append(PartialTxInput(prevout=TxOutpoint.from_str("%064x:0" % 2)))
+        outputs = [PartialTxOutput.from_address_and_value(addr, 5_000) for addr in (w.get_change_addresses()[0], other_addr)]
+        psbt = PartialTransaction.from_io(inputs, outputs, BIP69_sort=False).serialize()
+
+        tx1 = tx_from_any(psbt)
+        for txin in tx1.inputs():
+            w.add_input_info(txin)
+        for txout in tx1.outputs():
+            w.add_output_info(txout)
+        tx2 = tx_from_any(psbt)
+        w.add_inputs_and_outputs_info(tx2.inputs(), tx2.outputs())
+        self.assertEqual(tx1.serialize(), tx2.serialize())
+        for tx in (tx1, tx2):
+            self.assertEqual([True, True, True, False], [txin.is_mine for txin in tx.inputs()])
+            self.assertEqual([True, False], [txout.is_change for txout in tx.outputs()])
+            self.assertEqual(2, len(tx.inputs()[0].bip32_paths))
+            self.assertIsNotNone(tx.inputs()[2].witness_script)
+            self.assertIsNone(tx.inputs()[3].utxo)
+        # the descriptor of addr0 is shared between its txins, but not the bip32 paths
+        self.assertIs(tx2.inputs()[0].script_descriptor, tx2.inputs()[1].script_descriptor)
+        self.assertIsNot(tx1.inputs()[0].script_descriptor, tx1.inputs()[1].script_descriptor)
+        path0, path1 = [list(txin.bip32_paths.values())[0][1] for txin in tx2.inputs()[:2]]
+        self.assertEqual(path0, path1)
+        self.assertIsNot(path0, path1)
+
 
 class TestWalletCreationChecks(ElectrumTestCase):
     TESTNET = True
@@ -4760,3 +4801,79 @@ class TestImportedWallet(ElectrumTestCase):
         with self.assertRaises(UserFacingException) as ctx:
             w.delete_address("tb1qsyzgpwa0vg2940u5t6l97etuvedr5dejpf9tdy")
         self.assertTrue("Cannot delete last remaining address" in ctx.exception.args[0])
+
+    @staticmethod
+    def make_tx(prevouts, outputs) -> Transaction:
+        txins = []
+        for prevout in prevouts:
+            txin = PartialTxInput(prevout=TxOutpoint.from_str(prevout))
+            txin.script_sig = b''
+            txin.witness = bytes([1, 1, 0x51])
+            txins.append(txin)
+        tx = PartialTransaction.from_io(
+            txins, [PartialTxOutput.from_address_and_value(addr, 10_000) for addr in outputs])
+        return Transaction(tx.serialize())
+
+    async def test_bulk_importing_and_deleting_addresses(self):
+        make_tx = self.make_tx
+        addr_a, addr_b, addr_c, addr_d = [bitcoin.script_to_address(bytes([0x00, 0x14, i]) + bytes(19)) for i in range(4)]
+        w = restore_wallet_from_text__for_unittest(addr_d, path=None, config=self.config)['wallet']  # type: Abstract_Wallet
+        good_addr, bad_addr = w.import_addresses([addr_a, addr_b, addr_c, addr_a, 'garbage'])
+        self.assertEqual([addr_a, addr_b, addr_c], good_addr)
+        self.assertEqual(2, len(bad_addr))
+        self.assertEqual(4, len(w.get_addresses()))
+        tx1 = make_tx(["%064x:0" % 1], [addr_a])  # only refers to addr_a
+        tx2 = make_tx(["%064x:0" % 2], [addr_a, addr_b])
+        tx3 = make_tx(["%064x:0" % 3], [addr_c])  # only refers to addr_c
+        tx4 = make_tx([tx1.txid() + ":0"], [addr_d])  # spends from addr_a
+        for tx in (tx1, tx2, tx3, tx4):
+            w.adb.add_transaction(tx)
+        self.assertEqual(4, len(w.db.transactions))
+
+        w.delete_addresses([addr_a, addr_c, 'garbage'])
+        self.assertEqual(sorted([addr_b, addr_d]), sorted(w.get_addresses()))
+        self.assertEqual({tx2.txid(), tx4.txid()}, set(w.db.transactions))
+        self.assertEqual(20_000, sum(w.get_balance()))
+
+        # tx4 no longer refers to an address in the wallet once addr_d is gone
+        w.delete_addresses([addr_d])
+        self.assertEqual({tx2.txid()}, set(w.db.transactions))
+        with self.assertRaises(UserFacingException) as ctx:
+            w.delete_addresses([addr_b])
+        self.assertTrue("Cannot delete last remaining address" in ctx.exception.args[0])
+
+    async def test_add_transaction_skips_outputs_that_are_not_ours(self):
+        make_tx = self.make_tx
+        addr_a, addr_b = [bitcoin.script_to_address(bytes([0x00, 0x14, i]) + bytes(19)) for i in range(2)]
+        foreign = [bitcoin.script_to_address(bytes([0x00, 0x14, 0xff, i]) + bytes(18)) for i in range(20)]
+        w = restore_wallet_from_text__for_unittest(addr_a, path=None, config=self.config)['wallet']  # type: Abstract_Wallet
+        tx1 = make_tx(["%064x:0" % 1], foreign[:10] + [addr_a] + foreign[10:])
+        with mock.patch('electrum_grs.transaction.get_address_from_output_script',
+                        wraps=transaction.get_address_from_output_script) as get_address:
+            w.adb.add_transaction(tx1)
+        # only the address of our output was derived
+        self.assertEqual([mock.call(bitcoin.address_to_script(addr_a))], get_address.call_args_list)
+        self.assertEqual({tx1.txid()}, set(w.db.transactions))
+        self.assertEqual(10_000, sum(w.get_balance()))
+        with self.assertRaises(UnrelatedTransactionException):
+            w.adb.add_transaction(make_tx(["%064x:0" % 2], foreign))
+
+        # spends our output, and an output of tx1 that is not ours yet
+        scripts = [txo.scriptpubkey for txo in tx1.outputs()]
+        n_a, n_foreign = [scripts.index(bitcoin.address_to_script(addr)) for addr in (addr_a, foreign[10])]
+        tx2 = make_tx([tx1.txid() + f":{n_a}", tx1.txid() + f":{n_foreign}"], foreign[:1])
+        w.adb.add_transaction(tx2)
+        self.assertEqual(0, sum(w.get_balance()))
+        # addresses added after the filter was built are ours too
+        w.import_addresses([addr_b, foreign[10]])
+        w.adb.add_transaction(make_tx(["%064x:0" % 3], [addr_b]))
+        self.assertEqual(10_000, sum(w.get_balance()))
+        # we learn about more outputs of tx1 being ours (e.g. as the gap limit rolls forward)
+        w.adb.add_transaction(tx1)
+        self.assertEqual({addr_a, foreign[10]}, set(w.db.get_txo_addresses(tx1.txid())))
+        self.assertEqual({addr_a, foreign[10]}, set(w.db.get_txi_addresses(tx2.txid())))
+        self.assertEqual(10_000, sum(w.get_balance()))
+        # spends an output of tx1 that is ours, but that we did not know was ours when tx1 was added
+        w.import_addresses([foreign[0]])
+        n = scripts.index(bitcoin.address_to_script(foreign[0]))
+        w.adb.add_transaction(make_tx([tx1.txid() + f":{n}"], foreign[1:2]))